@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sfa.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +56,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'sfa.middleware.ProfilingMiddleware',
+    'sfa.middleware.QueryCountMiddleware',
+    'sfa.middleware.SlowQueryMiddleware',
 ]
 
 ROOT_URLCONF = 'IISE.urls'
@@ -174,6 +178,37 @@ LOGOUT_REDIRECT_URL = '/'
 SOCIAL_AUTH_FIELDS_STORED_IN_SESSION = ['registration_flg']
 SOCIAL_AUTH_LOGIN_REDIRECT_URL = '/dashboard/'
 
+# 画面ごとのクエリ数の上限（sfa/urls.py、register/urls.pyのquery_budgets）を超えた場合に例外にする
+# 無効の場合は警告を出力するだけ
+QUERY_BUDGET_STRICT = False
+
+# 画面ごとの計測値（/metrics/）を各ワーカーからデータベースへ加算する間隔（秒）
+METRICS_FLUSH_INTERVAL = 10
+# /metrics/を収集するPrometheusに指定するトークン（Authorization: Bearer）。未設定の場合はトークンでは参照できない
+METRICS_TOKEN = environ.get('METRICS_TOKEN')
+
+# オーナーが取得したプロファイルをワークスペースごとに残す件数と、取得指示用トークンの有効期間（秒）
+PROFILE_KEEP = 20
+PROFILE_TOKEN_MAX_AGE = 60 * 60 * 24
+
+# ログファイル（スロークエリログなど）を置くディレクトリ
+LOG_DIR = environ.get('LOG_DIR', os.path.join(BASE_DIR, 'logs'))
+
+# しきい値（ミリ秒）以上かかったSQLを記録するスロークエリログ。Noneの場合は記録しない
+# ワーカーごとのファイル（sfa_slow_query.<pid>.log）を、MAX_BYTESごとにBACKUP_COUNT世代までローテーションする
+# ファイルが合計MAX_FILESを超えた場合は古いものから削除し、集計画面では新しいものからREAD_MAX_BYTESまで読み込む
+SLOW_QUERY_THRESHOLD_MS = 200
+SLOW_QUERY_LOG = os.path.join(LOG_DIR, 'sfa_slow_query.log')
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 3
+SLOW_QUERY_LOG_MAX_FILES = 20
+SLOW_QUERY_READ_MAX_BYTES = 20 * 1024 * 1024
+
+# 訪問ルートの提案に用いる移動の平均速度（km/h）、1件あたりの滞在時間（分）、訪問を始める時刻（予定がない場合）
+ROUTE_SPEED_KMH = 30
+ROUTE_STAY_MINUTES = 30
+ROUTE_DAY_START = '09:00'
+
 # Heroku用の設定とローカル設定を共存させる
 DEBUG = False
 
@@ -100,3 +100,12 @@ urlpatterns = [
         views.UserInviteConfirmView.as_view(),
         name='user_invite_confirm'),
 ]
+
+# 画面ごとの1リクエストあたりのクエリ数の上限（URL名: 件数）
+# 名前空間（register:）は付けずに宣言する。
+query_budgets = {
+    'mygroup_list': 7,
+    'user_list': 7,
+    'user_detail': 7,
+    'workspace_update': 5,
+}
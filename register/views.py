@@ -15,6 +15,7 @@ from django.views import generic
 from django.views.generic import ListView, DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from pure_pagination.mixins import PaginationMixin
+from sfa.metrics import InstrumentedGet
 from .forms import (
     LoginForm,
     UserCreateForm,
@@ -33,7 +34,6 @@ from .forms import (
 )
 from .models import MyGroup, Workspace
 import json
-import requests
 
 User = get_user_model()
 
@@ -74,7 +74,7 @@ class UserCreate(generic.CreateView):
         # reCAPCHAで不正利用を弾く
         recaptcha_response = self.request.POST.get('g-recaptcha-response')
         url = 'https://www.google.com/recaptcha/api/siteverify?secret=' + settings.GOOGLE_RECAPTCHA_SECRET_KEY + '&response=' + recaptcha_response
-        response = requests.get(url)
+        response = InstrumentedGet(url)
         result = response.json()
         if not result['success']:
             form.add_error(None, '「私はロボットではありません」にチェックを入れてください')
@@ -382,7 +382,7 @@ class UserInviteView(LoginRequiredMixin, generic.CreateView):
         # reCAPCHAで不正利用を弾く
         recaptcha_response = self.request.POST.get('g-recaptcha-response')
         url = 'https://www.google.com/recaptcha/api/siteverify?secret=' + settings.GOOGLE_RECAPTCHA_SECRET_KEY + '&response=' + recaptcha_response
-        response = requests.get(url)
+        response = InstrumentedGet(url)
         result = response.json()
         if not result['success']:
             form.add_error(None, '「私はロボットではありません」にチェックを入れてください')
@@ -0,0 +1,293 @@
+from collections import defaultdict, OrderedDict
+from django.db import connection, transaction
+from django.db.models import Case, F, Max, Value, When
+from .common_util import BuildActionStatusTransition, ExtractNumber, GetViewableCustomerInfo, NormalizeJapaneseAddress
+from .dedup import Batches, NormalizeCompanyName, NormalizePhoneNumber, RefreshDuplicates, PHONE_SUFFIX_LENGTH
+from .merge import RecountDuplicatePhoneNumbers
+from .models import AddressInfo, CustomerInfo, ActionStatusTransition
+from .postal import EnrichWithPostalCodes
+import datetime
+import unicodedata
+
+# 項目ごとの一致した場合の点数と、関連付ける点数（企業名だけ、電話番号だけの一致では関連付けない）
+MATCH_WEIGHTS = OrderedDict([
+    ('企業名', 0.5),
+    ('電話番号', 0.4),
+    ('FAX番号', 0.3),
+    ('メールのドメイン', 0.3),
+    ('郵便番号', 0.1),
+])
+MATCH_THRESHOLD = 0.6
+# 点数が同じ顧客が複数ある場合に、所属と部署名が一致する顧客を優先するための点数
+DEPARTMENT_WEIGHT = 0.05
+# 同じキーを持つ顧客がこれより多い場合は、ありふれたキーとみなして照合に使わない
+MATCH_KEY_LIMIT = 200
+# 会社のドメインとみなさないメールアドレスのドメイン
+FREE_MAIL_DOMAINS = frozenset((
+    'gmail.com', 'googlemail.com', 'yahoo.co.jp', 'ymail.ne.jp', 'hotmail.com', 'hotmail.co.jp',
+    'outlook.com', 'outlook.jp', 'live.jp', 'icloud.com', 'me.com', 'mac.com', 'aol.com',
+    'docomo.ne.jp', 'ezweb.ne.jp', 'au.com', 'softbank.ne.jp', 'i.softbank.jp', 'nifty.com',
+    'biglobe.ne.jp', 'so-net.ne.jp', 'ocn.ne.jp'))
+# 連絡先情報から作成した顧客情報のデータソース
+ADDRESSINFO_DATA_SOURCE = '連絡先情報'
+# 照合に用いる連絡先情報の項目
+CARD_FIELDS = ('id', 'customer_name', 'department_name', 'major_organization',
+               'middle_organization', 'phone_number', 'phone_number_2', 'fax_number',
+               'fax_number_2', 'mail_address', 'zip_code', 'zip_code_2')
+
+
+def NormalizeMailDomain(mail_address):
+    """
+    メールアドレスのドメインを小文字で返す。フリーメールの場合は空にする
+    """
+    domain = (mail_address or '').rpartition('@')[2].strip().lower()
+    return '' if domain in FREE_MAIL_DOMAINS else domain
+
+
+def _NormalizeDepartment(department_name):
+    return unicodedata.normalize('NFKC', department_name or '').replace(' ', '')
+
+
+def _CardDepartment(department_name, middle_organization, major_organization):
+    """
+    連絡先情報の所属。空の場合は中組織、大組織の順に用いる
+    """
+    return department_name or middle_organization or major_organization
+
+
+def _PhoneKeys(*phone_numbers):
+    keys = set()
+    for phone_number in phone_numbers:
+        phone = NormalizePhoneNumber(phone_number)
+        if len(phone) >= PHONE_SUFFIX_LENGTH:
+            keys.add(phone)
+    return keys
+
+
+def _CardKeys(card):
+    """
+    連絡先情報の照合に用いるキーを、項目ごとに返す
+    """
+    return {
+        '企業名': {NormalizeCompanyName(card['customer_name'])} - {''},
+        '電話番号': _PhoneKeys(card['phone_number'], card['phone_number_2']),
+        'FAX番号': _PhoneKeys(card['fax_number'], card['fax_number_2']),
+        'メールのドメイン': {NormalizeMailDomain(card['mail_address'])} - {''},
+        '郵便番号': {
+            zip_code for zip_code in (ExtractNumber(card['zip_code'], 2),
+                                      ExtractNumber(card['zip_code_2'], 2))
+            if len(zip_code) == 7
+        },
+    }
+
+
+class CustomerMatchIndex:
+    """
+    ユーザーが閲覧可能な顧客情報の索引。正規化した企業名・電話番号・FAX番号・メールのドメイン・郵便番号をキーにした辞書で、
+    1回のクエリで作成する。連絡先情報ごとにデータベースを検索せずに照合できる
+    連絡先情報はワークスペース内で共有されるため、他のユーザーの非公開の顧客情報には関連付けない
+    """
+
+    def __init__(self, user):
+        self.keys = {reason: defaultdict(list) for reason in MATCH_WEIGHTS}
+        self.departments = {}
+        for (pk, customer_name, department_name, tel_number1, tel_number2, tel_number3,
+             fax_number, mail_address, zip_code) in GetViewableCustomerInfo(user).order_by(
+                 'pk').values_list(
+                     'pk', 'customer_name', 'department_name', 'tel_number1', 'tel_number2',
+                     'tel_number3', 'fax_number', 'mail_address', 'zip_code').iterator():
+            name = NormalizeCompanyName(customer_name)
+            if name:
+                self.keys['企業名'][name].append(pk)
+            for phone in _PhoneKeys(tel_number1, tel_number2, tel_number3):
+                self.keys['電話番号'][phone].append(pk)
+            for fax in _PhoneKeys(fax_number):
+                self.keys['FAX番号'][fax].append(pk)
+            domain = NormalizeMailDomain(mail_address)
+            if domain:
+                self.keys['メールのドメイン'][domain].append(pk)
+            zip_code = ExtractNumber(zip_code or '', 2)
+            if len(zip_code) == 7:
+                self.keys['郵便番号'][zip_code].append(pk)
+            self.departments[pk] = _NormalizeDepartment(department_name)
+
+    def match(self, card):
+        """
+        連絡先情報に最も一致する顧客情報を返す
+        param: card。CARD_FIELDSを持つ辞書
+        return: (顧客情報のpk, 一致した項目のリスト)。関連付ける点数に満たない場合や、1件に決まらない場合はNone
+        """
+        reasons = defaultdict(list)
+        for reason, keys in _CardKeys(card).items():
+            candidates = set()
+            for key in keys:
+                pks = self.keys[reason].get(key, ())
+                if len(pks) <= MATCH_KEY_LIMIT:
+                    candidates.update(pks)
+            for pk in candidates:
+                reasons[pk].append(reason)
+        if not reasons:
+            return None
+
+        department = _NormalizeDepartment(_CardDepartment(
+            card['department_name'], card['middle_organization'], card['major_organization']))
+        scores = {}
+        for pk, matched in reasons.items():
+            score = sum(MATCH_WEIGHTS[reason] for reason in matched)
+            if department and department == self.departments[pk]:
+                score += DEPARTMENT_WEIGHT
+            # 浮動小数点の誤差で同点の顧客に差がつかないよう丸める
+            scores[pk] = round(score, 2)
+        best = max(scores.values())
+        best_pks = [pk for pk, score in scores.items() if score == best]
+        if best < MATCH_THRESHOLD or len(best_pks) > 1:
+            return None
+        return best_pks[0], reasons[best_pks[0]]
+
+
+def _CaseByPk(field, values):
+    """
+    連絡先情報ごとに値を変えるUPDATE用のCase式
+    """
+    return Case(*[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+                default=F(field))
+
+
+def _LinkAddressInfos(links):
+    """
+    連絡先情報を顧客情報に関連付ける
+    param: links。連絡先情報のpkをキーにした、(顧客情報のpk, 一致した項目)の辞書
+    return: 関連付けた件数
+    """
+    count = 0
+    now = datetime.datetime.now()
+    # IN句のpkに加えて、2項目のCase式（pkと値）を使う
+    for batch in Batches(links, params_per_value=5):
+        count += AddressInfo.objects.filter(pk__in=batch).update(
+            related_customer=_CaseByPk('related_customer', {pk: links[pk][0] for pk in batch}),
+            related_reasons=_CaseByPk('related_reasons', {pk: links[pk][1] for pk in batch}),
+            related_flg=True,
+            modified_timestamp=now)
+    return count
+
+
+def _UnlinkedAddressInfos(workspace, pks):
+    """
+    関連付けていない連絡先情報の照合に用いる項目を返す
+    """
+    pks = None if pks is None else set(pks)
+    cards = AddressInfo.objects.filter(workspace=workspace, related_flg=False).order_by('pk')
+    return [
+        card for card in cards.values(*CARD_FIELDS).iterator()
+        if pks is None or card['id'] in pks
+    ]
+
+
+def MatchAddressInfos(workspace, user, pks=None):
+    """
+    関連付けていない連絡先情報を、企業名・電話番号・FAX番号・メールのドメイン・郵便番号で顧客情報と照合し、関連付ける
+    顧客情報の索引を最初に1回だけ作るため、連絡先情報の件数によらず数回のクエリで済む
+    param: workspace。ワークスペース
+    param: user。照合を行うユーザー。ユーザーが閲覧可能な顧客情報とだけ照合する
+    param: pks。対象の連絡先情報のpk（インポートしたものなど）。省略時はワークスペースのすべての連絡先情報
+    return: 関連付けた件数
+    """
+    cards = _UnlinkedAddressInfos(workspace, pks)
+    if not cards:
+        return 0
+    index = CustomerMatchIndex(user)
+    links = {}
+    for card in cards:
+        match = index.match(card)
+        if match is not None:
+            links[card['id']] = (match[0], '・'.join(match[1]))
+    return _LinkAddressInfos(links)
+
+
+def _Truncate(field, value):
+    return (value or '')[:CustomerInfo._meta.get_field(field).max_length]
+
+
+def CreateCustomersFromAddressInfos(workspace, user, potential, pks=None):
+    """
+    関連付けていない連絡先情報から顧客情報をまとめて作成し（bulk_create）、関連付ける
+    会社名と所属が同じ連絡先情報は、1件の顧客情報にまとめる。会社名が空の連絡先情報は対象外
+    param: workspace。ワークスペース
+    param: user。作成者（営業担当者にも設定する）
+    param: potential。作成する顧客情報のポテンシャル
+    param: pks。対象の連絡先情報のpk。省略時はワークスペースのすべての連絡先情報
+    return: 作成した顧客情報の件数
+    """
+    groups = OrderedDict()
+    for card in _UnlinkedAddressInfos(workspace, pks):
+        name = NormalizeCompanyName(card['customer_name'])
+        if name:
+            department_name = _Truncate('department_name', _CardDepartment(
+                card['department_name'], card['middle_organization'],
+                card['major_organization']))
+            key = (name, _NormalizeDepartment(department_name))
+            groups.setdefault(key, []).append(card['id'])
+    if not groups:
+        return 0
+
+    first_cards = {
+        card.pk: card for batch in Batches([card_pks[0] for card_pks in groups.values()])
+        for card in AddressInfo.objects.filter(pk__in=batch)
+    }
+    customers = []
+    for card_pks in groups.values():
+        card = first_cards[card_pks[0]]
+        address1 = _Truncate('address1', card.address1)
+        address2 = _Truncate('address2', card.address2)
+        customers.append(CustomerInfo(
+            customer_name=card.customer_name,
+            department_name=_Truncate('department_name', _CardDepartment(
+                card.department_name, card.middle_organization, card.major_organization)),
+            tel_number1=_Truncate('tel_number1', ExtractNumber(card.phone_number, 1)),
+            fax_number=_Truncate('fax_number', ExtractNumber(card.fax_number, 1)),
+            mail_address=card.mail_address,
+            contact_name=_Truncate('contact_name', '{} {}'.format(
+                card.last_name, card.first_name).strip()),
+            zip_code=_Truncate('zip_code', ExtractNumber(card.zip_code, 2)),
+            address1=address1,
+            address2=address2,
+            address3=_Truncate('address3', card.address3),
+            # bulk_createではsaveが呼ばれないため、正規化した住所もここで設定する
+            normalized_address=NormalizeJapaneseAddress(address1, address2),
+            data_source=ADDRESSINFO_DATA_SOURCE,
+            potential=potential,
+            sales_person=user,
+            workspace=workspace,
+            author=user.email,
+            modifier=user.email,
+        ))
+
+    with transaction.atomic():
+        if connection.features.can_return_ids_from_bulk_insert:
+            # PostgreSQLではbulk_createでpkが設定される
+            CustomerInfo.objects.bulk_create(customers)
+        else:
+            last_pk = CustomerInfo.objects.aggregate(Max('pk'))['pk__max'] or 0
+            CustomerInfo.objects.bulk_create(customers)
+            # SQLiteではbulk_createでpkが設定されないため、作成した顧客情報を企業名と部署名で引き当てる
+            created = {}
+            for pk, customer_name, department_name in CustomerInfo.objects.filter(
+                    workspace=workspace, author=user.email, pk__gt=last_pk).order_by(
+                        'pk').values_list('pk', 'customer_name', 'department_name'):
+                created.setdefault(
+                    (NormalizeCompanyName(customer_name), _NormalizeDepartment(department_name)), pk)
+            for key, customer in zip(groups, customers):
+                customer.pk = created[key]
+        links = {}
+        transitions = []
+        for key, customer in zip(groups, customers):
+            links.update((card_pk, (customer.pk, '新規作成')) for card_pk in groups[key])
+            transitions.append(BuildActionStatusTransition(customer, None, user))
+        ActionStatusTransition.objects.bulk_create(transitions)
+        _LinkAddressInfos(links)
+
+        new_pks = [customer.pk for customer in customers]
+        RecountDuplicatePhoneNumbers(user, new_pks)
+        EnrichWithPostalCodes(workspace, new_pks)
+    RefreshDuplicates(workspace, new_pks)
+    return len(customers)
@@ -4,12 +4,16 @@ from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from django.utils.translation import ugettext_lazy as _
 # Register your models here.
-from .models import CustomerInfo, ContactInfo, AddressInfo
+from .models import CustomerInfo, CustomerInfoSupplement, ContactInfo, AddressInfo
+
+
+class CustomerInfoSupplementInline(admin.StackedInline):
+    model = CustomerInfoSupplement
 
 
 @admin.register(CustomerInfo)
 class CustomerInfoAdmin(admin.ModelAdmin):
-    pass
+    inlines = [CustomerInfoSupplementInline]
 
 
 @admin.register(ContactInfo)
@@ -0,0 +1,5 @@
+"""
+性能計測用のパッケージ
+generatorで計測用のワークスペースを生成し、runnerで主要な画面の応答時間とクエリ数を計測する。
+manage.py run_benchmarksから実行する。
+"""
@@ -0,0 +1,240 @@
+from django.db import connection
+from faker import Faker
+from register.models import MyGroup, User, Workspace
+from sfa.common_util import NormalizeJapaneseAddress
+from sfa.models import CustomerInfo, CustomerInfoSupplement, ContactInfo, AddressInfo
+import datetime
+import random
+
+# 大量の行を作るため、bulk_createの1回あたりの件数を制限する
+BATCH_SIZE = 1000
+# 生成するユーザーのパスワード
+BENCHMARK_PASSWORD = 'benchmark'
+
+
+def _BatchSize():
+    # SQLiteは1文あたりの変数の数に上限があるため、Djangoの既定の分割に任せる
+    return None if connection.vendor == 'sqlite' else BATCH_SIZE
+
+
+def BenchmarkEmail(seed, index):
+    """
+    生成するユーザーのメールアドレスを返す。負荷試験でログインする際にも用いる
+    """
+    return 'benchmark{}-{}@example.com'.format(seed, index)
+
+
+def GenerateWorkspace(seed=0,
+                      users=20,
+                      groups=5,
+                      customers=5000,
+                      contacts=20000,
+                      addresses=2000,
+                      shared_ratio=0.3):
+    """
+    性能計測用のワークスペースを生成する。同じseedであれば同じ内容のデータが作られる。
+    param: seed。FakerとRandomの乱数の種
+    param: users。ユーザー数。先頭のユーザーがオーナーになる
+    param: groups。グループ数
+    param: customers。顧客情報の件数
+    param: contacts。コンタクト情報の件数
+    param: addresses。連絡先情報（名刺）の件数
+    param: shared_ratio。グループやユーザーと共有する顧客情報の割合
+    return: 生成したワークスペース、ユーザー、グループ、電話番号の候補の辞書
+    """
+    fake = Faker('ja_JP')
+    fake.seed_instance(seed)
+    rand = random.Random(seed)
+
+    workspace = Workspace.objects.create(
+        workspace_name='benchmark-{}-{}'.format(seed, fake.company())[:40])
+    group_list = [
+        MyGroup.objects.create(group_name='{} {}'.format(fake.city(), i)[:40])
+        for i in range(groups)
+    ]
+    workspace.my_group.set(group_list)
+
+    user_list = []
+    for i in range(users):
+        user = User.objects.create_user(
+            email=BenchmarkEmail(seed, i),
+            password=BENCHMARK_PASSWORD,
+            first_name=fake.first_name(),
+            last_name=fake.last_name(),
+            workspace=workspace,
+            is_workspace_active=True,
+            workspace_role='2' if i == 0 else '0',
+        )
+        if group_list:
+            user.my_group.set(rand.sample(group_list, min(2, len(group_list))))
+        user_list.append(user)
+
+    # 電話番号の重複チェックが働くよう、電話番号は顧客数より少ない候補から選ぶ
+    phone_numbers = [
+        '0{}'.format(rand.randrange(100000000, 999999999))
+        for _ in range(max(1, customers * 4 // 5))
+    ]
+    now = datetime.datetime.now()
+    customer_rows = []
+    for _ in range(customers):
+        prefecture = fake.prefecture()
+        address2 = fake.city() + fake.town() + fake.chome() + fake.ban()
+        deleted = rand.random() < 0.05
+        customer_rows.append(
+            CustomerInfo(
+                corporate_number=str(rand.randrange(10**12, 10**13)),
+                customer_name=fake.company(),
+                department_name=fake.company_prefix(),
+                tel_number1=rand.choice(phone_numbers),
+                tel_number2=rand.choice(phone_numbers) if rand.random() < 0.3 else '',
+                mail_address=fake.email(),
+                representative=fake.name(),
+                contact_name=fake.name(),
+                zip_code=fake.zipcode().replace('-', ''),
+                address1=prefecture,
+                address2=address2,
+                address3=fake.building_name(),
+                normalized_address=NormalizeJapaneseAddress(prefecture, address2),
+                latitude=round(rand.uniform(31.0, 43.0), 6),
+                longitude=round(rand.uniform(130.0, 145.0), 6),
+                potential=rand.randrange(1, 1000) * 1000,
+                action_status=rand.randrange(4),
+                public_status=rand.randrange(3),
+                workspace=workspace,
+                sales_person=rand.choice(user_list),
+                author=rand.choice(user_list).email,
+                delete_flg=deleted,
+                deleted_timestamp=now if deleted else None,
+            ))
+    CustomerInfo.objects.bulk_create(customer_rows, batch_size=_BatchSize())
+    customer_pks = list(
+        CustomerInfo.objects.filter(workspace=workspace).order_by('pk').values_list(
+            'pk', flat=True))
+
+    CustomerInfoSupplement.objects.bulk_create([
+        CustomerInfoSupplement(customer_id=pk, url1=fake.url())
+        for pk in customer_pks
+    ], batch_size=_BatchSize())
+
+    # 共有設定（多対多の中間テーブル）
+    for field_name, targets, target_column in (
+            ('shared_edit_group', group_list, 'mygroup_id'),
+            ('shared_view_group', group_list, 'mygroup_id'),
+            ('shared_edit_user', user_list, 'user_id'),
+            ('shared_view_user', user_list, 'user_id')):
+        if not targets:
+            continue
+        through = getattr(CustomerInfo, field_name).through
+        through.objects.bulk_create([
+            through(**{
+                'customerinfo_id': pk,
+                target_column: rand.choice(targets).pk
+            }) for pk in customer_pks if rand.random() < shared_ratio
+        ], batch_size=_BatchSize())
+
+    # コンタクト情報は直近30日に分散させ、訪問予定の一部は本日にする
+    today = datetime.date.today()
+    contact_rows = []
+    contact_days = []
+    for _ in range(contacts):
+        days_ago = rand.randrange(30)
+        contact_type = rand.choice((0, 2, 2, 2))
+        visit_date = today - datetime.timedelta(
+            days=days_ago) if contact_type == 0 else None
+        contact_rows.append(
+            ContactInfo(
+                target_customer_id=rand.choice(customer_pks),
+                operator=rand.choice(user_list),
+                contact_type=contact_type,
+                target_person=fake.name(),
+                called_flg=contact_type == 2 and rand.random() < 0.6,
+                visited_flg=contact_type == 0 and rand.random() < 0.5,
+                visit_date_plan=visit_date,
+                visit_date_act=visit_date,
+                start_time_plan=datetime.time(rand.randrange(9, 18)),
+                remarks=fake.sentence(),
+            ))
+        contact_days.append(days_ago)
+    ContactInfo.objects.bulk_create(contact_rows, batch_size=_BatchSize())
+    # contact_timestampはauto_now_addのため、作成後に日単位でまとめて書き換える
+    contact_pks = list(
+        ContactInfo.objects.filter(target_customer__workspace=workspace).order_by(
+            'pk').values_list('pk', flat=True))
+    for days_ago in range(1, 30):
+        pks = [
+            pk for pk, day in zip(contact_pks, contact_days) if day == days_ago
+        ]
+        for i in range(0, len(pks), BATCH_SIZE):
+            ContactInfo.objects.filter(pk__in=pks[i:i + BATCH_SIZE]).update(
+                contact_timestamp=now - datetime.timedelta(days=days_ago))
+
+    AddressInfo.objects.bulk_create([
+        AddressInfo(
+            last_name=fake.last_name(),
+            first_name=fake.first_name(),
+            customer_name=fake.company(),
+            mail_address=fake.email(),
+            phone_number=rand.choice(phone_numbers),
+            zip_code=fake.zipcode(),
+            address1=fake.prefecture(),
+            address2=fake.city() + fake.town(),
+            workspace=workspace,
+            author=rand.choice(user_list),
+            modifier=rand.choice(user_list),
+        ) for _ in range(addresses)
+    ], batch_size=_BatchSize())
+
+    return {
+        'workspace': workspace,
+        'users': user_list,
+        'groups': group_list,
+        'phone_numbers': phone_numbers,
+    }
+
+
+def GenerateCustomerInfoCsv(rows, seed=0):
+    """
+    顧客情報インポート用のCSVファイル（MS932）の内容を生成する
+    param: rows。ヘッダ行を除いた行数
+    return: CSVファイルの内容（bytes）
+    """
+    fake = Faker('ja_JP')
+    fake.seed_instance(seed)
+    lines = [','.join(['列{}'.format(i) for i in range(31)])]
+    for _ in range(rows):
+        row = [''] * 31
+        row[0] = str(fake.random_int(10**12, 10**13 - 1))
+        row[4] = fake.company()
+        row[6] = fake.phone_number()
+        row[10] = fake.email()
+        row[12] = fake.name()
+        row[13] = fake.zipcode()
+        row[14] = fake.prefecture()
+        row[15] = fake.city() + fake.town()
+        row[19] = fake.url()
+        row[30] = fake.sentence()
+        lines.append(','.join(row))
+    return '\r\n'.join(lines).encode('cp932', errors='replace')
+
+
+def GenerateAddressInfoCsv(rows, seed=0):
+    """
+    連絡先情報インポート用のCSVファイル（SkyDesk形式、Shift_JIS）の内容を生成する
+    param: rows。ヘッダ行を除いた行数
+    return: CSVファイルの内容（bytes）
+    """
+    fake = Faker('ja_JP')
+    fake.seed_instance(seed)
+    lines = [','.join(['列{}'.format(i) for i in range(34)])]
+    for _ in range(rows):
+        row = [''] * 34
+        row[1] = fake.last_name()
+        row[2] = fake.first_name()
+        row[6] = fake.company()
+        row[8] = fake.email()
+        row[9] = fake.phone_number()
+        row[14] = fake.zipcode()
+        row[15] = fake.prefecture()
+        row[16] = fake.city() + fake.town()
+        lines.append(','.join(row))
+    return '\r\n'.join(lines).encode('shift_jisx0213', errors='replace')
@@ -0,0 +1,233 @@
+from .generator import GenerateCustomerInfoCsv
+from .runner import Percentile
+import random
+import re
+import requests
+import threading
+import time
+
+# 1セッションで行う操作と、選ばれる割合
+SCENARIO_WEIGHTS = (
+    ('search', 40),
+    ('open_card', 25),
+    ('log_call', 15),
+    ('dashboard', 15),
+    ('import_csv', 5),
+)
+SEARCH_PREFECTURES = ('東京都', '大阪府', '北海道', '愛知県', '福岡県', '神奈川県')
+
+_DETAIL_RE = re.compile(r'/detail/(\d+)/')
+_OPERATOR_RE = re.compile(
+    r'<select[^>]*name="operator"[^>]*>.*?<option value="(\d+)"[^>]*selected', re.S)
+
+
+class LoadTestError(Exception):
+    """負荷試験の準備（ログインなど）に失敗した"""
+    pass
+
+
+class VirtualUser:
+    """
+    1人の営業担当者として、ログインしてから画面を順に操作する
+    リクエストごとのURL名・応答時間・成否を、共有の記録先に追加する
+    """
+
+    def __init__(self, base_url, email, password, records, lock, rand, csv_data):
+        self.base_url = base_url.rstrip('/')
+        self.email = email
+        self.password = password
+        self.records = records
+        self.lock = lock
+        self.rand = rand
+        self.csv_data = csv_data
+        self.session = requests.Session()
+        self.customer_pks = []
+
+    def request(self, url_name, method, path, expected=(200, 302), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, self.base_url + path, allow_redirects=False, timeout=60, **kwargs)
+            ok = response.status_code in expected
+        except requests.RequestException:
+            response = None
+            ok = False
+        finally:
+            # Djangoのテストサーバーは応答後に接続を閉じるため、接続を使い回さない（Cookieは残る）
+            self.session.close()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.records.append((url_name, elapsed, ok))
+        return response
+
+    def post(self, url_name, path, data, **kwargs):
+        data = dict(data, csrfmiddlewaretoken=self.session.cookies.get('csrftoken', ''))
+        return self.request(
+            url_name, 'post', path, data=data,
+            headers={'Referer': self.base_url + path}, **kwargs)
+
+    def login(self):
+        self.request('register:login', 'get', '/register/login/')
+        response = self.post('register:login', '/register/login/', {
+            'username': self.email,
+            'password': self.password,
+        })
+        if response is None or response.status_code != 302:
+            raise LoadTestError('{}でログインできませんでした。'.format(self.email))
+        self.search()
+
+    def search(self):
+        params = {'address1': self.rand.choice(SEARCH_PREFECTURES), 'action_status': ''}
+        if not self.customer_pks:
+            params = {'none': ''}
+        response = self.request('customer_list_all', 'get', '/customer_list_all/', params=params)
+        if response is not None:
+            pks = _DETAIL_RE.findall(response.text)
+            if pks:
+                self.customer_pks = sorted(set(pks))
+
+    def open_card(self):
+        if self.customer_pks:
+            pk = self.rand.choice(self.customer_pks)
+            self.request('detail', 'get', '/detail/{}/'.format(pk))
+            self.request('contactinfo_by_customer_list', 'get',
+                         '/contactinfo_by_customer_list/{}/'.format(pk))
+
+    def log_call(self):
+        if not self.customer_pks:
+            return
+        pk = self.rand.choice(self.customer_pks)
+        path = '/call_history_create/{}/'.format(pk)
+        response = self.request('call_history_create', 'get', path)
+        match = _OPERATOR_RE.search(response.text) if response is not None else None
+        if not match:
+            return
+        self.post('call_history_create', path, {
+            'target_customer': pk,
+            'operator': match.group(1),
+            'contact_type': '2',
+            'tel_number': '0312345678',
+            'target_person': '負荷試験',
+            'called_flg': 'on',
+            'remarks': '負荷試験による架電記録',
+        }, expected=(302, ))
+        self.request('call_history_filter', 'get', '/call_history_filter/')
+
+    def dashboard(self):
+        today = time.strftime('%Y-%m-%d')
+        self.request('dashboard', 'get', '/dashboard/')
+        self.request('get_contactinfo_count', 'get', '/get_contactinfo_count/', params={
+            'contact_timestamp_gte': today + ' 00:00:00',
+            'contact_timestamp_lte': today + ' 23:59:59',
+        })
+
+    def import_csv(self):
+        self.post('customer_info_import', '/customer_info_import/', {
+            'potential': '1',
+            'public_status': '0',
+        }, files={'file': ('customer.csv', self.csv_data)})
+
+    def run(self, deadline=None, iterations=None, think_time=0):
+        """
+        締め切り時刻または回数に達するまで、割合に従って選んだ操作を繰り返す
+        """
+        names = [name for name, _ in SCENARIO_WEIGHTS]
+        weights = [weight for _, weight in SCENARIO_WEIGHTS]
+        count = 0
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if iterations is not None and count >= iterations:
+                break
+            getattr(self, self.rand.choices(names, weights)[0])()
+            count += 1
+            if think_time:
+                time.sleep(self.rand.uniform(0, think_time * 2))
+
+
+def RunLoadTest(base_url, accounts, duration=None, iterations=None, think_time=0, seed=0,
+                import_rows=20):
+    """
+    指定したアカウントの数だけ仮想ユーザーのスレッドを起動し、同時に画面を操作させる
+    param: base_url。対象のサーバー（例: http://localhost:8000）
+    param: accounts。(メールアドレス, パスワード)のリスト。同時接続数になる
+    param: duration。計測時間（秒）。iterationsとどちらかを指定する
+    param: iterations。仮想ユーザー1人あたりの操作回数
+    param: think_time。操作の間の平均待ち時間（秒）
+    return: URL名をキーにした、件数・エラー数・スループット・パーセンタイルの辞書。合計は'_total'
+    """
+    records = []
+    lock = threading.Lock()
+    csv_data = GenerateCustomerInfoCsv(import_rows, seed)
+    users = [
+        VirtualUser(base_url, email, password, records, lock, random.Random(seed + i),
+                    csv_data) for i, (email, password) in enumerate(accounts)
+    ]
+    for user in users:
+        user.login()
+    # ログインは計測に含めない
+    del records[:]
+
+    started = time.monotonic()
+    deadline = started + duration if duration else None
+    threads = [
+        threading.Thread(
+            target=user.run, args=(deadline, iterations, think_time), daemon=True)
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return SummarizeLoadTest(records, elapsed)
+
+
+def SummarizeLoadTest(records, elapsed):
+    """
+    リクエストの記録をURL名ごとに集計する
+    param: records。(URL名, 応答時間（秒）, 成否)のリスト
+    param: elapsed。計測にかかった時間（秒）
+    """
+    grouped = {}
+    for url_name, seconds, ok in records:
+        grouped.setdefault(url_name, []).append((seconds, ok))
+    grouped['_total'] = [(seconds, ok) for _, seconds, ok in records]
+
+    results = {}
+    for url_name, values in grouped.items():
+        if not values:
+            continue
+        timings = [seconds * 1000 for seconds, _ in values]
+        results[url_name] = {
+            'requests': len(values),
+            'errors': sum(1 for _, ok in values if not ok),
+            'rps': round(len(values) / elapsed, 2) if elapsed else 0,
+            'p50_ms': round(Percentile(timings, 50), 2),
+            'p95_ms': round(Percentile(timings, 95), 2),
+            'p99_ms': round(Percentile(timings, 99), 2),
+        }
+    return results
+
+
+def CompareLoadTests(results, baseline, tolerance=0.2):
+    """
+    負荷試験の結果を前回の結果と比較し、悪化した項目を返す。
+    スループットが(1 - tolerance)倍を下回るか、p95が(1 + tolerance)倍を超えたら悪化とみなす。
+    return: 悪化内容を表す文字列のリスト
+    """
+    regressions = []
+    for url_name, result in sorted(results.items()):
+        base = baseline.get(url_name)
+        if not base:
+            continue
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append('{}: スループット {}/s → {}/s'.format(
+                url_name, base['rps'], result['rps']))
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append('{}: p95 {}ms → {}ms'.format(
+                url_name, base['p95_ms'], result['p95_ms']))
+        if result['errors'] > base['errors']:
+            regressions.append('{}: エラー {}件 → {}件'.format(
+                url_name, base['errors'], result['errors']))
+    return regressions
@@ -0,0 +1,94 @@
+from sfa.common_util import ExtractNumber, ExtractNumbers, ExtractNumberColumns
+import random
+import re
+import time
+import zenhan
+
+# ExtractNumberの計測・検証で使う文字。全角・半角の数字と記号、カナ、漢字を混ぜる
+EXTRACT_NUMBER_SAMPLE_CHARS = (
+    '0123456789０１２３４５６７８９()-（）−ー－―‐ 　+＋.．/／'
+    'abcＡＢＣｱｶﾞアガパ東京都〒#＃')
+
+
+def ExtractNumberReference(org_str, data_type):
+    """
+    str.translateに置き換える前のExtractNumberと同じ処理。結果が変わらないことの検証に使う
+    """
+    han_org_str = zenhan.z2h(org_str)
+    if data_type == 1:  # 電話番号用
+        filterd_str = re.findall(r'[^\(\)\-（）−]+', han_org_str)
+    elif data_type == 2:  # 郵便番号用
+        filterd_str = re.findall(r'[^\-−]+', han_org_str)
+    elif data_type == 3:  # 法人番号用
+        filterd_str = han_org_str
+    return ''.join(filterd_str)
+
+
+def GenerateNumberStrings(count, seed=0, max_length=16):
+    """
+    ExtractNumberの計測・検証用に、番号らしい文字列を生成する
+    param: count。生成する件数
+    param: seed。乱数の種
+    param: max_length。1件の最大の文字数
+    return: 文字列のリスト
+    """
+    rand = random.Random(seed)
+    return [
+        ''.join(rand.choice(EXTRACT_NUMBER_SAMPLE_CHARS)
+                for _ in range(rand.randint(0, max_length))) for _ in range(count)
+    ]
+
+
+def _Measure(func, iterations):
+    """
+    funcをiterations回呼び出し、最も速かった1回の時間（ミリ秒）を返す
+    """
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(min(timings), 2)
+
+
+def RunExtractNumberBenchmark(rows=10000, iterations=5, seed=0):
+    """
+    CSVインポートの番号の列（6列）をrows行分変換する時間を、変換方法ごとに計測する
+    param: rows。行数
+    param: iterations。計測回数。最も速かった1回を結果とする
+    param: seed。乱数の種
+    return: 変換方法の名前をキーにした、時間（ミリ秒）の辞書
+    """
+    columns = {0: 3, 6: 1, 7: 1, 8: 1, 9: 1, 13: 2}
+    values = GenerateNumberStrings(rows * len(columns), seed)
+    table = [values[i:i + len(columns)] for i in range(0, len(values), len(columns))]
+    rows_data = []
+    for cells in table:
+        row = [''] * 14
+        for index, value in zip(columns, cells):
+            row[index] = value
+        rows_data.append(row)
+
+    def Reference():
+        for row in rows_data:
+            [ExtractNumberReference(row[index], data_type)
+             for index, data_type in columns.items()]
+
+    def Single():
+        for row in rows_data:
+            [ExtractNumber(row[index], data_type) for index, data_type in columns.items()]
+
+    def Column():
+        for index, data_type in columns.items():
+            ExtractNumbers([row[index] for row in rows_data], data_type)
+
+    def Rows():
+        for _ in ExtractNumberColumns([list(row) for row in rows_data], columns):
+            pass
+
+    return {
+        'zenhan_re': _Measure(Reference, iterations),
+        'extract_number': _Measure(Single, iterations),
+        'extract_numbers': _Measure(Column, iterations),
+        'extract_number_columns': _Measure(Rows, iterations),
+    }
@@ -0,0 +1,159 @@
+from django.db import connection
+from django.test import RequestFactory
+from sfa.views import (
+    CustomerInfoFilterView,
+    CustomerInfoGroupFilterView,
+    CustomerInfoAllFilterView,
+    CustomerInfoCheckDuplicateView,
+    VisitTargetFilterView,
+    CallHistoryFilterView,
+    GetContactInfoCountView,
+)
+import datetime
+import json
+import re
+
+# 実行計画ごとに確認する性質
+#  no_seq_scan: 全件走査してはいけないテーブル
+#  limit_sort: 並べ替える行数を1ワークスペース分以下に抑えるべきもの（他のワークスペースの行まで並べ替えない）
+# 地図画面は一覧画面と同じクエリセットを用いる
+CUSTOMER_TABLE = ('sfa_customerinfo', )
+PLAN_EXPECTATIONS = {
+    'customer_list_user': {'no_seq_scan': CUSTOMER_TABLE, 'limit_sort': True},
+    'customer_list_user_count': {'no_seq_scan': CUSTOMER_TABLE},
+    'customer_list_group': {'no_seq_scan': CUSTOMER_TABLE, 'limit_sort': True},
+    'customer_list_group_count': {'no_seq_scan': CUSTOMER_TABLE},
+    'customer_list_all': {'no_seq_scan': CUSTOMER_TABLE, 'limit_sort': True},
+    'customer_list_all_count': {'no_seq_scan': CUSTOMER_TABLE},
+    'customer_list_duplicate': {'no_seq_scan': CUSTOMER_TABLE, 'limit_sort': True},
+    'visit_target_filter': {'no_seq_scan': CUSTOMER_TABLE, 'limit_sort': True},
+    'call_history_filter': {'no_seq_scan': CUSTOMER_TABLE, 'limit_sort': True},
+    'outbound_count': {'no_seq_scan': CUSTOMER_TABLE},
+    'visit_plan_count': {'no_seq_scan': CUSTOMER_TABLE},
+    'visit_count': {'no_seq_scan': CUSTOMER_TABLE},
+}
+
+# 月次パーティションは月が変わると名前が変わるため、まとめて扱う
+_PARTITION_RE = re.compile(r'_p\d{6}\b')
+
+
+def _BuildView(view_class, user, params=None):
+    request = RequestFactory().get('/', params or {})
+    request.user = user
+    view = view_class()
+    view.request = request
+    view.args = ()
+    view.kwargs = {}
+    return view
+
+
+def GetPlanQuerysets(user, phone_number):
+    """
+    実行計画を確認する一覧・件数・重複チェックのクエリセットを、各画面と同じ条件で作成する
+    param: user。画面を表示するユーザー
+    param: phone_number。重複チェックに用いる電話番号
+    return: 名前をキーにしたクエリセットの辞書。一覧は1ページ分。名前が_countで終わるものは件数を数える
+    """
+    today = datetime.date.today()
+    querysets = {}
+    for name, view_class in (('customer_list_user', CustomerInfoFilterView),
+                             ('customer_list_group', CustomerInfoGroupFilterView),
+                             ('customer_list_all', CustomerInfoAllFilterView)):
+        view = _BuildView(view_class, user)
+        queryset = view.get_queryset()
+        querysets[name] = queryset[:view.paginate_by]
+        querysets[name + '_count'] = queryset
+    view = _BuildView(CustomerInfoCheckDuplicateView, user, {'phone_number': phone_number})
+    querysets['customer_list_duplicate'] = view.get_queryset()[:view.paginate_by]
+    view = _BuildView(VisitTargetFilterView, user)
+    querysets['visit_target_filter'] = view.get_queryset().filter(
+        contact_type=0, visit_date_plan=today)[:view.paginate_by]
+    view = _BuildView(CallHistoryFilterView, user, {'contact_date': today.isoformat()})
+    querysets['call_history_filter'] = view.get_queryset().filter(
+        contact_type=2)[:view.paginate_by]
+    view = _BuildView(GetContactInfoCountView, user, {
+        'contact_timestamp_gte': today.isoformat() + ' 00:00:00',
+        'contact_timestamp_lte': today.isoformat() + ' 23:59:59',
+    })
+    querysets.update(view.get_count_querysets())
+    return querysets
+
+
+def CaptureSql(func):
+    """
+    関数を実行し、最初に発行されたSQLとパラメータを返す
+    """
+    captured = []
+
+    def wrapper(execute, sql, params, many, context):
+        captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        func()
+    return captured[0]
+
+
+def ExplainQueryset(queryset, count=False):
+    """
+    クエリセットの実行計画をEXPLAIN (FORMAT JSON)で取得する（PostgreSQLのみ）
+    画面と同じSQLになるよう、実際に評価（件数の場合はcount()）したときのSQLを用いる
+    param: count。Trueの場合は件数を数えるSQLの実行計画を取得する
+    return: 最上位の計画ノード（辞書）
+    """
+    sql, params = CaptureSql(queryset.count if count else lambda: list(queryset))
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def IterPlanNodes(node, depth=0):
+    """
+    計画ノードを深さ優先でたどる
+    return: (深さ, ノード)のイテレータ
+    """
+    yield depth, node
+    for child in node.get('Plans', []):
+        yield from IterPlanNodes(child, depth + 1)
+
+
+def SummarizePlan(node):
+    """
+    実行計画から、見積もり値を除いたノードの種類・テーブル・索引・並べ替えキーだけを残したテキストを作成する。
+    データ量による揺れを含まないため、スナップショットとの比較に用いる。
+    """
+    lines = []
+    for depth, child in IterPlanNodes(node):
+        line = child['Node Type']
+        if 'Relation Name' in child:
+            line += ' on ' + _PARTITION_RE.sub('_p*', child['Relation Name'])
+        if 'Index Name' in child:
+            line += ' using ' + _PARTITION_RE.sub('_p*', child['Index Name'])
+        if 'Sort Key' in child:
+            line += ' [' + ', '.join(child['Sort Key']) + ']'
+        line = '  ' * depth + line
+        # 同じ形のパーティションの走査はまとめる
+        if not lines or lines[-1] != line:
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def CheckPlan(node, no_seq_scan=(), max_sort_rows=None):
+    """
+    実行計画が満たすべき性質を確認する
+    return: 違反内容を表す文字列のリスト
+    """
+    violations = []
+    for _, child in IterPlanNodes(node):
+        relation = _PARTITION_RE.sub('', child.get('Relation Name', ''))
+        if child['Node Type'] == 'Seq Scan' and relation in no_seq_scan:
+            violations.append('{}を全件走査しています'.format(relation))
+        if child['Node Type'] == 'Sort' and max_sort_rows is not None:
+            rows = max([grandchild.get('Plan Rows', 0) for grandchild in child.get('Plans', [])] or [0])
+            if rows > max_sort_rows:
+                violations.append('{}行を並べ替えています（上限{}行）: {}'.format(
+                    rows, max_sort_rows, ', '.join(child.get('Sort Key', []))))
+    return violations
@@ -0,0 +1,179 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .generator import GenerateCustomerInfoCsv, GenerateAddressInfoCsv
+import datetime
+import json
+import math
+import time
+
+# バックエンドの統計情報が統計情報コレクタへ送られる間隔（PostgreSQLのPGSTAT_STAT_INTERVALは500ミリ秒）
+STATS_FLUSH_WAIT = 0.6
+
+
+def GetBenchmarks(dataset, import_rows=100):
+    """
+    計測対象の画面の一覧を返す
+    param: dataset。GenerateWorkspaceの戻り値
+    param: import_rows。CSVインポートで取り込む行数
+    return: (名前, HTTPメソッド, URL, パラメータを返す関数)のリスト
+    """
+    today = datetime.date.today().strftime('%Y-%m-%d')
+    customer_csv = GenerateCustomerInfoCsv(import_rows)
+    address_csv = GenerateAddressInfoCsv(import_rows)
+    return [
+        ('customer_list_user', 'get', reverse('customer_list_user'), dict),
+        ('customer_list_group', 'get', reverse('customer_list_group'), dict),
+        ('customer_list_all', 'get', reverse('customer_list_all'), dict),
+        ('customer_list_user_map', 'get', reverse('customer_list_user_map'), dict),
+        ('customer_list_group_map', 'get', reverse('customer_list_group_map'), dict),
+        ('customer_list_all_map', 'get', reverse('customer_list_all_map'), dict),
+        ('customer_list_duplicate', 'get', reverse('customer_list_duplicate'),
+         lambda: {'phone_number': dataset['phone_numbers'][0]}),
+        ('customer_info_import', 'post', reverse('customer_info_import'),
+         lambda: {
+             'potential': '1',
+             'public_status': '0',
+             'file': SimpleUploadedFile('customer.csv', customer_csv),
+         }),
+        ('address_info_import', 'post', reverse('address_info_import'),
+         lambda: {'file': SimpleUploadedFile('address.csv', address_csv)}),
+        ('get_contactinfo_count', 'get', reverse('get_contactinfo_count'),
+         lambda: {
+             'contact_timestamp_gte': today + ' 0:00:00',
+             'contact_timestamp_lte': today + ' 23:59:59',
+         }),
+        ('visit_target_filter', 'get', reverse('visit_target_filter'),
+         lambda: {'visit_date': today}),
+    ]
+
+
+def Percentile(values, percent):
+    """
+    最近傍順位法でパーセンタイル値を返す
+    """
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def ReadBufferStats():
+    """
+    pg_statio_user_tablesから、テーブルとインデックスの共有バッファのヒット数と読み込み数の合計を返す
+    統計情報は一定間隔でしか送られないため、待ってから空のクエリで送らせ、スナップショットを捨ててから読む
+    同じデータベースへの他の接続の読み込みも含まれるため、計測中は他の処理を止めておく
+    return: (ヒット数, 読み込み数)のタプル。PostgreSQL以外ではNone
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    time.sleep(STATS_FLUSH_WAIT)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    time.sleep(STATS_FLUSH_WAIT)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_stat_clear_snapshot()')
+        cursor.execute(
+            'SELECT COALESCE(SUM(heap_blks_hit), 0) + COALESCE(SUM(idx_blks_hit), 0), '
+            'COALESCE(SUM(heap_blks_read), 0) + COALESCE(SUM(idx_blks_read), 0) '
+            'FROM pg_statio_user_tables')
+        hit, read = cursor.fetchone()
+    return int(hit), int(read)
+
+
+def CacheHitRate(before, after):
+    """
+    ReadBufferStatsの前後の値から、共有バッファのヒット率（%）を返す
+    return: 計測できない場合（PostgreSQL以外、読み込みがない場合）はNone
+    """
+    if before is None or after is None:
+        return None
+    hit = after[0] - before[0]
+    read = after[1] - before[1]
+    if hit + read <= 0:
+        return None
+    return round(hit / (hit + read) * 100, 2)
+
+
+def RunBenchmarks(dataset, iterations=20, warmup=2, import_rows=100):
+    """
+    各画面を繰り返し呼び出し、応答時間とクエリ数を計測する。
+    データを変更する画面でも毎回同じ条件で計測できるよう、1回ごとにロールバックする。
+    param: dataset。GenerateWorkspaceの戻り値
+    param: iterations。計測回数
+    param: warmup。計測前に捨てる呼び出し回数
+    return: 名前をキーにした、p50・p95（ミリ秒）・クエリ数・共有バッファのヒット率（%）の辞書
+    """
+    client = Client()
+    client.force_login(dataset['users'][0])
+    results = {}
+    for name, method, url, params in GetBenchmarks(dataset, import_rows):
+        timings = []
+        queries = []
+        status_code = None
+        buffer_stats = None
+        for i in range(warmup + iterations):
+            if i == warmup:
+                # ウォームアップ後の計測分だけのヒット率を求める
+                buffer_stats = ReadBufferStats()
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(url, params())
+                    elapsed = (time.perf_counter() - started) * 1000
+                transaction.set_rollback(True)
+            status_code = response.status_code
+            if i >= warmup:
+                timings.append(elapsed)
+                queries.append(len(captured))
+        results[name] = {
+            'p50_ms': round(Percentile(timings, 50), 2),
+            'p95_ms': round(Percentile(timings, 95), 2),
+            'queries': max(queries),
+            'cache_hit_pct': CacheHitRate(buffer_stats, ReadBufferStats()),
+            'status_code': status_code,
+        }
+    return results
+
+
+def CompareWithBaseline(results, baseline, tolerance=0.5):
+    """
+    計測結果を基準値と比較し、悪化した項目を返す。
+    クエリ数は1件でも増えたら、p95は基準値の(1 + tolerance)倍を超えたら悪化とみなす。
+    return: 悪化内容を表す文字列のリスト
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append('{}: クエリ数 {} → {}'.format(
+                name, base['queries'], result['queries']))
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append('{}: p95 {}ms → {}ms'.format(
+                name, base['p95_ms'], result['p95_ms']))
+    return regressions
+
+
+def LoadBaseline(path):
+    """
+    基準値のJSONファイルを読み込む。存在しない場合は空の辞書を返す
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['results']
+    except FileNotFoundError:
+        return {}
+
+
+def SaveBaseline(path, results, settings):
+    """
+    計測結果を基準値としてJSONファイルに保存する
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'settings': settings,
+            'results': results
+        }, f, ensure_ascii=False, indent=2, sort_keys=True)
@@ -1,11 +1,45 @@
 from decimal import Decimal
-from django.db.models import Q
-from .models import CustomerInfo
+from django.core import serializers
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from .models import CustomerInfo, CustomerInfoSupplement, ContactInfo, AddressInfo, PipelineSnapshot, ActionStatusTransition, ArchivedRecord, ACTION_CHOICES
 
+import datetime
 import re
+import unicodedata
 import zenhan
 
 
+# ExtractNumberの種別ごとに取り除く記号。例：1=電話番号用、2=郵便番号用、3=法人番号用
+EXTRACT_NUMBER_REMOVED_CHARS = {
+    1: '()-（）−',
+    2: '-−',
+    3: '',
+}
+
+
+def _BuildExtractNumberTables():
+    """
+    ExtractNumberで使う、種別ごとのstr.translate用の変換表を作る。
+    zenhanの全角→半角変換表に、記号の削除を合成しておく。
+    return: 種別をキーにした変換表の辞書
+    """
+    zen2han = zenhan.converter._make_zen2han_dict(zenhan.ALL)
+    tables = {}
+    for data_type, removed in EXTRACT_NUMBER_REMOVED_CHARS.items():
+        table = {}
+        for char in set(zen2han) | set(removed):
+            # 変換後の文字が取り除く記号になる場合も削除する（例：全角ハイフン）
+            converted = ''.join(c for c in zen2han.get(char, char) if c not in removed)
+            if converted != char:
+                table[ord(char)] = converted
+        tables[data_type] = table
+    return tables
+
+
+_EXTRACT_NUMBER_TABLES = _BuildExtractNumberTables()
+
+
 def ExtractNumber(org_str, data_type):
     """
     引数で渡された文字列を半角に変換し、数字のみを抽出して返す。
@@ -13,19 +47,142 @@ def ExtractNumber(org_str, data_type):
     param: data_type。例：1=電話番号用、2=郵便番号用、3=法人番号用
     return: org_strから数字のみを抽出した文字列。例：'0120123456'
     """
-    # 全角→半角変換
-    han_org_str = zenhan.z2h(org_str)
-    if data_type == 1:  # 電話番号用
-        # カッコとハイフン以外を抽出
-        filterd_str = re.findall(r'[^\(\)\-（）−]+', han_org_str)
-    elif data_type == 2:  # 郵便番号用
-        # ハイフン以外を抽出
-        filterd_str = re.findall(r'[^\-−]+', han_org_str)
-    elif data_type == 3:  # 法人番号用
-        # 法人番号は数字のみなので正規表現の抽出は行わない
-        filterd_str = han_org_str
-    # filterd_strは配列なので結合した文字列を返す
-    return ''.join(filterd_str)
+    # 全角→半角変換と記号の削除を、変換表で一度に行う
+    return org_str.translate(_EXTRACT_NUMBER_TABLES[data_type])
+
+
+def ExtractNumbers(values, data_type):
+    """
+    CSVの列など、複数の文字列をまとめてExtractNumberで変換する。
+    param: values。文字列のイテラブル
+    param: data_type。ExtractNumberと同じ
+    return: 変換後の文字列のリスト
+    """
+    table = _EXTRACT_NUMBER_TABLES[data_type]
+    return [value.translate(table) for value in values]
+
+
+def ExtractNumberColumns(rows, columns):
+    """
+    CSVの各行のうち、指定した列をExtractNumberで変換しながら返す。
+    列数が足りない行は、足りない列を変換せずにそのまま返す。
+    param: rows。csv.readerなど、行（文字列のリスト）のイテラブル
+    param: columns。列の位置をキー、ExtractNumberの種別を値にした辞書。例：{6: 1, 13: 2}
+    return: 変換後の行のジェネレーター
+    """
+    tables = [(index, _EXTRACT_NUMBER_TABLES[data_type]) for index, data_type in columns.items()]
+    for row in rows:
+        length = len(row)
+        for index, table in tables:
+            if index < length:
+                row[index] = row[index].translate(table)
+        yield row
+
+
+PREFECTURES = (
+    '北海道', '青森県', '岩手県', '宮城県', '秋田県', '山形県', '福島県', '茨城県', '栃木県', '群馬県',
+    '埼玉県', '千葉県', '東京都', '神奈川県', '新潟県', '富山県', '石川県', '福井県', '山梨県', '長野県',
+    '岐阜県', '静岡県', '愛知県', '三重県', '滋賀県', '京都府', '大阪府', '兵庫県', '奈良県', '和歌山県',
+    '鳥取県', '島根県', '岡山県', '広島県', '山口県', '徳島県', '香川県', '愛媛県', '高知県', '福岡県',
+    '佐賀県', '長崎県', '熊本県', '大分県', '宮崎県', '鹿児島県', '沖縄県')
+# 正規化した住所の最大の長さ（CustomerInfo.normalized_addressの長さ）
+NORMALIZED_ADDRESS_LENGTH = 100
+
+
+def _BuildAddressTable():
+    """
+    住所の正規化に用いる変換表を作成する
+    全角英数字・記号と半角カナはNFKCと同じ文字に、ハイフンに似た記号はハイフンにし、空白は取り除く
+    """
+    table = {}
+    for code in range(0xFF01, 0xFFEF):
+        normalized = unicodedata.normalize('NFKC', chr(code))
+        if len(normalized) == 1:
+            table[code] = normalized
+    for dash in '‐‑‒–—―−－':
+        table[ord(dash)] = '-'
+    for space in ' \t\r\n\u3000':
+        table[ord(space)] = None
+    return str.maketrans(table)
+
+
+_ADDRESS_TABLE = _BuildAddressTable()
+_PREFECTURE_RE = re.compile('^(?:{})'.format('|'.join(PREFECTURES)))
+_KANJI_DIGITS = {'〇': 0, '一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_KANJI_UNITS = {'十': 10, '百': 100, '千': 1000}
+# 丁目・番地・番・号の前の漢数字（一番町などの町名は除く）
+_KANJI_NUMBER_RE = re.compile(r'[〇一二三四五六七八九十百千]+(?=丁目|番地|番(?!町)|号)')
+# 数字の間の長音記号、丁目・番地・番・の（ハイフンにする）
+_ADDRESS_SEPARATOR_RE = re.compile(r'(?<=\d)(?:[ｰー]|丁目|番地|番(?!町)|の)(?=\d)')
+# 末尾の丁目・番地・番・号（取り除く）
+_ADDRESS_SUFFIX_RE = re.compile(r'(?<=\d)(?:丁目|番地|番(?!町)|号)(?!\d)')
+
+
+def _KanjiToNumber(match):
+    """
+    漢数字を算用数字にする。例：'十二' → '12'、'二〇' → '20'
+    """
+    text = match.group(0)
+    if not any(char in _KANJI_UNITS for char in text):
+        return ''.join(str(_KANJI_DIGITS[char]) for char in text)
+    total = 0
+    current = 0
+    for char in text:
+        if char in _KANJI_UNITS:
+            total += (current or 1) * _KANJI_UNITS[char]
+            current = 0
+        else:
+            current = current * 10 + _KANJI_DIGITS[char]
+    return str(total + current)
+
+
+def NormalizeAddressText(address):
+    """
+    住所の表記ゆれをなくす。全角半角・空白・ハイフンの違いをなくし、丁目・番地・番・号を漢数字も含めてハイフン区切りにする
+    例：'丸の内一丁目１番１号' → '丸の内1-1-1'
+    """
+    address = (address or '').translate(_ADDRESS_TABLE)
+    # 変換する文字を含まない住所は正規表現を使わない
+    if '丁目' in address or '番' in address or '号' in address:
+        address = _KANJI_NUMBER_RE.sub(_KanjiToNumber, address)
+        address = _ADDRESS_SUFFIX_RE.sub('', _ADDRESS_SEPARATOR_RE.sub('-', address))
+    elif 'の' in address or 'ー' in address or 'ｰ' in address:
+        address = _ADDRESS_SEPARATOR_RE.sub('-', address)
+    return address
+
+
+def SplitPrefecture(address):
+    """
+    住所の先頭の都道府県を切り出す
+    return: (都道府県, 残りの住所)。都道府県がない場合は('', 住所)
+    """
+    match = _PREFECTURE_RE.match(address)
+    if match:
+        return match.group(0), address[match.end():]
+    return '', address
+
+
+def NormalizeJapaneseAddress(address1, address2):
+    """
+    都道府県と市区町村番地から、表記ゆれをなくした住所を作成する。顧客情報のnormalized_addressに保存する
+    市区町村番地に都道府県が含まれている場合も、都道府県は1つにする
+    例：('東京都', '千代田区丸の内一丁目1番1号') → '東京都千代田区丸の内1-1-1'
+    """
+    prefecture = NormalizeAddressText(address1)
+    rest = NormalizeAddressText(address2)
+    if rest.startswith(prefecture):
+        prefecture = ''
+    return (prefecture + rest)[:NORMALIZED_ADDRESS_LENGTH]
+
+
+def NormalizeJapaneseAddresses(rows):
+    """
+    NormalizeJapaneseAddressをまとめて行う。CSVの列など、大量の住所を正規化する場合に用いる
+    param: rows。(都道府県, 市区町村番地)のリスト
+    return: 正規化した住所のリスト
+    """
+    normalize = NormalizeJapaneseAddress
+    return [normalize(address1, address2) for address1, address2 in rows]
 
 
 def DecimalDefaultProc(obj):
@@ -46,12 +203,492 @@ def CheckDuplicatePhoneNumber(phone_number, user):
     return CustomerInfo.objects.filter(
         Q(tel_number1=phone_number) | Q(tel_number2=phone_number)
         | Q(tel_number3=phone_number)).filter(
-            workspace=user.workspace, delete_flg='False').filter(
-                Q(public_status='1')
-                | Q(public_status='2')
+            workspace=user.workspace, delete_flg=False).filter(
+                Q(public_status=1)
+                | Q(public_status=2)
                 | Q(author=user.email)
                 | Q(shared_edit_user=user)
                 | Q(shared_view_user=user)
                 | Q(shared_edit_group__in=user.my_group.all())
                 | Q(shared_view_group__in=user.my_group.all())).distinct(
                 ).count()
+
+
+def TakePipelineSnapshot(snapshot_date):
+    """
+    顧客情報の対応状況ごとの件数とポテンシャル合計を集計し、スナップショットとして保存する。
+    ワークスペース全体と営業担当者ごとの集計を1回のINSERT ... SELECTで書き込む。
+    同じ集計日のスナップショットが既にある場合は置き換える。
+    param: snapshot_date。集計日
+    return: 書き込んだ行数
+    """
+    qn = connection.ops.quote_name
+    customer_table = qn(CustomerInfo._meta.db_table)
+    snapshot_table = qn(PipelineSnapshot._meta.db_table)
+    sql = """
+        INSERT INTO {snapshot_table}
+            (snapshot_date, workspace_id, sales_person_id, action_status,
+             customer_count, potential_sum)
+        SELECT %s, s.workspace_id, s.sales_person_id, s.action_status,
+               s.customer_count, s.potential_sum
+        FROM (
+            SELECT workspace_id, NULL AS sales_person_id, action_status,
+                   COUNT(*) AS customer_count,
+                   COALESCE(SUM(potential), 0) AS potential_sum
+            FROM {customer_table}
+            WHERE delete_flg = %s AND workspace_id IS NOT NULL
+            GROUP BY workspace_id, action_status
+            UNION ALL
+            SELECT workspace_id, sales_person_id, action_status,
+                   COUNT(*) AS customer_count,
+                   COALESCE(SUM(potential), 0) AS potential_sum
+            FROM {customer_table}
+            WHERE delete_flg = %s AND workspace_id IS NOT NULL
+              AND sales_person_id IS NOT NULL
+            GROUP BY workspace_id, sales_person_id, action_status
+        ) s
+    """.format(
+        snapshot_table=snapshot_table, customer_table=customer_table)
+
+    with transaction.atomic():
+        PipelineSnapshot.objects.filter(snapshot_date=snapshot_date).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [snapshot_date, False, False])
+            return cursor.rowcount
+
+
+def BuildActionStatusTransition(customerinfo, from_status, user):
+    """
+    対応状況の変更履歴を生成する。保存は呼び出し側でbulk_createを用いてまとめて行う。
+    param: customerinfo。変更後の顧客情報
+    param: from_status。変更前の対応状況。新規作成の場合はNone
+    param: user。変更を行ったユーザー
+    return: 未保存の変更履歴。対応状況が変わっていない場合はNone
+    """
+    if from_status == customerinfo.action_status:
+        return None
+    return ActionStatusTransition(
+        workspace_id=customerinfo.workspace_id,
+        customer_id=customerinfo.pk,
+        from_status=from_status,
+        to_status=customerinfo.action_status,
+        changed_by=user,
+    )
+
+
+def GetActionStatusFunnel(workspace, date_from, date_to):
+    """
+    指定期間内に各対応状況へ到達した顧客数と、直前の段階からの移行率を返す。
+    return: 対応状況の順に並んだ辞書のリスト
+    """
+    reached = dict(
+        ActionStatusTransition.objects.filter(
+            workspace=workspace,
+            changed_timestamp__gte=date_from,
+            changed_timestamp__lt=date_to).values('to_status').annotate(
+                customer_count=Count('customer', distinct=True)).values_list(
+                    'to_status', 'customer_count'))
+
+    funnel = []
+    previous_count = None
+    for status, label in ACTION_CHOICES:
+        customer_count = reached.get(status, 0)
+        if previous_count:
+            conversion_rate = round(customer_count * 100 / previous_count, 1)
+        else:
+            conversion_rate = None
+        funnel.append({
+            'action_status': status,
+            'label': label,
+            'customer_count': customer_count,
+            'conversion_rate': conversion_rate,
+        })
+        previous_count = customer_count
+    return funnel
+
+
+def GetActionStatusDuration(workspace, date_from, date_to):
+    """
+    指定期間内に各対応状況へ変更された顧客が、次に対応状況が変わるまでの平均日数を返す。
+    次の変更はウィンドウ関数(LEAD)で求め、集計はデータベース側で行う。
+    return: 対応状況の順に並んだ辞書のリスト
+    """
+    if connection.vendor == 'postgresql':
+        duration_sql = 'EXTRACT(EPOCH FROM (next_timestamp - changed_timestamp))'
+    elif connection.vendor == 'mysql':
+        duration_sql = 'TIMESTAMPDIFF(SECOND, changed_timestamp, next_timestamp)'
+    else:
+        duration_sql = '(JULIANDAY(next_timestamp) - JULIANDAY(changed_timestamp)) * 86400'
+
+    sql = """
+        SELECT to_status, COUNT(*), AVG({duration_sql})
+        FROM (
+            SELECT to_status, changed_timestamp,
+                   LEAD(changed_timestamp) OVER (
+                       PARTITION BY customer_id
+                       ORDER BY changed_timestamp, id) AS next_timestamp
+            FROM {transition_table}
+            WHERE workspace_id = %s AND changed_timestamp >= %s
+        ) t
+        WHERE next_timestamp IS NOT NULL AND changed_timestamp < %s
+        GROUP BY to_status
+    """.format(
+        duration_sql=duration_sql,
+        transition_table=connection.ops.quote_name(
+            ActionStatusTransition._meta.db_table))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [workspace.pk, date_from, date_to])
+        rows = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    durations = []
+    for status, label in ACTION_CHOICES:
+        transition_count, average_seconds = rows.get(status, (0, None))
+        durations.append({
+            'action_status': status,
+            'label': label,
+            'transition_count': transition_count,
+            'average_days': None if average_seconds is None else round(
+                float(average_seconds) / 86400, 1),
+        })
+    return durations
+
+
+def GetEditableCustomerInfo(user):
+    """
+    指定されたユーザーが編集可能な顧客情報をクエリセットで返す。
+    CustomerInfo.is_editableと同じ条件を、1件ずつではなくまとめて判定するためのもの。
+     AND条件
+     ・削除フラグが立っていない
+     ・同一ワークスペース
+     OR条件
+     ・ワークスペースの公開ステータスが編集可能
+     ・作成者が自分
+     ・編集可能ユーザーが自分
+     ・編集可能グループが自分が所属するグループと一致
+    """
+    return CustomerInfo.objects.filter(
+        workspace=user.workspace, delete_flg=False).filter(
+            Q(public_status=2)
+            | Q(author=user.email)
+            | Q(shared_edit_user=user)
+            | Q(shared_edit_group__in=user.my_group.all()))
+
+
+def GetViewableCustomerInfo(user):
+    """
+    指定されたユーザーが閲覧可能な顧客情報をクエリセットで返す。
+    詳細画面や重複電話番号のチェックと同じ条件
+     AND条件
+     ・削除フラグが立っていない
+     ・同一ワークスペース
+     OR条件
+     ・ワークスペースの公開ステータスが閲覧可能
+     ・ワークスペースの公開ステータスが編集可能
+     ・作成者が自分
+     ・編集可能ユーザーが自分
+     ・参照可能ユーザーが自分
+     ・編集可能グループが自分が所属するグループと一致
+     ・参照可能グループが自分が所属するグループと一致
+    """
+    return CustomerInfo.objects.filter(
+        workspace=user.workspace, delete_flg=False).filter(
+            Q(public_status=1)
+            | Q(public_status=2)
+            | Q(author=user.email)
+            | Q(shared_edit_user=user)
+            | Q(shared_view_user=user)
+            | Q(shared_edit_group__in=user.my_group.all())
+            | Q(shared_view_group__in=user.my_group.all())).distinct()
+
+
+def GetEditableCustomerPks(user, pks):
+    """
+    指定された顧客情報のうち、ユーザーが編集可能なもののpkを集合で返す。
+    一覧画面で1行ずつ編集可否を判定するとクエリが行数分発行されるため、1回のクエリでまとめて判定する。
+    param: user。判定対象のユーザー
+    param: pks。判定する顧客情報のpkのリスト（1ページ分）
+    """
+    pks = [pk for pk in pks if pk is not None]
+    if not pks:
+        return set()
+    return set(
+        GetEditableCustomerInfo(user).filter(pk__in=pks).values_list(
+            'pk', flat=True))
+
+
+def BulkUpdateCustomerInfo(queryset, user, action, shared_group=None):
+    """
+    顧客情報を一括更新する。1件ずつ保存せず、まとめてUPDATEまたはINSERTを発行する。
+    更新されるのは、querysetのうちユーザーが編集可能な顧客情報のみ。
+    param: queryset。更新候補の顧客情報（チェックされた顧客、または検索条件に一致する顧客）
+    param: user。更新を行うユーザー
+    param: action。'0'～'3'=対応状況の変更、'10'=営業担当者を自分に設定、
+                   '20'=グループと共有（編集可能）、'21'=グループと共有（閲覧可能）、'99'=削除
+    param: shared_group。共有先のグループ（actionが'20'、'21'の場合のみ）
+    return: 更新した顧客情報の件数
+    """
+    targets = GetEditableCustomerInfo(user).filter(
+        pk__in=queryset.values('pk'))
+    now = datetime.datetime.now()
+
+    with transaction.atomic():
+        if action in ('0', '1', '2', '3'):
+            # 対応状況が変わる顧客のみ更新し、変更履歴をまとめて記録する
+            action_status = int(action)
+            changed = targets.exclude(action_status=action_status)
+            ActionStatusTransition.objects.bulk_create([
+                ActionStatusTransition(
+                    workspace_id=user.workspace_id,
+                    customer_id=pk,
+                    from_status=from_status,
+                    to_status=action_status,
+                    changed_by=user,
+                ) for pk, from_status in changed.values_list(
+                    'pk', 'action_status').distinct()
+            ])
+            return changed.update(
+                action_status=action_status, modified_timestamp=now)
+        elif action == '10':
+            return targets.update(sales_person=user, modified_timestamp=now)
+        elif action in ('20', '21') and shared_group:
+            # 中間テーブルに未登録の顧客だけをまとめて追加する
+            field_name = 'shared_edit_group' if action == '20' else 'shared_view_group'
+            through = getattr(CustomerInfo, field_name).through
+            rows = [
+                through(customerinfo_id=pk, mygroup_id=shared_group.pk)
+                for pk in targets.exclude(**{
+                    field_name: shared_group
+                }).values_list('pk', flat=True).distinct()
+            ]
+            through.objects.bulk_create(rows, batch_size=1000)
+            return len(rows)
+        elif action == '99':
+            return targets.update(
+                delete_flg=True, deleted_timestamp=now, modified_timestamp=now)
+    return 0
+
+
+def ArchiveDeletedCustomerInfo(cutoff, batch_size=500):
+    """
+    削除日時がcutoffより前の顧客情報を1バッチ分アーカイブへ移す。
+    補足情報・コンタクト情報・対応状況の変更履歴も同じpayloadにまとめて退避し、元の行は削除する。
+    バッチごとにコミットするため、中断しても再実行すれば続きから処理される。
+    param: cutoff。この日時より前に削除された顧客情報が対象
+    param: batch_size。1回のトランザクションで処理する件数
+    return: アーカイブした顧客情報の件数
+    """
+    with transaction.atomic():
+        customers = list(
+            CustomerInfo.objects.select_for_update().filter(
+                delete_flg=True, deleted_timestamp__lt=cutoff).order_by('pk')
+            [:batch_size])
+        if not customers:
+            return 0
+        pks = [customer.pk for customer in customers]
+
+        related = {pk: [] for pk in pks}
+        for supplement in CustomerInfoSupplement.objects.filter(
+                customer_id__in=pks):
+            related[supplement.customer_id].append(supplement)
+        for contactinfo in ContactInfo.objects.filter(
+                target_customer_id__in=pks).order_by('pk'):
+            related[contactinfo.target_customer_id].append(contactinfo)
+        for transition in ActionStatusTransition.objects.filter(
+                customer_id__in=pks).order_by('pk'):
+            related[transition.customer_id].append(transition)
+
+        ArchivedRecord.objects.bulk_create([
+            ArchivedRecord(
+                workspace_id=customer.workspace_id,
+                model_name='customerinfo',
+                original_id=customer.pk,
+                label=customer.customer_name,
+                payload=serializers.serialize(
+                    'json', [customer] + related[customer.pk]),
+                deleted_timestamp=customer.deleted_timestamp,
+            ) for customer in customers
+        ])
+
+        # 外部キーの参照元から順に削除する
+        # （重複候補の処理は正規化の関数を使うため、循環参照にならないようここでimportする）
+        from .dedup import RemoveDuplicateEntries
+        RemoveDuplicateEntries(pks)
+        # 関連付けた連絡先情報は残し、関連付けだけを外す
+        AddressInfo.objects.filter(related_customer_id__in=pks).update(
+            related_customer=None, related_flg=False, related_reasons='')
+        ActionStatusTransition.objects.filter(customer_id__in=pks).delete()
+        ContactInfo.objects.filter(target_customer_id__in=pks).delete()
+        CustomerInfo.objects.filter(pk__in=pks).delete()
+    return len(customers)
+
+
+def ArchiveDeletedContactInfo(cutoff, batch_size=500):
+    """
+    削除日時がcutoffより前のコンタクト情報を1バッチ分アーカイブへ移す。
+    param: cutoff。この日時より前に削除されたコンタクト情報が対象
+    param: batch_size。1回のトランザクションで処理する件数
+    return: アーカイブしたコンタクト情報の件数
+    """
+    with transaction.atomic():
+        contacts = list(
+            ContactInfo.objects.select_for_update(of=('self', )).filter(
+                delete_flg=True, deleted_timestamp__lt=cutoff).select_related(
+                    'target_customer').order_by('pk')[:batch_size])
+        if not contacts:
+            return 0
+
+        ArchivedRecord.objects.bulk_create([
+            ArchivedRecord(
+                workspace_id=contactinfo.target_customer.workspace_id,
+                model_name='contactinfo',
+                original_id=contactinfo.pk,
+                label=contactinfo.target_customer.customer_name,
+                payload=serializers.serialize('json', [contactinfo]),
+                deleted_timestamp=contactinfo.deleted_timestamp,
+            ) for contactinfo in contacts
+        ])
+        ContactInfo.objects.filter(
+            pk__in=[contactinfo.pk for contactinfo in contacts]).delete()
+    return len(contacts)
+
+
+def RestoreArchivedRecord(archived_record):
+    """
+    アーカイブ済みデータを元のテーブルへ戻し、削除フラグを解除する。
+    コンタクト情報の対象顧客がアーカイブされている場合は、先に顧客情報を復元する必要がある。
+    param: archived_record。復元するアーカイブ済みデータ
+    return: 復元した顧客情報またはコンタクト情報
+    raise: CustomerInfo.DoesNotExist。コンタクト情報の対象顧客が存在しない場合
+    """
+    with transaction.atomic():
+        restored = None
+        for deserialized in serializers.deserialize(
+                'json', archived_record.payload):
+            if restored is None:
+                # payloadの先頭が復元対象の本体
+                restored = deserialized.object
+                if isinstance(restored, ContactInfo) and not CustomerInfo.objects.filter(
+                        pk=restored.target_customer_id).exists():
+                    raise CustomerInfo.DoesNotExist
+            deserialized.save()
+        restored_fields = {'delete_flg': False, 'deleted_timestamp': None}
+        if isinstance(restored, CustomerInfo):
+            # 正規化した住所がない時期にアーカイブしたデータのため、作り直す
+            restored_fields['normalized_address'] = NormalizeJapaneseAddress(
+                restored.address1, restored.address2)
+        type(restored).objects.filter(pk=restored.pk).update(**restored_fields)
+        archived_record.delete()
+    return restored
+
+
+def IsContactInfoPartitioned():
+    """
+    コンタクト情報のテーブルが月次のレンジパーティションになっているかを返す。
+    PostgreSQL 11以降でマイグレーション0011を適用した場合のみTrueになる。
+    """
+    if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)',
+            [ContactInfo._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def _AddMonth(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def CreateContactInfoPartitions(months_ahead=3, base_date=None):
+    """
+    当月からmonths_ahead か月先までのコンタクト情報の月次パーティションを作成する。
+    既定パーティションに該当月のデータが入っている場合は、新しいパーティションへ移してから接続する。
+    param: months_ahead。当月から何か月先まで作成するか
+    param: base_date。当月の基準日。省略時は本日
+    return: 作成したパーティション名のリスト
+    """
+    if not IsContactInfoPartitioned():
+        return []
+    table = ContactInfo._meta.db_table
+    month = (base_date or datetime.date.today()).replace(day=1)
+    created = []
+    for _ in range(months_ahead + 1):
+        partition = '{}_p{}'.format(table, month.strftime('%Y%m'))
+        next_month = _AddMonth(month)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [partition])
+            if cursor.fetchone()[0] is None:
+                cursor.execute(
+                    'CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)'.
+                    format(partition=partition, table=table))
+                cursor.execute(
+                    'WITH moved AS (DELETE FROM {table}_default '
+                    'WHERE contact_timestamp >= %s AND contact_timestamp < %s RETURNING *) '
+                    'INSERT INTO {partition} SELECT * FROM moved'.format(
+                        partition=partition, table=table), [month, next_month])
+                cursor.execute(
+                    "ALTER TABLE {table} ATTACH PARTITION {partition} "
+                    "FOR VALUES FROM ('{start}') TO ('{end}')".format(
+                        table=table, partition=partition,
+                        start=month.isoformat(), end=next_month.isoformat()))
+                created.append(partition)
+        month = next_month
+    return created
+
+
+def DetachContactInfoPartitions(before, drop=False):
+    """
+    before の月より前のコンタクト情報の月次パーティションを切り離す。
+    切り離したテーブルは外部キーを外したうえで「_archived_」を含む名前へ改名し、
+    pg_dumpなどで退避してから削除できるようにする。dropがTrueの場合はそのまま削除する。
+    param: before。この月の1日より前のパーティションが対象
+    param: drop。切り離したテーブルを削除するかどうか
+    return: 切り離したパーティション名のリスト
+    """
+    if not IsContactInfoPartitioned():
+        return []
+    table = ContactInfo._meta.db_table
+    before = before.replace(day=1).strftime('%Y%m')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) AND c.relname ~ %s "
+            "ORDER BY c.relname", [table, '^{}_p[0-9]{{6}}$'.format(table)])
+        partitions = [
+            row[0] for row in cursor.fetchall() if row[0][-6:] < before
+        ]
+
+    for partition in partitions:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE {table} DETACH PARTITION {partition}'.
+                           format(table=table, partition=partition))
+            if drop:
+                cursor.execute('DROP TABLE {}'.format(partition))
+                continue
+            # 顧客情報のアーカイブや削除を妨げないよう、切り離したテーブルの外部キーは外す
+            cursor.execute(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+                [partition])
+            for (constraint, ) in cursor.fetchall():
+                cursor.execute('ALTER TABLE {} DROP CONSTRAINT {}'.format(
+                    partition, connection.ops.quote_name(constraint)))
+            cursor.execute('ALTER TABLE {} RENAME TO {}_archived_p{}'.format(
+                partition, table, partition[-6:]))
+    return partitions
+
+
+def GetContactTimestampRange(contact_timestamp_gte, contact_timestamp_lte):
+    """
+    画面から渡された対応日時の範囲（'YYYY-MM-DD HH:MM:SS'形式、両端を含む）を、
+    [開始, 終了) の半開区間のdatetimeに変換する。
+    定数の範囲で絞り込むことで、パーティション化したテーブルでは該当月のパーティションだけが検索される。
+    return: (開始日時, 終了日時)のタプル。終了日時は含まない
+    """
+    date_format = '%Y-%m-%d %H:%M:%S'
+    start = datetime.datetime.strptime(contact_timestamp_gte, date_format)
+    end = datetime.datetime.strptime(contact_timestamp_lte,
+                                     date_format) + datetime.timedelta(seconds=1)
+    return start, end
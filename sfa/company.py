@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .dedup import Batches
+from .models import CompanyRollup, ContactInfo, CustomerInfo
+import datetime
+
+# 会社単位のコンタクト履歴の1ページあたりの件数
+COMPANY_CONTACT_PAGE_SIZE = 30
+# コンタクト履歴の続きを取得するためのカーソル（最後に表示したコンタクト情報の対応日時とpk）の書式
+CONTACT_CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def _CorporateNumbers(workspace, pks):
+    """
+    顧客情報のpkから、法人番号の集合を返す（削除済みの顧客情報も含む）
+    """
+    numbers = set()
+    for batch in Batches(pks):
+        numbers.update(
+            CustomerInfo.objects.filter(workspace=workspace, pk__in=batch).exclude(
+                corporate_number='').values_list('corporate_number', flat=True).distinct())
+    return numbers
+
+
+def RefreshCompanyRollups(workspace, pks=None, corporate_numbers=None):
+    """
+    会社単位の集計を更新する。変更された顧客情報や法人番号を指定すれば、その会社の集計だけを作り直す
+    会社ごとに1件ずつではなく、法人番号でまとめて集計するため、会社の数によらず数回のクエリで済む
+    param: workspace。ワークスペース
+    param: pks。変更された顧客情報のpk（削除したものや、コンタクト情報を追加・削除した対象顧客を含む）
+    param: corporate_numbers。変更前の法人番号など、あわせて集計し直す法人番号
+    pksとcorporate_numbersの両方がNoneの場合は、ワークスペースのすべての会社を集計し直す
+    return: 集計した会社の数
+    """
+    if pks is None and corporate_numbers is None:
+        numbers = set(
+            CustomerInfo.objects.filter(workspace=workspace).exclude(
+                corporate_number='').values_list('corporate_number', flat=True).distinct())
+        numbers.update(
+            CompanyRollup.objects.filter(workspace=workspace).values_list(
+                'corporate_number', flat=True))
+    else:
+        numbers = _CorporateNumbers(workspace, pks or ())
+        numbers.update(number for number in corporate_numbers or () if number)
+
+    count = 0
+    with transaction.atomic():
+        for batch in Batches(numbers):
+            rollups = {
+                row['corporate_number']: CompanyRollup(workspace=workspace, **row)
+                for row in CustomerInfo.objects.filter(
+                    workspace=workspace, corporate_number__in=batch,
+                    delete_flg=False).order_by().values('corporate_number').annotate(
+                        company_name=Min('customer_name'),
+                        customer_count=Count('pk'),
+                        potential_sum=Sum('potential'),
+                        sales_person_count=Count('sales_person', distinct=True))
+            }
+            for number, contact_count, last_contact_timestamp in ContactInfo.objects.filter(
+                    target_customer__workspace=workspace,
+                    target_customer__corporate_number__in=batch,
+                    target_customer__delete_flg=False, delete_flg=False).order_by().values(
+                        'target_customer__corporate_number').annotate(
+                            Count('pk'), Max('contact_timestamp')).values_list(
+                                'target_customer__corporate_number', 'pk__count',
+                                'contact_timestamp__max'):
+                rollups[number].contact_count = contact_count
+                rollups[number].last_contact_timestamp = last_contact_timestamp
+
+            # 顧客情報がなくなった会社の集計も消えるよう、対象の法人番号の集計をまとめて入れ替える
+            CompanyRollup.objects.filter(workspace=workspace, corporate_number__in=batch).delete()
+            CompanyRollup.objects.bulk_create(rollups.values())
+            count += len(rollups)
+    return count
+
+
+def RefreshSalesPersonCounts(workspace):
+    """
+    会社単位の集計のうち、営業担当者の人数だけを1回のUPDATEで集計し直す
+    営業担当者だけを変更した場合（担当エリアの反映など）に、変更した顧客情報の件数によらず同じ回数のクエリで済む
+    return: 更新した集計の件数
+    """
+    counts = CustomerInfo.objects.filter(
+        workspace=OuterRef('workspace'), corporate_number=OuterRef('corporate_number'),
+        delete_flg=False).order_by().values('corporate_number').annotate(
+            count=Count('sales_person', distinct=True)).values('count')
+    return CompanyRollup.objects.filter(workspace=workspace).update(
+        sales_person_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+def EncodeContactCursor(contactinfo):
+    """
+    コンタクト履歴の続きを取得するためのカーソルを作る
+    """
+    return '{}-{}'.format(contactinfo.contact_timestamp.strftime(CONTACT_CURSOR_FORMAT),
+                          contactinfo.pk)
+
+
+def DecodeContactCursor(cursor):
+    """
+    カーソルから(対応日時, pk)を取り出す
+    return: 不正なカーソルの場合はNone
+    """
+    timestamp, _, pk = (cursor or '').partition('-')
+    try:
+        return datetime.datetime.strptime(timestamp, CONTACT_CURSOR_FORMAT), int(pk)
+    except ValueError:
+        return None
+
+
+def GetCompanyContacts(workspace, corporate_number, cursor=None,
+                       page_size=COMPANY_CONTACT_PAGE_SIZE):
+    """
+    会社のすべての部署（法人番号が同じ顧客情報）のコンタクト履歴を、新しい順に1ページ分返す
+    OFFSETを使わず、前のページの最後の(対応日時, pk)より後のものを取得するため、履歴が多くても1回のクエリで済む
+    param: cursor。前のページのカーソル。省略時は最初のページ
+    return: (コンタクト情報のリスト, 次のページのカーソル)。次のページがない場合、カーソルはNone
+    """
+    contacts = ContactInfo.objects.filter(
+        target_customer__workspace=workspace, target_customer__corporate_number=corporate_number,
+        target_customer__delete_flg=False, delete_flg=False).select_related(
+            'target_customer', 'operator').order_by('-contact_timestamp', '-pk')
+    position = DecodeContactCursor(cursor)
+    if position is not None:
+        timestamp, pk = position
+        contacts = contacts.filter(
+            Q(contact_timestamp__lt=timestamp) | Q(contact_timestamp=timestamp, pk__lt=pk))
+    contacts = list(contacts[:page_size + 1])
+    if len(contacts) > page_size:
+        return contacts[:page_size], EncodeContactCursor(contacts[page_size - 1])
+    return contacts, None
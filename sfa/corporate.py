@@ -0,0 +1,264 @@
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from .common_util import NormalizeJapaneseAddress, SplitPrefecture
+from .company import RefreshCompanyRollups
+from .dedup import Batches, NormalizeCompanyName, RefreshDuplicates
+from .models import CustomerInfo
+import datetime
+import hashlib
+import heapq
+import mmap
+import numpy as np
+import os
+import tempfile
+
+# 国税庁の法人番号公表サイトの全件データ（CSV形式）の列の位置
+NTA_CORPORATE_NUMBER = 1
+NTA_PROCESS = 2
+NTA_NAME = 6
+NTA_PREFECTURE = 9
+NTA_CITY = 10
+NTA_STREET = 11
+NTA_POST_CODE = 15
+NTA_CLOSE_DATE = 18
+NTA_LATEST = 23
+NTA_HIDDEN = 29
+# 処理区分の「削除」
+NTA_PROCESS_DELETED = '99'
+
+# 索引の1件分。キー（正規化した法人名と都道府県のハッシュ値）、法人番号、住所の位置と長さ
+CORPORATE_INDEX_DTYPE = np.dtype([('key', '<u8'), ('number', '<u8'), ('offset', '<u8'),
+                                  ('length', '<u4')])
+CORPORATE_INDEX_FILE = 'corporate_index.npy'
+CORPORATE_ADDRESS_FILE = 'corporate_address.bin'
+# 索引の作成時に、一度に並べ替える件数と、書き出す件数
+CORPORATE_SORT_CHUNK_SIZE = 500000
+CORPORATE_WRITE_BLOCK_SIZE = 65536
+# 住所の項目（郵便番号、都道府県、市区町村、番地）の区切り
+CORPORATE_ADDRESS_SEPARATOR = '\t'
+
+
+def GetCorporateIndexDir():
+    """
+    法人番号の索引を置くディレクトリ
+    """
+    return getattr(settings, 'CORPORATE_INDEX_DIR',
+                   os.path.join(settings.BASE_DIR, 'corporate_index'))
+
+
+def CorporateKey(name, prefecture):
+    """
+    正規化した法人名と都道府県から、索引のキー（64ビットのハッシュ値）を作る
+    """
+    text = '{}\t{}'.format(NormalizeCompanyName(name), prefecture)
+    return int.from_bytes(
+        hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _IterBlocks(array):
+    """
+    メモリマップした配列を、少しずつタプルにして返す
+    """
+    for start in range(0, len(array), CORPORATE_WRITE_BLOCK_SIZE):
+        yield from array[start:start + CORPORATE_WRITE_BLOCK_SIZE].tolist()
+
+
+def _WriteSortedChunk(records, directory, number):
+    """
+    索引の一部を並べ替えて一時ファイルに書き出す
+    """
+    chunk = np.array(records, dtype=CORPORATE_INDEX_DTYPE)
+    chunk.sort(order='key', kind='mergesort')
+    path = os.path.join(directory, 'chunk{}.npy'.format(number))
+    np.save(path, chunk)
+    return path
+
+
+def BuildCorporateIndex(rows, directory, chunk_size=CORPORATE_SORT_CHUNK_SIZE):
+    """
+    法人番号の全件データから、法人名と都道府県をキーにした索引をファイルに作る
+    全件をメモリに読み込まないよう、一定件数ごとに並べ替えて一時ファイルに書き出し、最後にマージする
+    param: rows。csv.readerなど、全件データの行のイテラブル（複数ファイルを続けてもよい）
+    param: directory。索引を置くディレクトリ。既存の索引は作成が終わった時点で置き換える
+    param: chunk_size。一度に並べ替える件数
+    return: 索引に登録した件数
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, CORPORATE_INDEX_FILE)
+    address_path = os.path.join(directory, CORPORATE_ADDRESS_FILE)
+    with tempfile.TemporaryDirectory(dir=directory) as work:
+        chunks = []
+        records = []
+        offset = 0
+        with open(os.path.join(work, CORPORATE_ADDRESS_FILE), 'wb') as addresses:
+            for row in rows:
+                # 最新の情報のうち、削除・閉鎖されたものと公表しないものは除く
+                if (row[NTA_LATEST] != '1' or row[NTA_PROCESS] == NTA_PROCESS_DELETED
+                        or row[NTA_CLOSE_DATE] or row[NTA_HIDDEN] == '1'):
+                    continue
+                address = CORPORATE_ADDRESS_SEPARATOR.join(
+                    (row[NTA_POST_CODE], row[NTA_PREFECTURE], row[NTA_CITY],
+                     row[NTA_STREET])).encode('utf-8')
+                addresses.write(address)
+                records.append((CorporateKey(row[NTA_NAME], row[NTA_PREFECTURE]),
+                                int(row[NTA_CORPORATE_NUMBER]), offset, len(address)))
+                offset += len(address)
+                if len(records) >= chunk_size:
+                    chunks.append(_WriteSortedChunk(records, work, len(chunks)))
+                    records = []
+        if records or not chunks:
+            chunks.append(_WriteSortedChunk(records, work, len(chunks)))
+
+        # 並べ替えた一時ファイルをマージしながら書き出す
+        sorted_chunks = [np.load(path, mmap_mode='r') for path in chunks]
+        total = sum(len(chunk) for chunk in sorted_chunks)
+        work_index_path = os.path.join(work, CORPORATE_INDEX_FILE)
+        output = np.lib.format.open_memmap(
+            work_index_path, mode='w+', dtype=CORPORATE_INDEX_DTYPE, shape=(total, ))
+        position = 0
+        block = []
+        for record in heapq.merge(*[_IterBlocks(chunk) for chunk in sorted_chunks],
+                                  key=lambda record: record[0]):
+            block.append(record)
+            if len(block) >= CORPORATE_WRITE_BLOCK_SIZE:
+                output[position:position + len(block)] = block
+                position += len(block)
+                block = []
+        output[position:position + len(block)] = block
+        output.flush()
+        del output, sorted_chunks
+
+        os.replace(os.path.join(work, CORPORATE_ADDRESS_FILE), address_path)
+        os.replace(work_index_path, index_path)
+    return total
+
+
+class CorporateIndex:
+    """
+    法人番号の索引。ファイルをメモリマップで開くため、索引全体をメモリに読み込まない
+    """
+
+    def __init__(self, directory=None):
+        directory = directory or GetCorporateIndexDir()
+        self.records = np.load(os.path.join(directory, CORPORATE_INDEX_FILE), mmap_mode='r')
+        self.keys = self.records['key']
+        with open(os.path.join(directory, CORPORATE_ADDRESS_FILE), 'rb') as f:
+            # 空のファイルはメモリマップできない
+            self.addresses = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(
+                f.fileno()).st_size else b''
+
+    def __len__(self):
+        return len(self.records)
+
+    def lookup_many(self, keys):
+        """
+        キーごとに、一致する法人の一覧を返す
+        param: keys。CorporateKeyで作ったキーのリスト
+        return: キーと同じ順の、(法人番号, 郵便番号, 都道府県, 市区町村, 番地)のリストのリスト
+        """
+        queries = np.array(keys, dtype='<u8')
+        starts = np.searchsorted(self.keys, queries, side='left')
+        ends = np.searchsorted(self.keys, queries, side='right')
+        results = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            entries = []
+            for _, number, offset, length in self.records[start:end].tolist():
+                address = bytes(self.addresses[offset:offset + length]).decode('utf-8')
+                entries.append(('{:013d}'.format(number), ) + tuple(
+                    address.split(CORPORATE_ADDRESS_SEPARATOR)))
+            results.append(entries)
+        return results
+
+    def lookup(self, name, prefecture):
+        """
+        法人名と都道府県が一致する法人の一覧を返す
+        """
+        return self.lookup_many([CorporateKey(name, prefecture)])[0]
+
+
+def ChooseCorporation(entries, normalized_address):
+    """
+    法人名と都道府県が一致した法人から、1つに決まる場合だけその法人を返す
+    複数ある場合は、住所（正規化したもの）の前方が一致する法人に絞り込む
+    param: entries。CorporateIndex.lookupの戻り値
+    param: normalized_address。顧客情報の正規化した住所
+    return: (法人番号, 郵便番号, 都道府県, 市区町村, 番地)。決まらない場合はNone
+    """
+    if len({entry[0] for entry in entries}) > 1 and normalized_address:
+        narrowed = []
+        for entry in entries:
+            registered = NormalizeJapaneseAddress(entry[2], entry[3] + entry[4])
+            if registered.startswith(normalized_address) or normalized_address.startswith(
+                    registered):
+                narrowed.append(entry)
+        entries = narrowed
+    if len({entry[0] for entry in entries}) != 1:
+        return None
+    return entries[0]
+
+
+def _CaseByPk(field, values):
+    """
+    顧客情報ごとに値を変えるUPDATE用のCase式
+    """
+    return Case(*[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+                default=F(field))
+
+
+def EnrichCorporateNumbers(workspace, index, pks=None):
+    """
+    法人番号が空の顧客情報を法人番号の索引と照合し、法人番号を補う
+    索引は法人名と都道府県で引くため、住所から都道府県が分からない顧客情報は対象にしない
+    登記された住所と前方が一致する場合（表記が違うだけの場合）は、登記された住所に揃える
+    param: workspace。ワークスペース
+    param: index。CorporateIndex
+    param: pks。対象の顧客情報のpkのリスト。省略時はワークスペースのすべての顧客情報
+    return: 法人番号を補った件数、住所を揃えた件数のタプル
+    """
+    queryset = CustomerInfo.objects.filter(
+        workspace=workspace, delete_flg=False, corporate_number='').exclude(customer_name='')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    rows = []
+    for pk, customer_name, normalized_address in queryset.order_by('pk').values_list(
+            'pk', 'customer_name', 'normalized_address').iterator():
+        # 正規化した住所は都道府県から始まる
+        prefecture = SplitPrefecture(normalized_address)[0]
+        if prefecture:
+            rows.append((pk, CorporateKey(customer_name, prefecture), normalized_address))
+
+    numbers = {}
+    addresses = {}
+    for (pk, _, normalized_address), entries in zip(
+            rows, index.lookup_many([row[1] for row in rows])):
+        entry = ChooseCorporation(entries, normalized_address)
+        if entry is None:
+            continue
+        numbers[pk] = entry[0]
+        zip_code, prefecture, city, street = entry[1:]
+        canonical = NormalizeJapaneseAddress(prefecture, city + street)
+        if canonical.startswith(normalized_address) and len(
+                city + street) <= CustomerInfo._meta.get_field('address2').max_length:
+            addresses[pk] = (zip_code, prefecture, city + street, canonical)
+
+    number_count = address_count = 0
+    now = datetime.datetime.now()
+    # IN句のpkに加えて、顧客情報ごとに最大4項目のCase式（pkと値）を使う
+    for batch in Batches(numbers, params_per_value=9):
+        number_count += CustomerInfo.objects.filter(pk__in=batch, corporate_number='').update(
+            corporate_number=_CaseByPk('corporate_number', {pk: numbers[pk] for pk in batch}),
+            modified_timestamp=now)
+        located = {pk: addresses[pk] for pk in batch if pk in addresses}
+        if located:
+            address_count += CustomerInfo.objects.filter(pk__in=located).update(
+                zip_code=_CaseByPk('zip_code', {pk: a[0] for pk, a in located.items()}),
+                address1=_CaseByPk('address1', {pk: a[1] for pk, a in located.items()}),
+                address2=_CaseByPk('address2', {pk: a[2] for pk, a in located.items()}),
+                normalized_address=_CaseByPk(
+                    'normalized_address', {pk: a[3] for pk, a in located.items()}),
+                modified_timestamp=now)
+    if numbers:
+        # 法人番号と住所は重複候補の判定に用いるため、関係する重複候補を更新する
+        RefreshDuplicates(workspace, list(numbers))
+        RefreshCompanyRollups(workspace, corporate_numbers=set(numbers.values()))
+    return number_count, address_count
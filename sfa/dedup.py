@@ -0,0 +1,350 @@
+from collections import defaultdict
+from difflib import SequenceMatcher
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Max, Value, When
+from .common_util import SplitPrefecture
+from .models import CustomerInfo, DuplicateKey, DuplicateCluster, DuplicateClusterMember
+import re
+import unicodedata
+
+# 重複とみなす類似度
+DUPLICATE_THRESHOLD = 0.7
+# 同じキーを持つ顧客がこれより多い場合は、ありふれたキーとみなして比較に使わない
+BLOCK_LIMIT = 200
+# 企業名のキーに用いる先頭の文字数と、電話番号のキーに用いる末尾の桁数
+NAME_PREFIX_LENGTH = 4
+PHONE_SUFFIX_LENGTH = 8
+# Batchesで、IN句以外の条件と更新する値のために空けておくパラメータの数
+BATCH_RESERVED_PARAMS = 20
+# 比較に用いる顧客情報の項目
+PROFILE_FIELDS = ('id', 'customer_name', 'corporate_number', 'tel_number1', 'tel_number2',
+                  'tel_number3', 'fax_number', 'normalized_address', 'delete_flg')
+
+# 法人格（NFKCで正規化した後の表記）
+LEGAL_FORMS = (
+    '特定非営利活動法人', '一般社団法人', '一般財団法人', '公益社団法人', '公益財団法人', '医療法人社団',
+    '医療法人財団', '社会福祉法人', '独立行政法人', '国立大学法人', '株式会社', '有限会社', '合同会社',
+    '合資会社', '合名会社', '医療法人', '学校法人', '宗教法人', 'NPO法人', 'カブシキガイシャ',
+    'カブシキカイシャ', 'ユウゲンガイシャ', 'ユウゲンカイシャ', 'ゴウドウガイシャ')
+_LEGAL_FORM_RE = re.compile('|'.join(re.escape(form) for form in LEGAL_FORMS))
+# (株)、(有)などの略記と、先頭・末尾のカナの略記（カ)ABC、ABC(カ など）
+_ABBREVIATION_RE = re.compile(
+    r'\((?:株|有|同|資|名|社|財|医|福|学|宗|特非|NPO)\)|\((?:カ|ユ|ド)\)|^(?:カ|ユ|ド)\)|\((?:カ|ユ|ド)$')
+# 企業名の末尾に付けられた部署・拠点
+_DEPARTMENT_RE = re.compile(
+    r'\s+\S*(?:部|課|室|グループ|チーム|支店|支社|本店|本社|営業所|事業所|出張所|工場|センター)$')
+_NAME_SYMBOL_RE = re.compile(r'[\s・.,、。\'"&+()\[\]「」『』/-]')
+_DIGIT_RE = re.compile(r'\D')
+
+
+def NormalizeCompanyName(name):
+    """
+    企業名から法人格・部署・記号を取り除き、全角半角や大文字小文字の違いをなくす
+    例：'株式会社ＡＢＣ　東京支店' → 'abc'、'(株)ABC' → 'abc'
+    """
+    name = unicodedata.normalize('NFKC', name or '').strip()
+    while True:
+        stripped = _DEPARTMENT_RE.sub('', name)
+        if stripped == name:
+            break
+        name = stripped
+    name = _ABBREVIATION_RE.sub('', name)
+    name = _LEGAL_FORM_RE.sub('', name)
+    return _NAME_SYMBOL_RE.sub('', name).lower()
+
+
+def NormalizePhoneNumber(phone_number):
+    """
+    電話番号から数字以外を取り除く
+    """
+    return _DIGIT_RE.sub('', unicodedata.normalize('NFKC', phone_number or ''))
+
+
+def BuildProfile(row):
+    """
+    比較に用いる正規化済みの値をまとめる
+    param: row。PROFILE_FIELDSを持つ辞書
+    """
+    phones = set()
+    for field in ('tel_number1', 'tel_number2', 'tel_number3', 'fax_number'):
+        phone = NormalizePhoneNumber(row[field])
+        if len(phone) >= PHONE_SUFFIX_LENGTH:
+            phones.add(phone)
+    return {
+        'id': row['id'],
+        'name': NormalizeCompanyName(row['customer_name']),
+        'corporate_number': NormalizePhoneNumber(row['corporate_number']),
+        'prefecture': SplitPrefecture(row['normalized_address'])[0],
+        'address': row['normalized_address'],
+        'phones': phones,
+    }
+
+
+def BlockingKeys(profile):
+    """
+    重複候補を探すためのキーを返す。同じキーを持つ顧客同士だけを比較する
+    ・企業名の先頭と都道府県
+    ・電話番号の末尾
+    ・法人番号
+    ・住所
+    """
+    keys = set()
+    if profile['name']:
+        keys.add('n:{}:{}'.format(profile['name'][:NAME_PREFIX_LENGTH], profile['prefecture']))
+    for phone in profile['phones']:
+        keys.add('t:' + phone[-PHONE_SUFFIX_LENGTH:])
+    if len(profile['corporate_number']) == 13:
+        keys.add('c:' + profile['corporate_number'])
+    if len(profile['address']) >= 8:
+        keys.add('a:' + profile['address'][:90])
+    return keys
+
+
+def ScorePair(a, b):
+    """
+    2件の顧客情報の類似度（0～1）と、一致した項目を返す
+    法人番号が一致すれば同じ企業、異なれば別の企業とみなす
+    """
+    if a['corporate_number'] and b['corporate_number']:
+        if a['corporate_number'] == b['corporate_number']:
+            return 1.0, ['法人番号']
+        return 0.0, []
+    reasons = []
+    name_ratio = 0.0
+    if a['name'] and b['name']:
+        name_ratio = SequenceMatcher(None, a['name'], b['name']).ratio()
+    score = 0.6 * name_ratio
+    if name_ratio >= 0.9:
+        reasons.append('企業名')
+    if name_ratio == 1 and a['prefecture'] and a['prefecture'] == b['prefecture']:
+        score += 0.1
+    if a['phones'] & b['phones']:
+        score += 0.3
+        reasons.append('電話番号')
+    if a['address'] and a['address'] == b['address']:
+        score += 0.2
+        reasons.append('住所')
+    return min(score, 1.0), reasons
+
+
+def Batches(values, params_per_value=1):
+    """
+    IN句のパラメータ数の上限（SQLite）を超えないように分割する
+    IN句以外の条件（ワークスペースや削除フラグなど）と更新する値の分として、BATCH_RESERVED_PARAMS個を空けておく
+    param: params_per_value。1つの値につき使うパラメータの数（同じ値を複数のIN句に使う場合など）
+    """
+    values = list(values)
+    size = max(((connection.features.max_query_params or 10000) - BATCH_RESERVED_PARAMS) //
+               params_per_value, 1)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _LoadProfiles(pks):
+    profiles = {}
+    for batch in Batches(pks):
+        for row in CustomerInfo.objects.filter(pk__in=batch, delete_flg=False).values(
+                *PROFILE_FIELDS):
+            profiles[row['id']] = BuildProfile(row)
+    return profiles
+
+
+def FindDuplicatePairs(workspace, pks):
+    """
+    指定した顧客情報の索引を作り直し、同じキーを持つ顧客と比較して重複と思われる組を返す
+    return: {(小さいpk, 大きいpk): (類似度, 一致した項目のリスト)}
+    """
+    for batch in Batches(pks):
+        DuplicateKey.objects.filter(customer_id__in=batch).delete()
+    targets = _LoadProfiles(pks)
+    target_keys = {pk: BlockingKeys(profile) for pk, profile in targets.items()}
+    DuplicateKey.objects.bulk_create(
+        [
+            DuplicateKey(workspace=workspace, customer_id=pk, key=key)
+            for pk, keys in target_keys.items() for key in keys
+        ])
+
+    blocks = defaultdict(list)
+    for batch in Batches(set().union(*target_keys.values())):
+        for key, customer_id in DuplicateKey.objects.filter(
+                workspace=workspace, key__in=batch).values_list('key', 'customer_id'):
+            blocks[key].append(customer_id)
+    others = {pk for block in blocks.values() if len(block) <= BLOCK_LIMIT for pk in block}
+    profiles = dict(targets)
+    profiles.update(_LoadProfiles(others - set(targets)))
+
+    pairs = {}
+    for pk, keys in target_keys.items():
+        for key in keys:
+            block = blocks[key]
+            if len(block) > BLOCK_LIMIT:
+                continue
+            for other in block:
+                pair = (min(pk, other), max(pk, other))
+                if other == pk or pair in pairs or other not in profiles:
+                    continue
+                pairs[pair] = ScorePair(profiles[pk], profiles[other])
+    return {pair: result for pair, result in pairs.items() if result[0] >= DUPLICATE_THRESHOLD}
+
+
+def _Find(parents, node):
+    """
+    union-findで、nodeが属するまとまりの代表を返す（経路を縮める）
+    """
+    root = node
+    while parents.setdefault(root, root) != root:
+        root = parents[root]
+    while parents[node] != root:
+        parents[node], node = root, parents[node]
+    return root
+
+
+def _Union(parents, a, b):
+    parents[_Find(parents, a)] = _Find(parents, b)
+
+
+def _CreateClusters(workspace, count):
+    """
+    重複候補をまとめて作成し、pkのリストを返す
+    PostgreSQLではbulk_createでpkが設定される。pkを返せないデータベース（SQLite）では1件ずつ作成する
+    """
+    clusters = [DuplicateCluster(workspace=workspace) for _ in range(count)]
+    if connection.features.can_return_ids_from_bulk_insert:
+        DuplicateCluster.objects.bulk_create(clusters)
+    else:
+        for cluster in clusters:
+            cluster.save()
+    return [cluster.pk for cluster in clusters]
+
+
+def RefreshDuplicates(workspace, pks=None):
+    """
+    重複候補を更新する。インポートなどで追加・変更された顧客情報だけを指定すれば、その顧客に関係する候補のみ更新する
+    確認済みの重複候補に顧客が加わった場合は、未確認に戻す
+    param: pks。対象の顧客情報のpk。Noneの場合はワークスペースのすべての顧客情報
+    return: 新たに重複候補に加わった顧客情報の件数
+    """
+    if pks is None:
+        pks = CustomerInfo.objects.filter(workspace=workspace).values_list('pk', flat=True)
+    pks = set(pks)
+    with transaction.atomic():
+        pairs = FindDuplicatePairs(workspace, pks)
+        involved = pks | {pk for pair in pairs for pk in pair}
+        members = {}
+        for batch in Batches(involved):
+            members.update(
+                DuplicateClusterMember.objects.filter(customer_id__in=batch).values_list(
+                    'customer_id', 'cluster_id'))
+
+        # 重複の組がなくなった対象の顧客は、重複候補から外す
+        linked = defaultdict(set)
+        for a, b in pairs:
+            linked[a].add(b)
+            linked[b].add(a)
+        removed = [
+            pk for pk in pks if pk in members and not any(
+                members.get(other) == members[pk] for other in linked[pk])
+        ]
+        affected_clusters = {members[pk] for pk in removed}
+        for batch in Batches(removed):
+            DuplicateClusterMember.objects.filter(customer_id__in=batch).delete()
+        for pk in removed:
+            del members[pk]
+
+        # 重複の組と既存の重複候補をunion-findでつなぎ、つながった顧客を1つの重複候補にまとめる
+        # まとめ方はメモリ上で決め、書き込みは件数によらずまとめて行う
+        parents = {}
+        for pk, cluster_id in members.items():
+            _Union(parents, pk, ('cluster', cluster_id))
+        scores = defaultdict(float)
+        reasons = defaultdict(set)
+        for (a, b), (score, pair_reasons) in pairs.items():
+            for pk in (a, b):
+                scores[pk] = max(scores[pk], score)
+                reasons[pk].update(pair_reasons)
+            _Union(parents, a, b)
+        components = defaultdict(set)
+        for pk in scores:
+            components[_Find(parents, pk)].add(pk)
+        component_clusters = defaultdict(set)
+        for cluster_id in set(members.values()):
+            root = _Find(parents, ('cluster', cluster_id))
+            if root in components:
+                component_clusters[root].add(cluster_id)
+
+        # 既存の重複候補がない場合は新しく作り、複数ある場合はpkの最も小さいものに統合する
+        new_roots = [root for root in components if root not in component_clusters]
+        targets = dict(zip(new_roots, _CreateClusters(workspace, len(new_roots))))
+        merged = {}
+        for root, cluster_ids in component_clusters.items():
+            targets[root] = min(cluster_ids)
+            merged.update(
+                (cluster_id, targets[root]) for cluster_id in cluster_ids
+                if cluster_id != targets[root])
+        new_members = [
+            DuplicateClusterMember(cluster_id=targets[root], customer_id=pk)
+            for root, component in components.items() for pk in sorted(component)
+            if pk not in members
+        ]
+        changed_clusters = {member.cluster_id for member in new_members}
+        changed_clusters.update(merged)
+        changed_clusters.update(merged.values())
+
+        # IN句の重複候補のpkに加えて、Case式で統合前後のpkを使う
+        for batch in Batches(merged, params_per_value=3):
+            DuplicateClusterMember.objects.filter(cluster_id__in=batch).update(
+                cluster_id=Case(
+                    *[When(cluster_id=cluster_id, then=Value(merged[cluster_id]))
+                      for cluster_id in batch],
+                    default=F('cluster_id')))
+        DuplicateClusterMember.objects.bulk_create(new_members)
+        # IN句の顧客のpkに加えて、2項目のCase式（pkと値）を使う
+        for batch in Batches(scores, params_per_value=5):
+            DuplicateClusterMember.objects.filter(customer_id__in=batch).update(
+                score=Case(
+                    *[When(customer_id=pk, then=Value(scores[pk])) for pk in batch],
+                    default=F('score')),
+                reasons=Case(
+                    *[When(customer_id=pk, then=Value('・'.join(sorted(reasons[pk]))))
+                      for pk in batch],
+                    default=F('reasons')))
+        for batch in Batches(changed_clusters):
+            DuplicateCluster.objects.filter(pk__in=batch).update(status=0)
+        _CleanUpClusters(affected_clusters | changed_clusters | set(targets.values()))
+    return len(new_members)
+
+
+def _CleanUpClusters(cluster_ids):
+    """
+    顧客が1件以下になった重複候補を削除し、重複候補の類似度を顧客の最大値に揃える
+    """
+    # IN句のpkに加えて、Case式でpkと類似度を使う
+    for batch in Batches(cluster_ids, params_per_value=3):
+        clusters = list(DuplicateCluster.objects.filter(pk__in=batch).annotate(
+            member_count=Count('members'), max_score=Max('members__score')))
+        single = [cluster.pk for cluster in clusters if cluster.member_count < 2]
+        if single:
+            DuplicateClusterMember.objects.filter(cluster_id__in=single).delete()
+            DuplicateCluster.objects.filter(pk__in=single).delete()
+        rescored = {
+            cluster.pk: cluster.max_score for cluster in clusters
+            if cluster.member_count >= 2 and cluster.max_score != cluster.score
+        }
+        if rescored:
+            DuplicateCluster.objects.filter(pk__in=rescored).update(score=Case(
+                *[When(pk=pk, then=Value(score)) for pk, score in rescored.items()],
+                default=F('score')))
+
+
+def RemoveDuplicateEntries(pks):
+    """
+    削除（アーカイブ）する顧客情報を、重複候補と索引から取り除く
+    """
+    cluster_ids = set()
+    for batch in Batches(pks):
+        cluster_ids.update(
+            DuplicateClusterMember.objects.filter(customer_id__in=batch).values_list(
+                'cluster_id', flat=True))
+        DuplicateKey.objects.filter(customer_id__in=batch).delete()
+        DuplicateClusterMember.objects.filter(customer_id__in=batch).delete()
+    _CleanUpClusters(cluster_ids)
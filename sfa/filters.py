@@ -1,4 +1,6 @@
 from django_filters import filters, FilterSet
+from django.db.models import Q
+from .common_util import NormalizeAddressText
 from .models import CustomerInfo, ContactInfo
 from django import forms
 
@@ -40,7 +42,7 @@ class CustomerInfoFilter(FilterSet):
     address1 = filters.CharFilter(
         name='address1', label='都道府県', lookup_expr='contains')
     address2 = filters.CharFilter(
-        name='address2', label='市区町村番地', lookup_expr='contains')
+        name='address2', label='市区町村番地', method='filter_address2')
     address3 = filters.CharFilter(
         name='address3', label='建物名', lookup_expr='contains')
     latitude_gte = filters.CharFilter(
@@ -52,11 +54,11 @@ class CustomerInfoFilter(FilterSet):
     longitude_lte = filters.CharFilter(
         name='longitude', label='経度（以下）', lookup_expr='lte')
     url1 = filters.CharFilter(
-        name='url1', label='企業URL1', lookup_expr='contains')
+        name='supplement__url1', label='企業URL1', lookup_expr='contains')
     url2 = filters.CharFilter(
-        name='url2', label='企業URL2', lookup_expr='contains')
+        name='supplement__url2', label='企業URL2', lookup_expr='contains')
     url3 = filters.CharFilter(
-        name='url3', label='企業URL3', lookup_expr='contains')
+        name='supplement__url3', label='企業URL3', lookup_expr='contains')
     industry_code = filters.CharFilter(
         name='industry_code', label='業種', lookup_expr='contains')
     contracted_flg = filters.BooleanFilter(name='contracted_flg', label='契約済み')
@@ -67,7 +69,7 @@ class CustomerInfoFilter(FilterSet):
     potential_lte = filters.CharFilter(
         name='potential', label='ポテンシャル（以下）', lookup_expr='lte')
     remarks = filters.CharFilter(
-        name='remarks', label='備考', lookup_expr='contains')
+        name='supplement__remarks', label='備考', lookup_expr='contains')
     author = filters.CharFilter(
         name='author', label='作成者', lookup_expr='contains')
     created_timestamp_gte = filters.CharFilter(
@@ -90,6 +92,15 @@ class CustomerInfoFilter(FilterSet):
         lookup_expr='exact',
         exclude=True)
 
+    def filter_address2(self, queryset, name, value):
+        """
+        市区町村番地は、入力どおりの文字列に加えて表記ゆれをなくした住所でも検索する
+        例：'丸の内一丁目' で '丸の内1-1-1' も見つかる
+        """
+        return queryset.filter(
+            Q(address2__contains=value)
+            | Q(normalized_address__contains=NormalizeAddressText(value)))
+
     order_by = MyOrderingFilter(
         # tuple-mapping retains order
         fields=(
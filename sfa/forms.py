@@ -1,11 +1,71 @@
 from django import forms
-from .models import CustomerInfo, ContactInfo, AddressInfo, GoalSetting, WorkspaceEnvironmentSetting, CustomerInfoDisplaySetting
+from .models import CustomerInfo, CustomerInfoSupplement, ContactInfo, AddressInfo, GoalSetting, WorkspaceEnvironmentSetting, CustomerInfoDisplaySetting
 from register.models import User
 from sfa.common_util import ExtractNumber
 import bootstrap_datepicker_plus as datetimepicker
 
 
-class CustomerInfoForm(forms.ModelForm):
+class CustomerInfoSupplementFormMixin:
+    """
+    顧客情報の補足（別テーブルに保存する項目）を顧客情報のフォームで扱うための共通処理
+    """
+    # フォームで扱う補足情報の項目
+    supplement_fields = ('url1', 'url2', 'url3', 'related_document_url',
+                         'remarks')
+    # 補足情報の項目を表示する位置（直後に来る項目名）
+    supplement_field_positions = {
+        'url1': 'industry_code',
+        'url2': 'industry_code',
+        'url3': 'industry_code',
+        'related_document_url': 'workspace',
+        'remarks': 'workspace',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        supplement = self.instance.get_supplement()
+        supplement_fields = forms.fields_for_model(
+            CustomerInfoSupplement,
+            fields=self.supplement_fields,
+            widgets=self._meta.widgets)
+        for name, field in supplement_fields.items():
+            self.fields[name] = field
+            self.initial.setdefault(name, getattr(supplement, name))
+
+        # 補足情報の項目を元の表示位置に並べ直す
+        field_order = []
+        for name in self.fields:
+            if name in supplement_fields:
+                continue
+            field_order.extend(
+                supplement_name for supplement_name in supplement_fields
+                if self.supplement_field_positions[supplement_name] == name)
+            field_order.append(name)
+        self.order_fields(field_order)
+
+    def save(self, commit=True):
+        instance = super().save(commit)
+        if commit:
+            self.save_supplement()
+        return instance
+
+    def save_supplement(self):
+        """
+        補足情報を保存する
+        """
+        supplement = self.instance.get_supplement()
+        for name in self.supplement_fields:
+            if name in self.cleaned_data:
+                setattr(supplement, name, self.cleaned_data[name])
+        supplement.customer = self.instance
+        supplement.save()
+
+
+class CustomerInfoForm(CustomerInfoSupplementFormMixin, forms.ModelForm):
+    # 編集画面を開いた時点の修正日時。楽観的排他制御に使う
+    last_modified_timestamp = forms.CharField(
+        widget=forms.HiddenInput(), required=False)
+
     def clean_corporate_number(self):
         data = self.cleaned_data['corporate_number']
         return ExtractNumber(data, 3)
@@ -30,6 +90,11 @@ class CustomerInfoForm(forms.ModelForm):
         data = self.cleaned_data['zip_code']
         return ExtractNumber(data, 2)
 
+    def clean_action_status(self):
+        # 対応状況は数値で保存するため、未選択（'---------'）の場合は「未対応」とする
+        data = self.cleaned_data['action_status']
+        return 0 if data in ('', None) else data
+
     class Meta:
         model = CustomerInfo
         fields = (
@@ -52,9 +117,6 @@ class CustomerInfoForm(forms.ModelForm):
             'address3',
             'latitude',
             'longitude',
-            'url1',
-            'url2',
-            'url3',
             'industry_code',
             'data_source',
             'contracted_flg',
@@ -63,8 +125,6 @@ class CustomerInfoForm(forms.ModelForm):
             'fax_limit_flg',
             'mail_limit_flg',
             'attention_flg',
-            'related_document_url',
-            'remarks',
             'workspace',
             'shared_edit_group',
             'shared_view_group',
@@ -120,7 +180,9 @@ class CustomerInfoForm(forms.ModelForm):
         }
 
 
-class CustomerInfoDeleteForm(forms.ModelForm):
+class CustomerInfoDeleteForm(CustomerInfoSupplementFormMixin, forms.ModelForm):
+    supplement_fields = ('url1', 'url2', 'url3', 'remarks')
+
     def clean_delete_flg(self):
         return True
 
@@ -144,9 +206,6 @@ class CustomerInfoDeleteForm(forms.ModelForm):
             'address1',
             'address2',
             'address3',
-            'url1',
-            'url2',
-            'url3',
             'industry_code',
             'data_source',
             'contracted_flg',
@@ -155,7 +214,6 @@ class CustomerInfoDeleteForm(forms.ModelForm):
             'fax_limit_flg',
             'mail_limit_flg',
             'attention_flg',
-            'remarks',
             'workspace',
             'shared_edit_group',
             'shared_view_group',
@@ -354,6 +412,14 @@ class AddressInfoUploadForm(forms.Form):
             raise forms.ValidationError('拡張子がcsvのファイルをアップロードしてください')
 
 
+class AddressInfoCustomerCreateForm(forms.Form):
+    potential = forms.IntegerField(
+        label='ポテンシャル',
+        min_value=0,
+        initial=80000,
+        widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+
+
 class CustomerInfoUploadForm(forms.ModelForm):
     file = forms.FileField(
         label='CSVファイル',
@@ -382,6 +448,17 @@ class CustomerInfoUploadForm(forms.ModelForm):
         )
 
 
+class TerritoryForm(forms.Form):
+    sales_persons = forms.ModelMultipleChoiceField(
+        queryset=User.objects.none(),
+        label='営業担当者',
+        widget=forms.CheckboxSelectMultiple,
+        help_text='選択した営業担当者の人数分の担当エリアに分けます。')
+    unassigned_only = forms.BooleanField(
+        label='営業担当者が未設定の顧客のみ',
+        required=False)
+
+
 class VisitHistoryForm(ContactInfoForm):
     class Meta:
         model = ContactInfo
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from sfa.common_util import ArchiveDeletedCustomerInfo, ArchiveDeletedContactInfo
+import datetime
+
+
+class Command(BaseCommand):
+    """
+    論理削除から一定期間が経過した顧客情報・コンタクト情報をアーカイブへ移す
+    Heroku Schedulerなどから1日1回実行することを想定している
+    バッチごとにコミットするため、途中で中断しても再実行すれば続きから処理される
+    """
+    help = '論理削除から指定日数が経過した顧客情報とコンタクト情報をアーカイブへ移します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            dest='days',
+            type=int,
+            default=90,
+            help='削除日時からの経過日数を指定します。省略時は90日です。',
+        )
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=500,
+            help='1回のトランザクションで処理する件数を指定します。省略時は500件です。',
+        )
+        parser.add_argument(
+            '--max-batches',
+            dest='max_batches',
+            type=int,
+            default=None,
+            help='今回の実行で処理するバッチ数の上限を指定します。省略時は対象がなくなるまで処理します。',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('経過日数は0以上、件数は1以上を指定してください。')
+        cutoff = datetime.datetime.now() - datetime.timedelta(
+            days=options['days'])
+
+        # 個別に削除されたコンタクト情報を先に移し、顧客情報のpayloadを小さくする
+        for label, archive in (('コンタクト情報', ArchiveDeletedContactInfo),
+                               ('顧客情報', ArchiveDeletedCustomerInfo)):
+            total = 0
+            batches = 0
+            while options['max_batches'] is None or batches < options['max_batches']:
+                count = archive(cutoff, options['batch_size'])
+                total += count
+                batches += 1
+                if count < options['batch_size']:
+                    break
+            self.stdout.write('{}を{}件アーカイブしました。'.format(label, total))
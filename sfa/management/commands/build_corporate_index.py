@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from sfa.corporate import BuildCorporateIndex, GetCorporateIndexDir
+import csv
+import itertools
+
+
+class Command(BaseCommand):
+    """
+    国税庁の法人番号公表サイトの全件データ（CSV形式）から法人番号の索引を作り直す
+    ファイルは事前にダウンロード・解凍しておく。ネットワークには接続しない
+    """
+    help = '法人番号の全件データ（CSV形式）を読み込み、法人名と都道府県をキーにした法人番号の索引を作り直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='全件データのCSVファイルのパスです。複数指定できます。')
+        parser.add_argument('--output', help='索引を置くディレクトリです。省略時はCORPORATE_INDEX_DIRです。')
+        parser.add_argument('--encoding', default='utf-8',
+                            help='CSVファイルの文字コードです。省略時はUTF-8（Unicode版）です。')
+
+    def handle(self, *args, **options):
+        output = options['output'] or GetCorporateIndexDir()
+        files = []
+        try:
+            files = [
+                open(path, encoding=options['encoding'], newline='') for path in options['paths']
+            ]
+            count = BuildCorporateIndex(
+                itertools.chain.from_iterable(csv.reader(f) for f in files), output)
+        except (OSError, UnicodeDecodeError, IndexError, ValueError) as e:
+            raise CommandError('法人番号の全件データを読み込めませんでした。{}'.format(e))
+        finally:
+            for f in files:
+                f.close()
+        self.stdout.write('法人番号の索引に{}件を登録しました。{}'.format(count, output))
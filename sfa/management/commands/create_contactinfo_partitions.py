@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from sfa.common_util import IsContactInfoPartitioned, CreateContactInfoPartitions
+
+
+class Command(BaseCommand):
+    """
+    コンタクト情報の月次パーティションを先の月の分まで作成する
+    Heroku Schedulerなどから1日1回実行することを想定している
+    """
+    help = 'コンタクト情報の月次パーティションを当月から指定した月数先まで作成します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            dest='months',
+            type=int,
+            default=3,
+            help='当月から何か月先まで作成するかを指定します。省略時は3か月です。',
+        )
+
+    def handle(self, *args, **options):
+        if options['months'] < 0:
+            raise CommandError('月数は0以上を指定してください。')
+        if not IsContactInfoPartitioned():
+            self.stdout.write('コンタクト情報はパーティション化されていないため、何もしません。')
+            return
+
+        created = CreateContactInfoPartitions(options['months'])
+        self.stdout.write('パーティションを{}件作成しました。{}'.format(
+            len(created), ' '.join(created)))
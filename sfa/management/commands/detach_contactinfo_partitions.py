@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from sfa.common_util import IsContactInfoPartitioned, DetachContactInfoPartitions
+import datetime
+
+
+class Command(BaseCommand):
+    """
+    古いコンタクト情報の月次パーティションを切り離してアーカイブする
+    切り離したテーブルはpg_dumpなどで退避した後に削除することを想定している
+    """
+    help = '指定した月より前のコンタクト情報の月次パーティションを切り離します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'before',
+            help='この月より前のパーティションを切り離します。YYYY-MM形式で指定します。',
+        )
+        parser.add_argument(
+            '--drop',
+            dest='drop',
+            action='store_true',
+            help='切り離したテーブルを残さずに削除します。',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            before = datetime.datetime.strptime(options['before'],
+                                                '%Y-%m').date()
+        except ValueError:
+            raise CommandError('月はYYYY-MM形式で指定してください。')
+        if not IsContactInfoPartitioned():
+            self.stdout.write('コンタクト情報はパーティション化されていないため、何もしません。')
+            return
+
+        detached = DetachContactInfoPartitions(before, drop=options['drop'])
+        self.stdout.write('パーティションを{}件切り離しました。{}'.format(
+            len(detached), ' '.join(detached)))
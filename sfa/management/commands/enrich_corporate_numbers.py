@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from register.models import Workspace
+from sfa.corporate import CorporateIndex, EnrichCorporateNumbers
+
+
+class Command(BaseCommand):
+    """
+    法人番号が空の顧客情報を法人番号の索引と照合し、法人番号と登記された住所を補う
+    索引は build_corporate_index コマンドで事前に作成しておく
+    """
+    help = '法人番号が空の顧客情報に、法人名と都道府県が一致する法人の法人番号を設定します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workspace',
+            dest='workspace_id',
+            type=int,
+            help='対象のワークスペースのIDを指定します。省略時はすべてのワークスペースです。',
+        )
+        parser.add_argument('--index', help='索引のディレクトリです。省略時はCORPORATE_INDEX_DIRです。')
+
+    def handle(self, *args, **options):
+        try:
+            index = CorporateIndex(options['index'])
+        except OSError as e:
+            raise CommandError('法人番号の索引を開けませんでした。{}'.format(e))
+        workspaces = Workspace.objects.order_by('pk')
+        if options['workspace_id'] is not None:
+            workspaces = workspaces.filter(pk=options['workspace_id'])
+            if not workspaces.exists():
+                raise CommandError('ワークスペースが見つかりません。')
+        for workspace in workspaces:
+            number_count, address_count = EnrichCorporateNumbers(workspace, index)
+            self.stdout.write('{}: 法人番号を{}件設定し、住所を{}件揃えました。'.format(
+                workspace, number_count, address_count))
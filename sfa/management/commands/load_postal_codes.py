@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from sfa.postal import LoadPostalCodes, ReadCentroids
+import csv
+
+
+class Command(BaseCommand):
+    """
+    日本郵便の郵便番号データ（KEN_ALL.CSV）から郵便番号の索引を作り直す
+    ファイルは事前にダウンロード・解凍しておく。ネットワークには接続しない
+    """
+    help = '郵便番号データ（KEN_ALL.CSV）を読み込み、郵便番号の索引を作り直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='KEN_ALL.CSVのパスです。')
+        parser.add_argument('--encoding', default='MS932',
+                            help='KEN_ALL.CSVの文字コードです。省略時はMS932です。')
+        parser.add_argument(
+            '--centroids',
+            help='郵便番号ごとの代表地点のCSV（郵便番号, 緯度, 経度）のパスです。UTF-8で読み込みます。')
+
+    def handle(self, *args, **options):
+        centroids = None
+        try:
+            if options['centroids']:
+                with open(options['centroids'], encoding='utf-8', newline='') as f:
+                    centroids = ReadCentroids(csv.reader(f))
+            with open(options['path'], encoding=options['encoding'], newline='') as f:
+                count = LoadPostalCodes(csv.reader(f), centroids)
+        except (OSError, UnicodeDecodeError, IndexError) as e:
+            raise CommandError('郵便番号データを読み込めませんでした。{}'.format(e))
+        self.stdout.write('郵便番号の索引に{}件を登録しました。'.format(count))
+        if centroids is not None:
+            self.stdout.write('代表地点は{}件です。'.format(len(centroids)))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from register.models import Workspace
+from sfa.company import RefreshCompanyRollups
+
+
+class Command(BaseCommand):
+    """
+    ワークスペースのすべての会社について、会社単位の集計を作り直す
+    既存のデータに対して初めて実行する場合や、画面を通さずに顧客情報を変更した場合を想定している
+    """
+    help = '法人番号ごとに顧客情報とコンタクト情報を集計し直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workspace',
+            dest='workspace_id',
+            type=int,
+            help='対象のワークスペースのIDを指定します。省略時はすべてのワークスペースです。',
+        )
+
+    def handle(self, *args, **options):
+        workspaces = Workspace.objects.order_by('pk')
+        if options['workspace_id'] is not None:
+            workspaces = workspaces.filter(pk=options['workspace_id'])
+            if not workspaces.exists():
+                raise CommandError('ワークスペースが見つかりません。')
+        for workspace in workspaces:
+            count = RefreshCompanyRollups(workspace)
+            self.stdout.write('{}: {}社を集計しました。'.format(workspace, count))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from register.models import Workspace
+from sfa.dedup import RefreshDuplicates
+
+
+class Command(BaseCommand):
+    """
+    ワークスペースのすべての顧客情報から重複候補を探し直す
+    重複の判定方法を変更した場合や、既存のデータに対して初めて実行する場合を想定している
+    """
+    help = 'ワークスペースのすべての顧客情報から、重複と思われる会社を探し直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workspace',
+            dest='workspace_id',
+            type=int,
+            help='対象のワークスペースのIDを指定します。省略時はすべてのワークスペースです。',
+        )
+
+    def handle(self, *args, **options):
+        workspaces = Workspace.objects.order_by('pk')
+        if options['workspace_id'] is not None:
+            workspaces = workspaces.filter(pk=options['workspace_id'])
+            if not workspaces.exists():
+                raise CommandError('ワークスペースが見つかりません。')
+        for workspace in workspaces:
+            count = RefreshDuplicates(workspace)
+            self.stdout.write('{}: 重複候補に{}件の顧客情報が加わりました。'.format(
+                workspace, count))
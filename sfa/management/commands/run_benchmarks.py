@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from sfa.benchmarks.generator import GenerateWorkspace
+from sfa.benchmarks.runner import RunBenchmarks, CompareWithBaseline, LoadBaseline, SaveBaseline
+import os
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmarks',
+    'baseline.json')
+
+
+class Command(BaseCommand):
+    """
+    主要な画面の応答時間とクエリ数を計測し、基準値と比較する
+    計測用のデータはテスト用データベースに生成するため、本番のデータには影響しない
+    """
+    help = '計測用のワークスペースを生成し、主要な画面のp50/p95応答時間とクエリ数を計測します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='データ生成の乱数の種です。')
+        parser.add_argument('--users', type=int, default=20, help='ユーザー数です。')
+        parser.add_argument('--groups', type=int, default=5, help='グループ数です。')
+        parser.add_argument('--customers', type=int, default=5000, help='顧客情報の件数です。')
+        parser.add_argument('--contacts', type=int, default=20000, help='コンタクト情報の件数です。')
+        parser.add_argument('--addresses', type=int, default=2000, help='連絡先情報の件数です。')
+        parser.add_argument('--import-rows', dest='import_rows', type=int, default=100,
+                            help='CSVインポートで取り込む行数です。')
+        parser.add_argument('--iterations', type=int, default=20, help='画面ごとの計測回数です。')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基準値のJSONファイルです。')
+        parser.add_argument('--save-baseline', dest='save_baseline', action='store_true',
+                            help='今回の計測結果を基準値として保存します。')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='p95が基準値の何割増しまでを許容するかを指定します。省略時は0.5です。')
+        parser.add_argument('--fail-on-regression', dest='fail_on_regression', action='store_true',
+                            help='基準値より悪化した項目がある場合にエラー終了します。')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['users'] < 1 or options['customers'] < 1:
+            raise CommandError('計測回数・ユーザー数・顧客情報の件数は1以上を指定してください。')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            dataset = GenerateWorkspace(
+                seed=options['seed'],
+                users=options['users'],
+                groups=options['groups'],
+                customers=options['customers'],
+                contacts=options['contacts'],
+                addresses=options['addresses'])
+            # 計測環境ではcollectstaticを前提にしない
+            with override_settings(
+                    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+                results = RunBenchmarks(
+                    dataset,
+                    iterations=options['iterations'],
+                    import_rows=options['import_rows'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write('{:<28}{:>10}{:>10}{:>8}{:>8}{:>8}'.format(
+            'name', 'p50(ms)', 'p95(ms)', 'queries', 'hit(%)', 'status'))
+        for name, result in sorted(results.items()):
+            # ヒット率はPostgreSQLの場合だけ計測できる
+            hit = result['cache_hit_pct']
+            self.stdout.write('{:<28}{:>10}{:>10}{:>8}{:>8}{:>8}'.format(
+                name, result['p50_ms'], result['p95_ms'], result['queries'],
+                '-' if hit is None else hit, result['status_code']))
+
+        if options['save_baseline']:
+            settings = {
+                key: options[key]
+                for key in ('seed', 'users', 'groups', 'customers', 'contacts',
+                            'addresses', 'import_rows', 'iterations')
+            }
+            SaveBaseline(options['baseline'], results, settings)
+            self.stdout.write('基準値を保存しました。{}'.format(options['baseline']))
+            return
+
+        baseline = LoadBaseline(options['baseline'])
+        if not baseline:
+            self.stdout.write('基準値がないため比較しません。--save-baseline で保存できます。')
+            return
+        regressions = CompareWithBaseline(results, baseline, options['tolerance'])
+        for regression in regressions:
+            self.stdout.write(regression)
+        if regressions and options['fail_on_regression']:
+            raise CommandError('基準値より悪化した項目が{}件あります。'.format(len(regressions)))
+        if not regressions:
+            self.stdout.write('基準値からの悪化はありません。')
@@ -0,0 +1,128 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIServer
+from django.db import connection, connections
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler, _StaticFilesHandler
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from sfa.benchmarks.generator import GenerateWorkspace, BenchmarkEmail, BENCHMARK_PASSWORD
+from sfa.benchmarks.loadtest import RunLoadTest, CompareLoadTests, LoadTestError
+from sfa.benchmarks.runner import LoadBaseline, SaveBaseline
+
+
+class SerialLiveServerThread(LiveServerThread):
+    """
+    リクエストを1件ずつ処理するテストサーバー
+    SQLiteのメモリ上のデータベースは1つの接続を共有するため、同時に処理するとテーブルのロックで失敗する
+    """
+
+    def _create_server(self):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class Command(BaseCommand):
+    """
+    仮想の営業担当者を同時にログインさせ、顧客検索・顧客カード・架電記録・ダッシュボード・CSVインポートを繰り返して
+    URL名ごとのスループットと応答時間を計測する。
+    --urlを省略した場合はテスト用データベースとDjangoのテストサーバーを起動して計測する。
+    """
+    help = '仮想ユーザーを同時に操作させ、URL名ごとのスループットとp50/p95/p99応答時間を計測します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='計測対象のサーバーです。省略時はテストサーバーを起動します。'
+                            '指定する場合、対象のデータベースには--seedと同じ計測用ワークスペースが必要です。')
+        parser.add_argument('--seed', type=int, default=0, help='データ生成とシナリオの乱数の種です。')
+        parser.add_argument('--concurrency', type=int, default=5, help='同時に操作する仮想ユーザーの数です。')
+        parser.add_argument('--duration', type=float, default=30, help='計測時間（秒）です。')
+        parser.add_argument('--think-time', dest='think_time', type=float, default=0,
+                            help='操作の間の平均待ち時間（秒）です。')
+        parser.add_argument('--customers', type=int, default=2000,
+                            help='テストサーバーで計測する場合の顧客情報の件数です。')
+        parser.add_argument('--contacts', type=int, default=5000,
+                            help='テストサーバーで計測する場合のコンタクト情報の件数です。')
+        parser.add_argument('--output', help='計測結果を保存するJSONファイルです。')
+        parser.add_argument('--compare', help='比較する前回の計測結果のJSONファイルです。')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='スループットとp95の悪化を何割まで許容するかを指定します。省略時は0.2です。')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('同時接続数と計測時間は1以上を指定してください。')
+        accounts = [(BenchmarkEmail(options['seed'], i), BENCHMARK_PASSWORD)
+                    for i in range(options['concurrency'])]
+        try:
+            if options['url']:
+                results = self.run(options['url'], accounts, options)
+            else:
+                results = self.run_with_test_server(accounts, options)
+        except LoadTestError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('{:<32}{:>9}{:>8}{:>9}{:>10}{:>10}{:>10}'.format(
+            'name', 'requests', 'errors', 'rps', 'p50(ms)', 'p95(ms)', 'p99(ms)'))
+        for name, result in sorted(results.items()):
+            self.stdout.write('{:<32}{:>9}{:>8}{:>9}{:>10}{:>10}{:>10}'.format(
+                name, result['requests'], result['errors'], result['rps'],
+                result['p50_ms'], result['p95_ms'], result['p99_ms']))
+
+        if options['output']:
+            settings = {
+                key: options[key]
+                for key in ('url', 'seed', 'concurrency', 'duration', 'think_time', 'customers',
+                            'contacts')
+            }
+            SaveBaseline(options['output'], results, settings)
+            self.stdout.write('計測結果を保存しました。{}'.format(options['output']))
+        if options['compare']:
+            regressions = CompareLoadTests(
+                results, LoadBaseline(options['compare']), options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(regression)
+            if not regressions:
+                self.stdout.write('前回の計測結果からの悪化はありません。')
+
+    def run(self, base_url, accounts, options):
+        return RunLoadTest(
+            base_url,
+            accounts,
+            duration=options['duration'],
+            think_time=options['think_time'],
+            seed=options['seed'])
+
+    def run_with_test_server(self, accounts, options):
+        """
+        テスト用データベースに計測用のワークスペースを作成し、テストサーバーを起動して計測する
+        """
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            GenerateWorkspace(
+                seed=options['seed'],
+                users=len(accounts),
+                customers=options['customers'],
+                contacts=options['contacts'])
+            # SQLiteのメモリ上のデータベースはスレッド間で接続を共有し、リクエストは1件ずつ処理する
+            server_class = LiveServerThread
+            connections_override = {}
+            if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+                shared_connection = connections[connection.alias]
+                shared_connection.allow_thread_sharing = True
+                connections_override[connection.alias] = shared_connection
+                server_class = SerialLiveServerThread
+                self.stderr.write('SQLiteではリクエストを1件ずつ処理するため、同時接続時の値は参考値です。'
+                                  '実際の同時実行性能はPostgreSQLを用いるか、--urlで計測してください。')
+            with override_settings(
+                    ALLOWED_HOSTS=['localhost', '127.0.0.1'],
+                    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+                server = server_class('localhost', _StaticFilesHandler, connections_override)
+                server.daemon = True
+                server.start()
+                server.is_ready.wait()
+                if server.error:
+                    raise server.error
+                try:
+                    return self.run(
+                        'http://localhost:{}'.format(server.port), accounts, options)
+                finally:
+                    server.terminate()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from sfa.benchmarks.micro import RunExtractNumberBenchmark
+
+
+class Command(BaseCommand):
+    """
+    データベースを使わない処理（番号の正規化など）の処理時間を計測する
+    """
+    help = 'CSVインポートの番号の列の正規化にかかる時間を、変換方法ごとに計測します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='計測に使うCSVの行数です。')
+        parser.add_argument('--iterations', type=int, default=5, help='計測回数です。')
+        parser.add_argument('--seed', type=int, default=0, help='データ生成の乱数の種です。')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['iterations'] < 1:
+            raise CommandError('行数・計測回数は1以上を指定してください。')
+
+        results = RunExtractNumberBenchmark(
+            rows=options['rows'], iterations=options['iterations'], seed=options['seed'])
+        reference = results['zenhan_re']
+        self.stdout.write('{:<28}{:>10}{:>10}'.format('name', 'ms', 'ratio'))
+        for name, elapsed in results.items():
+            ratio = round(reference / elapsed, 1) if elapsed else '-'
+            self.stdout.write('{:<28}{:>10}{:>10}'.format(name, elapsed, ratio))
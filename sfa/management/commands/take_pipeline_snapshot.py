@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from pytz import timezone
+from sfa.common_util import TakePipelineSnapshot
+import datetime
+
+
+class Command(BaseCommand):
+    """
+    パイプラインの日次スナップショットを作成する
+    Heroku Schedulerなどから1日1回実行することを想定している
+    """
+    help = '顧客情報の対応状況ごとの件数とポテンシャル合計をスナップショットとして保存します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            dest='snapshot_date',
+            help='集計日をYYYY-MM-DD形式で指定します。省略時は本日です。',
+        )
+
+    def handle(self, *args, **options):
+        if options['snapshot_date']:
+            try:
+                snapshot_date = datetime.datetime.strptime(
+                    options['snapshot_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('集計日はYYYY-MM-DD形式で指定してください。')
+        else:
+            snapshot_date = datetime.datetime.now(
+                timezone('Asia/Tokyo')).date()
+
+        count = TakePipelineSnapshot(snapshot_date)
+        self.stdout.write('{}のスナップショットを{}件作成しました。'.format(
+            snapshot_date, count))
@@ -0,0 +1,297 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from .common_util import BuildActionStatusTransition, GetViewableCustomerInfo
+from .company import RefreshCompanyRollups
+from .dedup import Batches, RefreshDuplicates, RemoveDuplicateEntries
+from .models import CustomerInfo, CustomerInfoSupplement, ContactInfo, ActionStatusTransition, AddressInfo, DuplicateClusterMember
+import datetime
+
+# 残す顧客情報の値が空の場合に、他の顧客情報の値で補う項目
+MERGE_FILL_FIELDS = ('corporate_number', 'optional_code1', 'optional_code2', 'optional_code3',
+                     'department_name', 'fax_number', 'mail_address', 'representative',
+                     'contact_name', 'industry_code', 'data_source', 'sales_person_id')
+# 住所は項目ごとではなく1組として補う
+MERGE_ADDRESS_FIELDS = ('zip_code', 'address1', 'address2', 'address3', 'normalized_address')
+MERGE_PHONE_FIELDS = ('tel_number1', 'tel_number2', 'tel_number3')
+# いずれかの顧客情報でTrueならTrueにする項目
+MERGE_ANY_FIELDS = ('contracted_flg', 'tel_limit_flg', 'fax_limit_flg', 'mail_limit_flg',
+                    'attention_flg', 'tel_called_flg', 'mail_sent_flg', 'fax_sent_flg',
+                    'dm_sent_flg', 'visited_flg')
+# 最も大きい値にする項目（ポテンシャル、最も進んだ対応状況、最も広い公開ステータス）
+MERGE_MAX_FIELDS = ('potential', 'action_status', 'public_status')
+MERGE_SUPPLEMENT_FIELDS = ('url1', 'url2', 'url3', 'related_document_url')
+MERGE_SHARED_FIELDS = ('shared_edit_group', 'shared_view_group', 'shared_edit_user',
+                       'shared_view_user')
+# コンタクト情報の対応種別から立てる済フラグ（訪問は訪問済みの場合のみ）
+CONTACT_FLAG_FIELDS = {2: 'tel_called_flg', 3: 'mail_sent_flg', 4: 'fax_sent_flg', 5: 'dm_sent_flg'}
+REMARKS_MAX_LENGTH = 4096
+
+
+def _IsBlank(value):
+    return value is None or value == ''
+
+
+def ChooseSurvivors(clusters):
+    """
+    重複候補ごとに残す顧客情報を選ぶ。コンタクト情報が最も多いもの、同じ場合は最も古いものを残す
+    param: clusters。重複候補のリスト
+    return: [(残す顧客情報のpk, [統合する顧客情報のpk...])...]
+    """
+    members = defaultdict(list)
+    for batch in Batches([cluster.pk for cluster in clusters]):
+        for cluster_id, customer_id in DuplicateClusterMember.objects.filter(
+                cluster_id__in=batch, customer__delete_flg=False).values_list(
+                    'cluster_id', 'customer_id'):
+            members[cluster_id].append(customer_id)
+    counts = defaultdict(int)
+    for batch in Batches([pk for pks in members.values() for pk in pks]):
+        counts.update(
+            ContactInfo.objects.filter(target_customer_id__in=batch, delete_flg=False).values_list(
+                'target_customer_id').annotate(count=Count('pk')).order_by())
+    groups = []
+    for cluster in clusters:
+        pks = sorted(members[cluster.pk], key=lambda pk: (-counts[pk], pk))
+        if len(pks) >= 2:
+            groups.append((pks[0], pks[1:]))
+    return groups
+
+
+def _MergeValues(survivor, others, contact_flags):
+    """
+    残す顧客情報に、統合する顧客情報の値をルールに従ってまとめる
+    param: others。統合する顧客情報（値を優先する順）
+    param: contact_flags。コンタクト情報から求めた、Trueにする済フラグ
+    return: 変更する項目と値の辞書
+    """
+    members = [survivor] + others
+    changes = {}
+    for field in MERGE_FILL_FIELDS:
+        if _IsBlank(getattr(survivor, field)):
+            value = next((getattr(c, field) for c in others if not _IsBlank(getattr(c, field))),
+                         None)
+            if value is not None:
+                changes[field] = value
+
+    # 電話番号は空いている欄に、まだない番号を順に入れる
+    phones = [getattr(survivor, field) for field in MERGE_PHONE_FIELDS]
+    extras = []
+    for c in others:
+        for field in MERGE_PHONE_FIELDS:
+            phone = getattr(c, field)
+            if phone and phone not in phones and phone not in extras:
+                extras.append(phone)
+    for field, phone in zip(MERGE_PHONE_FIELDS, phones):
+        if not phone and extras:
+            changes[field] = extras.pop(0)
+
+    address_source = survivor
+    if not survivor.address1 and not survivor.address2:
+        address_source = next((c for c in others if c.address1 or c.address2), survivor)
+        if address_source is not survivor:
+            changes.update({field: getattr(address_source, field) for field in MERGE_ADDRESS_FIELDS})
+    # 緯度・経度は、同じ住所の顧客情報のものだけを用いる。郵便番号からの概算よりも住所から取得したものを優先する
+    if not survivor.latitude or not survivor.longitude or survivor.approximate_location:
+        located = min((c for c in members if c.latitude and c.longitude
+                       and c.normalized_address == address_source.normalized_address),
+                      key=lambda c: c.approximate_location, default=None)
+        if located is not None and located is not survivor and not (
+                survivor.latitude and survivor.longitude and located.approximate_location):
+            changes['latitude'] = located.latitude
+            changes['longitude'] = located.longitude
+            changes['approximate_location'] = located.approximate_location
+
+    for field in MERGE_ANY_FIELDS:
+        if not getattr(survivor, field) and (field in contact_flags or any(
+                getattr(c, field) for c in others)):
+            changes[field] = True
+    for field in MERGE_MAX_FIELDS:
+        value = max(getattr(c, field) for c in members)
+        if value != getattr(survivor, field):
+            changes[field] = value
+    return changes
+
+
+def _MergeSupplement(survivor_pk, pks, supplements):
+    """
+    補足情報を補い、備考はすべての顧客情報のものをつなげる
+    return: 変更する項目と値の辞書
+    """
+    survivor = supplements.get(survivor_pk) or CustomerInfoSupplement(customer_id=survivor_pk)
+    others = [supplements[pk] for pk in pks if pk != survivor_pk and pk in supplements]
+    changes = {}
+    for field in MERGE_SUPPLEMENT_FIELDS:
+        if not getattr(survivor, field):
+            value = next((getattr(s, field) for s in others if getattr(s, field)), '')
+            if value:
+                changes[field] = value
+    remarks = [survivor.remarks] if survivor.remarks else []
+    remarks.extend(s.remarks for s in others if s.remarks and s.remarks not in remarks)
+    if len(remarks) > 1 or (remarks and not survivor.remarks):
+        changes['remarks'] = '\n'.join(remarks)[:REMARKS_MAX_LENGTH]
+    return changes
+
+
+def _Repoint(model, field, mapping):
+    """
+    外部キーを、統合する顧客情報から残す顧客情報へ1回のUPDATEでまとめて付け替える
+    （SQLiteはパラメータ数に上限があるため、上限ごとに分けて更新する）
+    """
+    count = 0
+    for chunk in Batches(sorted(mapping.items()), 3):
+        count += model.objects.filter(**{
+            field + '__in': [victim for victim, _ in chunk]
+        }).update(**{
+            field: Case(
+                *[When(**{field: victim, 'then': Value(survivor)}) for victim, survivor in chunk],
+                output_field=IntegerField())
+        })
+    return count
+
+
+def _MergeSharedRows(mapping):
+    """
+    共有先（ユーザー・グループ）の中間テーブルの行を、残す顧客情報にまとめる
+    残す顧客情報にまだない共有先だけを追加し、統合する顧客情報の行は削除する
+    """
+    survivors = set(mapping.values())
+    for name in MERGE_SHARED_FIELDS:
+        field = CustomerInfo._meta.get_field(name)
+        through = field.remote_field.through
+        source = field.m2m_column_name()
+        target = field.m2m_reverse_name()
+        existing = set()
+        for batch in Batches(survivors | set(mapping)):
+            existing.update(
+                through.objects.filter(**{
+                    source + '__in': batch
+                }).values_list(source, target))
+        rows = {(mapping[pk], other) for pk, other in existing if pk in mapping} - existing
+        through.objects.bulk_create(
+            [through(**{source: pk, target: other}) for pk, other in sorted(rows)])
+        for batch in Batches(mapping):
+            through.objects.filter(**{source + '__in': batch}).delete()
+
+
+def RecountDuplicatePhoneNumbers(user, pks):
+    """
+    指定した顧客情報の電話番号の重複件数を、同じ番号を持つ他の顧客情報の件数に数え直す
+    CheckDuplicatePhoneNumberと同じく、更新を行ったユーザーが閲覧可能な顧客情報だけを数え、指定した顧客情報にだけ設定する
+    （他のユーザーの非公開の顧客情報の有無が件数から分からないよう、同じ番号を持つ他の顧客情報の件数は変えない）
+    項目と件数ごとに1回のUPDATEでまとめて更新する
+    param: user。更新を行ったユーザー
+    param: pks。数え直す顧客情報のpk
+    """
+    phones_by_pk = {}
+    for batch in Batches(pks):
+        for row in CustomerInfo.objects.filter(pk__in=batch, delete_flg=False).values_list(
+                'pk', *MERGE_PHONE_FIELDS):
+            phones_by_pk[row[0]] = row[1:]
+    phone_numbers = {phone for phones in phones_by_pk.values() for phone in phones if phone}
+    holders = defaultdict(set)
+    for batch in Batches(phone_numbers, 3):
+        for row in GetViewableCustomerInfo(user).filter(
+                Q(tel_number1__in=batch) | Q(tel_number2__in=batch)
+                | Q(tel_number3__in=batch)).values_list('pk', *MERGE_PHONE_FIELDS):
+            for phone in set(row[1:]) & phone_numbers:
+                holders[phone].add(row[0])
+    by_count = defaultdict(list)
+    for pk, phones in phones_by_pk.items():
+        for field, phone in zip(MERGE_PHONE_FIELDS, phones):
+            by_count[field, len(holders[phone] - {pk}) if phone else 0].append(pk)
+    for (field, count), field_pks in by_count.items():
+        for batch in Batches(field_pks):
+            CustomerInfo.objects.filter(pk__in=batch).update(
+                **{field + '_duplicate_count': count})
+
+
+def MergeCustomers(workspace, groups, user):
+    """
+    重複している顧客情報を統合する。すべての組をまとめて1つのトランザクションで処理する
+    ・残す顧客情報の項目をルールに従って補い、対応状況が変わる場合は変更履歴を記録する
+    ・コンタクト情報と対応状況の変更履歴、関連付けた連絡先情報を、残す顧客情報へまとめて付け替える
+    ・共有先（ユーザー・グループ）を残す顧客情報にまとめる
+    ・統合した顧客情報は削除し（削除フラグ）、電話番号の重複件数と重複候補、会社単位の集計を更新する
+    param: groups。[(残す顧客情報のpk, [統合する顧客情報のpk...])...]
+    param: user。統合を行うユーザー
+    return: 統合した（削除した）顧客情報の件数
+    """
+    now = datetime.datetime.now()
+    with transaction.atomic():
+        all_pks = {pk for survivor, victims in groups for pk in [survivor] + list(victims)}
+        customers = {}
+        for batch in Batches(all_pks):
+            customers.update(
+                (customer.pk, customer)
+                for customer in CustomerInfo.objects.select_for_update().filter(
+                    workspace=workspace, delete_flg=False, pk__in=batch))
+        mapping = {}
+        for survivor, victims in groups:
+            if survivor not in customers:
+                continue
+            for victim in victims:
+                if victim in customers and victim != survivor and victim not in mapping:
+                    mapping[victim] = survivor
+        if not mapping:
+            return 0
+        merged = defaultdict(list)
+        for victim, survivor in mapping.items():
+            merged[survivor].append(victim)
+
+        # 統合前のコンタクト情報から、残す顧客情報に立てる済フラグを求める
+        contact_flags = defaultdict(set)
+        for batch in Batches(all_pks):
+            contacts = ContactInfo.objects.filter(
+                target_customer_id__in=batch, delete_flg=False).filter(
+                    Q(contact_type__in=list(CONTACT_FLAG_FIELDS))
+                    | Q(contact_type=0, visited_flg=True)).values_list(
+                        'target_customer_id', 'contact_type').distinct()
+            for pk, contact_type in contacts:
+                contact_flags[mapping.get(pk, pk)].add(
+                    CONTACT_FLAG_FIELDS.get(contact_type, 'visited_flg'))
+        supplements = {}
+        for batch in Batches(all_pks):
+            supplements.update(
+                (supplement.customer_id, supplement)
+                for supplement in CustomerInfoSupplement.objects.filter(customer_id__in=batch))
+
+        transitions = []
+        new_supplements = []
+        for survivor_pk, victims in sorted(merged.items()):
+            survivor = customers[survivor_pk]
+            # 最近修正された顧客情報の値を優先する
+            others = sorted((customers[pk] for pk in victims),
+                            key=lambda c: c.modified_timestamp, reverse=True)
+            changes = _MergeValues(survivor, others, contact_flags[survivor_pk])
+            if 'action_status' in changes:
+                from_status = survivor.action_status
+                survivor.action_status = changes['action_status']
+                transitions.append(BuildActionStatusTransition(survivor, from_status, user))
+            CustomerInfo.objects.filter(pk=survivor_pk).update(
+                modifier=user.email, modified_timestamp=now, **changes)
+
+            supplement_changes = _MergeSupplement(survivor_pk, [survivor_pk] + victims,
+                                                  supplements)
+            if survivor_pk in supplements and supplement_changes:
+                CustomerInfoSupplement.objects.filter(customer_id=survivor_pk).update(
+                    **supplement_changes)
+            elif supplement_changes:
+                new_supplements.append(
+                    CustomerInfoSupplement(customer_id=survivor_pk, **supplement_changes))
+        CustomerInfoSupplement.objects.bulk_create(new_supplements)
+        ActionStatusTransition.objects.bulk_create(transitions)
+
+        _Repoint(ContactInfo, 'target_customer', mapping)
+        _Repoint(ActionStatusTransition, 'customer', mapping)
+        _Repoint(AddressInfo, 'related_customer', mapping)
+        _MergeSharedRows(mapping)
+        for batch in Batches(mapping):
+            CustomerInfo.objects.filter(pk__in=batch).update(
+                delete_flg=True, deleted_timestamp=now, modifier=user.email,
+                modified_timestamp=now)
+
+        RemoveDuplicateEntries(list(mapping))
+        RecountDuplicatePhoneNumbers(user, list(merged))
+        RefreshDuplicates(workspace, list(merged))
+        RefreshCompanyRollups(workspace, set(mapping) | set(merged))
+    return len(mapping)
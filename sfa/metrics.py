@@ -0,0 +1,163 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, FloatField, Value, When
+import logging
+import requests
+import threading
+import time
+
+# 計測する指標と、ヒストグラムの区切り（上限値）
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+METRICS = (
+    ('request_seconds', SECONDS_BUCKETS, '画面の処理時間（秒）'),
+    ('sql_queries', COUNT_BUCKETS, '1リクエストで発行されたSQLの件数'),
+    ('sql_seconds', SECONDS_BUCKETS, '1リクエストのSQLの合計時間（秒）'),
+    ('template_seconds', SECONDS_BUCKETS, 'テンプレートの描画時間（秒）。描画中のSQLの時間を含む'),
+    ('http_seconds', SECONDS_BUCKETS, '外部API（ジオコーディング、reCAPTCHA）の呼び出し時間（秒）'),
+)
+METRIC_PREFIX = 'sfa_'
+
+# 各ワーカーのプロセス内に貯めておき、一定間隔でデータベースに加算する
+_pending = defaultdict(float)
+_lock = threading.Lock()
+_state = {'flushed': time.monotonic()}
+# リクエストを処理中のスレッドごとの外部API呼び出し時間
+_local = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def FormatBound(bound):
+    return repr(float(bound))
+
+
+def StartHttpTimer():
+    """
+    リクエストの処理開始時に、外部API呼び出し時間の集計をリセットする
+    """
+    _local.http_seconds = 0.0
+
+
+def GetHttpSeconds():
+    return getattr(_local, 'http_seconds', 0.0)
+
+
+def InstrumentedGet(url, **kwargs):
+    """
+    requests.getを呼び出し、かかった時間を処理中のリクエストの外部API呼び出し時間に加算する
+    """
+    started = time.perf_counter()
+    try:
+        return requests.get(url, **kwargs)
+    finally:
+        _local.http_seconds = GetHttpSeconds() + time.perf_counter() - started
+
+
+def ObserveRequest(url_name, values):
+    """
+    1リクエスト分の計測値をヒストグラムに加算する
+    param: url_name。URL名（名前空間付き）
+    param: values。指標名をキーにした計測値の辞書
+    """
+    with _lock:
+        for metric, buckets, _ in METRICS:
+            value = values.get(metric)
+            if value is None:
+                continue
+            # Prometheusのヒストグラムは累積値のため、値以上の区切りすべてに加算する
+            for bound in buckets:
+                if value <= bound:
+                    _pending[(url_name, metric, FormatBound(bound))] += 1
+            _pending[(url_name, metric, '+Inf')] += 1
+            _pending[(url_name, metric, 'sum')] += value
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        due = time.monotonic() - _state['flushed'] >= interval
+    if due:
+        try:
+            FlushMetrics()
+        except Exception:
+            # 計測値の書き込みに失敗しても、利用者のリクエストはエラーにしない
+            logger.exception('計測値をデータベースに書き込めませんでした。')
+
+
+def _WritePending(pending):
+    """
+    計測値を1つのトランザクションでまとめて加算する。
+    既存の行はpkの順にロックしてから1回のUPDATE（Case式）で加算し、ない行はbulk_createで作成する
+    """
+    from .dedup import Batches
+    from .models import RequestMetric
+    with transaction.atomic():
+        # 複数のワーカーが同じ行を更新してもデッドロックしないよう、pkの順にロックする
+        existing = {
+            (row.url_name, row.metric, row.bucket): row.pk
+            for row in RequestMetric.objects.select_for_update().filter(
+                url_name__in={key[0] for key in pending}).order_by('pk')
+        }
+        RequestMetric.objects.bulk_create([
+            RequestMetric(url_name=url_name, metric=metric, bucket=bucket, value=value)
+            for (url_name, metric, bucket), value in pending.items()
+            if (url_name, metric, bucket) not in existing
+        ])
+        increments = {existing[key]: value for key, value in pending.items() if key in existing}
+        # IN句のpkに加えて、Case式でpkと加算する値を使う
+        for batch in Batches(increments, params_per_value=3):
+            RequestMetric.objects.filter(pk__in=batch).update(value=Case(
+                *[When(pk=pk, then=F('value') + Value(increments[pk])) for pk in batch],
+                default=F('value'), output_field=FloatField()))
+
+
+def FlushMetrics():
+    """
+    プロセス内に貯めた計測値をデータベースに加算する。
+    複数のワーカーが同時に加算しても値が失われないよう、F式で加算する。
+    書き込みに失敗した場合は、次回に加算できるよう計測値をプロセス内に戻してから例外を送出する
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _state['flushed'] = time.monotonic()
+    if not pending:
+        return
+    try:
+        try:
+            _WritePending(pending)
+        except IntegrityError:
+            # 他のワーカーが同じ行を先に作成した場合は、作成済みの行に加算し直す
+            _WritePending(pending)
+    except Exception:
+        with _lock:
+            for key, value in pending.items():
+                _pending[key] += value
+        raise
+
+
+def RenderPrometheus():
+    """
+    データベースに集計された計測値をPrometheusのテキスト形式で返す
+    """
+    from .models import RequestMetric
+    values = defaultdict(dict)
+    for row in RequestMetric.objects.all():
+        values[(row.metric, row.url_name)][row.bucket] = row.value
+
+    lines = []
+    for metric, buckets, help_text in METRICS:
+        name = METRIC_PREFIX + metric
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} histogram'.format(name))
+        url_names = sorted(
+            url_name for (row_metric, url_name) in values if row_metric == metric)
+        for url_name in url_names:
+            observed = values[(metric, url_name)]
+            label = url_name.replace('\\', '\\\\').replace('"', '\\"')
+            for bound in [FormatBound(bound) for bound in buckets] + ['+Inf']:
+                lines.append('{}_bucket{{url_name="{}",le="{}"}} {}'.format(
+                    name, label, bound, int(observed.get(bound, 0))))
+            lines.append('{}_sum{{url_name="{}"}} {}'.format(
+                name, label, observed.get('sum', 0)))
+            lines.append('{}_count{{url_name="{}"}} {}'.format(
+                name, label, int(observed.get('+Inf', 0))))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.db import connection
+from .metrics import ObserveRequest, StartHttpTimer, GetHttpSeconds
+from .profiling import QueryLogRecorder, IsProfilingRequested, SaveRequestProfile
+from .query_budget import QueryRecorder, QueryBudgetExceeded, GetQueryBudget
+from .slow_query import SlowQueryRecorder, WriteSlowQueries
+import cProfile
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCountMiddleware:
+    """
+    リクエストごとに発行されたSQLの件数と合計時間を記録する。
+    記録した値はrequest.query_countとrequest.query_time（秒）に設定する。
+    URL名ごとに宣言された上限（query_budgets）を超えた場合は警告を出力し、
+    QUERY_BUDGET_STRICTが有効な場合は例外にする。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        request.query_count = recorder.count
+        request.query_time = recorder.time
+
+        budget = GetQueryBudget(getattr(request, 'resolver_match', None))
+        if budget is not None and recorder.count > budget:
+            message = '{}: クエリ数が上限を超えています。{}件（上限{}件）'.format(
+                request.resolver_match.view_name, recorder.count, budget)
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time'] = '{:.1f}'.format(recorder.time * 1000)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    画面（URL名）ごとに、処理時間・SQLの件数と時間・テンプレートの描画時間・外部APIの呼び出し時間を
+    ヒストグラムに集計する。SQLの件数と時間はQueryCountMiddlewareが記録した値を用いるため、
+    MIDDLEWAREではこのクラスをQueryCountMiddlewareより前（外側）に置く。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        request.template_time = 0.0
+        StartHttpTimer()
+        response = self.get_response(request)
+        resolver_match = getattr(request, 'resolver_match', None)
+        url_name = resolver_match.view_name if resolver_match and resolver_match.url_name else 'unresolved'
+        ObserveRequest(url_name, {
+            'request_seconds': time.perf_counter() - started,
+            'sql_queries': getattr(request, 'query_count', None),
+            'sql_seconds': getattr(request, 'query_time', None),
+            'template_seconds': request.template_time,
+            'http_seconds': GetHttpSeconds(),
+        })
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        TemplateResponseの描画にかかった時間を記録する
+        """
+        started = time.perf_counter()
+
+        def record_template_time(rendered_response):
+            request.template_time += time.perf_counter() - started
+
+        response.add_post_render_callback(record_template_time)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    オーナーまたは管理者が指示した場合に限り、1リクエスト分のcProfileとSQL（実行計画付き）を取得して保存する。
+    保存したプロファイルはプロファイル一覧画面からダウンロードできる。
+    プロファイルの保存で発行するSQLを画面のクエリ数に含めないよう、QueryCountMiddlewareより前（外側）に置く。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not IsProfilingRequested(request):
+            return self.get_response(request)
+
+        recorder = QueryLogRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        profile = SaveRequestProfile(request, profiler, recorder,
+                                     time.perf_counter() - started)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    SLOW_QUERY_THRESHOLD_MS（ミリ秒）以上かかったSQLを、画面のURL名・ワークスペース・
+    SQLを発行したビューやテンプレートの行と一緒にスロークエリログへ記録する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+        if threshold_ms is None:
+            return self.get_response(request)
+
+        recorder = SlowQueryRecorder(threshold_ms)
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if recorder.entries:
+            resolver_match = getattr(request, 'resolver_match', None)
+            user = getattr(request, 'user', None)
+            WriteSlowQueries(
+                recorder.entries,
+                resolver_match.view_name if resolver_match and resolver_match.url_name else '',
+                getattr(user, 'workspace_id', None))
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sfa', '0004_auto_20181109_1349'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField(verbose_name='集計日')),
+                ('action_status', models.CharField(choices=[('0', '未対応'), ('1', '対応予定'), ('2', '対応中'), ('3', '対応終了')], max_length=20, verbose_name='対応状況')),
+                ('customer_count', models.IntegerField(default=0, verbose_name='顧客数')),
+                ('potential_sum', models.BigIntegerField(default=0, verbose_name='ポテンシャル合計')),
+                ('sales_person', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='営業担当者')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース')),
+            ],
+            options={
+                'verbose_name': 'パイプラインスナップショット',
+                'verbose_name_plural': 'パイプラインスナップショット',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pipelinesnapshot',
+            index=models.Index(fields=['workspace', 'snapshot_date'], name='sfa_pipesnap_ws_date_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('register', '0001_initial'),
+        ('sfa', '0005_pipelinesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionStatusTransition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('0', '未対応'), ('1', '対応予定'), ('2', '対応中'), ('3', '対応終了')], max_length=20, verbose_name='変更前の対応状況')),
+                ('to_status', models.CharField(choices=[('0', '未対応'), ('1', '対応予定'), ('2', '対応中'), ('3', '対応終了')], max_length=20, verbose_name='変更後の対応状況')),
+                ('changed_timestamp', models.DateTimeField(auto_now_add=True, verbose_name='変更日時')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='変更者')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='sfa.CustomerInfo', verbose_name='対象顧客')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース')),
+            ],
+            options={
+                'verbose_name': '対応状況の変更履歴',
+                'verbose_name_plural': '対応状況の変更履歴',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='actionstatustransition',
+            index=models.Index(fields=['workspace', 'to_status', 'changed_timestamp'], name='sfa_transition_ws_to_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actionstatustransition',
+            index=models.Index(fields=['customer', 'changed_timestamp'], name='sfa_transition_cust_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0006_actionstatustransition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerInfoSupplement',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='supplement', serialize=False, to='sfa.CustomerInfo', verbose_name='顧客')),
+                ('url1', models.URLField(blank=True, max_length=512, verbose_name='企業URL1')),
+                ('url2', models.URLField(blank=True, max_length=512, verbose_name='企業URL2')),
+                ('url3', models.URLField(blank=True, max_length=512, verbose_name='企業URL3')),
+                ('related_document_url', models.URLField(blank=True, max_length=512, verbose_name='関連資料URL')),
+                ('remarks', models.TextField(blank=True, max_length=4096, verbose_name='備考')),
+            ],
+            options={
+                'verbose_name': '顧客情報の補足',
+                'verbose_name_plural': '顧客情報の補足',
+            },
+        ),
+        # 既存の顧客情報の補足項目を新しいテーブルへ移す
+        migrations.RunSQL(
+            sql=['''
+                INSERT INTO sfa_customerinfosupplement
+                    (customer_id, url1, url2, url3, related_document_url, remarks)
+                SELECT id, url1, url2, url3, related_document_url, remarks
+                FROM sfa_customerinfo
+            '''],
+            reverse_sql=['''
+                UPDATE sfa_customerinfo SET
+                    url1 = (SELECT s.url1 FROM sfa_customerinfosupplement s WHERE s.customer_id = sfa_customerinfo.id),
+                    url2 = (SELECT s.url2 FROM sfa_customerinfosupplement s WHERE s.customer_id = sfa_customerinfo.id),
+                    url3 = (SELECT s.url3 FROM sfa_customerinfosupplement s WHERE s.customer_id = sfa_customerinfo.id),
+                    related_document_url = (SELECT s.related_document_url FROM sfa_customerinfosupplement s WHERE s.customer_id = sfa_customerinfo.id),
+                    remarks = (SELECT s.remarks FROM sfa_customerinfosupplement s WHERE s.customer_id = sfa_customerinfo.id)
+                WHERE id IN (SELECT customer_id FROM sfa_customerinfosupplement)
+            '''],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0007_customerinfosupplement'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='customerinfo',
+            name='related_document_url',
+        ),
+        migrations.RemoveField(
+            model_name='customerinfo',
+            name='remarks',
+        ),
+        migrations.RemoveField(
+            model_name='customerinfo',
+            name='url1',
+        ),
+        migrations.RemoveField(
+            model_name='customerinfo',
+            name='url2',
+        ),
+        migrations.RemoveField(
+            model_name='customerinfo',
+            name='url3',
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0008_remove_customerinfo_supplement_fields'),
+    ]
+
+    operations = [
+        # 整数に変換できない値を事前に補正する
+        migrations.AlterField(
+            model_name='actionstatustransition',
+            name='from_status',
+            field=models.CharField(blank=True, null=True, max_length=20),
+        ),
+        migrations.RunSQL(
+            sql=[
+                "UPDATE sfa_actionstatustransition SET from_status = NULL WHERE from_status = ''",
+                "UPDATE sfa_customerinfo SET action_status = '0' WHERE action_status NOT IN ('0', '1', '2', '3')",
+                "UPDATE sfa_customerinfo SET public_status = '0' WHERE public_status NOT IN ('0', '1', '2')",
+                "UPDATE sfa_contactinfo SET contact_type = '0' WHERE contact_type NOT IN ('0', '1', '2', '3', '4', '5')",
+            ],
+            reverse_sql=[
+                "UPDATE sfa_actionstatustransition SET from_status = '' WHERE from_status IS NULL",
+            ],
+        ),
+        migrations.AlterField(
+            model_name='actionstatustransition',
+            name='from_status',
+            field=models.SmallIntegerField(blank=True, choices=[(0, '未対応'), (1, '対応予定'), (2, '対応中'), (3, '対応終了')], help_text='新規作成時は空になります。', null=True, verbose_name='変更前の対応状況'),
+        ),
+        migrations.AlterField(
+            model_name='actionstatustransition',
+            name='to_status',
+            field=models.SmallIntegerField(choices=[(0, '未対応'), (1, '対応予定'), (2, '対応中'), (3, '対応終了')], verbose_name='変更後の対応状況'),
+        ),
+        migrations.AlterField(
+            model_name='contactinfo',
+            name='contact_type',
+            field=models.SmallIntegerField(choices=[(0, '訪問'), (1, '架電（インバウンド）'), (2, '架電（アウトバウンド）'), (3, 'メール'), (4, 'FAX'), (5, 'DM')], default=0, verbose_name='対応種別'),
+        ),
+        migrations.AlterField(
+            model_name='customerinfo',
+            name='action_status',
+            field=models.SmallIntegerField(blank=True, choices=[(0, '未対応'), (1, '対応予定'), (2, '対応中'), (3, '対応終了')], default=0, verbose_name='対応状況'),
+        ),
+        migrations.AlterField(
+            model_name='customerinfo',
+            name='public_status',
+            field=models.SmallIntegerField(choices=[(0, '非公開'), (1, '閲覧可能'), (2, '編集可能')], default=0, verbose_name='公開ステータス'),
+        ),
+        migrations.AlterField(
+            model_name='pipelinesnapshot',
+            name='action_status',
+            field=models.SmallIntegerField(choices=[(0, '未対応'), (1, '対応予定'), (2, '対応中'), (3, '対応終了')], verbose_name='対応状況'),
+        ),
+        migrations.AddIndex(
+            model_name='contactinfo',
+            index=models.Index(fields=['operator', 'contact_type', 'contact_timestamp'], name='sfa_contact_op_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerinfo',
+            index=models.Index(fields=['workspace', 'sales_person', 'action_status'], name='sfa_cust_ws_sales_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerinfo',
+            index=models.Index(fields=['workspace', '-created_timestamp'], name='sfa_cust_ws_created_idx'),
+        ),
+    ]
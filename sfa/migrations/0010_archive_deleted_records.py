@@ -0,0 +1,103 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:21
+
+from django.db import migrations, models
+import datetime
+import django.db.models.deletion
+
+# PostgreSQLでは一覧・集計用の複合インデックスを削除されていない行だけの部分インデックスに置き換える
+# インデックス名は0009と同じにして、Djangoのマイグレーション状態とずれないようにしている
+PARTIAL_INDEXES = (
+    ('sfa_cust_ws_sales_status_idx', 'sfa_customerinfo',
+     '(workspace_id, sales_person_id, action_status)', 'NOT delete_flg'),
+    ('sfa_cust_ws_created_idx', 'sfa_customerinfo',
+     '(workspace_id, created_timestamp DESC)', 'NOT delete_flg'),
+    ('sfa_contact_op_type_ts_idx', 'sfa_contactinfo',
+     '(operator_id, contact_type, contact_timestamp)', 'NOT delete_flg'),
+)
+
+# アーカイブ対象の検索用。削除済みの行だけを持つため小さく保たれる
+DELETED_INDEXES = (
+    ('sfa_cust_deleted_ts_idx', 'sfa_customerinfo', '(deleted_timestamp)',
+     'delete_flg'),
+    ('sfa_contact_deleted_ts_idx', 'sfa_contactinfo', '(deleted_timestamp)',
+     'delete_flg'),
+)
+
+
+def set_deleted_timestamp(apps, schema_editor):
+    """既存の削除済みレコードは、マイグレーション実行日時を削除日時とみなす"""
+    now = datetime.datetime.now()
+    for model_name in ('CustomerInfo', 'ContactInfo'):
+        model = apps.get_model('sfa', model_name)
+        model.objects.filter(delete_flg=True).update(deleted_timestamp=now)
+
+
+def create_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, columns, condition in PARTIAL_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+        schema_editor.execute('CREATE INDEX {} ON {} {} WHERE {}'.format(
+            name, table, columns, condition))
+    for name, table, columns, condition in DELETED_INDEXES:
+        schema_editor.execute('CREATE INDEX {} ON {} {} WHERE {}'.format(
+            name, table, columns, condition))
+
+
+def drop_partial_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, columns, condition in DELETED_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+    for name, table, columns, condition in PARTIAL_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+        schema_editor.execute('CREATE INDEX {} ON {} {}'.format(
+            name, table, columns))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0001_initial'),
+        ('sfa', '0009_integer_status_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(choices=[('customerinfo', '顧客情報'), ('contactinfo', 'コンタクト情報')], max_length=20, verbose_name='種別')),
+                ('original_id', models.IntegerField(verbose_name='元のID')),
+                ('label', models.CharField(blank=True, max_length=255, verbose_name='表示名')),
+                ('payload', models.TextField(verbose_name='退避データ')),
+                ('deleted_timestamp', models.DateTimeField(blank=True, null=True, verbose_name='削除日時')),
+                ('archived_timestamp', models.DateTimeField(auto_now_add=True, verbose_name='アーカイブ日時')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース')),
+            ],
+            options={
+                'verbose_name': 'アーカイブ済みデータ',
+                'verbose_name_plural': 'アーカイブ済みデータ',
+            },
+        ),
+        migrations.AddField(
+            model_name='contactinfo',
+            name='deleted_timestamp',
+            field=models.DateTimeField(blank=True, help_text='アーカイブ対象の判定に使用します。', null=True, verbose_name='削除日時'),
+        ),
+        migrations.AddField(
+            model_name='customerinfo',
+            name='deleted_timestamp',
+            field=models.DateTimeField(blank=True, help_text='アーカイブ対象の判定に使用します。', null=True, verbose_name='削除日時'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedrecord',
+            index=models.Index(fields=['workspace', '-archived_timestamp'], name='sfa_archive_ws_ts_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedrecord',
+            unique_together={('model_name', 'original_id')},
+        ),
+        migrations.RunPython(set_deleted_timestamp, migrations.RunPython.noop),
+        migrations.RunPython(create_partial_indexes, drop_partial_indexes),
+    ]
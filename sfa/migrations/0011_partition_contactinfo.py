@@ -0,0 +1,105 @@
+from django.db import migrations
+import datetime
+
+# PostgreSQL 11以降では、コンタクト情報を対応日時(contact_timestamp)の月単位で
+# レンジパーティション化する。それ以外のデータベースでは何もしない。
+# パーティション化したテーブルの主キーにはパーティションキーを含める必要があるため、
+# データベース上の主キーは(id, contact_timestamp)になる。idはシーケンスで採番されるため一意のまま。
+TABLE = 'sfa_contactinfo'
+MONTHS_AHEAD = 3
+
+INDEXES = (
+    'CREATE INDEX sfa_contactinfo_target_customer_id_idx ON {table} (target_customer_id)',
+    'CREATE INDEX sfa_contactinfo_operator_id_idx ON {table} (operator_id)',
+    'CREATE INDEX sfa_contact_op_type_ts_idx ON {table} (operator_id, contact_type, contact_timestamp) WHERE NOT delete_flg',
+    'CREATE INDEX sfa_contact_deleted_ts_idx ON {table} (deleted_timestamp) WHERE delete_flg',
+)
+
+FOREIGN_KEYS = (
+    'ALTER TABLE {table} ADD CONSTRAINT sfa_contactinfo_target_customer_id_fk '
+    'FOREIGN KEY (target_customer_id) REFERENCES sfa_customerinfo (id) DEFERRABLE INITIALLY DEFERRED',
+    'ALTER TABLE {table} ADD CONSTRAINT sfa_contactinfo_operator_id_fk '
+    'FOREIGN KEY (operator_id) REFERENCES register_user (id) DEFERRABLE INITIALLY DEFERRED',
+)
+
+
+def supports_partitioning(connection):
+    return connection.vendor == 'postgresql' and connection.pg_version >= 110000
+
+
+def add_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def replace_table(schema_editor, old_table, create_sql):
+    """
+    既存のテーブルをold_tableへ改名し、新しい定義でコンタクト情報のテーブルを作成する
+    """
+    schema_editor.execute('ALTER TABLE {} RENAME TO {}'.format(TABLE, old_table))
+    schema_editor.execute(create_sql)
+    return old_table
+
+
+def copy_and_drop(schema_editor, old_table, primary_key):
+    schema_editor.execute('INSERT INTO {} SELECT * FROM {}'.format(TABLE, old_table))
+    schema_editor.execute(
+        'ALTER SEQUENCE sfa_contactinfo_id_seq OWNED BY {}.id'.format(TABLE))
+    # 旧テーブルと一緒に主キー・インデックス・外部キーも削除されるため、同じ名前で作り直せる
+    schema_editor.execute('DROP TABLE {}'.format(old_table))
+    schema_editor.execute(
+        'ALTER TABLE {} ADD CONSTRAINT sfa_contactinfo_pkey PRIMARY KEY {}'.format(
+            TABLE, primary_key))
+    for sql in FOREIGN_KEYS + INDEXES:
+        schema_editor.execute(sql.format(table=TABLE))
+
+
+def partition_contactinfo(apps, schema_editor):
+    if not supports_partitioning(schema_editor.connection):
+        return
+    old_table = replace_table(
+        schema_editor, 'sfa_contactinfo_unpartitioned',
+        'CREATE TABLE {table} (LIKE sfa_contactinfo_unpartitioned INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (contact_timestamp)'.format(table=TABLE))
+
+    # 既存データの最初の月から、数か月先までの月次パーティションを作成する
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(contact_timestamp) FROM {}'.format(old_table))
+        first_timestamp = cursor.fetchone()[0]
+    today = datetime.date.today()
+    month = (first_timestamp.date() if first_timestamp else today).replace(day=1)
+    last_month = today.replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last_month = add_month(last_month)
+    while month <= last_month:
+        schema_editor.execute(
+            "CREATE TABLE {table}_p{suffix} PARTITION OF {table} "
+            "FOR VALUES FROM ('{start}') TO ('{end}')".format(
+                table=TABLE, suffix=month.strftime('%Y%m'),
+                start=month.isoformat(), end=add_month(month).isoformat()))
+        month = add_month(month)
+    # 月次パーティションが作成されていない日時のデータを受け止める
+    schema_editor.execute(
+        'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT'.format(table=TABLE))
+
+    copy_and_drop(schema_editor, old_table, '(id, contact_timestamp)')
+
+
+def unpartition_contactinfo(apps, schema_editor):
+    if not supports_partitioning(schema_editor.connection):
+        return
+    old_table = replace_table(
+        schema_editor, 'sfa_contactinfo_partitioned',
+        'CREATE TABLE {table} (LIKE sfa_contactinfo_partitioned INCLUDING DEFAULTS)'.format(
+            table=TABLE))
+    copy_and_drop(schema_editor, old_table, '(id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0010_archive_deleted_records'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_contactinfo, unpartition_contactinfo),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0011_partition_contactinfo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestMetric',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=100, verbose_name='URL名')),
+                ('metric', models.CharField(max_length=30, verbose_name='指標')),
+                ('bucket', models.CharField(max_length=10, verbose_name='区分')),
+                ('value', models.FloatField(default=0, verbose_name='値')),
+            ],
+            options={
+                'verbose_name': '画面の計測値',
+                'verbose_name_plural': '画面の計測値',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='requestmetric',
+            unique_together={('url_name', 'metric', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.0.8 on 2026-10-20 01:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('register', '0001_initial'),
+        ('sfa', '0012_requestmetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(blank=True, max_length=100, verbose_name='URL名')),
+                ('path', models.CharField(max_length=2000, verbose_name='パス')),
+                ('duration', models.FloatField(verbose_name='処理時間（秒）')),
+                ('query_count', models.IntegerField(verbose_name='SQLの件数')),
+                ('report', models.TextField(verbose_name='レポート')),
+                ('profile_data', models.BinaryField(verbose_name='プロファイル')),
+                ('created_timestamp', models.DateTimeField(auto_now_add=True, verbose_name='取得日時')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='ユーザー')),
+                ('workspace', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース')),
+            ],
+            options={
+                'verbose_name': 'プロファイル',
+                'verbose_name_plural': 'プロファイル',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='requestprofile',
+            index=models.Index(fields=['workspace', '-created_timestamp'], name='sfa_profile_ws_created_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.0.8 on 2026-10-20 02:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0001_initial'),
+        ('sfa', '0013_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCluster',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.SmallIntegerField(choices=[(0, '未確認'), (1, '重複'), (2, '重複ではない')], default=0, verbose_name='確認状況')),
+                ('score', models.FloatField(default=0, verbose_name='類似度')),
+                ('created_timestamp', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('modified_timestamp', models.DateTimeField(auto_now=True, verbose_name='修正日時')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース')),
+            ],
+            options={
+                'verbose_name': '重複候補',
+                'verbose_name_plural': '重複候補',
+            },
+        ),
+        migrations.CreateModel(
+            name='DuplicateClusterMember',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0, verbose_name='類似度')),
+                ('reasons', models.CharField(blank=True, max_length=100, verbose_name='一致した項目')),
+                ('cluster', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='members', to='sfa.DuplicateCluster', verbose_name='重複候補')),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='duplicate_member', to='sfa.CustomerInfo', verbose_name='顧客')),
+            ],
+            options={
+                'verbose_name': '重複候補の顧客',
+                'verbose_name_plural': '重複候補の顧客',
+            },
+        ),
+        migrations.CreateModel(
+            name='DuplicateKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, verbose_name='キー')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='sfa.CustomerInfo', verbose_name='顧客')),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース')),
+            ],
+            options={
+                'verbose_name': '重複候補の索引',
+                'verbose_name_plural': '重複候補の索引',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='duplicatekey',
+            index=models.Index(fields=['workspace', 'key'], name='sfa_dupkey_ws_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='duplicatecluster',
+            index=models.Index(fields=['workspace', 'status', '-score'], name='sfa_dupcluster_ws_status_idx'),
+        ),
+    ]
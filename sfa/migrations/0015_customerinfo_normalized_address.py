@@ -0,0 +1,106 @@
+# Generated by Django 2.0.8 on 2026-10-20 02:12
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, Value, When
+import re
+import unicodedata
+
+# 1回のUPDATEで設定する件数（SQLiteのパラメータ数の上限を超えないようにする）
+BATCH_SIZE = 300
+
+# 以下は、このマイグレーションを作成した時点のsfa.common_util.NormalizeJapaneseAddressの写し。
+# 後で正規化の方法を変えても、このマイグレーションが書き込む値が変わらないようにする
+NORMALIZED_ADDRESS_LENGTH = 100
+_KANJI_DIGITS = {'〇': 0, '一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_KANJI_UNITS = {'十': 10, '百': 100, '千': 1000}
+_KANJI_NUMBER_RE = re.compile(r'[〇一二三四五六七八九十百千]+(?=丁目|番地|番(?!町)|号)')
+_ADDRESS_SEPARATOR_RE = re.compile(r'(?<=\d)(?:[ｰー]|丁目|番地|番(?!町)|の)(?=\d)')
+_ADDRESS_SUFFIX_RE = re.compile(r'(?<=\d)(?:丁目|番地|番(?!町)|号)(?!\d)')
+
+
+def _build_address_table():
+    table = {}
+    for code in range(0xFF01, 0xFFEF):
+        normalized = unicodedata.normalize('NFKC', chr(code))
+        if len(normalized) == 1:
+            table[code] = normalized
+    for dash in '‐‑‒–—―−－':
+        table[ord(dash)] = '-'
+    for space in ' \t\r\n\u3000':
+        table[ord(space)] = None
+    return str.maketrans(table)
+
+
+_ADDRESS_TABLE = _build_address_table()
+
+
+def _kanji_to_number(match):
+    text = match.group(0)
+    if not any(char in _KANJI_UNITS for char in text):
+        return ''.join(str(_KANJI_DIGITS[char]) for char in text)
+    total = 0
+    current = 0
+    for char in text:
+        if char in _KANJI_UNITS:
+            total += (current or 1) * _KANJI_UNITS[char]
+            current = 0
+        else:
+            current = current * 10 + _KANJI_DIGITS[char]
+    return str(total + current)
+
+
+def _normalize_text(address):
+    address = (address or '').translate(_ADDRESS_TABLE)
+    if '丁目' in address or '番' in address or '号' in address:
+        address = _KANJI_NUMBER_RE.sub(_kanji_to_number, address)
+        address = _ADDRESS_SUFFIX_RE.sub('', _ADDRESS_SEPARATOR_RE.sub('-', address))
+    elif 'の' in address or 'ー' in address or 'ｰ' in address:
+        address = _ADDRESS_SEPARATOR_RE.sub('-', address)
+    return address
+
+
+def normalize_address(address1, address2):
+    prefecture = _normalize_text(address1)
+    rest = _normalize_text(address2)
+    if rest.startswith(prefecture):
+        prefecture = ''
+    return (prefecture + rest)[:NORMALIZED_ADDRESS_LENGTH]
+
+
+def set_normalized_address(apps, schema_editor):
+    """既存の顧客情報の正規化した住所を設定する"""
+    CustomerInfo = apps.get_model('sfa', 'CustomerInfo')
+    last_pk = 0
+    while True:
+        rows = list(
+            CustomerInfo.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', 'address1', 'address2')[:BATCH_SIZE])
+        if not rows:
+            break
+        values = [normalize_address(address1, address2) for _, address1, address2 in rows]
+        CustomerInfo.objects.filter(pk__in=[row[0] for row in rows]).update(
+            normalized_address=Case(
+                *[When(pk=row[0], then=Value(value)) for row, value in zip(rows, values)],
+                default=Value(''),
+                output_field=CharField()))
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0014_duplicate_cluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerinfo',
+            name='normalized_address',
+            field=models.CharField(blank=True, editable=False, help_text='都道府県と市区町村番地の表記ゆれをなくしたものです。保存時に自動で設定されます。', max_length=100, verbose_name='正規化した住所'),
+        ),
+        migrations.AddIndex(
+            model_name='customerinfo',
+            index=models.Index(fields=['workspace', 'normalized_address'], name='sfa_cust_ws_address_idx'),
+        ),
+        migrations.RunPython(set_normalized_address, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.0.8 on 2026-10-20 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0015_customerinfo_normalized_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostalCode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zip_code', models.CharField(max_length=7, verbose_name='郵便番号')),
+                ('prefecture', models.CharField(max_length=10, verbose_name='都道府県')),
+                ('city', models.CharField(max_length=40, verbose_name='市区町村')),
+                ('town', models.CharField(blank=True, max_length=100, verbose_name='町域')),
+                ('latitude', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True, verbose_name='代表地点の緯度')),
+                ('longitude', models.DecimalField(blank=True, decimal_places=7, max_digits=10, null=True, verbose_name='代表地点の経度')),
+            ],
+            options={
+                'verbose_name': '郵便番号',
+                'verbose_name_plural': '郵便番号',
+            },
+        ),
+        migrations.AddField(
+            model_name='customerinfo',
+            name='approximate_location',
+            field=models.BooleanField(default=False, editable=False, help_text='住所から緯度経度を取得できず、郵便番号の代表地点で代用している場合にTrueになります。', verbose_name='緯度経度が概算'),
+        ),
+        migrations.AddIndex(
+            model_name='postalcode',
+            index=models.Index(fields=['zip_code'], name='sfa_postalcode_zip_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.0.8 on 2026-10-20 02:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('register', '0001_initial'),
+        ('sfa', '0016_postalcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('corporate_number', models.CharField(max_length=13, verbose_name='法人番号')),
+                ('company_name', models.CharField(max_length=40, verbose_name='企業名')),
+                ('customer_count', models.IntegerField(default=0, verbose_name='顧客情報の件数')),
+                ('potential_sum', models.BigIntegerField(default=0, verbose_name='ポテンシャルの合計')),
+                ('sales_person_count', models.IntegerField(default=0, verbose_name='営業担当者の人数')),
+                ('contact_count', models.IntegerField(default=0, verbose_name='コンタクト情報の件数')),
+                ('last_contact_timestamp', models.DateTimeField(blank=True, null=True, verbose_name='最終対応日時')),
+                ('modified_timestamp', models.DateTimeField(auto_now=True, verbose_name='集計日時')),
+            ],
+            options={
+                'verbose_name': '会社単位の集計',
+                'verbose_name_plural': '会社単位の集計',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='customerinfo',
+            index=models.Index(fields=['workspace', 'corporate_number'], name='sfa_cust_ws_corp_idx'),
+        ),
+        migrations.AddField(
+            model_name='companyrollup',
+            name='workspace',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='register.Workspace', verbose_name='ワークスペース'),
+        ),
+        migrations.AddIndex(
+            model_name='companyrollup',
+            index=models.Index(fields=['workspace', '-potential_sum'], name='sfa_company_ws_potential_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='companyrollup',
+            unique_together={('workspace', 'corporate_number')},
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.0.8 on 2026-10-20 02:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0017_companyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='addressinfo',
+            name='related_customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='address_infos', to='sfa.CustomerInfo', verbose_name='関連付けた顧客'),
+        ),
+        migrations.AddField(
+            model_name='addressinfo',
+            name='related_reasons',
+            field=models.CharField(blank=True, max_length=100, verbose_name='一致した項目'),
+        ),
+    ]
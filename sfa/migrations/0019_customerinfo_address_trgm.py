@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# 市区町村番地の検索（filters.pyのfilter_address2）は、address2とnormalized_addressの部分一致（LIKE '%…%'）で行う。
+# 先頭にワイルドカードがあるLIKEはB-treeのインデックス（sfa_cust_ws_address_idx）を使えないため、
+# PostgreSQLではpg_trgmのGINインデックスを作成する。それ以外のデータベースでは何もしない。
+INDEXES = (
+    ('sfa_cust_address2_trgm_idx', 'address2'),
+    ('sfa_cust_norm_address_trgm_idx', 'normalized_address'),
+)
+
+
+def create_trgm_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {} ON sfa_customerinfo USING gin ({} gin_trgm_ops)'.format(name, column))
+
+
+def drop_trgm_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sfa', '0018_addressinfo_related_customer'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trgm_indexes, drop_trgm_indexes),
+    ]
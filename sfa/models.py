@@ -10,25 +10,25 @@ from register.models import MyGroup, Workspace, User
 import datetime
 
 ACTION_CHOICES = (
-    ('0', '未対応'),
-    ('1', '対応予定'),
-    ('2', '対応中'),
-    ('3', '対応終了'),
+    (0, '未対応'),
+    (1, '対応予定'),
+    (2, '対応中'),
+    (3, '対応終了'),
 )
 
 PUBLIC_CHOICES = (
-    ('0', '非公開'),
-    ('1', '閲覧可能'),
-    ('2', '編集可能'),
+    (0, '非公開'),
+    (1, '閲覧可能'),
+    (2, '編集可能'),
 )
 
 CONTACT_CHOICES = (
-    ('0', '訪問'),
-    ('1', '架電（インバウンド）'),
-    ('2', '架電（アウトバウンド）'),
-    ('3', 'メール'),
-    ('4', 'FAX'),
-    ('5', 'DM'),
+    (0, '訪問'),
+    (1, '架電（インバウンド）'),
+    (2, '架電（アウトバウンド）'),
+    (3, 'メール'),
+    (4, 'FAX'),
+    (5, 'DM'),
 )
 
 
@@ -158,6 +158,14 @@ class CustomerInfo(models.Model):
         blank=True,
     )
 
+    normalized_address = models.CharField(
+        verbose_name='正規化した住所',
+        max_length=100,
+        blank=True,
+        editable=False,
+        help_text='都道府県と市区町村番地の表記ゆれをなくしたものです。保存時に自動で設定されます。',
+    )
+
     latitude = models.DecimalField(
         verbose_name='緯度',
         max_digits=10,
@@ -174,22 +182,11 @@ class CustomerInfo(models.Model):
         null=True,
     )
 
-    url1 = models.URLField(
-        verbose_name='企業URL1',
-        max_length=512,
-        blank=True,
-    )
-
-    url2 = models.URLField(
-        verbose_name='企業URL2',
-        max_length=512,
-        blank=True,
-    )
-
-    url3 = models.URLField(
-        verbose_name='企業URL3',
-        max_length=512,
-        blank=True,
+    approximate_location = models.BooleanField(
+        verbose_name='緯度経度が概算',
+        default=False,
+        editable=False,
+        help_text='住所から緯度経度を取得できず、郵便番号の代表地点で代用している場合にTrueになります。',
     )
 
     industry_code = models.CharField(
@@ -236,18 +233,6 @@ class CustomerInfo(models.Model):
         default=False,
     )
 
-    related_document_url = models.URLField(
-        verbose_name='関連資料URL',
-        max_length=512,
-        blank=True,
-    )
-
-    remarks = models.TextField(
-        verbose_name='備考',
-        max_length=4096,
-        blank=True,
-    )
-
     workspace = models.ForeignKey(
         Workspace,
         verbose_name='ワークスペース',
@@ -295,12 +280,11 @@ class CustomerInfo(models.Model):
         null=True,
         on_delete=models.PROTECT)
 
-    action_status = models.CharField(
+    action_status = models.SmallIntegerField(
         verbose_name='対応状況',
-        max_length=20,
         blank=True,
         choices=ACTION_CHOICES,
-        default='0',
+        default=0,
     )
 
     tel_called_flg = models.BooleanField(
@@ -333,11 +317,10 @@ class CustomerInfo(models.Model):
         default=False,
     )
 
-    public_status = models.CharField(
+    public_status = models.SmallIntegerField(
         verbose_name='公開ステータス',
-        max_length=1,
         choices=PUBLIC_CHOICES,
-        default='0',
+        default=0,
     )
 
     delete_flg = models.BooleanField(
@@ -346,6 +329,13 @@ class CustomerInfo(models.Model):
         default=False,
     )
 
+    deleted_timestamp = models.DateTimeField(
+        verbose_name='削除日時',
+        blank=True,
+        null=True,
+        help_text='アーカイブ対象の判定に使用します。',
+    )
+
     author = models.CharField(
         verbose_name='作成者',
         max_length=256,
@@ -371,13 +361,34 @@ class CustomerInfo(models.Model):
     def __str__(self):
         return self.customer_name
 
+    def save(self, *args, **kwargs):
+        # 循環参照にならないよう、ここでimportする
+        from .common_util import NormalizeJapaneseAddress
+        self.normalized_address = NormalizeJapaneseAddress(self.address1, self.address2)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('address1' in update_fields
+                                          or 'address2' in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'normalized_address'}
+        super().save(*args, **kwargs)
+
+    def get_supplement(self):
+        """
+        補足情報を返す。まだ作成されていない場合は保存前の空の補足情報を返す
+        """
+        if self.pk:
+            try:
+                return self.supplement
+            except CustomerInfoSupplement.DoesNotExist:
+                pass
+        return CustomerInfoSupplement(customer=self)
+
     def is_editable(self, email):
         """
         顧客情報が指定されたユーザーで編集可能かどうか確認する
         """
         if email == self.author:
             return True
-        if self.public_status == '2':
+        if self.public_status == 2:
             return True
         # ユーザーが編集可能かどうか確認
         for editable_user in self.shared_edit_user.all():
@@ -395,6 +406,71 @@ class CustomerInfo(models.Model):
     class Meta:
         verbose_name = '顧客情報'
         verbose_name_plural = '顧客情報'
+        indexes = [
+            models.Index(
+                fields=['workspace', 'sales_person', 'action_status'],
+                name='sfa_cust_ws_sales_status_idx'),
+            models.Index(
+                fields=['workspace', '-created_timestamp'],
+                name='sfa_cust_ws_created_idx'),
+            models.Index(
+                fields=['workspace', 'normalized_address'],
+                name='sfa_cust_ws_address_idx'),
+            models.Index(
+                fields=['workspace', 'corporate_number'],
+                name='sfa_cust_ws_corp_idx'),
+        ]
+
+
+class CustomerInfoSupplement(models.Model):
+    """
+    顧客情報の補足
+    一覧画面では使わない文字数の大きい項目を、顧客情報とは別のテーブルに保存する
+    """
+    customer = models.OneToOneField(
+        CustomerInfo,
+        verbose_name='顧客',
+        primary_key=True,
+        related_name='supplement',
+        on_delete=models.CASCADE,
+    )
+
+    url1 = models.URLField(
+        verbose_name='企業URL1',
+        max_length=512,
+        blank=True,
+    )
+
+    url2 = models.URLField(
+        verbose_name='企業URL2',
+        max_length=512,
+        blank=True,
+    )
+
+    url3 = models.URLField(
+        verbose_name='企業URL3',
+        max_length=512,
+        blank=True,
+    )
+
+    related_document_url = models.URLField(
+        verbose_name='関連資料URL',
+        max_length=512,
+        blank=True,
+    )
+
+    remarks = models.TextField(
+        verbose_name='備考',
+        max_length=4096,
+        blank=True,
+    )
+
+    def __str__(self):
+        return str(self.customer)
+
+    class Meta:
+        verbose_name = '顧客情報の補足'
+        verbose_name_plural = '顧客情報の補足'
 
 
 class ContactInfo(models.Model):
@@ -417,12 +493,10 @@ class ContactInfo(models.Model):
         on_delete=models.PROTECT,
     )
 
-    contact_type = models.CharField(
+    contact_type = models.SmallIntegerField(
         verbose_name='対応種別',
-        max_length=20,
-        blank=False,
         choices=CONTACT_CHOICES,
-        default='0',
+        default=0,
     )
 
     target_person = models.CharField(
@@ -510,6 +584,13 @@ class ContactInfo(models.Model):
         default=False,
     )
 
+    deleted_timestamp = models.DateTimeField(
+        verbose_name='削除日時',
+        blank=True,
+        null=True,
+        help_text='アーカイブ対象の判定に使用します。',
+    )
+
     # 管理サイト上の表示設定
     def __str__(self):
         return self.target_customer.customer_name
@@ -517,6 +598,11 @@ class ContactInfo(models.Model):
     class Meta:
         verbose_name = 'コンタクト情報'
         verbose_name_plural = 'コンタクト情報'
+        indexes = [
+            models.Index(
+                fields=['operator', 'contact_type', 'contact_timestamp'],
+                name='sfa_contact_op_type_ts_idx'),
+        ]
 
 
 class AddressInfo(models.Model):
@@ -709,6 +795,21 @@ class AddressInfo(models.Model):
         default=False,
     )
 
+    related_customer = models.ForeignKey(
+        CustomerInfo,
+        verbose_name='関連付けた顧客',
+        related_name='address_infos',
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+    )
+
+    related_reasons = models.CharField(
+        verbose_name='一致した項目',
+        max_length=100,
+        blank=True,
+    )
+
     author = models.ForeignKey(
         User,
         verbose_name='作成者',
@@ -856,3 +957,449 @@ class CustomerInfoDisplaySetting(models.Model):
         blank=True,
         default=True,
     )
+
+
+class PipelineSnapshot(models.Model):
+    """
+    パイプラインの日次スナップショット
+    営業担当者が空の行はワークスペース全体の集計を表す
+    """
+    snapshot_date = models.DateField(verbose_name='集計日', )
+
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        on_delete=models.PROTECT,
+    )
+
+    sales_person = models.ForeignKey(
+        User,
+        verbose_name='営業担当者',
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+    )
+
+    action_status = models.SmallIntegerField(
+        verbose_name='対応状況',
+        choices=ACTION_CHOICES,
+    )
+
+    customer_count = models.IntegerField(
+        verbose_name='顧客数',
+        default=0,
+    )
+
+    potential_sum = models.BigIntegerField(
+        verbose_name='ポテンシャル合計',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'パイプラインスナップショット'
+        verbose_name_plural = 'パイプラインスナップショット'
+        indexes = [
+            models.Index(
+                fields=['workspace', 'snapshot_date'],
+                name='sfa_pipesnap_ws_date_idx'),
+        ]
+
+
+class ActionStatusTransition(models.Model):
+    """
+    顧客情報の対応状況の変更履歴
+    追記のみで更新は行わない。顧客情報をアーカイブする際に一緒に退避する
+    """
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        on_delete=models.PROTECT,
+    )
+
+    customer = models.ForeignKey(
+        CustomerInfo,
+        verbose_name='対象顧客',
+        on_delete=models.PROTECT,
+    )
+
+    from_status = models.SmallIntegerField(
+        verbose_name='変更前の対応状況',
+        blank=True,
+        null=True,
+        choices=ACTION_CHOICES,
+        help_text='新規作成時は空になります。',
+    )
+
+    to_status = models.SmallIntegerField(
+        verbose_name='変更後の対応状況',
+        choices=ACTION_CHOICES,
+    )
+
+    changed_by = models.ForeignKey(
+        User,
+        verbose_name='変更者',
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+    )
+
+    changed_timestamp = models.DateTimeField(
+        verbose_name='変更日時', auto_now_add=True)
+
+    class Meta:
+        verbose_name = '対応状況の変更履歴'
+        verbose_name_plural = '対応状況の変更履歴'
+        indexes = [
+            models.Index(
+                fields=['workspace', 'to_status', 'changed_timestamp'],
+                name='sfa_transition_ws_to_ts_idx'),
+            models.Index(
+                fields=['customer', 'changed_timestamp'],
+                name='sfa_transition_cust_ts_idx'),
+        ]
+
+
+ARCHIVE_MODEL_CHOICES = (
+    ('customerinfo', '顧客情報'),
+    ('contactinfo', 'コンタクト情報'),
+)
+
+
+class ArchivedRecord(models.Model):
+    """
+    論理削除から一定期間が経過した顧客情報・コンタクト情報の退避先
+    元のレコードは関連レコードとまとめてJSON形式でpayloadに保存し、オーナーが復元できるようにする
+    """
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        on_delete=models.PROTECT,
+    )
+
+    model_name = models.CharField(
+        verbose_name='種別',
+        max_length=20,
+        choices=ARCHIVE_MODEL_CHOICES,
+    )
+
+    original_id = models.IntegerField(verbose_name='元のID', )
+
+    label = models.CharField(
+        verbose_name='表示名',
+        max_length=255,
+        blank=True,
+    )
+
+    payload = models.TextField(verbose_name='退避データ', )
+
+    deleted_timestamp = models.DateTimeField(
+        verbose_name='削除日時',
+        blank=True,
+        null=True,
+    )
+
+    archived_timestamp = models.DateTimeField(
+        verbose_name='アーカイブ日時', auto_now_add=True)
+
+    def __str__(self):
+        return self.label
+
+    class Meta:
+        verbose_name = 'アーカイブ済みデータ'
+        verbose_name_plural = 'アーカイブ済みデータ'
+        unique_together = ('model_name', 'original_id')
+        indexes = [
+            models.Index(
+                fields=['workspace', '-archived_timestamp'],
+                name='sfa_archive_ws_ts_idx'),
+        ]
+
+
+class RequestMetric(models.Model):
+    """
+    画面（URL名）ごとの処理時間・SQL件数などのヒストグラム
+    gunicornの各ワーカーが一定間隔で差分を加算するため、ワーカーをまたいで集計できる
+    bucketにはヒストグラムの上限値（'0.05'、'+Inf'など）または合計値を表す'sum'が入る
+    """
+    url_name = models.CharField(
+        verbose_name='URL名',
+        max_length=100,
+    )
+
+    metric = models.CharField(
+        verbose_name='指標',
+        max_length=30,
+    )
+
+    bucket = models.CharField(
+        verbose_name='区分',
+        max_length=10,
+    )
+
+    value = models.FloatField(
+        verbose_name='値',
+        default=0,
+    )
+
+    def __str__(self):
+        return '{} {} {}'.format(self.url_name, self.metric, self.bucket)
+
+    class Meta:
+        verbose_name = '画面の計測値'
+        verbose_name_plural = '画面の計測値'
+        unique_together = ('url_name', 'metric', 'bucket')
+
+
+class RequestProfile(models.Model):
+    """
+    オーナーの指示で1リクエスト分だけ取得したプロファイル
+    cProfileの計測結果と、発行されたSQLおよび実行計画を保存し、ダウンロードできるようにする
+    """
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+    )
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='ユーザー',
+        on_delete=models.PROTECT,
+    )
+
+    url_name = models.CharField(
+        verbose_name='URL名',
+        max_length=100,
+        blank=True,
+    )
+
+    path = models.CharField(
+        verbose_name='パス',
+        max_length=2000,
+    )
+
+    duration = models.FloatField(verbose_name='処理時間（秒）', )
+
+    query_count = models.IntegerField(verbose_name='SQLの件数', )
+
+    report = models.TextField(verbose_name='レポート', )
+
+    profile_data = models.BinaryField(verbose_name='プロファイル', )
+
+    created_timestamp = models.DateTimeField(
+        verbose_name='取得日時', auto_now_add=True)
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = 'プロファイル'
+        verbose_name_plural = 'プロファイル'
+        indexes = [
+            models.Index(
+                fields=['workspace', '-created_timestamp'],
+                name='sfa_profile_ws_created_idx'),
+        ]
+
+
+DUPLICATE_STATUS_CHOICES = (
+    (0, '未確認'),
+    (1, '重複'),
+    (2, '重複ではない'),
+)
+
+
+class DuplicateKey(models.Model):
+    """
+    重複候補を探すための顧客情報の索引（ブロッキングキー）
+    同じキーを持つ顧客同士だけを比較するため、顧客ごとに正規化した企業名や電話番号などから作成する
+    """
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        on_delete=models.PROTECT,
+    )
+
+    customer = models.ForeignKey(
+        CustomerInfo,
+        verbose_name='顧客',
+        on_delete=models.PROTECT,
+    )
+
+    key = models.CharField(
+        verbose_name='キー',
+        max_length=100,
+    )
+
+    class Meta:
+        verbose_name = '重複候補の索引'
+        verbose_name_plural = '重複候補の索引'
+        indexes = [
+            models.Index(fields=['workspace', 'key'], name='sfa_dupkey_ws_key_idx'),
+        ]
+
+
+class DuplicateCluster(models.Model):
+    """
+    同じ企業と思われる顧客情報のまとまり
+    """
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        on_delete=models.PROTECT,
+    )
+
+    status = models.SmallIntegerField(
+        verbose_name='確認状況',
+        choices=DUPLICATE_STATUS_CHOICES,
+        default=0,
+    )
+
+    score = models.FloatField(verbose_name='類似度', default=0)
+
+    created_timestamp = models.DateTimeField(
+        verbose_name='作成日時', auto_now_add=True)
+
+    modified_timestamp = models.DateTimeField(
+        verbose_name='修正日時', auto_now=True)
+
+    class Meta:
+        verbose_name = '重複候補'
+        verbose_name_plural = '重複候補'
+        indexes = [
+            models.Index(
+                fields=['workspace', 'status', '-score'],
+                name='sfa_dupcluster_ws_status_idx'),
+        ]
+
+
+class DuplicateClusterMember(models.Model):
+    """
+    重複候補に含まれる顧客情報。顧客情報は1つの重複候補にのみ含まれる
+    """
+    cluster = models.ForeignKey(
+        DuplicateCluster,
+        verbose_name='重複候補',
+        related_name='members',
+        on_delete=models.PROTECT,
+    )
+
+    customer = models.OneToOneField(
+        CustomerInfo,
+        verbose_name='顧客',
+        related_name='duplicate_member',
+        on_delete=models.PROTECT,
+    )
+
+    score = models.FloatField(verbose_name='類似度', default=0)
+
+    reasons = models.CharField(
+        verbose_name='一致した項目',
+        max_length=100,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = '重複候補の顧客'
+        verbose_name_plural = '重複候補の顧客'
+
+
+class PostalCode(models.Model):
+    """
+    郵便番号の索引。日本郵便の郵便番号データ（KEN_ALL.CSV）から作成する。ワークスペースによらず共通
+    1つの郵便番号に複数の町域がある場合は、町域ごとに1行になる
+    """
+    zip_code = models.CharField(
+        verbose_name='郵便番号',
+        max_length=7,
+    )
+
+    prefecture = models.CharField(
+        verbose_name='都道府県',
+        max_length=10,
+    )
+
+    city = models.CharField(
+        verbose_name='市区町村',
+        max_length=40,
+    )
+
+    town = models.CharField(
+        verbose_name='町域',
+        max_length=100,
+        blank=True,
+    )
+
+    latitude = models.DecimalField(
+        verbose_name='代表地点の緯度',
+        max_digits=10,
+        decimal_places=7,
+        blank=True,
+        null=True,
+    )
+
+    longitude = models.DecimalField(
+        verbose_name='代表地点の経度',
+        max_digits=10,
+        decimal_places=7,
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = '郵便番号'
+        verbose_name_plural = '郵便番号'
+        indexes = [
+            models.Index(fields=['zip_code'], name='sfa_postalcode_zip_idx'),
+        ]
+
+
+class CompanyRollup(models.Model):
+    """
+    法人番号が同じ顧客情報（同じ会社の部署など）をまとめた、会社単位の集計
+    顧客情報やコンタクト情報が変更された時に、関係する法人番号の分だけ集計し直す
+    """
+    workspace = models.ForeignKey(
+        Workspace,
+        verbose_name='ワークスペース',
+        on_delete=models.PROTECT,
+    )
+
+    corporate_number = models.CharField(
+        verbose_name='法人番号',
+        max_length=13,
+    )
+
+    company_name = models.CharField(
+        verbose_name='企業名',
+        max_length=40,
+    )
+
+    customer_count = models.IntegerField(verbose_name='顧客情報の件数', default=0)
+
+    potential_sum = models.BigIntegerField(verbose_name='ポテンシャルの合計', default=0)
+
+    sales_person_count = models.IntegerField(verbose_name='営業担当者の人数', default=0)
+
+    contact_count = models.IntegerField(verbose_name='コンタクト情報の件数', default=0)
+
+    last_contact_timestamp = models.DateTimeField(
+        verbose_name='最終対応日時',
+        blank=True,
+        null=True,
+    )
+
+    modified_timestamp = models.DateTimeField(
+        verbose_name='集計日時', auto_now=True)
+
+    class Meta:
+        verbose_name = '会社単位の集計'
+        verbose_name_plural = '会社単位の集計'
+        unique_together = (('workspace', 'corporate_number'), )
+        indexes = [
+            models.Index(
+                fields=['workspace', '-potential_sum'],
+                name='sfa_company_ws_potential_idx'),
+        ]
@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Avg, Case, F, Q, Value, When
+from .common_util import ExtractNumber, NormalizeJapaneseAddress
+from .dedup import Batches
+from .models import CustomerInfo, PostalCode
+import datetime
+import re
+
+# KEN_ALL.CSVの列の位置（郵便番号、都道府県名、市区町村名、町域名）
+KEN_ALL_ZIP_CODE = 2
+KEN_ALL_PREFECTURE = 6
+KEN_ALL_CITY = 7
+KEN_ALL_TOWN = 8
+# 一度に登録する郵便番号の件数
+POSTAL_CODE_CHUNK_SIZE = 5000
+# 代表地点の緯度経度の桁数（顧客情報の緯度経度に合わせる）
+LOCATION_PLACES = Decimal('0.0000001')
+
+# 町域名として扱わない記載（例：「以下に掲載がない場合」「猿払村の次に番地がくる場合」「奥多摩町一円」）
+_TOWN_IGNORED_RE = re.compile(r'^(?:以下に掲載がない場合|.+の次に番地がくる場合|.+一円)$')
+# 町域名の後ろの補足（例：「大通西（１〜１９丁目）」「（次のビルを除く）」）
+_TOWN_NOTE_RE = re.compile(r'（.*$')
+
+
+def CleanTownName(town):
+    """
+    KEN_ALL.CSVの町域名から、住所として入力しない記載や補足を取り除く
+    param: town。例：'大通西（１〜１９丁目）'
+    return: 例：'大通西'
+    """
+    if _TOWN_IGNORED_RE.match(town):
+        return ''
+    return _TOWN_NOTE_RE.sub('', town)
+
+
+def _JoinTownLines(rows):
+    """
+    町域名が長く複数行に分かれている行（カッコが閉じていない行）を1行にまとめる
+    """
+    pending = None
+    for row in rows:
+        entry = (row[KEN_ALL_ZIP_CODE], row[KEN_ALL_PREFECTURE], row[KEN_ALL_CITY],
+                 row[KEN_ALL_TOWN])
+        if pending is not None:
+            if pending[0] == entry[0]:
+                entry = entry[:3] + (pending[3] + entry[3], )
+            else:
+                # 閉じカッコがないまま次の郵便番号になった場合は、そこまでで区切る
+                yield pending
+            pending = None
+        if '（' in entry[3] and '）' not in entry[3]:
+            pending = entry
+        else:
+            yield entry
+    if pending is not None:
+        yield pending
+
+
+def ParseKenAll(rows):
+    """
+    KEN_ALL.CSVの行から、郵便番号ごとの住所を返す。町域名を整え、同じ内容の行は1つにする
+    param: rows。csv.readerなど、KEN_ALL.CSVの行のイテラブル
+    return: (郵便番号, 都道府県, 市区町村, 町域)のジェネレーター
+    """
+    seen = set()
+    for zip_code, prefecture, city, town in _JoinTownLines(rows):
+        entry = (zip_code, prefecture, city, CleanTownName(town))
+        if entry not in seen:
+            seen.add(entry)
+            yield entry
+
+
+def ReadCentroids(rows):
+    """
+    郵便番号の代表地点のCSV（郵便番号, 緯度, 経度）を読み込む。数値でない行（見出しなど）は読み飛ばす
+    param: rows。csv.readerなどの行のイテラブル
+    return: 郵便番号をキーにした、(緯度, 経度)の辞書
+    """
+    centroids = {}
+    for row in rows:
+        if len(row) < 3:
+            continue
+        try:
+            location = (Decimal(row[1]).quantize(LOCATION_PLACES),
+                        Decimal(row[2]).quantize(LOCATION_PLACES))
+        except ArithmeticError:
+            continue
+        centroids[ExtractNumber(row[0], 2)] = location
+    return centroids
+
+
+def LoadPostalCodes(rows, centroids=None):
+    """
+    郵便番号の索引を、KEN_ALL.CSVの内容で作り直す
+    param: rows。csv.readerなど、KEN_ALL.CSVの行のイテラブル
+    param: centroids。郵便番号をキーにした代表地点の(緯度, 経度)の辞書。省略時は代表地点なし
+    return: 登録した件数
+    """
+    centroids = centroids or {}
+    count = 0
+    with transaction.atomic():
+        PostalCode.objects.all().delete()
+        chunk = []
+        for zip_code, prefecture, city, town in ParseKenAll(rows):
+            latitude, longitude = centroids.get(zip_code, (None, None))
+            chunk.append(PostalCode(
+                zip_code=zip_code, prefecture=prefecture, city=city, town=town,
+                latitude=latitude, longitude=longitude))
+            if len(chunk) >= POSTAL_CODE_CHUNK_SIZE:
+                PostalCode.objects.bulk_create(chunk)
+                count += len(chunk)
+                chunk = []
+        PostalCode.objects.bulk_create(chunk)
+        count += len(chunk)
+    return count
+
+
+def HasPostalCodes():
+    """
+    郵便番号の索引が作成済み（load_postal_codesを実行済み）かどうか
+    """
+    return PostalCode.objects.exists()
+
+
+def LookupPostalCodes(zip_codes):
+    """
+    郵便番号から都道府県と市区町村（町域が1つに決まる場合は町域まで）を返す
+    param: zip_codes。郵便番号のイテラブル（ハイフンや全角を含んでもよい）
+    return: 数字のみの郵便番号をキーにした、(都道府県, 市区町村番地)の辞書。見つからないものは含まない
+    """
+    rows = OrderedDict()
+    zip_codes = {ExtractNumber(zip_code, 2) for zip_code in zip_codes if zip_code}
+    for batch in Batches(zip_codes):
+        for zip_code, prefecture, city, town in PostalCode.objects.filter(
+                zip_code__in=batch).order_by('pk').values_list(
+                    'zip_code', 'prefecture', 'city', 'town'):
+            rows.setdefault(zip_code, []).append((prefecture, city, town))
+    addresses = {}
+    for zip_code, entries in rows.items():
+        prefecture, city, town = entries[0]
+        if len({entry[2] for entry in entries}) > 1:
+            town = ''  # 複数の町域がある場合は市区町村までにする
+        addresses[zip_code] = (prefecture, city + town)
+    return addresses
+
+
+def GetZipCentroids(workspace, zip_codes):
+    """
+    郵便番号の代表地点の緯度経度を返す。ネットワークには接続しない
+    郵便番号の索引に代表地点がない場合は、ワークスペース内の同じ郵便番号の顧客情報（住所から緯度経度を取得したもの）の平均で代用する
+    param: workspace。ワークスペース（またはそのID）
+    param: zip_codes。郵便番号のイテラブル
+    return: 数字のみの郵便番号をキーにした、(緯度, 経度)の辞書。見つからないものは含まない
+    """
+    zip_codes = {ExtractNumber(zip_code, 2) for zip_code in zip_codes if zip_code}
+    centroids = {}
+    for batch in Batches(zip_codes):
+        centroids.update(
+            (row[0], row[1:]) for row in PostalCode.objects.filter(
+                zip_code__in=batch, latitude__isnull=False,
+                longitude__isnull=False).order_by().values('zip_code').annotate(
+                    Avg('latitude'), Avg('longitude')).values_list(
+                        'zip_code', 'latitude__avg', 'longitude__avg'))
+    missing = zip_codes - set(centroids)
+    for batch in Batches(missing):
+        centroids.update(
+            (row[0], row[1:]) for row in CustomerInfo.objects.filter(
+                workspace=workspace, zip_code__in=batch, delete_flg=False,
+                approximate_location=False, latitude__isnull=False,
+                longitude__isnull=False).order_by().values('zip_code').annotate(
+                    Avg('latitude'), Avg('longitude')).values_list(
+                        'zip_code', 'latitude__avg', 'longitude__avg'))
+    return {
+        zip_code: tuple(Decimal(value).quantize(LOCATION_PLACES) for value in location)
+        for zip_code, location in centroids.items()
+    }
+
+
+def SetApproximateLocation(customerinfo):
+    """
+    顧客情報の郵便番号から、代表地点の緯度経度を概算の緯度経度として設定する（保存はしない）
+    return: 設定できた場合はTrue
+    """
+    zip_code = ExtractNumber(customerinfo.zip_code or '', 2)
+    location = GetZipCentroids(customerinfo.workspace_id, [zip_code]).get(zip_code)
+    if location is None:
+        return False
+    customerinfo.latitude, customerinfo.longitude = location
+    customerinfo.approximate_location = True
+    return True
+
+
+def _CaseByZipCode(field, values):
+    """
+    郵便番号ごとに値を変えるUPDATE用のCase式
+    """
+    return Case(
+        *[When(zip_code=zip_code, then=Value(value)) for zip_code, value in values.items()],
+        default=F(field))
+
+
+def EnrichWithPostalCodes(workspace, pks, fill_address=True):
+    """
+    郵便番号の索引から、顧客情報の空の住所（都道府県・市区町村番地）と、未取得の緯度経度（概算）を補う
+    郵便番号ごとにまとめて更新するため、顧客情報の件数によらず数回のクエリで済む
+    param: workspace。ワークスペース
+    param: pks。対象の顧客情報のpkのリスト（CSVインポートで登録したものなど）
+    param: fill_address。Falseの場合は緯度経度だけを補う
+    return: 住所を補った件数、緯度経度を補った件数のタプル
+    """
+    address_count = location_count = 0
+    # IN句のpkと郵便番号に加えて、郵便番号ごとに3項目（都道府県・市区町村番地・正規化した住所）のCase式を使うため、
+    # 1件あたり最大8個のパラメータを使う
+    for batch in Batches(pks, params_per_value=8):
+        targets = CustomerInfo.objects.filter(
+            pk__in=batch, workspace=workspace, delete_flg=False).exclude(zip_code='')
+        rows = list(targets.filter(
+            Q(address1='', address2='') | Q(latitude__isnull=True) | Q(longitude__isnull=True)
+        ).values_list('zip_code', 'address1', 'address2', 'latitude', 'longitude'))
+
+        # 索引の郵便番号は数字のみのため、数字のみで保存されている顧客情報だけが対象になる
+        zip_codes = {row[0] for row in rows if not row[1] and not row[2]} if fill_address else set()
+        addresses = {
+            zip_code: address
+            for zip_code, address in LookupPostalCodes(zip_codes).items() if zip_code in zip_codes
+        }
+        if addresses:
+            address_count += targets.filter(
+                zip_code__in=addresses, address1='', address2='').update(
+                    address1=_CaseByZipCode(
+                        'address1', {z: a[0] for z, a in addresses.items()}),
+                    address2=_CaseByZipCode(
+                        'address2', {z: a[1] for z, a in addresses.items()}),
+                    normalized_address=_CaseByZipCode(
+                        'normalized_address',
+                        {z: NormalizeJapaneseAddress(*a) for z, a in addresses.items()}),
+                    modified_timestamp=datetime.datetime.now())
+
+        zip_codes = {row[0] for row in rows if row[3] is None or row[4] is None}
+        centroids = {
+            zip_code: location
+            for zip_code, location in GetZipCentroids(workspace, zip_codes).items()
+            if zip_code in zip_codes
+        }
+        if centroids:
+            location_count += targets.filter(
+                Q(latitude__isnull=True) | Q(longitude__isnull=True),
+                zip_code__in=centroids).update(
+                    latitude=_CaseByZipCode('latitude', {z: c[0] for z, c in centroids.items()}),
+                    longitude=_CaseByZipCode(
+                        'longitude', {z: c[1] for z, c in centroids.items()}),
+                    approximate_location=True,
+                    modified_timestamp=datetime.datetime.now())
+    return address_count, location_count
@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.core.signing import BadSignature, SignatureExpired, loads, dumps
+from django.db import connection
+from .query_budget import QueryRecorder
+import io
+import marshal
+import pstats
+import time
+
+# プロファイル取得を指示するクエリパラメータとヘッダ
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_SFA_PROFILE'
+PROFILE_SALT = 'sfa.profiling'
+# 実行計画を取得するSQLの最大件数
+EXPLAIN_LIMIT = 50
+
+
+class QueryLogRecorder(QueryRecorder):
+    """
+    発行されたSQLの件数と時間に加え、SQL文とパラメータを記録する
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return super().__call__(execute, sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': None if many else params,
+                'seconds': time.perf_counter() - started,
+            })
+
+
+def CreateProfileToken(user):
+    """
+    プロファイル取得を指示するヘッダ（X-SFA-Profile）に指定する署名付きトークンを返す
+    """
+    return dumps(user.pk, salt=PROFILE_SALT)
+
+
+def CanProfile(user):
+    """
+    プロファイルを取得できるのはオーナーと管理者のみ
+    """
+    return user.is_authenticated and (user.is_superuser or user.workspace_role == '2')
+
+
+def IsProfilingRequested(request):
+    """
+    リクエストでプロファイルの取得が指示されているか確認する
+    クエリパラメータ（_profile）またはヘッダ（X-SFA-Profile）の署名付きトークンで指示する
+    """
+    if not CanProfile(request.user):
+        return False
+    if PROFILE_PARAM in request.GET:
+        return True
+    token = request.META.get(PROFILE_HEADER)
+    if not token:
+        return False
+    try:
+        max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 60 * 60 * 24)
+        return loads(token, salt=PROFILE_SALT, max_age=max_age) == request.user.pk
+    except (BadSignature, SignatureExpired):
+        return False
+
+
+def ExplainQueries(queries):
+    """
+    記録したSELECT文の実行計画を取得する。実際には実行しない（ANALYZEは付けない）
+    return: 実行計画の文字列のリスト（SQLの順）。取得しなかったSQLはNone
+    """
+    explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    plans = []
+    for i, query in enumerate(queries):
+        if i >= EXPLAIN_LIMIT or query['params'] is None or not query['sql'].lstrip(
+        ).upper().startswith('SELECT'):
+            plans.append(None)
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(explain + query['sql'], query['params'])
+                plans.append('\n'.join(
+                    ' '.join(str(column) for column in row) for row in cursor.fetchall()))
+        except Exception as e:
+            plans.append('実行計画を取得できませんでした: {}'.format(e))
+    return plans
+
+
+def BuildProfileReport(stats, recorder, plans, sort='cumulative', limit=60):
+    """
+    cProfileの集計結果と、SQLおよび実行計画をまとめたテキストのレポートを作成する
+    param: stats。pstats.Stats
+    """
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats(sort).print_stats(limit)
+    out.write('\n==== SQL ({}件, {:.1f}ms) ====\n'.format(
+        recorder.count, recorder.time * 1000))
+    for i, (query, plan) in enumerate(zip(recorder.queries, plans), 1):
+        out.write('\n-- [{}] {:.2f}ms\n{}\n'.format(i, query['seconds'] * 1000,
+                                                    query['sql']))
+        if query['params']:
+            out.write('-- params: {}\n'.format(query['params']))
+        if plan:
+            out.write('-- plan:\n{}\n'.format(plan))
+    return out.getvalue()
+
+
+def SaveRequestProfile(request, profiler, recorder, duration):
+    """
+    取得したプロファイルを保存する。ワークスペースごとに新しいものからPROFILE_KEEP件だけ残す
+    return: 保存したRequestProfile
+    """
+    from .models import RequestProfile
+    plans = ExplainQueries(recorder.queries)
+    # Statsの作成時にプロファイラの計測結果が取り出されるため、1回だけ作成して使い回す
+    stats = pstats.Stats(profiler)
+    resolver_match = getattr(request, 'resolver_match', None)
+    workspace = request.user.workspace
+    profile = RequestProfile.objects.create(
+        workspace=workspace,
+        user=request.user,
+        url_name=resolver_match.view_name if resolver_match and resolver_match.url_name else '',
+        path=request.get_full_path()[:2000],
+        duration=duration,
+        query_count=recorder.count,
+        report=BuildProfileReport(stats, recorder, plans),
+        profile_data=marshal.dumps(stats.stats),
+    )
+    keep = getattr(settings, 'PROFILE_KEEP', 20)
+    old_pks = RequestProfile.objects.filter(workspace=workspace).order_by(
+        '-created_timestamp', '-pk').values_list('pk', flat=True)[keep:]
+    RequestProfile.objects.filter(pk__in=list(old_pks)).delete()
+    return profile
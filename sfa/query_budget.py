@@ -0,0 +1,52 @@
+from importlib import import_module
+import time
+
+# 画面ごとのクエリ数の上限（query_budgets）を宣言しているURL設定のモジュール
+BUDGET_URLCONFS = ('sfa.urls', 'register.urls')
+
+
+class QueryBudgetExceeded(Exception):
+    """画面のクエリ数が上限を超えた"""
+    pass
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapperに渡して、発行されたSQLの件数と合計時間を記録する
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - started
+
+
+def GetQueryBudgets():
+    """
+    各URL設定のquery_budgetsをまとめて、URL名（名前空間付き）をキーにした辞書で返す
+    """
+    budgets = {}
+    for urlconf in BUDGET_URLCONFS:
+        module = import_module(urlconf)
+        app_name = getattr(module, 'app_name', None)
+        for url_name, budget in getattr(module, 'query_budgets', {}).items():
+            key = '{}:{}'.format(app_name, url_name) if app_name else url_name
+            budgets[key] = budget
+    return budgets
+
+
+def GetQueryBudget(resolver_match):
+    """
+    リクエストを処理した画面のクエリ数の上限を返す。宣言されていない場合はNone
+    param: resolver_match。request.resolver_match
+    """
+    if resolver_match is None or not resolver_match.url_name:
+        return None
+    return GetQueryBudgets().get(resolver_match.view_name)
@@ -0,0 +1,237 @@
+from django.conf import settings
+from django.db.models import Case, Value, When, TimeField
+from .models import ContactInfo
+import datetime
+import numpy as np
+
+# 地球の半径（km）
+EARTH_RADIUS_KM = 6371.0
+# 改善する組み替えの探索を打ち切る回数
+MAX_TWO_OPT_PASSES = 200
+
+
+def HaversineMatrix(latitudes, longitudes):
+    """
+    緯度・経度の配列から、全地点間の大圏距離（km）の行列を作成する
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lng = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2)**2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlng / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _Schedule(order, distances, earliest, latest, stay, minutes_per_km, day_start):
+    """
+    訪問順に移動・待ち・滞在の時間を積み上げ、各訪問先の開始時刻を求める
+    return: (時間帯に遅れた合計時間（分）, 移動距離の合計（km）, 開始時刻（分）のリスト)
+    """
+    lateness = 0.0
+    distance = 0.0
+    starts = []
+    time = day_start
+    previous = None
+    for stop in order:
+        if previous is not None:
+            leg = distances[previous, stop]
+            distance += leg
+            time += leg * minutes_per_km
+        start = max(time, earliest[stop])
+        lateness += max(0.0, start - latest[stop])
+        starts.append(start)
+        time = start + stay
+        previous = stop
+    return lateness, distance, starts
+
+
+def _NearestNeighbour(distances, earliest, latest, stay, minutes_per_km, day_start):
+    """
+    時間帯に間に合う訪問先のうち、最も早く訪問を始められるものを順に選ぶ
+    """
+    count = len(distances)
+    unvisited = np.ones(count, dtype=bool)
+    # 最初は時間帯の締め切りが最も早い訪問先から始める
+    current = int(np.lexsort((earliest, latest))[0])
+    order = [current]
+    unvisited[current] = False
+    time = max(day_start, earliest[current]) + stay
+    while unvisited.any():
+        starts = np.maximum(time + distances[current] * minutes_per_km, earliest)
+        candidates = unvisited & (starts <= latest)
+        if not candidates.any():
+            candidates = unvisited
+        current = int(np.argmin(np.where(candidates, starts, np.inf)))
+        order.append(current)
+        unvisited[current] = False
+        time = starts[current] + stay
+    return order
+
+
+def _ScheduleMany(orders, distances, earliest, latest, stay, minutes_per_km, day_start):
+    """
+    複数の訪問順（行ごとに1つ）について、_Scheduleと同じ計算をまとめて行う
+    return: (時間帯に遅れた合計時間（分）の配列, 移動距離の合計（km）の配列)
+    """
+    lateness = np.zeros(len(orders))
+    distance = np.zeros(len(orders))
+    time = np.full(len(orders), float(day_start))
+    for position in range(orders.shape[1]):
+        stops = orders[:, position]
+        if position:
+            legs = distances[orders[:, position - 1], stops]
+            distance += legs
+            time += legs * minutes_per_km
+        starts = np.maximum(time, earliest[stops])
+        lateness += np.maximum(0.0, starts - latest[stops])
+        time = starts + stay
+    return lateness, distance
+
+
+def _TwoOpt(order, distances, earliest, latest, stay, minutes_per_km, day_start):
+    """
+    訪問順の一部を逆順にする組み替え（2-opt）を、改善しなくなるまで繰り返す。
+    始点と終点は固定しない。組み替えの候補をすべてまとめて評価し、時間帯への遅れ、移動距離の順に最も良いものを採用する。
+    """
+    count = len(order)
+    if count < 3:
+        return order
+    # order[a:b]を逆順にする組み替え（2件以上）の一覧
+    a_list, b_list = np.nonzero(np.triu(np.ones((count + 1, count + 1), dtype=bool), 2))
+    positions = np.arange(count)[None, :]
+    inside = (positions >= a_list[:, None]) & (positions < b_list[:, None])
+    sources = np.where(inside, a_list[:, None] + b_list[:, None] - 1 - positions, positions)
+
+    order = np.asarray(order)
+    best = _ScheduleMany(order[None, :], distances, earliest, latest, stay, minutes_per_km,
+                         day_start)
+    best = (best[0][0], best[1][0])
+    for _ in range(MAX_TWO_OPT_PASSES):
+        candidates = order[sources]
+        lateness, distance = _ScheduleMany(candidates, distances, earliest, latest, stay,
+                                           minutes_per_km, day_start)
+        index = np.lexsort((distance, np.round(lateness, 6)))[0]
+        if lateness[index] < best[0] - 1e-6 or (lateness[index] <= best[0] + 1e-6
+                                               and distance[index] < best[1] - 1e-9):
+            order = candidates[index]
+            best = (lateness[index], distance[index])
+        else:
+            break
+    return [int(stop) for stop in order]
+
+
+def PlanRoute(distances, earliest, latest, stay=30, speed_kmh=30, day_start=9 * 60):
+    """
+    訪問先を回る順番を、最近傍法で作成してから2-optで改善して求める
+    param: distances。訪問先間の距離（km）の行列
+    param: earliest, latest。訪問を始められる時間帯（0時からの分）。制約がない場合は-inf, inf
+    param: stay。1件あたりの滞在時間（分）
+    param: speed_kmh。移動の平均速度（km/h）
+    param: day_start。最初の訪問を始められる時刻（0時からの分）
+    return: (訪問順のインデックスのリスト, 各訪問の開始時刻（分）のリスト, 移動距離の合計（km）, 時間帯への遅れの合計（分）)
+    """
+    if not len(distances):
+        return [], [], 0.0, 0.0
+    distances = np.asarray(distances, dtype=float)
+    earliest = np.asarray(earliest, dtype=float)
+    latest = np.asarray(latest, dtype=float)
+    minutes_per_km = 60.0 / speed_kmh
+    order = _NearestNeighbour(distances, earliest, latest, stay, minutes_per_km, day_start)
+    order = _TwoOpt(order, distances, earliest, latest, stay, minutes_per_km, day_start)
+    lateness, distance, starts = _Schedule(order, distances, earliest, latest, stay,
+                                           minutes_per_km, day_start)
+    return order, starts, distance, lateness
+
+
+def _ToMinutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _ToTime(minutes):
+    minutes = min(int(round(minutes)), 24 * 60 - 1)
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def SuggestVisitRoute(contactinfo_list):
+    """
+    1日分の訪問予定から、移動距離が短くなる訪問順と訪問開始時刻（予定）を提案する。
+    開始・終了時刻（予定）の両方が入力されている訪問は、その時間帯に始められるように並べる。
+    緯度・経度がない顧客への訪問は順番を決められないため、提案の末尾に現在の時刻のまま残す。
+    return: {'stops': [{'contactinfo', 'start_time', 'distance'}...], 'distance', 'current_distance', 'lateness'}
+    """
+    stay = getattr(settings, 'ROUTE_STAY_MINUTES', 30)
+    speed_kmh = getattr(settings, 'ROUTE_SPEED_KMH', 30)
+    located = [
+        contactinfo for contactinfo in contactinfo_list
+        if contactinfo.target_customer.latitude and contactinfo.target_customer.longitude
+    ]
+    unlocated = [contactinfo for contactinfo in contactinfo_list if contactinfo not in located]
+    if not located:
+        return {
+            'stops': [{'contactinfo': c, 'start_time': c.start_time_plan, 'distance': None}
+                      for c in unlocated],
+            'distance': 0.0,
+            'current_distance': 0.0,
+            'lateness': 0.0,
+        }
+
+    distances = HaversineMatrix([c.target_customer.latitude for c in located],
+                                [c.target_customer.longitude for c in located])
+    earliest = []
+    latest = []
+    for contactinfo in located:
+        if contactinfo.start_time_plan and contactinfo.end_time_plan and (
+                contactinfo.start_time_plan <= contactinfo.end_time_plan):
+            earliest.append(_ToMinutes(contactinfo.start_time_plan))
+            latest.append(_ToMinutes(contactinfo.end_time_plan))
+        else:
+            earliest.append(-np.inf)
+            latest.append(np.inf)
+    planned = [_ToMinutes(c.start_time_plan) for c in located if c.start_time_plan]
+    day_start = min(planned) if planned else _ToMinutes(
+        datetime.datetime.strptime(getattr(settings, 'ROUTE_DAY_START', '09:00'), '%H:%M'))
+    order, starts, distance, lateness = PlanRoute(
+        distances, earliest, latest, stay=stay, speed_kmh=speed_kmh, day_start=day_start)
+
+    # 比較用に、現在の並び（開始時刻（予定）の昇順）の移動距離を求める
+    current_order = sorted(
+        range(len(located)),
+        key=lambda i: (located[i].start_time_plan is None, located[i].start_time_plan or
+                       datetime.time(), i))
+    current_distance = float(
+        sum(distances[a, b] for a, b in zip(current_order, current_order[1:])))
+
+    stops = []
+    previous = None
+    for index, start in zip(order, starts):
+        stops.append({
+            'contactinfo': located[index],
+            'start_time': _ToTime(start),
+            'distance': None if previous is None else round(float(distances[previous, index]), 2),
+        })
+        previous = index
+    stops.extend({'contactinfo': c, 'start_time': c.start_time_plan, 'distance': None}
+                 for c in unlocated)
+    return {
+        'stops': stops,
+        'distance': round(float(distance), 2),
+        'current_distance': round(current_distance, 2),
+        'lateness': round(float(lateness)),
+    }
+
+
+def ApplyVisitRoute(stops):
+    """
+    提案した訪問開始時刻（予定）を、1回のUPDATEでまとめて反映する
+    return: 更新した件数
+    """
+    stops = [stop for stop in stops if stop['start_time'] is not None]
+    if not stops:
+        return 0
+    return ContactInfo.objects.filter(pk__in=[stop['contactinfo'].pk for stop in stops]).update(
+        start_time_plan=Case(
+            *[
+                When(pk=stop['contactinfo'].pk,
+                     then=Value(stop['start_time'], output_field=TimeField())) for stop in stops
+            ],
+            output_field=TimeField()))
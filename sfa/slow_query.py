@@ -0,0 +1,250 @@
+from django.conf import settings
+from logging.handlers import RotatingFileHandler
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+# 呼び出し元として扱うアプリケーションのディレクトリ
+APP_DIRS = tuple(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), name) + os.sep
+    for name in ('sfa', 'register', 'socials'))
+# 呼び出し元から除外する計測用のモジュール
+IGNORED_FILES = ('middleware.py', 'slow_query.py', 'query_budget.py', 'profiling.py', 'metrics.py')
+
+_logger = logging.getLogger('sfa.slow_query')
+_logger.propagate = False
+_handler_lock = threading.Lock()
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def NormalizeSql(sql):
+    """
+    SQLの値の部分を?に置き換え、値や件数が違うだけのSQLを同じ形にする
+    """
+    normalized = _STRING_RE.sub('?', sql)
+    normalized = normalized.replace('%s', '?')
+    normalized = _NUMBER_RE.sub('?', normalized)
+    # IN句の値の個数の違いは同じSQLとみなす
+    normalized = _PLACEHOLDER_LIST_RE.sub('(?)', normalized)
+    return _SPACE_RE.sub(' ', normalized).strip()
+
+
+def FingerprintSql(sql):
+    """
+    正規化したSQLから、集計に使う識別子を返す
+    """
+    return hashlib.md5(NormalizeSql(sql).encode('utf-8')).hexdigest()[:12]
+
+
+def FindOrigin():
+    """
+    SQLを発行したアプリケーションの行と、描画中のテンプレートの行を探す
+    return: (アプリケーションの'ファイル:行'、テンプレートの'テンプレート名:行')。見つからない場合はNone
+    """
+    code_origin = None
+    template_origin = None
+    frame = sys._getframe(1)
+    while frame and not (code_origin and template_origin):
+        filename = frame.f_code.co_filename
+        if code_origin is None and filename.startswith(APP_DIRS) and not filename.endswith(
+                IGNORED_FILES):
+            code_origin = '{}:{}'.format(
+                os.path.relpath(filename, os.path.dirname(APP_DIRS[0].rstrip(os.sep))),
+                frame.f_lineno)
+        if template_origin is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template_origin = '{}:{}'.format(origin.template_name, token.lineno)
+        frame = frame.f_back
+    return code_origin, template_origin
+
+
+class SlowQueryRecorder:
+    """
+    connection.execute_wrapperに渡して、しきい値を超えたSQLを呼び出し元と一緒に記録する
+    """
+
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                code_origin, template_origin = FindOrigin()
+                self.entries.append({
+                    'fingerprint': FingerprintSql(sql),
+                    'sql': NormalizeSql(sql),
+                    'ms': round(elapsed * 1000, 2),
+                    'code': code_origin,
+                    'template': template_origin,
+                })
+
+
+def GetSlowQueryLogPath():
+    log_dir = getattr(settings, 'LOG_DIR', os.path.join(settings.BASE_DIR, 'logs'))
+    return getattr(settings, 'SLOW_QUERY_LOG', os.path.join(log_dir, 'sfa_slow_query.log'))
+
+
+def _ProcessLogPath(path, pid):
+    """
+    プロセスごとのファイル名を返す。例：sfa_slow_query.log → sfa_slow_query.12345.log
+    """
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, pid, ext)
+
+
+def ListSlowQueryLogs(path=None):
+    """
+    プロセスごとのファイルと、ローテーション済みのファイル（末尾が.1、.2など）を、新しいものから順に返す
+    """
+    path = path or GetSlowQueryLogPath()
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(root) + r'\.\d+' + re.escape(ext) + r'(\.\d+)?$')
+    filenames = []
+    for filename in glob.glob(glob.escape(root) + '.*'):
+        if not pattern.match(filename):
+            continue
+        try:
+            filenames.append((os.path.getmtime(filename), filename))
+        except OSError:
+            # 他のプロセスがローテーション中に移動したファイル
+            continue
+    return [filename for _, filename in sorted(filenames, reverse=True)]
+
+
+def _PruneSlowQueryLogs(path, current):
+    """
+    終了したプロセスのファイルが溜まり続けないよう、SLOW_QUERY_LOG_MAX_FILESを超えた古いファイルを削除する
+    """
+    max_files = getattr(settings, 'SLOW_QUERY_LOG_MAX_FILES', 20)
+    # これから作る自分のプロセスのファイルの分を空けておく
+    others = [filename for filename in ListSlowQueryLogs(path) if not filename.startswith(current)]
+    for filename in others[max(max_files - 1, 0):]:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+def _GetLogger():
+    """
+    ファイルに書き込むロガーを返す
+    gunicornの複数のワーカーが1つのファイルをローテーションすると行が失われるため、プロセスごとのファイルに書き込み、
+    SLOW_QUERY_LOG_MAX_BYTESごとにSLOW_QUERY_LOG_BACKUP_COUNT世代までローテーションする
+    """
+    with _handler_lock:
+        path = GetSlowQueryLogPath()
+        process_path = os.path.abspath(_ProcessLogPath(path, os.getpid()))
+        handlers = [
+            handler for handler in _logger.handlers
+            if getattr(handler, 'baseFilename', None) == process_path
+        ]
+        if not handlers:
+            for handler in list(_logger.handlers):
+                _logger.removeHandler(handler)
+                handler.close()
+            os.makedirs(os.path.dirname(process_path), exist_ok=True)
+            _PruneSlowQueryLogs(os.path.abspath(path), process_path)
+            handler = RotatingFileHandler(
+                process_path,
+                maxBytes=getattr(settings, 'SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                backupCount=getattr(settings, 'SLOW_QUERY_LOG_BACKUP_COUNT', 3),
+                encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+    return _logger
+
+
+def WriteSlowQueries(entries, url_name, workspace_id):
+    """
+    1リクエスト分の遅いSQLを、画面とワークスペースの情報を付けてJSON Lines形式で書き込む
+    """
+    logger = _GetLogger()
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    for entry in entries:
+        logger.info(json.dumps(dict(
+            entry, timestamp=timestamp, url_name=url_name,
+            workspace_id=workspace_id), ensure_ascii=False))
+
+
+def ReadSlowQueries(workspace_id=None):
+    """
+    プロセスごとのファイルとローテーション済みのファイルから、記録された遅いSQLを読み込む
+    新しいファイルから順に、合計SLOW_QUERY_READ_MAX_BYTESまでの末尾だけを読み込む
+    param: workspace_id。指定した場合はそのワークスペースの記録のみ返す
+    """
+    remaining = getattr(settings, 'SLOW_QUERY_READ_MAX_BYTES', 20 * 1024 * 1024)
+    entries = []
+    for filename in ListSlowQueryLogs():
+        if remaining <= 0:
+            break
+        try:
+            f = open(filename, 'rb')
+        except OSError:
+            continue
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size > remaining:
+                # 1バイト前の改行から読み、途中から読み始めた行は捨てる
+                f.seek(size - remaining - 1)
+                f.readline()
+            remaining -= size
+            for line in f:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                if workspace_id is None or entry.get('workspace_id') == workspace_id:
+                    entries.append(entry)
+    return entries
+
+
+def SummarizeSlowQueries(entries):
+    """
+    遅いSQLをfingerprintごとに集計し、合計時間の長い順に返す
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'count': 0,
+            'total_ms': 0,
+            'max_ms': 0,
+            'url_names': {},
+            'origins': {},
+            'last_timestamp': '',
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['last_timestamp'] = max(group['last_timestamp'], entry.get('timestamp', ''))
+        url_name = entry.get('url_name') or '-'
+        group['url_names'][url_name] = group['url_names'].get(url_name, 0) + 1
+        for origin in (entry.get('code'), entry.get('template')):
+            if origin:
+                group['origins'][origin] = group['origins'].get(origin, 0) + 1
+    summary = sorted(groups.values(), key=lambda group: -group['total_ms'])
+    for group in summary:
+        group['total_ms'] = round(group['total_ms'], 2)
+        group['url_names'] = sorted(group['url_names'].items(), key=lambda item: -item[1])
+        group['origins'] = sorted(group['origins'].items(), key=lambda item: -item[1])
+    return summary
@@ -0,0 +1,258 @@
+from django.db import connection, transaction
+from .company import RefreshSalesPersonCounts
+from .models import CustomerInfo
+import datetime
+import numpy as np
+
+# 重心と倍率を求めるために用いる標本の件数
+SAMPLE_SIZE = 20000
+# 重心を求める繰り返し回数と、負荷を均す繰り返し回数（標本、全地点）
+KMEANS_ITERATIONS = 20
+BALANCE_ITERATIONS = 200
+FINAL_BALANCE_ITERATIONS = 30
+# 負荷の偏りとして許容する割合（目標の±2%）
+BALANCE_TOLERANCE = 0.02
+# 地図で確認するために返す、担当エリアごとの顧客の件数
+PREVIEW_SAMPLE = 300
+
+
+def _Distances(points, centers):
+    """
+    各地点から各重心までの距離（地点数×重心数）
+    地点数×重心数×座標の配列を作らないよう、行列の積で計算する
+    """
+    squared = ((points**2).sum(axis=1)[:, None] - 2 * points.dot(centers.T) +
+               (centers**2).sum(axis=1)[None, :])
+    return np.sqrt(np.maximum(squared, 0))
+
+
+def _InitialCenters(points, weights, k, rand):
+    """
+    k-means++と同じ方法で、離れた地点を重心の初期値に選ぶ
+    """
+    centers = np.empty((k, 2))
+    centers[0] = points[rand.choice(len(points), p=weights / weights.sum())]
+    nearest = ((points - centers[0])**2).sum(axis=1)
+    for i in range(1, k):
+        probabilities = nearest * weights
+        if probabilities.sum() > 0:
+            index = rand.choice(len(points), p=probabilities / probabilities.sum())
+        else:
+            index = rand.randint(len(points))
+        centers[i] = points[index]
+        nearest = np.minimum(nearest, ((points - centers[i])**2).sum(axis=1))
+    return centers
+
+
+def _UpdateCenters(points, weights, labels, centers):
+    """
+    担当エリアごとに、重み付きの重心を求め直す（地点がないエリアは元のまま）
+    """
+    k = len(centers)
+    totals = np.bincount(labels, weights, minlength=k)
+    filled = totals > 0
+    centers = centers.copy()
+    for axis in range(2):
+        centers[filled, axis] = np.bincount(
+            labels, weights * points[:, axis], minlength=k)[filled] / totals[filled]
+    return centers
+
+
+def _Balance(points, weights, centers, factors, iterations, move_centers):
+    """
+    重心までの距離にエリアごとの倍率を掛けて割り当て、重いエリアは倍率を上げ、軽いエリアは下げることを繰り返す
+    return: (各地点のエリア番号の配列, 重心, 倍率)
+    """
+    k = len(centers)
+    target = weights.sum() / k
+    for _ in range(iterations):
+        labels = np.argmin(_Distances(points, centers) * factors, axis=1)
+        ratios = np.bincount(labels, weights, minlength=k) / target
+        if np.abs(ratios - 1).max() <= BALANCE_TOLERANCE:
+            break
+        factors = factors * np.clip(ratios, 0.5, 2)**0.3
+        factors /= np.exp(np.log(factors).mean())
+        if move_centers:
+            centers = _UpdateCenters(points, weights, labels, centers)
+    return labels, centers, factors
+
+
+def BalancedKMeans(points, weights, k, seed=0):
+    """
+    重み付きのk-meansで地点をk個の担当エリアに分け、各エリアの重みの合計が均等になるよう調整する。
+    地点が多い場合は、標本で重心と倍率を求めてから、全地点で倍率だけを調整する。
+    param: points。地点の座標（地点数×2）
+    param: weights。地点の重み（ポテンシャルなど）
+    return: (各地点のエリア番号の配列, 各エリアの重心（k×2）)
+    """
+    points = np.asarray(points, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    k = min(k, len(points))
+    rand = np.random.RandomState(seed)
+    sample = np.arange(len(points))
+    if len(points) > SAMPLE_SIZE:
+        sample = rand.choice(len(points), SAMPLE_SIZE, replace=False)
+    sample_points = points[sample]
+    sample_weights = weights[sample]
+
+    centers = _InitialCenters(sample_points, sample_weights, k, rand)
+    for _ in range(KMEANS_ITERATIONS):
+        labels = np.argmin(_Distances(sample_points, centers), axis=1)
+        centers = _UpdateCenters(sample_points, sample_weights, labels, centers)
+    labels, centers, factors = _Balance(
+        sample_points, sample_weights, centers, np.ones(k), BALANCE_ITERATIONS, True)
+    if len(sample) < len(points):
+        labels, centers, factors = _Balance(
+            points, weights, centers, factors, FINAL_BALANCE_ITERATIONS, False)
+    return labels, centers
+
+
+def _Project(latitudes, longitudes):
+    """
+    緯度・経度を、距離の比がおおよそ正しくなる平面の座標に変換する
+    """
+    scale = np.cos(np.radians(latitudes.mean()))
+    return np.column_stack((longitudes * scale, latitudes))
+
+
+def GetTerritoryTargets(workspace, unassigned_only=False):
+    """
+    担当エリアに分ける顧客（削除されておらず、緯度・経度があるもの）を取得する
+    return: (pkの配列, 緯度の配列, 経度の配列, ポテンシャルの配列, 営業担当者のpkの配列（未設定は0）)
+    """
+    queryset = CustomerInfo.objects.filter(
+        workspace=workspace,
+        delete_flg=False,
+        latitude__isnull=False,
+        longitude__isnull=False)
+    if unassigned_only:
+        queryset = queryset.filter(sales_person__isnull=True)
+    rows = list(
+        queryset.order_by('pk').values_list('pk', 'latitude', 'longitude', 'potential',
+                                            'sales_person'))
+    if not rows:
+        empty = np.zeros(0)
+        return empty.astype(int), empty, empty, empty, empty.astype(int)
+    pks, latitudes, longitudes, potentials, sales_persons = zip(*rows)
+    latitudes = np.array(latitudes, dtype=float)
+    longitudes = np.array(longitudes, dtype=float)
+    # 緯度・経度が0の顧客は位置が登録されていないものとみなす
+    located = (latitudes != 0) & (longitudes != 0)
+    return (np.array(pks)[located], latitudes[located], longitudes[located],
+            np.array(potentials, dtype=float)[located],
+            np.array([pk or 0 for pk in sales_persons])[located])
+
+
+def _MatchSalesPersons(labels, current, sales_persons):
+    """
+    担当エリアと営業担当者を、すでに担当している顧客が多い組み合わせから順に対応付ける
+    return: エリア番号ごとの営業担当者のリスト
+    """
+    k = len(sales_persons)
+    counts = np.zeros((k, k), dtype=int)
+    for j, user in enumerate(sales_persons):
+        counts[:, j] = np.bincount(labels[current == user.pk], minlength=k)[:k]
+    assignment = [None] * k
+    used = set()
+    for index in np.argsort(-counts, axis=None, kind='mergesort'):
+        territory, j = divmod(int(index), k)
+        if assignment[territory] is None and j not in used:
+            assignment[territory] = sales_persons[j]
+            used.add(j)
+    return assignment
+
+
+def PlanTerritories(workspace, sales_persons, unassigned_only=False, seed=0):
+    """
+    ワークスペースの顧客を、営業担当者の人数分のポテンシャルが均等な担当エリアに分ける
+    ポテンシャルが0以下の顧客も1件として数えるため、重みはポテンシャル+1とする
+    param: sales_persons。担当エリアを割り当てる営業担当者のリスト
+    return: {'pks', 'labels', 'territories': [{'sales_person', 'count', 'potential', 'changed', 'center', 'sample'}...]}
+    """
+    pks, latitudes, longitudes, potentials, current = GetTerritoryTargets(
+        workspace, unassigned_only)
+    if not len(pks) or not sales_persons:
+        return {'pks': pks, 'labels': np.zeros(0, dtype=int), 'territories': []}
+    weights = np.maximum(potentials, 0) + 1
+    labels, centers = BalancedKMeans(
+        _Project(latitudes, longitudes), weights, len(sales_persons), seed=seed)
+    assignment = _MatchSalesPersons(labels, current, sales_persons)
+
+    rand = np.random.RandomState(seed)
+    territories = []
+    for territory, user in enumerate(assignment):
+        members = np.flatnonzero(labels == territory)
+        sample = members
+        if len(members) > PREVIEW_SAMPLE:
+            sample = np.sort(rand.choice(members, PREVIEW_SAMPLE, replace=False))
+        territories.append({
+            'sales_person': user,
+            'count': len(members),
+            'potential': int(potentials[members].sum()),
+            'changed': int((current[members] != user.pk).sum()),
+            'center': (float(latitudes[members].mean()) if len(members) else None,
+                       float(longitudes[members].mean()) if len(members) else None),
+            'sample': [(float(latitudes[i]), float(longitudes[i])) for i in sample],
+        })
+    return {'pks': pks, 'labels': labels, 'territories': territories}
+
+
+def _AssignSalesPersons(workspace, pks, sales_person_ids):
+    """
+    顧客情報ごとの営業担当者を1回のUPDATEで設定する
+    PostgreSQLでは、pkと営業担当者の配列を1組のパラメータとして渡し、unnestで結合する
+    配列を渡せないデータベース（SQLite）では、一時テーブルにまとめて登録してから結合する
+    どちらもIN句やCase式を使わないため、顧客情報の件数によらず同じ回数のクエリで済む
+    return: 更新した顧客情報の件数
+    """
+    qn = connection.ops.quote_name
+    customer_table = qn(CustomerInfo._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(datetime.datetime.now())
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                """
+                UPDATE {customer_table} AS c
+                SET sales_person_id = t.sales_person_id, modified_timestamp = %s
+                FROM unnest(%s::integer[], %s::integer[]) AS t(id, sales_person_id)
+                WHERE c.id = t.id AND c.workspace_id = %s
+                """.format(customer_table=customer_table),
+                [now, pks, sales_person_ids, workspace.pk])
+            return cursor.rowcount
+
+        assignment_table = qn('sfa_territory_assignment')
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(assignment_table))
+        cursor.execute(
+            'CREATE TEMPORARY TABLE {} (id integer PRIMARY KEY, sales_person_id integer NOT NULL)'
+            .format(assignment_table))
+        cursor.executemany(
+            'INSERT INTO {} (id, sales_person_id) VALUES (%s, %s)'.format(assignment_table),
+            list(zip(pks, sales_person_ids)))
+        cursor.execute(
+            """
+            UPDATE {customer_table}
+            SET sales_person_id = (
+                SELECT t.sales_person_id FROM {assignment_table} t
+                WHERE t.id = {customer_table}.id),
+                modified_timestamp = %s
+            WHERE workspace_id = %s AND id IN (SELECT id FROM {assignment_table})
+            """.format(customer_table=customer_table, assignment_table=assignment_table),
+            [now, workspace.pk])
+        count = cursor.rowcount
+        cursor.execute('DROP TABLE {}'.format(assignment_table))
+        return count
+
+
+def ApplyTerritories(workspace, plan):
+    """
+    すべての担当エリアの営業担当者を1回のUPDATEでまとめて設定し、会社単位の集計の営業担当者の人数を更新する
+    担当エリアの数（営業担当者の人数）や顧客情報の件数によらず、同じ回数のクエリで済む
+    return: 更新した顧客情報の件数
+    """
+    sales_persons = [values['sales_person'].pk for values in plan['territories']]
+    pks = plan['pks'].tolist()
+    sales_person_ids = [sales_persons[label] for label in plan['labels'].tolist()]
+    with transaction.atomic():
+        count = _AssignSalesPersons(workspace, pks, sales_person_ids)
+        RefreshSalesPersonCounts(workspace)
+    return count
@@ -0,0 +1,39 @@
+from django.urls import reverse
+from sfa.query_budget import GetQueryBudget
+
+
+class QueryBudgetTestMixin:
+    """
+    画面のクエリ数がURL設定のquery_budgetsに収まっていることを確認するためのテスト用Mixin。
+    クエリ数はQueryCountMiddlewareが記録したrequest.query_countを用いる。
+    """
+
+    def assertWithinQueryBudget(self, client, url_name, args=(), data=None):
+        """
+        画面を表示し、クエリ数が上限以内であることを確認する
+        return: 発行されたクエリ数
+        """
+        response = client.get(reverse(url_name, args=args), data or {})
+        self.assertEqual(200, response.status_code)
+        request = response.wsgi_request
+        budget = GetQueryBudget(request.resolver_match)
+        self.assertIsNotNone(budget, '{}のクエリ数の上限が宣言されていません'.format(url_name))
+        self.assertLessEqual(
+            request.query_count, budget,
+            '{}のクエリ数が上限を超えています。{}件（上限{}件）'.format(
+                url_name, request.query_count, budget))
+        return request.query_count
+
+    def assertQueryCountConstant(self, client, url_name, add_rows, args=(), data=None, page_size=30):
+        """
+        1件表示時と1ページ分表示時でクエリ数が変わらない（N+1になっていない）ことを確認する
+        param: add_rows。指定した件数の表示対象データを追加する関数
+        """
+        add_rows(1)
+        single = self.assertWithinQueryBudget(client, url_name, args, data)
+        add_rows(page_size - 1)
+        full = self.assertWithinQueryBudget(client, url_name, args, data)
+        self.assertEqual(
+            single, full,
+            '{}のクエリ数が表示件数に応じて増えています。1件: {}件、{}件: {}件'.format(
+                url_name, single, page_size, full))
@@ -0,0 +1,207 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+from register.models import User, Workspace
+from sfa.addressmatch import MatchAddressInfos, CreateCustomersFromAddressInfos
+from sfa.common_util import ArchiveDeletedCustomerInfo
+from sfa.models import ActionStatusTransition, AddressInfo, CustomerInfo
+import datetime
+
+
+class AddressMatchTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(), password=fake.password(), workspace=self.workspace,
+            is_workspace_active=True)
+
+    def customer(self, customer_name, **kwargs):
+        kwargs.setdefault('public_status', 1)
+        return CustomerInfo.objects.create(
+            customer_name=customer_name, potential=1, workspace=self.workspace, **kwargs)
+
+    def card(self, customer_name, **kwargs):
+        return AddressInfo.objects.create(
+            customer_name=customer_name, workspace=self.workspace, **kwargs)
+
+    def test_match(self):
+        """
+        企業名と電話番号・郵便番号・メールのドメインの組み合わせで関連付け、点数が足りない場合は関連付けないことを確認
+        """
+        yamada = self.customer('株式会社山田商事', tel_number1='0312345678', zip_code='1000005')
+        suzuki = self.customer('鈴木工業株式会社', mail_address='info@suzuki.example.jp')
+        self.customer('佐藤製作所', mail_address='sato@gmail.com')
+        by_phone = self.card('（株）山田商事', phone_number='03-1234-5678')
+        by_zip = self.card('山田商事', zip_code='100-0005')
+        by_domain = self.card('鈴木工業', mail_address='taro@SUZUKI.example.jp')
+        # フリーメールのドメインは照合に使わない
+        free_mail = self.card('佐藤製作所', mail_address='hanako@gmail.com')
+        name_only = self.card('鈴木工業')
+        self.assertEqual(3, MatchAddressInfos(self.workspace, self.user))
+
+        for card in (by_phone, by_zip, by_domain, free_mail, name_only):
+            card.refresh_from_db()
+        self.assertEqual((yamada.pk, True, '企業名・電話番号'),
+                         (by_phone.related_customer_id, by_phone.related_flg, by_phone.related_reasons))
+        self.assertEqual(yamada.pk, by_zip.related_customer_id)
+        self.assertEqual(suzuki.pk, by_domain.related_customer_id)
+        self.assertEqual((None, False), (free_mail.related_customer_id, free_mail.related_flg))
+        self.assertEqual((None, False), (name_only.related_customer_id, name_only.related_flg))
+
+    def test_department(self):
+        """
+        点数が同じ顧客情報が複数ある場合は所属が一致するものに関連付け、決まらない場合は関連付けないことを確認
+        """
+        self.customer('株式会社山田商事', department_name='総務部', tel_number1='0312345678')
+        sales = self.customer('株式会社山田商事', department_name='営業部', tel_number1='0312345678')
+        department = self.card('山田商事', department_name='営業部', phone_number='0312345678')
+        middle = self.card('山田商事', middle_organization='営業部', phone_number='0312345678')
+        tie = self.card('山田商事', department_name='経理部', phone_number='0312345678')
+        self.assertEqual(2, MatchAddressInfos(self.workspace, self.user))
+
+        for card in (department, middle, tie):
+            card.refresh_from_db()
+        self.assertEqual(sales.pk, department.related_customer_id)
+        self.assertEqual(sales.pk, middle.related_customer_id)
+        self.assertIsNone(tie.related_customer_id)
+
+    def test_private_customers(self):
+        """
+        他のユーザーの非公開の顧客情報とは照合せず、自分が作成した顧客情報や共有された顧客情報とは照合することを確認
+        """
+        self.customer('株式会社山田商事', tel_number1='0312345678', public_status=0,
+                      author='other@example.com')
+        own = self.customer('鈴木工業株式会社', tel_number1='0311112222', public_status=0,
+                            author=self.user.email)
+        shared = self.customer('佐藤製作所', tel_number1='0333334444', public_status=0,
+                               author='other@example.com')
+        shared.shared_view_user.add(self.user)
+        hidden = self.card('山田商事', phone_number='03-1234-5678')
+        by_own = self.card('鈴木工業', phone_number='03-1111-2222')
+        by_shared = self.card('佐藤製作所', phone_number='03-3333-4444')
+        self.assertEqual(2, MatchAddressInfos(self.workspace, self.user))
+
+        for card in (hidden, by_own, by_shared):
+            card.refresh_from_db()
+        self.assertIsNone(hidden.related_customer_id)
+        self.assertEqual(own.pk, by_own.related_customer_id)
+        self.assertEqual(shared.pk, by_shared.related_customer_id)
+
+    def test_create_customers(self):
+        """
+        関連付けていない連絡先情報から、会社名と所属ごとに顧客情報をまとめて作成し、関連付けることを確認
+        """
+        linked = self.card('株式会社山田商事', related_flg=True)
+        first = self.card('株式会社山田商事', department_name='営業部', phone_number='03-1234-5678',
+                          zip_code='100-0005', address1='東京都', address2='千代田区丸の内1-1-1',
+                          last_name='山田', first_name='太郎')
+        second = self.card('山田商事', department_name='営業部')
+        other = self.card('鈴木工業株式会社')
+        self.card('')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(2, CreateCustomersFromAddressInfos(self.workspace, self.user, 500))
+        # bulk_createでpkが設定されるデータベースでは、作成した顧客情報を引き当てない
+        looked_up = any('MAX("sfa_customerinfo"."id")' in query['sql'] for query in captured)
+        self.assertEqual(not connection.features.can_return_ids_from_bulk_insert, looked_up)
+
+        customer = CustomerInfo.objects.get(customer_name='株式会社山田商事')
+        self.assertEqual(
+            ('営業部', '0312345678', '1000005', '山田 太郎', '東京都千代田区丸の内1-1-1', 500,
+             self.user.pk, '連絡先情報'),
+            (customer.department_name, customer.tel_number1, customer.zip_code,
+             customer.contact_name, customer.normalized_address, customer.potential,
+             customer.sales_person_id, customer.data_source))
+        self.assertTrue(ActionStatusTransition.objects.filter(customer=customer).exists())
+        for card in (linked, first, second, other):
+            card.refresh_from_db()
+        self.assertEqual([customer.pk, customer.pk], [first.related_customer_id,
+                                                      second.related_customer_id])
+        self.assertEqual('新規作成', first.related_reasons)
+        self.assertEqual('鈴木工業株式会社',
+                         CustomerInfo.objects.get(pk=other.related_customer_id).customer_name)
+        self.assertIsNone(linked.related_customer_id)
+
+    def test_archive_unlinks(self):
+        """
+        関連付けた顧客情報をアーカイブすると、連絡先情報の関連付けが外れることを確認
+        """
+        customer = self.customer('株式会社山田商事', tel_number1='0312345678', delete_flg=True,
+                                 deleted_timestamp=datetime.datetime(2018, 1, 1))
+        card = self.card('山田商事', phone_number='0312345678', related_flg=True,
+                         related_customer=customer, related_reasons='企業名・電話番号')
+        self.assertEqual(1, ArchiveDeletedCustomerInfo(datetime.datetime(2018, 2, 1)))
+        card.refresh_from_db()
+        self.assertEqual((None, False, ''),
+                         (card.related_customer_id, card.related_flg, card.related_reasons))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AddressMatchViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        password = fake.password()
+        self.user = User.objects.create_user(
+            email=fake.email(), password=password, workspace=self.workspace,
+            is_workspace_active=True)
+        self.customer = CustomerInfo.objects.create(
+            customer_name='株式会社山田商事', tel_number1='0312345678', potential=1,
+            workspace=self.workspace, public_status=1)
+        self.client = Client()
+        self.client.login(email=self.user.email, password=password)
+
+    def test_import(self):
+        """
+        CSVインポートした連絡先情報が、顧客情報と照合されて関連付けられることを確認
+        """
+        row = [''] * 34
+        row[6] = '山田商事'
+        row[9] = '03-1234-5678'
+        content = '\r\n'.join([','.join(['列{}'.format(i) for i in range(34)]), ','.join(row)])
+        response = self.client.post(reverse('address_info_import'), {
+            'file': SimpleUploadedFile('address.csv', content.encode('Shift_JISx0213')),
+        })
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(self.customer.pk, AddressInfo.objects.get().related_customer_id)
+
+    def test_actions(self):
+        """
+        一覧画面から照合と顧客情報の作成ができることを確認
+        """
+        matched = AddressInfo.objects.create(
+            customer_name='山田商事', phone_number='0312345678', workspace=self.workspace)
+        unmatched = AddressInfo.objects.create(customer_name='鈴木工業', workspace=self.workspace)
+        response = self.client.get(reverse('address_info_list'))
+        self.assertContains(response, 'id_address_info_customer_create')
+
+        self.client.post(reverse('address_info_match'))
+        matched.refresh_from_db()
+        self.assertEqual(self.customer.pk, matched.related_customer_id)
+
+        response = self.client.post(reverse('address_info_customer_create'), {'potential': '-1'})
+        self.assertEqual(302, response.status_code)
+        self.assertFalse(CustomerInfo.objects.filter(customer_name='鈴木工業').exists())
+        self.client.post(reverse('address_info_customer_create'), {'potential': '100'})
+        unmatched.refresh_from_db()
+        self.assertEqual('鈴木工業', unmatched.related_customer.customer_name)
+
+    def test_detail_hides_private_customer(self):
+        """
+        関連付けた顧客情報が閲覧できない場合は、連絡先情報の詳細画面に企業名を表示しないことを確認
+        """
+        private = CustomerInfo.objects.create(
+            customer_name='鈴木工業株式会社', potential=1, workspace=self.workspace,
+            public_status=0, author='other@example.com')
+        card = AddressInfo.objects.create(
+            customer_name='山田商事', workspace=self.workspace, related_flg=True,
+            related_customer=self.customer)
+        response = self.client.get(reverse('address_info_detail', args=[card.pk]))
+        self.assertContains(response, '株式会社山田商事')
+        card.related_customer = private
+        card.save()
+        response = self.client.get(reverse('address_info_detail', args=[card.pk]))
+        self.assertNotContains(response, '鈴木工業株式会社')
@@ -0,0 +1,115 @@
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from register.models import User, Workspace
+from sfa.benchmarks.generator import GenerateWorkspace, BenchmarkEmail, BENCHMARK_PASSWORD
+from sfa.benchmarks.loadtest import CompareLoadTests, RunLoadTest, SummarizeLoadTest
+from sfa.benchmarks.runner import CacheHitRate, CompareWithBaseline, Percentile, ReadBufferStats
+from sfa.models import CustomerInfo, ContactInfo, AddressInfo
+
+
+class GenerateWorkspaceTests(TestCase):
+    def test_generate_workspace(self):
+        """
+        指定した件数のデータが生成され、同じseedなら同じ内容になることを確認
+        """
+        first = GenerateWorkspace(
+            seed=1, users=3, groups=2, customers=20, contacts=30, addresses=5)
+        # ワークスペース名とメールアドレスは一意のため、2回目の生成前に変更しておく
+        Workspace.objects.filter(pk=first['workspace'].pk).update(workspace_name='first')
+        for user in first['users']:
+            User.objects.filter(pk=user.pk).update(email='first-' + user.email)
+        second = GenerateWorkspace(
+            seed=1, users=3, groups=2, customers=20, contacts=30, addresses=5)
+        workspace = first['workspace']
+        self.assertEqual(20, CustomerInfo.objects.filter(workspace=workspace).count())
+        self.assertEqual(
+            30, ContactInfo.objects.filter(target_customer__workspace=workspace).count())
+        self.assertEqual(5, AddressInfo.objects.filter(workspace=workspace).count())
+        self.assertEqual('2', first['users'][0].workspace_role)
+
+        def customer_names(dataset):
+            return list(
+                CustomerInfo.objects.filter(workspace=dataset['workspace']).order_by(
+                    'pk').values_list('customer_name', 'tel_number1', 'action_status'))
+
+        self.assertEqual(customer_names(first), customer_names(second))
+
+
+class CompareWithBaselineTests(TestCase):
+    def test_compare_with_baseline(self):
+        """
+        クエリ数の増加とp95の許容範囲超えだけが悪化として報告されることを確認
+        """
+        baseline = {
+            'customer_list_user': {'p50_ms': 10, 'p95_ms': 20, 'queries': 5},
+            'visit_target_filter': {'p50_ms': 10, 'p95_ms': 20, 'queries': 5},
+        }
+        results = {
+            'customer_list_user': {'p50_ms': 12, 'p95_ms': 29, 'queries': 5},
+            'visit_target_filter': {'p50_ms': 12, 'p95_ms': 31, 'queries': 6},
+            'get_contactinfo_count': {'p50_ms': 1, 'p95_ms': 2, 'queries': 3},
+        }
+        regressions = CompareWithBaseline(results, baseline, tolerance=0.5)
+        self.assertEqual(2, len(regressions))
+        self.assertTrue(all(r.startswith('visit_target_filter') for r in regressions))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, Percentile(values, 50))
+        self.assertEqual(95, Percentile(values, 95))
+
+    def test_cache_hit_rate(self):
+        """
+        計測前後のバッファの差分からヒット率を求め、計測できない場合はNoneになることを確認
+        """
+        self.assertEqual(75.0, CacheHitRate((100, 10), (130, 20)))
+        self.assertIsNone(CacheHitRate((100, 10), (100, 10)))
+        self.assertIsNone(CacheHitRate(None, None))
+        if connection.vendor != 'postgresql':
+            self.assertIsNone(ReadBufferStats())
+
+
+class SummarizeLoadTestTests(TestCase):
+    def test_summarize_load_test(self):
+        """
+        URL名ごとと合計の件数・エラー数・スループットが集計されることを確認
+        """
+        records = [('detail', 0.1, True), ('detail', 0.3, False), ('dashboard', 0.2, True)]
+        results = SummarizeLoadTest(records, elapsed=2)
+        self.assertEqual({'detail', 'dashboard', '_total'}, set(results))
+        self.assertEqual(2, results['detail']['requests'])
+        self.assertEqual(1, results['detail']['errors'])
+        self.assertEqual(1.0, results['detail']['rps'])
+        self.assertEqual(3, results['_total']['requests'])
+        self.assertEqual(300, results['_total']['p99_ms'])
+
+    def test_compare_load_tests(self):
+        """
+        スループットの低下・p95の悪化・エラーの増加が報告されることを確認
+        """
+        baseline = {
+            'detail': {'rps': 10, 'p95_ms': 100, 'errors': 0},
+            'dashboard': {'rps': 10, 'p95_ms': 100, 'errors': 0},
+        }
+        results = {
+            'detail': {'rps': 9, 'p95_ms': 110, 'errors': 0},
+            'dashboard': {'rps': 7, 'p95_ms': 130, 'errors': 1},
+            'search': {'rps': 1, 'p95_ms': 1000, 'errors': 5},
+        }
+        regressions = CompareLoadTests(results, baseline, tolerance=0.2)
+        self.assertEqual(3, len(regressions))
+        self.assertTrue(all(r.startswith('dashboard') for r in regressions))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class RunLoadTestTests(LiveServerTestCase):
+    def test_run_load_test(self):
+        """
+        仮想ユーザーがログインして各操作をエラーなく行えることを確認
+        """
+        GenerateWorkspace(seed=2, users=1, customers=10, contacts=10)
+        results = RunLoadTest(
+            self.live_server_url, [(BenchmarkEmail(2, 0), BENCHMARK_PASSWORD)],
+            iterations=10, seed=2, import_rows=3)
+        self.assertEqual(0, results['_total']['errors'])
+        self.assertGreaterEqual(results['_total']['requests'], 10)
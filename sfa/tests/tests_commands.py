@@ -0,0 +1,256 @@
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from faker import Faker
+from io import StringIO
+from register.models import User, Workspace
+from sfa.common_util import RestoreArchivedRecord, IsContactInfoPartitioned, CreateContactInfoPartitions
+from sfa.models import CustomerInfo, CustomerInfoSupplement, ContactInfo, PipelineSnapshot, ActionStatusTransition, ArchivedRecord
+import datetime
+
+
+class TakePipelineSnapshotTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=100,
+            workspace=self.workspace,
+            sales_person=self.user,
+            action_status=0)
+        CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=200,
+            workspace=self.workspace,
+            sales_person=self.user,
+            action_status=0)
+        CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=400,
+            workspace=self.workspace,
+            action_status=2)
+        # 削除済みの顧客は集計しない
+        CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=800,
+            workspace=self.workspace,
+            sales_person=self.user,
+            action_status=2,
+            delete_flg=True)
+
+    def test_take_pipeline_snapshot(self):
+        """
+        ワークスペース全体と営業担当者ごとの集計が保存されることを確認
+        """
+        call_command(
+            'take_pipeline_snapshot', '--date', '2018-11-20', stdout=StringIO())
+        snapshot_date = datetime.date(2018, 11, 20)
+
+        workspace_rows = PipelineSnapshot.objects.filter(
+            snapshot_date=snapshot_date, sales_person__isnull=True)
+        self.assertEqual(2, workspace_rows.count())
+        row = workspace_rows.get(action_status=0)
+        self.assertEqual(2, row.customer_count)
+        self.assertEqual(300, row.potential_sum)
+        row = workspace_rows.get(action_status=2)
+        self.assertEqual(1, row.customer_count)
+        self.assertEqual(400, row.potential_sum)
+
+        user_rows = PipelineSnapshot.objects.filter(
+            snapshot_date=snapshot_date, sales_person=self.user)
+        self.assertEqual(1, user_rows.count())
+        self.assertEqual(2, user_rows.get(action_status=0).customer_count)
+
+    def test_take_pipeline_snapshot_twice(self):
+        """
+        同じ集計日で再実行してもスナップショットが重複しないことを確認
+        """
+        call_command(
+            'take_pipeline_snapshot', '--date', '2018-11-20', stdout=StringIO())
+        call_command(
+            'take_pipeline_snapshot', '--date', '2018-11-20', stdout=StringIO())
+        self.assertEqual(3, PipelineSnapshot.objects.count())
+
+
+class ArchiveDeletedRecordsTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        long_ago = datetime.datetime.now() - datetime.timedelta(days=100)
+        # 削除から100日経過した顧客情報（補足・コンタクト情報・変更履歴あり）
+        self.old_customer = CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=1,
+            workspace=self.workspace,
+            delete_flg=True,
+            deleted_timestamp=long_ago)
+        CustomerInfoSupplement.objects.create(
+            customer=self.old_customer, remarks=fake.sentence())
+        ContactInfo.objects.create(
+            target_customer=self.old_customer, operator=self.user)
+        ActionStatusTransition.objects.create(
+            workspace=self.workspace,
+            customer=self.old_customer,
+            to_status=0,
+            changed_by=self.user)
+        # 削除したばかりの顧客情報はアーカイブしない
+        self.recent_customer = CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=1,
+            workspace=self.workspace,
+            delete_flg=True,
+            deleted_timestamp=datetime.datetime.now())
+        # 有効な顧客情報の、削除から100日経過したコンタクト情報
+        self.live_customer = CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=1,
+            workspace=self.workspace)
+        self.old_contact = ContactInfo.objects.create(
+            target_customer=self.live_customer,
+            operator=self.user,
+            delete_flg=True,
+            deleted_timestamp=long_ago)
+
+    def test_archive_and_restore(self):
+        """
+        削除から一定期間が経過したデータだけがアーカイブされ、復元できることを確認
+        """
+        call_command(
+            'archive_deleted_records', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(
+            [self.recent_customer.pk, self.live_customer.pk],
+            list(CustomerInfo.objects.order_by('pk').values_list(
+                'pk', flat=True)))
+        self.assertEqual(0, ContactInfo.objects.count())
+        self.assertEqual(0, ActionStatusTransition.objects.count())
+        self.assertEqual(2, ArchivedRecord.objects.count())
+
+        customer_record = ArchivedRecord.objects.get(
+            model_name='customerinfo')
+        self.assertEqual(self.old_customer.pk, customer_record.original_id)
+        RestoreArchivedRecord(customer_record)
+        restored = CustomerInfo.objects.get(pk=self.old_customer.pk)
+        self.assertFalse(restored.delete_flg)
+        self.assertIsNone(restored.deleted_timestamp)
+        self.assertEqual(
+            self.old_customer.supplement.remarks, restored.supplement.remarks)
+        self.assertEqual(1, restored.contactinfo_set.count())
+        self.assertEqual(1, ActionStatusTransition.objects.count())
+
+        RestoreArchivedRecord(
+            ArchivedRecord.objects.get(model_name='contactinfo'))
+        self.assertFalse(ContactInfo.objects.get(pk=self.old_contact.pk).delete_flg)
+        self.assertEqual(0, ArchivedRecord.objects.count())
+
+
+class ContactInfoPartitionCommandsTests(TestCase):
+    def test_not_partitioned(self):
+        """
+        パーティション化されていないデータベースでは何もしないことを確認
+        """
+        out = StringIO()
+        call_command('create_contactinfo_partitions', stdout=out)
+        call_command('detach_contactinfo_partitions', '2018-01', stdout=out)
+        if not IsContactInfoPartitioned():
+            self.assertIn('パーティション化されていないため', out.getvalue())
+
+    def test_invalid_month(self):
+        """
+        切り離す月の形式が不正な場合はエラーになることを確認
+        """
+        with self.assertRaises(CommandError):
+            call_command(
+                'detach_contactinfo_partitions', '2018/01', stdout=StringIO())
+
+
+class ContactInfoPartitionTests(TestCase):
+    """
+    パーティション化したコンタクト情報のテーブルでの、月次パーティションの作成と切り離しのテスト。
+    マイグレーション0011でパーティション化されるPostgreSQL 11以降でのみ実行する（CIのbuild_partitioningジョブ）
+    """
+
+    def setUp(self):
+        if not IsContactInfoPartitioned():
+            self.skipTest('コンタクト情報のテーブルがパーティション化されていません')
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        self.customer = CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=1,
+            workspace=self.workspace)
+        # マイグレーションで作成される月次パーティションより前の月なので、既定パーティションに入る
+        self.contact = ContactInfo.objects.create(
+            target_customer=self.customer, operator=self.user)
+        ContactInfo.objects.filter(pk=self.contact.pk).update(
+            contact_timestamp=datetime.datetime(1990, 1, 15, 10, 0))
+        # 遅延された外部キーの検査が残っているとALTER TABLEできないため、ここで検査を済ませる
+        connection.check_constraints()
+
+    def _PartitionOf(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text FROM sfa_contactinfo WHERE id = %s',
+                [pk])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def test_create_and_detach(self):
+        """
+        既定パーティションのデータが新しい月次パーティションへ移り、切り離すと検索対象から外れることを確認
+        """
+        self.assertEqual('sfa_contactinfo_default',
+                         self._PartitionOf(self.contact.pk))
+
+        created = CreateContactInfoPartitions(
+            months_ahead=1, base_date=datetime.date(1990, 1, 20))
+        self.assertEqual(
+            ['sfa_contactinfo_p199001', 'sfa_contactinfo_p199002'], created)
+        self.assertEqual('sfa_contactinfo_p199001',
+                         self._PartitionOf(self.contact.pk))
+        # 作成済みの月は作り直さない
+        self.assertEqual([],
+                         CreateContactInfoPartitions(
+                             months_ahead=1,
+                             base_date=datetime.date(1990, 1, 1)))
+
+        out = StringIO()
+        call_command('detach_contactinfo_partitions', '1990-02', stdout=out)
+        self.assertIn('sfa_contactinfo_p199001', out.getvalue())
+        self.assertFalse(ContactInfo.objects.filter(pk=self.contact.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id FROM sfa_contactinfo_archived_p199001')
+            self.assertEqual([(self.contact.pk, )], cursor.fetchall())
+        # 外部キーを外しているため、顧客情報を削除できる
+        self.customer.delete()
+        connection.check_constraints()
+
+        # --dropを指定すると切り離したパーティションを削除する
+        call_command(
+            'detach_contactinfo_partitions', '1990-03', '--drop', stdout=out)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', ['sfa_contactinfo_p199002'])
+            self.assertIsNone(cursor.fetchone()[0])
+        # 当月のパーティションは切り離されずに残る
+        self.assertEqual([], CreateContactInfoPartitions(months_ahead=0))
@@ -0,0 +1,164 @@
+from django.test import SimpleTestCase, TestCase
+from faker import Faker
+from register.models import User, Workspace
+from sfa.benchmarks.micro import ExtractNumberReference, GenerateNumberStrings
+from sfa.common_util import BuildActionStatusTransition, GetActionStatusFunnel, GetActionStatusDuration, NormalizeJapaneseAddress, NormalizeJapaneseAddresses, SplitPrefecture, ExtractNumber, ExtractNumbers, ExtractNumberColumns
+from sfa.models import CustomerInfo, ActionStatusTransition
+import datetime
+import zenhan
+
+
+class ActionStatusTransitionTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        self.customer1 = CustomerInfo.objects.create(
+            customer_name=fake.company(), potential=1,
+            workspace=self.workspace)
+        self.customer2 = CustomerInfo.objects.create(
+            customer_name=fake.company(), potential=1,
+            workspace=self.workspace)
+
+    def create_transition(self, customer, from_status, to_status, day):
+        """
+        指定日時に対応状況を変更した履歴を作成する
+        """
+        transition = ActionStatusTransition.objects.create(
+            workspace=self.workspace,
+            customer=customer,
+            from_status=from_status,
+            to_status=to_status,
+            changed_by=self.user)
+        # changed_timestampはauto_now_addのため、作成後に書き換える
+        ActionStatusTransition.objects.filter(pk=transition.pk).update(
+            changed_timestamp=datetime.datetime(2018, 11, day, 9, 0))
+
+    def test_build_action_status_transition(self):
+        """
+        対応状況が変わっていない場合は履歴を作らないことを確認
+        """
+        self.customer1.action_status = 1
+        self.assertIsNone(
+            BuildActionStatusTransition(self.customer1, 1, self.user))
+        transition = BuildActionStatusTransition(
+            self.customer1, 0, self.user)
+        self.assertEqual(0, transition.from_status)
+        self.assertEqual(1, transition.to_status)
+
+    def test_funnel_and_duration(self):
+        """
+        到達顧客数・移行率と平均滞留日数の集計を確認
+        """
+        self.create_transition(self.customer1, None, 0, 1)
+        self.create_transition(self.customer1, 0, 1, 3)
+        self.create_transition(self.customer1, 1, 2, 7)
+        self.create_transition(self.customer2, None, 0, 1)
+        self.create_transition(self.customer2, 0, 1, 5)
+
+        date_from = datetime.datetime(2018, 11, 1)
+        date_to = datetime.datetime(2018, 12, 1)
+
+        funnel = {
+            row['action_status']: row
+            for row in GetActionStatusFunnel(self.workspace, date_from,
+                                             date_to)
+        }
+        self.assertEqual(2, funnel[0]['customer_count'])
+        self.assertEqual(2, funnel[1]['customer_count'])
+        self.assertEqual(100.0, funnel[1]['conversion_rate'])
+        self.assertEqual(1, funnel[2]['customer_count'])
+        self.assertEqual(50.0, funnel[2]['conversion_rate'])
+
+        durations = {
+            row['action_status']: row
+            for row in GetActionStatusDuration(self.workspace, date_from,
+                                               date_to)
+        }
+        # 見込み客：2日と4日で平均3日
+        self.assertEqual(2, durations[0]['transition_count'])
+        self.assertEqual(3.0, durations[0]['average_days'])
+        self.assertEqual(1, durations[1]['transition_count'])
+        self.assertEqual(4.0, durations[1]['average_days'])
+        # 次の変更がない対応状況は集計しない
+        self.assertEqual(0, durations[2]['transition_count'])
+        self.assertIsNone(durations[2]['average_days'])
+
+
+class NormalizeJapaneseAddressTests(TestCase):
+    def test_variants(self):
+        """
+        漢数字・全角数字・丁目番号の表記や、都道府県の入力先が違っても同じ住所になることを確認
+        """
+        expect = '東京都千代田区丸の内1-1-1'
+        for address1, address2 in (
+                ('東京都', '千代田区丸の内1-1-1'),
+                ('', '東京都千代田区丸の内一丁目1番1号'),
+                ('東京都', '千代田区丸の内１－１－１'),
+                ('東京都', '千代田区丸の内　1丁目1ー1'),
+                ('東京都', '東京都千代田区丸の内1の1の1'),
+        ):
+            self.assertEqual(expect, NormalizeJapaneseAddress(address1, address2))
+
+    def test_keep_place_names(self):
+        """
+        町名に含まれる漢数字や番は変換しないことを確認
+        """
+        self.assertEqual('東京都千代田区一番町12',
+                         NormalizeJapaneseAddress('東京都', '千代田区一番町十二番地'))
+        self.assertEqual('東京都千代田区九段北1-2-3',
+                         NormalizeJapaneseAddress('東京都', '千代田区九段北一丁目二番三号'))
+
+    def test_split_and_batch(self):
+        """
+        都道府県を切り出せること、まとめて正規化しても同じ結果になることを確認
+        """
+        self.assertEqual(('神奈川県', '横浜市西区みなとみらい2-2-1'),
+                         SplitPrefecture('神奈川県横浜市西区みなとみらい2-2-1'))
+        self.assertEqual(('', '横浜市'), SplitPrefecture('横浜市'))
+        rows = [('大阪府', '大阪市北区梅田三丁目1番1号'), ('', ''), (None, None)]
+        self.assertEqual([NormalizeJapaneseAddress(*row) for row in rows],
+                         NormalizeJapaneseAddresses(rows))
+
+    def test_saved_column(self):
+        """
+        顧客情報の保存時に正規化した住所が設定されることを確認
+        """
+        workspace = Workspace.objects.create(workspace_name=Faker('ja_JP').company())
+        customer = CustomerInfo.objects.create(
+            customer_name='テスト', potential=1, workspace=workspace, address1='東京都',
+            address2='千代田区丸の内一丁目1番1号')
+        self.assertEqual('東京都千代田区丸の内1-1-1', customer.normalized_address)
+        customer.address2 = '千代田区大手町1-1-1'
+        customer.save(update_fields=['address2'])
+        customer.refresh_from_db()
+        self.assertEqual('東京都千代田区大手町1-1-1', customer.normalized_address)
+
+
+class ExtractNumberTests(SimpleTestCase):
+    def test_same_as_reference(self):
+        """
+        ランダムな文字列で、zenhanと正規表現による以前の処理と同じ結果になることを確認
+        """
+        values = GenerateNumberStrings(3000, seed=1)
+        # zenhanが変換するすべての全角文字も1文字ずつ確認する
+        values.extend(zenhan.converter._make_zen2han_dict(zenhan.ALL))
+        for data_type in (1, 2, 3):
+            expect = [ExtractNumberReference(value, data_type) for value in values]
+            self.assertEqual(expect, [ExtractNumber(value, data_type) for value in values])
+            self.assertEqual(expect, ExtractNumbers(values, data_type))
+        self.assertEqual('0120123456', ExtractNumber('（０１２０）１２３−４５６', 1))
+        self.assertEqual('1234567', ExtractNumber('１２３−４５６７', 2))
+
+    def test_columns(self):
+        """
+        指定した列だけが変換され、列数が足りない行もそのまま返されることを確認
+        """
+        rows = [['（０３）１２３４', '１２３−４５６７', 'ＡＢＣ'], ['０３−１']]
+        self.assertEqual([['031234', '1234567', 'ＡＢＣ'], ['031']],
+                         list(ExtractNumberColumns(rows, {0: 1, 1: 2})))
@@ -0,0 +1,173 @@
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from faker import Faker
+from io import StringIO
+from register.models import User, Workspace
+from sfa.company import RefreshCompanyRollups, GetCompanyContacts
+from sfa.models import CompanyRollup, ContactInfo, CustomerInfo
+from .helpers import QueryBudgetTestMixin
+import datetime
+import json
+
+
+class CompanyRollupTests(TestCase):
+    def setUp(self):
+        self.fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=self.fake.company())
+        self.users = [
+            User.objects.create_user(
+                email=self.fake.email(), password=self.fake.password(),
+                workspace=self.workspace, is_workspace_active=True) for _ in range(2)
+        ]
+
+    def create(self, corporate_number, department_name='', potential=100, sales_person=None,
+               **kwargs):
+        return CustomerInfo.objects.create(
+            customer_name='株式会社山田商事', corporate_number=corporate_number,
+            department_name=department_name, potential=potential, sales_person=sales_person,
+            workspace=self.workspace, **kwargs)
+
+    def contact(self, customer, timestamp, **kwargs):
+        contactinfo = ContactInfo.objects.create(
+            target_customer=customer, operator=self.users[0], contact_type=2, **kwargs)
+        # 対応日時は自動で設定されるため、作成後に変更する
+        ContactInfo.objects.filter(pk=contactinfo.pk).update(contact_timestamp=timestamp)
+        return contactinfo
+
+    def test_refresh(self):
+        """
+        法人番号ごとに部署をまとめて集計し、削除済みの顧客情報とコンタクト情報は含まないことを確認
+        """
+        sales = self.create('1010001000001', '営業部', 100, self.users[0])
+        self.create('1010001000001', '総務部', 200, self.users[1])
+        self.create('1010001000001', '経理部', 300, self.users[1])
+        self.create('1010001000001', '旧部署', 400, self.users[0], delete_flg=True)
+        self.create('1010001000002', '', 50)
+        self.create('', '', 1000)
+        timestamp = datetime.datetime(2018, 10, 1, 9)
+        self.contact(sales, timestamp)
+        self.contact(sales, timestamp + datetime.timedelta(days=1), delete_flg=True)
+        self.assertEqual(2, RefreshCompanyRollups(self.workspace))
+
+        company = CompanyRollup.objects.get(corporate_number='1010001000001')
+        self.assertEqual((3, 600, 2, 1, timestamp), (
+            company.customer_count, company.potential_sum, company.sales_person_count,
+            company.contact_count, company.last_contact_timestamp))
+        company = CompanyRollup.objects.get(corporate_number='1010001000002')
+        self.assertEqual((1, 50, 0, 0, None), (
+            company.customer_count, company.potential_sum, company.sales_person_count,
+            company.contact_count, company.last_contact_timestamp))
+
+    def test_refresh_changed(self):
+        """
+        変更した顧客情報の会社だけを集計し直し、顧客情報がなくなった会社の集計は消えることを確認
+        """
+        customer = self.create('1010001000001', '営業部')
+        other = self.create('1010001000002')
+        RefreshCompanyRollups(self.workspace)
+        CustomerInfo.objects.filter(pk=other.pk).update(potential=999)
+
+        CustomerInfo.objects.filter(pk=customer.pk).update(corporate_number='1010001000003')
+        self.assertEqual(1, RefreshCompanyRollups(self.workspace, [customer.pk], ['1010001000001']))
+        self.assertEqual(['1010001000002', '1010001000003'], list(
+            CompanyRollup.objects.order_by('corporate_number').values_list(
+                'corporate_number', flat=True)))
+        # 指定しなかった会社は集計し直さない
+        self.assertEqual(100, CompanyRollup.objects.get(corporate_number='1010001000002').potential_sum)
+
+    def test_contacts(self):
+        """
+        部署をまたいだコンタクト履歴を、対応日時が同じものも漏れなく新しい順にページ分けできることを確認
+        """
+        sales = self.create('1010001000001', '営業部')
+        general = self.create('1010001000001', '総務部')
+        other = self.create('1010001000002')
+        timestamp = datetime.datetime(2018, 10, 1, 9)
+        created = [
+            self.contact(sales, timestamp + datetime.timedelta(hours=2)),
+            self.contact(general, timestamp + datetime.timedelta(hours=1)),
+            self.contact(sales, timestamp + datetime.timedelta(hours=1)),
+            self.contact(general, timestamp),
+            self.contact(sales, timestamp),
+        ]
+        self.contact(other, timestamp)
+
+        contacts = []
+        cursor = None
+        for _ in range(3):
+            page, cursor = GetCompanyContacts(self.workspace, '1010001000001', cursor, page_size=2)
+            contacts.extend(page)
+            if cursor is None:
+                break
+        self.assertIsNone(cursor)
+        # 対応日時が同じ場合はpkの大きい順
+        self.assertEqual([created[i].pk for i in (0, 2, 1, 4, 3)],
+                         [contact.pk for contact in contacts])
+
+    def test_command(self):
+        """
+        コマンドでワークスペースの会社単位の集計を作り直せることを確認
+        """
+        self.create('1010001000001')
+        out = StringIO()
+        call_command('refresh_company_rollups', workspace_id=self.workspace.pk, stdout=out)
+        self.assertIn('1社', out.getvalue())
+        self.assertTrue(CompanyRollup.objects.filter(corporate_number='1010001000001').exists())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CompanyViewTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.password = fake.password()
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.customers = [
+            CustomerInfo.objects.create(
+                customer_name='株式会社山田商事', corporate_number='1010001000001',
+                department_name=department_name, potential=100, sales_person=self.user,
+                workspace=self.workspace, author=self.user.email)
+            for department_name in ('営業部', '総務部')
+        ]
+        RefreshCompanyRollups(self.workspace)
+        self.client = Client()
+        self.client.login(email=self.user.email, password=self.password)
+
+    def test_views(self):
+        """
+        一覧・詳細・JSONのいずれもクエリ数の上限以内で表示できることを確認
+        """
+        self.assertWithinQueryBudget(self.client, 'company_list')
+        self.assertWithinQueryBudget(self.client, 'company_detail', args=('1010001000001', ))
+        self.assertWithinQueryBudget(self.client, 'get_company_rollup', args=('1010001000001', ))
+        response = self.client.get(reverse('company_detail', args=('9999999999999', )))
+        self.assertEqual(404, response.status_code)
+
+    def test_contact_updates_rollup(self):
+        """
+        コンタクト情報の登録と顧客情報の削除が、会社単位の集計に反映されることを確認
+        """
+        response = self.client.post(
+            reverse('contact_from_customer_create', args=(self.customers[1].pk, )), {
+                'target_customer': self.customers[1].pk,
+                'operator': self.user.pk,
+                'contact_type': '2',
+            })
+        self.assertEqual(302, response.status_code)
+        self.client.get(reverse('delete', args=(self.customers[0].pk, )))
+
+        response = self.client.get(reverse('get_company_rollup', args=('1010001000001', )))
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual(1, results['company']['customer_count'])
+        self.assertEqual(1, results['company']['contact_count'])
+        self.assertEqual(['総務部'], [d['department_name'] for d in results['departments']])
+        self.assertEqual([self.user.email], results['sales_persons'])
+        self.assertEqual('総務部', results['contacts'][0]['department_name'])
+        self.assertIsNone(results['next_cursor'])
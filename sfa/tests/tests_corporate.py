@@ -0,0 +1,114 @@
+from django.core.management import call_command
+from django.test import TestCase
+from faker import Faker
+from io import StringIO
+from register.models import Workspace
+from sfa.corporate import BuildCorporateIndex, CorporateIndex, EnrichCorporateNumbers
+from sfa.models import CustomerInfo
+import csv
+import numpy as np
+import os
+import tempfile
+
+
+def NtaRow(number, name, prefecture, city, street, post_code='1000005', latest='1',
+           close_date='', hidden='0'):
+    """
+    法人番号の全件データの1行（30列）を作る
+    """
+    row = [''] * 30
+    row[1] = number
+    row[2] = '01'
+    row[6] = name
+    row[9] = prefecture
+    row[10] = city
+    row[11] = street
+    row[15] = post_code
+    row[18] = close_date
+    row[23] = latest
+    row[29] = hidden
+    return row
+
+
+NTA_ROWS = [
+    NtaRow('1010001000001', '株式会社山田商事', '東京都', '千代田区', '丸の内１丁目１－１'),
+    NtaRow('1010001000002', '鈴木工業株式会社', '東京都', '港区', '芝大門１丁目１０－１８', '1050012'),
+    NtaRow('1010001000003', '鈴木工業株式会社', '東京都', '新宿区', '西新宿２丁目８－１', '1600023'),
+    NtaRow('1010001000004', '株式会社佐藤製作所', '大阪府', '大阪市北区', '梅田３丁目１－１', '5300001'),
+    # 閉鎖、過去の情報、公表しないものは索引に含めない
+    NtaRow('1010001000005', '株式会社田中商店', '東京都', '千代田区', '大手町１丁目１', close_date='2018-01-01'),
+    NtaRow('1010001000006', '株式会社高橋物産', '東京都', '千代田区', '大手町１丁目２', latest='0'),
+    NtaRow('1010001000007', '株式会社伊藤建設', '東京都', '千代田区', '大手町１丁目３', hidden='1'),
+]
+
+
+class CorporateIndexTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # 並べ替えとマージを確認するため、2件ずつ一時ファイルに書き出す
+        self.assertEqual(4, BuildCorporateIndex(NTA_ROWS, self.directory.name, chunk_size=2))
+        self.index = CorporateIndex(self.directory.name)
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+
+    def create(self, customer_name, address1='', address2='', **kwargs):
+        return CustomerInfo.objects.create(
+            customer_name=customer_name, workspace=self.workspace, potential=1,
+            address1=address1, address2=address2, **kwargs)
+
+    def test_lookup(self):
+        """
+        メモリマップで開いた索引から、表記の違う法人名でも検索できることを確認
+        """
+        self.assertIsInstance(self.index.records, np.memmap)
+        self.assertEqual(4, len(self.index))
+        self.assertEqual([('1010001000001', '1000005', '東京都', '千代田区', '丸の内１丁目１－１')],
+                         self.index.lookup('（株）山田商事', '東京都'))
+        self.assertEqual([], self.index.lookup('株式会社山田商事', '大阪府'))
+        self.assertEqual([], self.index.lookup('株式会社田中商店', '東京都'))
+        self.assertEqual(2, len(self.index.lookup('鈴木工業', '東京都')))
+
+    def test_enrich(self):
+        """
+        法人番号が1つに決まる顧客情報だけに法人番号を設定し、住所を登記された住所に揃えることを確認
+        """
+        unique = self.create('山田商事', '東京都')
+        narrowed = self.create('鈴木工業', '東京都', '新宿区西新宿2-8-1')
+        ambiguous = self.create('鈴木工業', '東京都')
+        branch = self.create('株式会社佐藤製作所 東京支店', '大阪府', '大阪市中央区本町1-1')
+        filled = self.create('株式会社山田商事', '東京都', corporate_number='9999999999999')
+        # 住所が空の場合は都道府県が分からないため照合しない
+        no_address = self.create('山田商事')
+        self.assertEqual((3, 2), EnrichCorporateNumbers(self.workspace, self.index))
+
+        for customer in (unique, narrowed, ambiguous, branch, filled, no_address):
+            customer.refresh_from_db()
+        self.assertEqual('1010001000001', unique.corporate_number)
+        self.assertEqual(('1000005', '千代田区丸の内１丁目１－１', '東京都千代田区丸の内1-1-1'),
+                         (unique.zip_code, unique.address2, unique.normalized_address))
+        self.assertEqual('1010001000003', narrowed.corporate_number)
+        self.assertEqual('新宿区西新宿２丁目８－１', narrowed.address2)
+        self.assertEqual('', ambiguous.corporate_number)
+        # 登記された住所と違う住所（支店など）は変えない
+        self.assertEqual('1010001000004', branch.corporate_number)
+        self.assertEqual('大阪市中央区本町1-1', branch.address2)
+        self.assertEqual('9999999999999', filled.corporate_number)
+        self.assertEqual(('', ''), (no_address.corporate_number, no_address.address1))
+
+    def test_commands(self):
+        """
+        全件データのCSVから索引を作り、顧客情報に法人番号を設定できることを確認
+        """
+        customer = self.create('株式会社佐藤製作所', '大阪府')
+        path = os.path.join(self.directory.name, 'nta.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows(NTA_ROWS)
+        output = os.path.join(self.directory.name, 'index')
+        out = StringIO()
+        call_command('build_corporate_index', path, output=output, stdout=out)
+        call_command('enrich_corporate_numbers', workspace_id=self.workspace.pk,
+                     index=output, stdout=out)
+        self.assertIn('4件', out.getvalue())
+        customer.refresh_from_db()
+        self.assertEqual('1010001000004', customer.corporate_number)
@@ -0,0 +1,248 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from faker import Faker
+from io import StringIO
+from register.models import User, Workspace
+from sfa.common_util import ArchiveDeletedCustomerInfo, NormalizeJapaneseAddress
+from sfa.dedup import NormalizeCompanyName, BuildProfile, ScorePair, RefreshDuplicates
+from sfa.models import CustomerInfo, DuplicateCluster, DuplicateClusterMember, DuplicateKey
+import datetime
+
+
+def _Profile(**kwargs):
+    row = {
+        'id': 1,
+        'customer_name': '',
+        'corporate_number': '',
+        'tel_number1': '',
+        'tel_number2': '',
+        'tel_number3': '',
+        'fax_number': '',
+        'delete_flg': False,
+    }
+    row['normalized_address'] = NormalizeJapaneseAddress(
+        kwargs.pop('address1', ''), kwargs.pop('address2', ''))
+    row.update(kwargs)
+    return BuildProfile(row)
+
+
+class NormalizeTests(TestCase):
+    def test_company_name(self):
+        """
+        法人格・略記・部署・全角半角の違いが取り除かれることを確認
+        """
+        self.assertEqual('abc', NormalizeCompanyName('株式会社ＡＢＣ　東京支店'))
+        self.assertEqual('abc', NormalizeCompanyName('(株)ABC'))
+        self.assertEqual('abc', NormalizeCompanyName('ABC㈱'))
+        self.assertEqual('abc', NormalizeCompanyName('ｶ)ABC'))
+        self.assertEqual('abc商事', NormalizeCompanyName('有限会社 ABC商事'))
+
+
+class ScorePairTests(TestCase):
+    def test_corporate_number(self):
+        """
+        法人番号が一致すれば重複、異なれば企業名が同じでも重複ではないことを確認
+        """
+        a = _Profile(customer_name='ABC', corporate_number='1234567890123')
+        b = _Profile(customer_name='XYZ', corporate_number='1234567890123')
+        c = _Profile(customer_name='ABC', corporate_number='9999999999999')
+        self.assertEqual(1.0, ScorePair(a, b)[0])
+        self.assertEqual(0.0, ScorePair(a, c)[0])
+
+    def test_name_and_phone(self):
+        """
+        表記の違う同じ企業名と同じ電話番号は重複、企業名だけ似ているものは重複ではないことを確認
+        """
+        a = _Profile(customer_name='株式会社山田商事', tel_number1='03-1234-5678', address1='東京都')
+        b = _Profile(customer_name='山田商事(株)', tel_number1='0312345678', address1='大阪府')
+        c = _Profile(customer_name='山田商店', address1='大阪府')
+        score, reasons = ScorePair(a, b)
+        self.assertGreaterEqual(score, 0.7)
+        self.assertEqual(['企業名', '電話番号'], reasons)
+        self.assertLess(ScorePair(b, c)[0], 0.7)
+
+
+class RefreshDuplicatesTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.other_workspace = Workspace.objects.create(workspace_name=fake.company())
+
+    def create(self, customer_name, workspace=None, **kwargs):
+        return CustomerInfo.objects.create(
+            customer_name=customer_name,
+            workspace=workspace or self.workspace,
+            potential=1,
+            **kwargs)
+
+    def test_refresh(self):
+        """
+        似た顧客が1つの重複候補にまとまり、別のワークスペースの顧客は含まれないことを確認
+        """
+        a = self.create('株式会社山田商事', tel_number1='03-1234-5678')
+        b = self.create('山田商事株式会社 本社', tel_number1='0312345678')
+        c = self.create('(株)山田商事', fax_number='03(1234)5678')
+        self.create('鈴木工業株式会社')
+        self.create('株式会社山田商事', workspace=self.other_workspace, tel_number1='0312345678')
+
+        self.assertEqual(3, RefreshDuplicates(self.workspace))
+        cluster = DuplicateCluster.objects.get(workspace=self.workspace)
+        self.assertEqual({a.pk, b.pk, c.pk},
+                         set(cluster.members.values_list('customer_id', flat=True)))
+        self.assertFalse(DuplicateCluster.objects.filter(workspace=self.other_workspace).exists())
+        # もう一度実行しても変わらない
+        self.assertEqual(0, RefreshDuplicates(self.workspace))
+        self.assertEqual(1, DuplicateCluster.objects.count())
+
+    def test_incremental(self):
+        """
+        追加した顧客だけを指定すると、確認済みの重複候補に加わって未確認に戻ることを確認
+        """
+        a = self.create('株式会社山田商事', tel_number1='0312345678')
+        b = self.create('山田商事', tel_number1='0312345678')
+        RefreshDuplicates(self.workspace)
+        cluster = DuplicateCluster.objects.get()
+        cluster.status = 2
+        cluster.save()
+
+        c = self.create('山田商事株式会社 大阪営業所', tel_number1='03-1234-5678', address1='大阪府')
+        self.assertEqual(1, RefreshDuplicates(self.workspace, [c.pk]))
+        cluster.refresh_from_db()
+        self.assertEqual(0, cluster.status)
+        self.assertEqual({a.pk, b.pk, c.pk},
+                         set(cluster.members.values_list('customer_id', flat=True)))
+
+        # 電話番号を変えると、重複候補から外れる
+        c.tel_number1 = '0698765432'
+        c.save()
+        RefreshDuplicates(self.workspace, [c.pk])
+        self.assertFalse(DuplicateClusterMember.objects.filter(customer=c).exists())
+        self.assertEqual(2, cluster.members.count())
+
+    def test_merge_clusters(self):
+        """
+        つながった既存の重複候補はpkの小さい重複候補にまとめられ、未確認に戻ることを確認
+        """
+        customers = [self.create(name, tel_number1='0312345678')
+                     for name in ('株式会社山田商事', '山田商事', '(株)山田商事', '山田商事株式会社')]
+        clusters = [DuplicateCluster.objects.create(workspace=self.workspace, status=2)
+                    for _ in range(2)]
+        for i, customer in enumerate(customers):
+            DuplicateClusterMember.objects.create(cluster=clusters[i // 2], customer=customer)
+
+        self.assertEqual(0, RefreshDuplicates(self.workspace))
+        cluster = DuplicateCluster.objects.get()
+        self.assertEqual((clusters[0].pk, 0), (cluster.pk, cluster.status))
+        self.assertEqual(4, cluster.members.count())
+        self.assertGreater(cluster.score, 0)
+
+    def test_bulk_writes(self):
+        """
+        重複の組の数によらず、重複候補の顧客の追加と類似度の更新がまとめて書き込まれることを確認
+        """
+        for i in range(10):
+            for name in ('株式会社山田商事{}', '山田商事{}'):
+                self.create(name.format(i), tel_number1='03123456{:02d}'.format(i))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(20, RefreshDuplicates(self.workspace))
+        self.assertEqual(10, DuplicateCluster.objects.count())
+        statements = [query['sql'] for query in captured]
+        self.assertEqual(1, sum(sql.startswith('INSERT INTO "sfa_duplicateclustermember"')
+                                for sql in statements))
+        self.assertEqual(1, sum(sql.startswith('UPDATE "sfa_duplicateclustermember"')
+                                for sql in statements))
+        if connection.features.can_return_ids_from_bulk_insert:
+            self.assertEqual(1, sum(sql.startswith('INSERT INTO "sfa_duplicatecluster"')
+                                    for sql in statements))
+
+    def test_archive(self):
+        """
+        削除した顧客をアーカイブすると、重複候補と索引から取り除かれることを確認
+        """
+        a = self.create('株式会社山田商事', tel_number1='0312345678')
+        b = self.create('山田商事', tel_number1='0312345678')
+        RefreshDuplicates(self.workspace)
+        b.delete_flg = True
+        b.deleted_timestamp = datetime.datetime.now() - datetime.timedelta(days=100)
+        b.save()
+        ArchiveDeletedCustomerInfo(datetime.datetime.now())
+        self.assertFalse(DuplicateCluster.objects.exists())
+        self.assertFalse(DuplicateKey.objects.filter(customer_id=b.pk).exists())
+        self.assertTrue(DuplicateKey.objects.filter(customer=a).exists())
+
+    def test_command(self):
+        """
+        コマンドでワークスペースごとに重複候補を探し直せることを確認
+        """
+        self.create('株式会社山田商事', tel_number1='0312345678')
+        self.create('山田商事', tel_number1='0312345678')
+        out = StringIO()
+        call_command('refresh_duplicates', workspace_id=self.workspace.pk, stdout=out)
+        self.assertIn('2件', out.getvalue())
+        self.assertEqual(1, DuplicateCluster.objects.count())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class DuplicateClusterViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.password = fake.password()
+        self.owner = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.member = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='0',
+        )
+        for name in ('株式会社山田商事', '山田商事'):
+            CustomerInfo.objects.create(
+                customer_name=name,
+                workspace=self.workspace,
+                potential=1,
+                tel_number1='0312345678',
+                author=self.owner.email)
+        RefreshDuplicates(self.workspace)
+        self.cluster = DuplicateCluster.objects.get()
+        self.client = Client()
+
+    def test_list_and_update(self):
+        """
+        重複候補を確認し、重複ではないと判断すると未確認の一覧から外れることを確認
+        """
+        self.client.login(email=self.owner.email, password=self.password)
+        response = self.client.get(reverse('duplicate_cluster_list'))
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, '株式会社山田商事')
+
+        response = self.client.post(
+            reverse('duplicate_cluster_update', kwargs={'pk': self.cluster.pk}), {'status': '2'})
+        self.assertEqual(302, response.status_code)
+        self.cluster.refresh_from_db()
+        self.assertEqual(2, self.cluster.status)
+        response = self.client.get(reverse('duplicate_cluster_list'))
+        self.assertNotContains(response, '株式会社山田商事')
+        response = self.client.get(reverse('duplicate_cluster_list'), {'status': '2'})
+        self.assertContains(response, '株式会社山田商事')
+
+    def test_owner_only(self):
+        """
+        オーナー以外は重複候補を表示・変更できないことを確認
+        """
+        self.client.login(email=self.member.email, password=self.password)
+        response = self.client.get(reverse('duplicate_cluster_list'))
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        self.client.post(
+            reverse('duplicate_cluster_update', kwargs={'pk': self.cluster.pk}), {'status': '1'})
+        self.cluster.refresh_from_db()
+        self.assertEqual(0, self.cluster.status)
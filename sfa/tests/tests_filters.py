@@ -1,5 +1,6 @@
 from django.test import TestCase
 from sfa.filters import CustomerInfoFilter
+from sfa.models import CustomerInfo
 
 class CustomerInfoFilterTests(TestCase):
     def test_fields_exist(self):
@@ -61,3 +62,15 @@ class CustomerInfoFilterTests(TestCase):
 
         for index in range(len(expect)):
             self.assertEqual(expect[index], result[index])
+
+    def test_address2_variants(self):
+        """
+        市区町村番地は、表記の違う住所でも検索できることを確認
+        """
+        customer = CustomerInfo.objects.create(
+            customer_name='テスト', potential=1, address1='東京都', address2='千代田区丸の内1-1-1')
+        for value in ('丸の内1-1-1', '丸の内一丁目1番', '丸の内１－１', '千代田区丸の内'):
+            result = CustomerInfoFilter({'address2': value}, queryset=CustomerInfo.objects.all()).qs
+            self.assertEqual([customer], list(result))
+        result = CustomerInfoFilter({'address2': '大手町'}, queryset=CustomerInfo.objects.all()).qs
+        self.assertEqual([], list(result))
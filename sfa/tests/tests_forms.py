@@ -79,7 +79,7 @@ class CustomerInfoFormModelTests(TestCase):
         self.assertFalse(form.cleaned_data['mail_limit_flg'])
         self.assertFalse(form.cleaned_data['attention_flg'])
         self.assertEquals(form.cleaned_data['remarks'], params['remarks'])
-        self.assertEquals(form.cleaned_data['public_status'], '0')
+        self.assertEquals(form.cleaned_data['public_status'], 0)
         self.assertEquals(form.cleaned_data['author'], params['author'])
         self.assertEquals(form.cleaned_data['modifier'], params['modifier'])
  
@@ -156,7 +156,7 @@ class CustomerInfoFormModelTests(TestCase):
         self.assertFalse(form.cleaned_data['mail_limit_flg'])
         self.assertFalse(form.cleaned_data['attention_flg'])
         self.assertEquals(form.cleaned_data['remarks'], params['remarks'])
-        self.assertEquals(form.cleaned_data['public_status'], '1')
+        self.assertEquals(form.cleaned_data['public_status'], 1)
         self.assertFalse(form.cleaned_data['delete_flg'])
         self.assertEquals(form.cleaned_data['author'], params['author'])
         self.assertEquals(form.cleaned_data['modifier'], params['modifier'])
@@ -236,7 +236,7 @@ class CustomerInfoFormModelTests(TestCase):
         self.assertFalse(form.cleaned_data['mail_limit_flg'])
         self.assertFalse(form.cleaned_data['attention_flg'])
         self.assertEquals(form.cleaned_data['remarks'], '')
-        self.assertEquals(form.cleaned_data['public_status'], '2')
+        self.assertEquals(form.cleaned_data['public_status'], 2)
         self.assertFalse(form.cleaned_data['delete_flg'])
         self.assertEquals(form.cleaned_data['author'], '')
         self.assertEquals(form.cleaned_data['modifier'], '')
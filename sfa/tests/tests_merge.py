@@ -0,0 +1,199 @@
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+from register.models import User, Workspace, MyGroup
+from sfa.dedup import RefreshDuplicates
+from sfa.merge import MergeCustomers, ChooseSurvivors
+from sfa.models import CustomerInfo, CustomerInfoSupplement, ContactInfo, ActionStatusTransition, DuplicateCluster
+
+
+class MergeCustomersTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.other_user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        self.group = MyGroup.objects.create(group_name=fake.word(), workspace=self.workspace)
+
+    def create(self, customer_name, potential=1, **kwargs):
+        return CustomerInfo.objects.create(
+            customer_name=customer_name, workspace=self.workspace, potential=potential, **kwargs)
+
+    def test_merge(self):
+        """
+        項目がルールに従ってまとまり、コンタクト情報・変更履歴・共有先が残す顧客情報に付け替わることを確認
+        """
+        survivor = self.create('株式会社山田商事', tel_number1='0312345678', potential=3)
+        victim = self.create(
+            '山田商事', tel_number1='0312345678', tel_number2='0311112222', potential=5,
+            address1='東京都', address2='千代田区丸の内1-1', action_status=2, attention_flg=True,
+            corporate_number='1234567890123')
+        CustomerInfoSupplement.objects.create(customer=survivor, remarks='本社')
+        CustomerInfoSupplement.objects.create(
+            customer=victim, remarks='支店', url1='https://example.com/')
+        ContactInfo.objects.create(target_customer=victim, operator=self.user, contact_type=3)
+        ActionStatusTransition.objects.create(
+            workspace=self.workspace, customer=victim, to_status=2, changed_by=self.user)
+        survivor.shared_view_user.add(self.other_user)
+        victim.shared_view_user.add(self.other_user)
+        victim.shared_edit_group.add(self.group)
+
+        self.assertEqual(1, MergeCustomers(self.workspace, [(survivor.pk, [victim.pk])],
+                                           self.user))
+        survivor.refresh_from_db()
+        victim.refresh_from_db()
+        self.assertTrue(victim.delete_flg)
+        self.assertEqual('0311112222', survivor.tel_number2)
+        self.assertEqual('千代田区丸の内1-1', survivor.address2)
+        self.assertEqual('1234567890123', survivor.corporate_number)
+        self.assertEqual(5, survivor.potential)
+        self.assertEqual(2, survivor.action_status)
+        self.assertTrue(survivor.attention_flg)
+        self.assertTrue(survivor.mail_sent_flg)
+        self.assertEqual(self.user.email, survivor.modifier)
+        self.assertEqual('本社\n支店', survivor.supplement.remarks)
+        self.assertEqual('https://example.com/', survivor.supplement.url1)
+        self.assertEqual(1, ContactInfo.objects.filter(target_customer=survivor).count())
+        self.assertEqual({(None, 2), (0, 2)},
+                         set(ActionStatusTransition.objects.filter(customer=survivor).values_list(
+                             'from_status', 'to_status')))
+        self.assertEqual([self.other_user], list(survivor.shared_view_user.all()))
+        self.assertEqual([self.group], list(survivor.shared_edit_group.all()))
+        self.assertFalse(victim.shared_view_user.exists())
+        self.assertEqual(0, survivor.tel_number1_duplicate_count)
+
+    def test_duplicate_count_visibility(self):
+        """
+        統合後の電話番号の重複件数は、統合したユーザーが閲覧可能な顧客情報だけで数え、
+        同じ番号を持つ他の顧客情報の件数は変えないことを確認
+        """
+        survivor = self.create('株式会社山田商事', tel_number1='0312345678', author=self.user.email)
+        victim = self.create('山田商事', tel_number1='0312345678', author=self.user.email)
+        public = self.create('山田商事 大阪支店', tel_number1='0312345678', public_status=1,
+                             tel_number1_duplicate_count=9)
+        private = self.create('山田商事 名古屋支店', tel_number2='0312345678',
+                              author=self.other_user.email, tel_number2_duplicate_count=9)
+        self.assertEqual(1, MergeCustomers(self.workspace, [(survivor.pk, [victim.pk])],
+                                           self.user))
+        for customer in (survivor, public, private):
+            customer.refresh_from_db()
+        self.assertEqual(1, survivor.tel_number1_duplicate_count)
+        self.assertEqual(9, public.tel_number1_duplicate_count)
+        self.assertEqual(9, private.tel_number2_duplicate_count)
+
+    def test_many_victims(self):
+        """
+        SQLiteのIN句のパラメータ数の上限（999）を超える顧客情報を1つに統合できることを確認
+        """
+        survivor = self.create('株式会社山田商事', tel_number1='0312345678')
+        CustomerInfo.objects.bulk_create([
+            CustomerInfo(customer_name='山田商事', workspace=self.workspace, potential=1,
+                         tel_number1='0312345678') for _ in range(1000)
+        ])
+        victims = list(CustomerInfo.objects.exclude(pk=survivor.pk).values_list('pk', flat=True))
+        param_counts = []
+
+        def RecordParams(execute, sql, params, many, context):
+            if not many:
+                param_counts.append(len(params or ()))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(RecordParams):
+            self.assertEqual(
+                1000, MergeCustomers(self.workspace, [(survivor.pk, victims)], self.user))
+        self.assertEqual(1, CustomerInfo.objects.filter(delete_flg=False).count())
+        self.assertLessEqual(max(param_counts), connection.features.max_query_params or 10000)
+
+    def test_batch(self):
+        """
+        多数の重複候補を、重複候補の数によらない回数のクエリでまとめて統合できることを確認
+        """
+        def CreateClusters(count, prefix):
+            for i in range(count):
+                for name in ('株式会社{}{}', '{}{}'):
+                    customer = self.create(
+                        name.format(prefix, i), tel_number1='03{:08d}'.format(i))
+                    ContactInfo.objects.create(target_customer=customer, operator=self.user)
+                    customer.shared_view_user.add(self.other_user)
+            RefreshDuplicates(self.workspace)
+            DuplicateCluster.objects.update(status=1)
+            return ChooseSurvivors(list(DuplicateCluster.objects.all()))
+
+        groups = CreateClusters(3, '山田商事')
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(3, MergeCustomers(self.workspace, groups, self.user))
+        groups = CreateClusters(40, '鈴木工業')
+        self.assertEqual(40, len(groups))
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(40, MergeCustomers(self.workspace, groups, self.user))
+        self.assertFalse(DuplicateCluster.objects.exists())
+        self.assertEqual(43, CustomerInfo.objects.filter(delete_flg=False).count())
+        self.assertEqual(
+            86, ContactInfo.objects.filter(target_customer__delete_flg=False).count())
+        # 残す顧客情報ごとの項目のUPDATE以外は、重複候補の数によらない
+        self.assertLessEqual(len(large.captured_queries), len(small.captured_queries) + 37 + 5)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class DuplicateClusterMergeViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.password = fake.password()
+        self.owner = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.customers = [
+            CustomerInfo.objects.create(
+                customer_name=name,
+                workspace=self.workspace,
+                potential=1,
+                tel_number1='0312345678',
+                author=self.owner.email) for name in ('株式会社山田商事', '山田商事')
+        ]
+        RefreshDuplicates(self.workspace)
+        self.cluster = DuplicateCluster.objects.get()
+        self.cluster.status = 1
+        self.cluster.save()
+        self.client = Client()
+        self.client.login(email=self.owner.email, password=self.password)
+
+    def test_merge_selected_survivor(self):
+        """
+        画面で選択した顧客情報を残して統合できることを確認
+        """
+        response = self.client.get(reverse('duplicate_cluster_list'), {'status': '1'})
+        self.assertContains(response, 'name="survivor" value="{}"'.format(self.customers[0].pk))
+        response = self.client.post(
+            reverse('duplicate_cluster_merge', kwargs={'pk': self.cluster.pk}),
+            {'survivor': self.customers[1].pk})
+        self.assertEqual(302, response.status_code)
+        self.assertEqual([self.customers[1].pk],
+                         list(CustomerInfo.objects.filter(delete_flg=False).values_list(
+                             'pk', flat=True)))
+
+    def test_merge_all_only_confirmed(self):
+        """
+        すべて統合しても、重複と確認していない重複候補は統合しないことを確認
+        """
+        self.cluster.status = 0
+        self.cluster.save()
+        self.client.post(reverse('duplicate_cluster_merge_all'))
+        self.assertEqual(2, CustomerInfo.objects.filter(delete_flg=False).count())
@@ -0,0 +1,117 @@
+from django.db import DatabaseError
+from django.test import TestCase, Client, override_settings
+from faker import Faker
+from register.models import User, Workspace
+from sfa.metrics import ObserveRequest, FlushMetrics, RenderPrometheus
+from sfa.models import RequestMetric
+from unittest import mock
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.owner = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.member = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        # 他のテストで貯まった計測値を捨てる
+        FlushMetrics()
+        RequestMetric.objects.all().delete()
+
+    def test_histogram(self):
+        """
+        計測値が累積ヒストグラムとして集計され、Prometheus形式で出力されることを確認
+        """
+        ObserveRequest('customer_list_user', {'request_seconds': 0.03, 'sql_queries': 12})
+        ObserveRequest('customer_list_user', {'request_seconds': 0.3, 'sql_queries': 12})
+        FlushMetrics()
+        # 別のワーカーからの加算
+        ObserveRequest('customer_list_user', {'request_seconds': 20})
+        FlushMetrics()
+        text = RenderPrometheus()
+        self.assertIn('sfa_request_seconds_bucket{url_name="customer_list_user",le="0.05"} 1', text)
+        self.assertIn('sfa_request_seconds_bucket{url_name="customer_list_user",le="0.5"} 2', text)
+        self.assertIn('sfa_request_seconds_bucket{url_name="customer_list_user",le="+Inf"} 3', text)
+        self.assertIn('sfa_request_seconds_count{url_name="customer_list_user"} 3', text)
+        self.assertIn('sfa_sql_queries_bucket{url_name="customer_list_user",le="20.0"} 2', text)
+        self.assertIn('sfa_request_seconds_sum{url_name="customer_list_user"} 20.33', text)
+
+    def test_flush_queries(self):
+        """
+        加算する区分の数によらず、一定の回数のクエリで書き込むことを確認
+        """
+        ObserveRequest('customer_list_user', {'request_seconds': 0.03, 'sql_queries': 12})
+        # 行の作成（ロック用のSELECTとINSERT）と、トランザクション（テストではセーブポイント）の開始・終了
+        with self.assertNumQueries(4):
+            FlushMetrics()
+        ObserveRequest('customer_list_user', {'request_seconds': 0.3, 'sql_queries': 3})
+        ObserveRequest('dashboard', {'request_seconds': 0.3})
+        # 既存の行への加算と新しい行の作成（SELECT、INSERT、UPDATE）
+        with self.assertNumQueries(5):
+            FlushMetrics()
+        self.assertEqual(2, RequestMetric.objects.get(
+            url_name='customer_list_user', metric='request_seconds', bucket='+Inf').value)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_flush_error(self):
+        """
+        書き込みに失敗してもリクエストの処理はエラーにならず、計測値は次回に加算されることを確認
+        """
+        with mock.patch('sfa.metrics._WritePending', side_effect=DatabaseError):
+            with self.assertLogs('sfa.metrics', level='ERROR'):
+                ObserveRequest('customer_list_user', {'request_seconds': 0.03})
+        self.assertFalse(RequestMetric.objects.exists())
+        FlushMetrics()
+        self.assertEqual(1, RequestMetric.objects.get(
+            url_name='customer_list_user', metric='request_seconds', bucket='+Inf').value)
+
+    @override_settings(
+        METRICS_FLUSH_INTERVAL=0,
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_middleware(self):
+        """
+        画面を表示するとURL名ごとに処理時間・SQL・テンプレートの描画時間が記録されることを確認
+        """
+        client = Client()
+        client.force_login(self.member)
+        client.get('/dashboard/')
+        metrics = set(
+            RequestMetric.objects.filter(url_name='dashboard').values_list('metric', flat=True))
+        self.assertEqual(
+            {'request_seconds', 'sql_queries', 'sql_seconds', 'template_seconds', 'http_seconds'},
+            metrics)
+
+    def test_metrics_view_permission(self):
+        """
+        計測値は管理者、トークンを指定した収集、同一ホストからのアクセスのみ参照でき、
+        ワークスペースのオーナーは参照できないことを確認
+        """
+        client = Client(REMOTE_ADDR='192.0.2.1')
+        client.force_login(self.member)
+        self.assertEqual(302, client.get('/metrics/').status_code)
+        client.force_login(self.owner)
+        self.assertEqual(302, client.get('/metrics/').status_code)
+        self.owner.is_superuser = True
+        self.owner.save()
+        response = client.get('/metrics/')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('# TYPE sfa_request_seconds histogram', response.content.decode())
+        self.assertEqual(200, Client().get('/metrics/').status_code)
+
+        scraper = Client(REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(302, scraper.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(
+                200, scraper.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code)
+            self.assertEqual(
+                302, scraper.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code)
@@ -0,0 +1,200 @@
+from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from faker import Faker
+from io import StringIO
+from register.models import User, Workspace
+from sfa.models import CustomerInfo, PostalCode
+from sfa.postal import ParseKenAll, LoadPostalCodes, LookupPostalCodes, GetZipCentroids, EnrichWithPostalCodes
+import json
+import os
+import tempfile
+
+
+def KenAllRow(zip_code, prefecture, city, town):
+    """
+    KEN_ALL.CSVの1行（15列）を作る
+    """
+    return ['13101', zip_code[:5], zip_code, '', '', '', prefecture, city, town,
+            '0', '0', '0', '0', '0', '0']
+
+
+KEN_ALL_ROWS = [
+    KenAllRow('1000000', '東京都', '千代田区', '以下に掲載がない場合'),
+    KenAllRow('1000005', '東京都', '千代田区', '丸の内（次のビルを除く）'),
+    KenAllRow('0600042', '北海道', '札幌市中央区', '大通西（１〜１９丁目）'),
+    # 町域名が長く2行に分かれている
+    KenAllRow('0580343', '北海道', '様似郡様似町', '冬島（ルイカ、１６９番地、'),
+    KenAllRow('0580343', '北海道', '様似郡様似町', '２６５番地）'),
+    # 1つの郵便番号に複数の町域がある
+    KenAllRow('4520961', '愛知県', '清須市', '春日夢の森'),
+    KenAllRow('4520961', '愛知県', '清須市', '春日振形'),
+]
+
+
+class PostalCodeTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        LoadPostalCodes(KEN_ALL_ROWS, {'1000005': (Decimal('35.6812362'), Decimal('139.7671248'))})
+
+    def create(self, zip_code, **kwargs):
+        return CustomerInfo.objects.create(
+            customer_name='テスト', potential=1, workspace=self.workspace, zip_code=zip_code,
+            **kwargs)
+
+    def test_parse_ken_all(self):
+        """
+        複数行の町域名がまとまり、補足や住所として入力しない記載が取り除かれることを確認
+        """
+        self.assertEqual([
+            ('1000000', '東京都', '千代田区', ''),
+            ('1000005', '東京都', '千代田区', '丸の内'),
+            ('0600042', '北海道', '札幌市中央区', '大通西'),
+            ('0580343', '北海道', '様似郡様似町', '冬島'),
+            ('4520961', '愛知県', '清須市', '春日夢の森'),
+            ('4520961', '愛知県', '清須市', '春日振形'),
+        ], list(ParseKenAll(KEN_ALL_ROWS)))
+
+    def test_lookup(self):
+        """
+        郵便番号から住所を取得でき、町域が複数ある場合は市区町村までになることを確認
+        """
+        self.assertEqual({
+            '1000005': ('東京都', '千代田区丸の内'),
+            '4520961': ('愛知県', '清須市'),
+        }, LookupPostalCodes(['100-0005', '４５２−０９６１', '9999999', '']))
+
+    def test_centroids(self):
+        """
+        索引の代表地点がない郵便番号は、同じ郵便番号の顧客情報の緯度経度の平均で代用することを確認
+        """
+        self.create('0600042', latitude=Decimal('43.0'), longitude=Decimal('141.0'))
+        self.create('0600042', latitude=Decimal('43.2'), longitude=Decimal('141.2'))
+        # 概算の緯度経度は平均に含めない
+        self.create('0600042', latitude=Decimal('50.0'), longitude=Decimal('150.0'),
+                    approximate_location=True)
+        centroids = GetZipCentroids(self.workspace, ['1000005', '0600042', '4520961'])
+        self.assertEqual({
+            '1000005': (Decimal('35.6812362'), Decimal('139.7671248')),
+            '0600042': (Decimal('43.1000000'), Decimal('141.1000000')),
+        }, centroids)
+
+    def test_enrich(self):
+        """
+        空の住所と未取得の緯度経度が補われ、入力済みの住所は変わらないことを確認
+        """
+        empty = self.create('1000005')
+        addressed = self.create('1000005', address1='東京都', address2='千代田区丸の内1-1-1')
+        unknown = self.create('9999999')
+        self.assertEqual((1, 2), EnrichWithPostalCodes(
+            self.workspace, [empty.pk, addressed.pk, unknown.pk]))
+        empty.refresh_from_db()
+        addressed.refresh_from_db()
+        self.assertEqual(('東京都', '千代田区丸の内'), (empty.address1, empty.address2))
+        self.assertEqual('東京都千代田区丸の内', empty.normalized_address)
+        self.assertEqual(Decimal('35.6812362'), empty.latitude)
+        self.assertTrue(empty.approximate_location)
+        self.assertEqual('千代田区丸の内1-1-1', addressed.address2)
+        self.assertTrue(addressed.approximate_location)
+        self.assertFalse(CustomerInfo.objects.get(pk=unknown.pk).approximate_location)
+
+    def test_load_command(self):
+        """
+        KEN_ALL.CSV（MS932）と代表地点のCSVから索引を作り直せることを確認
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            ken_all = os.path.join(directory, 'KEN_ALL.CSV')
+            with open(ken_all, 'w', encoding='MS932', newline='') as f:
+                f.write('\r\n'.join(','.join('"{}"'.format(c) for c in row)
+                                    for row in KEN_ALL_ROWS[:3]))
+            centroids = os.path.join(directory, 'centroids.csv')
+            with open(centroids, 'w', encoding='utf-8') as f:
+                f.write('zip_code,latitude,longitude\n0600042,43.0605,141.3543\n')
+            out = StringIO()
+            call_command('load_postal_codes', ken_all, centroids=centroids, stdout=out)
+        self.assertIn('3件', out.getvalue())
+        self.assertEqual(3, PostalCode.objects.count())
+        self.assertEqual(Decimal('43.0605000'),
+                         PostalCode.objects.get(zip_code='0600042').latitude)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PostalCodeViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.password = fake.password()
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        LoadPostalCodes(KEN_ALL_ROWS, {'1000005': (Decimal('35.6812362'), Decimal('139.7671248'))})
+        self.client = Client()
+        self.client.login(email=self.user.email, password=self.password)
+
+    def test_get_postal_code(self):
+        """
+        入力画面の自動入力用に、郵便番号から住所を返すことを確認
+        """
+        response = self.client.get(reverse('get_postal_code'), {'zip_code': '100-0005'})
+        self.assertEqual({'address1': '東京都', 'address2': '千代田区丸の内'},
+                         json.loads(response.content.decode())['results'])
+        response = self.client.get(reverse('get_postal_code'), {'zip_code': '100'})
+        self.assertEqual({}, json.loads(response.content.decode())['results'])
+
+    def test_autofill_fallback(self):
+        """
+        郵便番号の索引がある場合は索引で、ない場合はyubinbangoで住所を自動入力することを確認
+        """
+        response = self.client.get(reverse('create'))
+        self.assertContains(response, reverse('get_postal_code'))
+        self.assertNotContains(response, 'yubinbango.js')
+        PostalCode.objects.all().delete()
+        response = self.client.get(reverse('create'))
+        self.assertContains(response, 'yubinbango.js')
+        self.assertContains(response, 'class="h-adr"')
+        self.assertContains(response, 'p-postal-code')
+        self.assertNotContains(response, reverse('get_postal_code'))
+
+    def test_create_without_api_key(self):
+        """
+        APIキーがない場合は、郵便番号の代表地点を概算の緯度経度として設定することを確認
+        """
+        response = self.client.post(reverse('create'), {
+            'customer_name': 'テスト',
+            'potential': 1,
+            'workspace': self.workspace.pk,
+            'action_status': '0',
+            'public_status': '0',
+            'zip_code': '1000005',
+            'address1': '東京都',
+            'address2': '千代田区丸の内1-1-1',
+        })
+        self.assertEqual(302, response.status_code)
+        customer = CustomerInfo.objects.get()
+        self.assertEqual(Decimal('35.6812362'), customer.latitude)
+        self.assertTrue(customer.approximate_location)
+
+    def test_import(self):
+        """
+        CSVインポートで、空の住所と緯度経度が郵便番号から補われることを確認
+        """
+        row = [''] * 31
+        row[4] = 'テスト'
+        row[13] = '100-0005'
+        content = '\r\n'.join([','.join(['列{}'.format(i) for i in range(31)]), ','.join(row)])
+        response = self.client.post(reverse('customer_info_import'), {
+            'potential': '1',
+            'public_status': '0',
+            'file': SimpleUploadedFile('customer.csv', content.encode('cp932')),
+        })
+        self.assertEqual(302, response.status_code)
+        customer = CustomerInfo.objects.get()
+        self.assertEqual(('1000005', '東京都', '千代田区丸の内'),
+                         (customer.zip_code, customer.address1, customer.address2))
+        self.assertTrue(customer.approximate_location)
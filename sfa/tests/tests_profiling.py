@@ -0,0 +1,79 @@
+from django.test import TestCase, Client, override_settings
+from faker import Faker
+from register.models import User, Workspace
+from sfa.models import RequestProfile
+from sfa.profiling import CreateProfileToken
+import marshal
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProfilingTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.owner = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.member = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        self.client = Client()
+
+    def test_profile_by_owner(self):
+        """
+        オーナーが指示した場合のみプロファイルが保存されることを確認
+        """
+        self.client.force_login(self.member)
+        self.client.get('/customer_list_user/?_profile=1')
+        self.assertEqual(0, RequestProfile.objects.count())
+
+        self.client.force_login(self.owner)
+        self.client.get('/customer_list_user/')
+        self.assertEqual(0, RequestProfile.objects.count())
+        response = self.client.get('/customer_list_user/?_profile=1')
+        profile = RequestProfile.objects.get()
+        self.assertEqual(str(profile.pk), response['X-Profile-Id'])
+        self.assertEqual('customer_list_user', profile.url_name)
+        self.assertEqual(self.workspace, profile.workspace)
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn('SELECT', profile.report)
+        self.assertIn('-- plan:', profile.report)
+        self.assertTrue(marshal.loads(bytes(profile.profile_data)))
+
+    def test_profile_by_header(self):
+        """
+        署名付きトークンのヘッダで指示できること、他人のトークンは使えないことを確認
+        """
+        self.client.force_login(self.owner)
+        self.client.get('/dashboard/', HTTP_X_SFA_PROFILE='invalid')
+        self.assertEqual(0, RequestProfile.objects.count())
+        self.client.get('/dashboard/', HTTP_X_SFA_PROFILE=CreateProfileToken(self.member))
+        self.assertEqual(0, RequestProfile.objects.count())
+        self.client.get('/dashboard/', HTTP_X_SFA_PROFILE=CreateProfileToken(self.owner))
+        self.assertEqual(1, RequestProfile.objects.count())
+
+    @override_settings(PROFILE_KEEP=2)
+    def test_download_and_keep(self):
+        """
+        保存件数の上限を超えた古いプロファイルが削除され、レポートをダウンロードできることを確認
+        """
+        self.client.force_login(self.owner)
+        for _ in range(3):
+            self.client.get('/dashboard/?_profile=1')
+        self.assertEqual(2, RequestProfile.objects.count())
+        profile = RequestProfile.objects.order_by('-pk').first()
+        response = self.client.get('/request_profile_download/{}/txt/'.format(profile.pk))
+        self.assertEqual(200, response.status_code)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(profile.report, response.content.decode())
+        self.client.force_login(self.member)
+        response = self.client.get('/request_profile_download/{}/prof/'.format(profile.pk))
+        self.assertEqual(302, response.status_code)
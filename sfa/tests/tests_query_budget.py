@@ -0,0 +1,136 @@
+from django.test import TestCase, Client, override_settings
+from django.urls import resolve
+from faker import Faker
+from register.models import MyGroup, User, Workspace
+from sfa import urls
+from sfa.models import CustomerInfo, ContactInfo, AddressInfo
+from sfa.query_budget import GetQueryBudget, QueryBudgetExceeded
+from unittest.mock import patch
+from .helpers import QueryBudgetTestMixin
+import datetime
+
+
+@override_settings(
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=self.fake.company())
+        self.group = MyGroup.objects.create(group_name=self.fake.city())
+        self.workspace.my_group.add(self.group)
+        self.user = User.objects.create_user(
+            email=self.fake.email(),
+            password=self.fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.user.my_group.add(self.group)
+        self.other_user = User.objects.create_user(
+            email=self.fake.email(),
+            password=self.fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        self.customer = CustomerInfo.objects.create(
+            customer_name=self.fake.company(),
+            workspace=self.workspace,
+            sales_person=self.user,
+            potential=0,
+            author=self.other_user.email,
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def add_customers(self, count):
+        # 共有設定や編集可否の判定が一覧に含まれるよう、作成者や共有先を変えておく
+        for i in range(count):
+            customerinfo = CustomerInfo.objects.create(
+                customer_name=self.fake.company(),
+                workspace=self.workspace,
+                sales_person=self.user,
+                potential=0,
+                author=self.other_user.email if i % 2 else self.user.email,
+                public_status=i % 3,
+            )
+            customerinfo.shared_edit_group.add(self.group)
+            customerinfo.shared_view_user.add(self.other_user)
+
+    def add_contacts(self, count, contact_type=0):
+        for _ in range(count):
+            customerinfo = CustomerInfo.objects.create(
+                customer_name=self.fake.company(),
+                workspace=self.workspace,
+                sales_person=self.user,
+                potential=0,
+                author=self.other_user.email,
+            )
+            ContactInfo.objects.create(
+                target_customer=customerinfo,
+                operator=self.user,
+                contact_type=contact_type,
+                visit_date_plan=datetime.date.today(),
+                start_time_plan=datetime.time(9),
+            )
+
+    def add_customer_contacts(self, count):
+        for _ in range(count):
+            ContactInfo.objects.create(
+                target_customer=self.customer, operator=self.other_user, contact_type=2)
+
+    def add_addresses(self, count):
+        for _ in range(count):
+            AddressInfo.objects.create(
+                last_name=self.fake.last_name(),
+                customer_name=self.fake.company(),
+                workspace=self.workspace,
+                author=self.user,
+                modifier=self.user,
+            )
+
+    def test_customer_lists(self):
+        """
+        顧客情報一覧のクエリ数が表示件数に依存しないことを確認
+        """
+        self.assertQueryCountConstant(self.client, 'customer_list_user', self.add_customers)
+        for url_name in ('customer_list_group', 'customer_list_all',
+                         'customer_list_user_map', 'customer_list_group_map',
+                         'customer_list_all_map'):
+            self.assertWithinQueryBudget(self.client, url_name)
+
+    def test_visit_target_filter(self):
+        self.assertQueryCountConstant(self.client, 'visit_target_filter', self.add_contacts)
+
+    def test_call_history_filter(self):
+        self.assertQueryCountConstant(
+            self.client, 'call_history_filter', lambda count: self.add_contacts(count, 2))
+
+    def test_contactinfo_by_user_list(self):
+        self.assertQueryCountConstant(self.client, 'contactinfo_by_user_list', self.add_contacts)
+
+    def test_contactinfo_by_customer_list(self):
+        self.assertQueryCountConstant(
+            self.client, 'contactinfo_by_customer_list', self.add_customer_contacts,
+            args=(self.customer.pk, ))
+
+    def test_address_info_list(self):
+        self.assertQueryCountConstant(self.client, 'address_info_list', self.add_addresses)
+
+    def test_register_user_list(self):
+        self.assertWithinQueryBudget(self.client, 'register:user_list')
+
+    def test_get_query_budget(self):
+        """
+        register側のURL名は名前空間付きで上限を参照できることを確認
+        """
+        self.assertIsNotNone(GetQueryBudget(resolve('/register/user_list/')))
+        self.assertIsNone(GetQueryBudget(resolve('/create/')))
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_mode(self):
+        """
+        QUERY_BUDGET_STRICTが有効な場合、上限を超えると例外になることを確認
+        """
+        with patch.dict(urls.query_budgets, {'dashboard': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/dashboard/')
@@ -0,0 +1,125 @@
+from django.db import connection
+from django.test import TestCase
+from sfa.benchmarks.generator import GenerateWorkspace
+from sfa.benchmarks.plans import PLAN_EXPECTATIONS, GetPlanQuerysets, ExplainQueryset, SummarizePlan, CheckPlan
+import difflib
+import os
+import unittest
+
+# スナップショットはCIと同じバージョンのPostgreSQLで作成してコミットする
+# 環境変数PLAN_SNAPSHOT_DIRを指定した場合は、作成したスナップショットをそのディレクトリに書き出す
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), 'plan_snapshots')
+# 実行計画の比較に用いるデータ量。1ワークスペースの行が全体の一部になるよう、複数のワークスペースを作る
+WORKSPACES = 20
+CUSTOMERS_PER_WORKSPACE = 200
+CONTACTS_PER_WORKSPACE = 600
+
+
+class PlanSummaryTests(TestCase):
+    # PostgreSQLのEXPLAIN (FORMAT JSON)の出力の一部
+    PLAN = {
+        'Node Type': 'Limit',
+        'Plans': [{
+            'Node Type': 'Sort',
+            'Sort Key': ['sfa_customerinfo.created_timestamp DESC'],
+            'Plan Rows': 5000,
+            'Plans': [{
+                'Node Type': 'Append',
+                'Plan Rows': 5000,
+                'Plans': [
+                    {'Node Type': 'Seq Scan', 'Relation Name': 'sfa_contactinfo_p201810', 'Plan Rows': 2000},
+                    {'Node Type': 'Seq Scan', 'Relation Name': 'sfa_contactinfo_p201811', 'Plan Rows': 1000},
+                    {'Node Type': 'Seq Scan', 'Relation Name': 'sfa_customerinfo', 'Plan Rows': 2000},
+                ],
+            }],
+        }],
+    }
+
+    def test_summarize_plan(self):
+        """
+        見積もり値を除き、月次パーティションの走査をまとめたテキストになることを確認
+        """
+        self.assertEqual(
+            'Limit\n'
+            '  Sort [sfa_customerinfo.created_timestamp DESC]\n'
+            '    Append\n'
+            '      Seq Scan on sfa_contactinfo_p*\n'
+            '      Seq Scan on sfa_customerinfo\n', SummarizePlan(self.PLAN))
+
+    def test_check_plan(self):
+        violations = CheckPlan(self.PLAN, no_seq_scan=('sfa_customerinfo', ), max_sort_rows=1000)
+        self.assertEqual(2, len(violations))
+        # 月次パーティションの走査は元のテーブルの走査とみなす
+        self.assertEqual(2, len(CheckPlan(self.PLAN, no_seq_scan=('sfa_contactinfo', ))))
+        self.assertEqual([], CheckPlan(self.PLAN))
+
+    def test_plan_querysets(self):
+        """
+        確認対象のクエリセットがすべて作成でき、評価できることを確認
+        """
+        dataset = GenerateWorkspace(users=3, groups=2, customers=10, contacts=10, addresses=0)
+        querysets = GetPlanQuerysets(dataset['users'][1], dataset['phone_numbers'][0])
+        self.assertEqual(set(PLAN_EXPECTATIONS), set(querysets))
+        for name, queryset in querysets.items():
+            if name.endswith('_count'):
+                queryset.count()
+            else:
+                list(queryset)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', '実行計画の確認はPostgreSQLでのみ行う')
+class QueryPlanTests(TestCase):
+    """
+    一覧・件数・重複チェックのクエリの実行計画を確認し、コミットされたスナップショットと比較する。
+    スナップショットがないクエリは比較を省略する。環境変数UPDATE_PLAN_SNAPSHOTSを指定した場合は、比較せずに作成する。
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        datasets = [
+            GenerateWorkspace(
+                seed=seed,
+                users=5,
+                groups=2,
+                customers=CUSTOMERS_PER_WORKSPACE,
+                contacts=CONTACTS_PER_WORKSPACE,
+                addresses=0) for seed in range(WORKSPACES)
+        ]
+        cls.user = datasets[0]['users'][1]
+        cls.phone_number = datasets[0]['phone_numbers'][0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_query_plans(self):
+        update = bool(os.environ.get('UPDATE_PLAN_SNAPSHOTS'))
+        output_dir = os.environ.get('PLAN_SNAPSHOT_DIR') or SNAPSHOT_DIR
+        for name, queryset in sorted(GetPlanQuerysets(self.user, self.phone_number).items()):
+            with self.subTest(name=name):
+                plan = ExplainQueryset(queryset, count=name.endswith('_count'))
+                expectation = PLAN_EXPECTATIONS[name]
+                violations = CheckPlan(
+                    plan,
+                    no_seq_scan=expectation.get('no_seq_scan', ()),
+                    max_sort_rows=CUSTOMERS_PER_WORKSPACE if expectation.get('limit_sort') else None)
+                summary = SummarizePlan(plan)
+                # 確認したい計画に問題がある場合もスナップショットを残せるよう、判定の前に書き出す
+                if update:
+                    os.makedirs(output_dir, exist_ok=True)
+                    with open(os.path.join(output_dir, name + '.txt'), 'w', encoding='utf-8') as f:
+                        f.write(summary)
+                self.assertEqual([], violations, '{}の実行計画:\n{}'.format(name, summary))
+                if update:
+                    continue
+
+                path = os.path.join(SNAPSHOT_DIR, name + '.txt')
+                if not os.path.exists(path):
+                    self.skipTest('{}のスナップショットがありません。UPDATE_PLAN_SNAPSHOTS=1を指定して作成し、'
+                                  '内容を確認してコミットしてください'.format(name))
+                with open(path, encoding='utf-8') as f:
+                    snapshot = f.read()
+                self.assertEqual(
+                    snapshot, summary, '{}の実行計画がスナップショットと異なります:\n{}'.format(
+                        name, ''.join(
+                            difflib.unified_diff(
+                                snapshot.splitlines(True), summary.splitlines(True),
+                                'snapshot', 'current'))))
@@ -0,0 +1,120 @@
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+from register.models import User, Workspace
+from sfa.models import CustomerInfo, ContactInfo
+from sfa.route import HaversineMatrix, PlanRoute
+import datetime
+import numpy as np
+import time
+
+
+class PlanRouteTests(TestCase):
+    def test_haversine(self):
+        """
+        東京駅と大阪駅の距離がおよそ400kmになることを確認
+        """
+        distances = HaversineMatrix([35.681236, 34.702485], [139.767125, 135.495951])
+        self.assertAlmostEqual(403, distances[0, 1], delta=5)
+        self.assertEqual(0, distances[0, 0])
+
+    def test_plan_route(self):
+        """
+        一直線上の訪問先が端から順に並び、時間帯の指定が守られることを確認
+        """
+        longitudes = [139.70, 139.74, 139.71, 139.73, 139.72]
+        distances = HaversineMatrix([35.68] * 5, longitudes)
+        order, starts, distance, lateness = PlanRoute(
+            distances, [-np.inf] * 5, [np.inf] * 5, stay=30, speed_kmh=30, day_start=540)
+        self.assertIn([longitudes[i] for i in order], (sorted(longitudes),
+                                                        sorted(longitudes, reverse=True)))
+        self.assertAlmostEqual(distances[0, 1], distance)
+        self.assertEqual(540, starts[0])
+
+        # 東端の訪問先を13時から14時の間に訪問する
+        earliest = [-np.inf, 780, -np.inf, -np.inf, -np.inf]
+        latest = [np.inf, 840, np.inf, np.inf, np.inf]
+        order, starts, distance, lateness = PlanRoute(
+            distances, earliest, latest, stay=30, speed_kmh=30, day_start=540)
+        self.assertEqual(0, lateness)
+        self.assertTrue(780 <= starts[order.index(1)] <= 840)
+
+    def test_plan_route_speed(self):
+        """
+        30件の訪問先の順番を50ミリ秒以内に求められることを確認
+        """
+        rand = np.random.RandomState(0)
+        distances = HaversineMatrix(35.6 + rand.rand(30) * 0.2, 139.6 + rand.rand(30) * 0.2)
+        earliest = np.full(30, -np.inf)
+        latest = np.full(30, np.inf)
+        earliest[:5] = [600, 660, 780, 840, 900]
+        latest[:5] = earliest[:5] + 60
+        PlanRoute(distances, earliest, latest)
+        started = time.perf_counter()
+        order, starts, distance, lateness = PlanRoute(distances, earliest, latest)
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(list(range(30)), sorted(order))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class VisitRouteViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.password = fake.password()
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='0',
+        )
+        self.visit_date = datetime.date(2018, 10, 1)
+        self.contacts = []
+        for i, longitude in enumerate(['139.7000', '139.7400', '139.7100', '139.7300']):
+            customer = CustomerInfo.objects.create(
+                customer_name=fake.company(),
+                workspace=self.workspace,
+                sales_person=self.user,
+                potential=0,
+                latitude=Decimal('35.6800'),
+                longitude=Decimal(longitude),
+                author=self.user.email,
+            )
+            self.contacts.append(ContactInfo.objects.create(
+                target_customer=customer,
+                operator=self.user,
+                contact_type=0,
+                visit_date_plan=self.visit_date,
+                start_time_plan=datetime.time(9 + i, 0),
+            ))
+        self.client = Client()
+        self.client.login(email=self.user.email, password=self.password)
+
+    def test_suggest_and_apply(self):
+        """
+        提案画面を表示し、提案した訪問開始時刻が1回のUPDATEで反映されることを確認
+        """
+        url = reverse('visit_route')
+        response = self.client.get(url, {'visit_date': self.visit_date.isoformat()})
+        self.assertEqual(200, response.status_code)
+        route = response.context['route']
+        self.assertLess(route['distance'], route['current_distance'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'visit_date': self.visit_date.isoformat()})
+        self.assertRedirects(response, reverse('visit_target_filter'), fetch_redirect_response=False)
+        updates = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "sfa_contactinfo"')
+        ]
+        self.assertEqual(1, len(updates))
+        start_times = {
+            contact.pk: contact.start_time_plan
+            for contact in ContactInfo.objects.filter(pk__in=[c.pk for c in self.contacts])
+        }
+        self.assertEqual([stop['start_time'] for stop in route['stops']],
+                         [start_times[stop['contactinfo'].pk] for stop in route['stops']])
@@ -0,0 +1,106 @@
+from django.test import TestCase, Client, override_settings
+from faker import Faker
+from register.models import User, Workspace
+from sfa.models import CustomerInfo
+from sfa.slow_query import FingerprintSql, NormalizeSql, ListSlowQueryLogs, ReadSlowQueries, SummarizeSlowQueries, WriteSlowQueries
+import json
+import os
+import tempfile
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.owner = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            workspace=self.workspace,
+            sales_person=self.owner,
+            potential=0,
+            author=self.owner.email,
+        )
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tempdir.name, 'slow_query.log')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_fingerprint(self):
+        """
+        値やIN句の個数が違うだけのSQLは同じfingerprintになることを確認
+        """
+        sql1 = "SELECT * FROM sfa_customerinfo WHERE id IN (%s, %s) AND customer_name = 'a'"
+        sql2 = "SELECT * FROM sfa_customerinfo WHERE id IN (%s, %s, %s) AND customer_name = 'b''c'"
+        self.assertEqual(FingerprintSql(sql1), FingerprintSql(sql2))
+        self.assertEqual(
+            'SELECT * FROM sfa_customerinfo WHERE id IN (?) AND customer_name = ?',
+            NormalizeSql(sql1))
+        self.assertNotEqual(
+            FingerprintSql(sql1), FingerprintSql('SELECT * FROM sfa_contactinfo WHERE id = 1'))
+
+    def test_rotation(self):
+        """
+        ローテーションしたファイルも含めて読み込み、ワークスペースで絞り込めることを確認
+        """
+        entry = {'fingerprint': 'abc', 'sql': 'SELECT ?', 'ms': 300, 'code': None, 'template': None}
+        process_path = os.path.join(self.tempdir.name, 'slow_query.{}.log'.format(os.getpid()))
+        with self.settings(SLOW_QUERY_LOG=self.log_path, SLOW_QUERY_LOG_MAX_BYTES=500,
+                           SLOW_QUERY_LOG_BACKUP_COUNT=5):
+            for _ in range(4):
+                WriteSlowQueries([entry], 'dashboard', self.workspace.pk)
+            WriteSlowQueries([entry], 'dashboard', None)
+            self.assertTrue(os.path.exists(process_path + '.1'))
+            self.assertEqual(4, len(ReadSlowQueries(self.workspace.pk)))
+            summary = SummarizeSlowQueries(ReadSlowQueries())
+        self.assertEqual(1, len(summary))
+        self.assertEqual(5, summary[0]['count'])
+        self.assertEqual(1500, summary[0]['total_ms'])
+
+    def test_bounded_storage(self):
+        """
+        終了したプロセスの古いファイルを削除し、読み込みは新しいものから上限の大きさまでになることを確認
+        """
+        entry = {'fingerprint': 'abc', 'sql': 'SELECT ?', 'ms': 300, 'code': None, 'template': None}
+        line = json.dumps(dict(entry, workspace_id=self.workspace.pk)) + '\n'
+        for i, pid in enumerate((1, 2, 3)):
+            path = os.path.join(self.tempdir.name, 'slow_query.{}.log'.format(pid))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(line * 10)
+            os.utime(path, (1000000000 + i, 1000000000 + i))
+        with self.settings(SLOW_QUERY_LOG=self.log_path, SLOW_QUERY_LOG_MAX_FILES=2):
+            WriteSlowQueries([entry], 'dashboard', self.workspace.pk)
+            filenames = [os.path.basename(filename) for filename in ListSlowQueryLogs()]
+            # 自分のプロセスのファイルと、新しいもの1つだけが残る
+            self.assertEqual(
+                ['slow_query.{}.log'.format(os.getpid()), 'slow_query.3.log'], filenames)
+            # 自分のファイルの1行と、slow_query.3.logの末尾の5行だけを読み込む
+            process_path = os.path.join(self.tempdir.name, filenames[0])
+            with self.settings(
+                    SLOW_QUERY_READ_MAX_BYTES=os.path.getsize(process_path) + len(line) * 5):
+                self.assertEqual(6, len(ReadSlowQueries(self.workspace.pk)))
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_middleware(self):
+        """
+        しきい値を超えたSQLが、画面・ワークスペース・発行元の行と一緒に記録されることを確認
+        """
+        client = Client()
+        client.force_login(self.owner)
+        with self.settings(SLOW_QUERY_LOG=self.log_path, SLOW_QUERY_THRESHOLD_MS=0):
+            client.get('/customer_list_user/')
+            entries = ReadSlowQueries(self.workspace.pk)
+            response = client.get('/slow_query_summary/')
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['url_name'] == 'customer_list_user' for entry in entries))
+        self.assertTrue(any((entry['code'] or '').startswith('sfa/views.py:') for entry in entries))
+        self.assertTrue(any((entry['template'] or '').startswith('sfa/') for entry in entries))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.context['slow_queries'])
@@ -0,0 +1,157 @@
+from decimal import Decimal
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from faker import Faker
+from register.models import User, Workspace
+from sfa.company import RefreshCompanyRollups
+from sfa.models import CompanyRollup, CustomerInfo
+from sfa.query_budget import GetQueryBudget
+from sfa.territory import BalancedKMeans
+import numpy as np
+
+
+class BalancedKMeansTests(TestCase):
+    def test_balanced(self):
+        """
+        地点が偏っていても、各エリアの重みの合計がおおよそ均等になることを確認
+        """
+        rand = np.random.RandomState(0)
+        points = np.concatenate([rand.randn(3000, 2) * 0.1, rand.rand(1000, 2) * 5])
+        weights = rand.randint(1, 100, len(points)).astype(float)
+        labels, centers = BalancedKMeans(points, weights, 4)
+        loads = np.bincount(labels, weights, minlength=4)
+        self.assertEqual((4, 2), centers.shape)
+        self.assertLess(loads.max() / loads.mean(), 1.05)
+        self.assertGreater(loads.min() / loads.mean(), 0.95)
+
+    def test_separated_clusters(self):
+        """
+        離れた同じ大きさの集まりは、それぞれ1つのエリアになることを確認
+        """
+        rand = np.random.RandomState(1)
+        points = np.concatenate(
+            [rand.randn(200, 2) * 0.01 + center for center in ((0, 0), (1, 0), (0, 1))])
+        labels, _ = BalancedKMeans(points, np.ones(len(points)), 3)
+        for i in range(3):
+            self.assertEqual(1, len(set(labels[i * 200:(i + 1) * 200])))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TerritoryBalanceViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.password = fake.password()
+        self.owner = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='2',
+        )
+        self.member = User.objects.create_user(
+            email=fake.email(),
+            password=self.password,
+            workspace=self.workspace,
+            is_workspace_active=True,
+            workspace_role='0',
+        )
+        # 東京と大阪に10件ずつ
+        for i in range(20):
+            CustomerInfo.objects.create(
+                customer_name=fake.company(),
+                workspace=self.workspace,
+                potential=10,
+                latitude=Decimal('35.68') if i < 10 else Decimal('34.70'),
+                longitude=Decimal('139.76') + Decimal(i) / 1000 if i < 10 else Decimal('135.49'),
+                author=self.owner.email,
+            )
+        CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            workspace=self.workspace,
+            potential=10,
+            author=self.owner.email,
+        )
+        self.client = Client()
+
+    def test_preview_and_apply(self):
+        """
+        分割結果を確認でき、反映すると位置のある顧客の営業担当者がエリアごとに設定されることを確認
+        """
+        self.client.login(email=self.owner.email, password=self.password)
+        url = reverse('territory_balance')
+        self.assertEqual(200, self.client.get(url).status_code)
+        data = {'sales_persons': [self.owner.pk, self.member.pk]}
+        response = self.client.post(url, dict(data, preview=''))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([10, 10], [t['count'] for t in response.context['territories']])
+        self.assertIsNone(CustomerInfo.objects.filter(latitude__isnull=False).first().sales_person)
+
+        response = self.client.post(url, dict(data, apply=''))
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        tokyo = set(
+            CustomerInfo.objects.filter(latitude=Decimal('35.68')).values_list(
+                'sales_person', flat=True))
+        osaka = set(
+            CustomerInfo.objects.filter(latitude=Decimal('34.70')).values_list(
+                'sales_person', flat=True))
+        self.assertEqual(1, len(tokyo))
+        self.assertEqual(1, len(osaka))
+        self.assertEqual({self.owner.pk, self.member.pk}, tokyo | osaka)
+        self.assertIsNone(CustomerInfo.objects.get(latitude__isnull=True).sales_person)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_apply_within_budget(self):
+        """
+        反映時のクエリ数が営業担当者の人数や顧客情報の件数（IN句の上限を超える件数）によらず一定で、上限を超えないことを確認
+        """
+        CustomerInfo.objects.filter(latitude=Decimal('35.68')).update(corporate_number='1010001000001')
+        RefreshCompanyRollups(self.workspace)
+        users = [self.owner, self.member] + [
+            User.objects.create_user(
+                email='territory{}@example.com'.format(i), password=self.password,
+                workspace=self.workspace, is_workspace_active=True) for i in range(2)
+        ]
+        self.client.login(email=self.owner.email, password=self.password)
+        url = reverse('territory_balance')
+
+        def apply(count):
+            response = self.client.post(
+                url, {'sales_persons': [user.pk for user in users[:count]], 'apply': ''})
+            self.assertRedirects(response, url, fetch_redirect_response=False)
+            request = response.wsgi_request
+            self.assertLessEqual(request.query_count, GetQueryBudget(request.resolver_match))
+            return request.query_count
+
+        query_counts = [apply(2), apply(4)]
+        rollup = CompanyRollup.objects.get(corporate_number='1010001000001')
+        self.assertEqual(10, rollup.customer_count)
+        self.assertEqual(
+            CustomerInfo.objects.filter(corporate_number='1010001000001').values(
+                'sales_person').distinct().count(), rollup.sales_person_count)
+
+        # SQLiteのIN句のパラメータ数の上限（999）より多い顧客情報
+        rand = np.random.RandomState(0)
+        customers = [
+            CustomerInfo(
+                customer_name='顧客{}'.format(i), workspace=self.workspace, potential=10,
+                latitude=Decimal('35.6') + Decimal(int(rand.randint(0, 1000))) / 10000,
+                longitude=Decimal('139.6') + Decimal(int(rand.randint(0, 1000))) / 10000,
+                author=self.owner.email) for i in range(1200)
+        ]
+        CustomerInfo.objects.bulk_create(customers)
+        query_counts.append(apply(4))
+        self.assertEqual(1, len(set(query_counts)))
+        self.assertFalse(CustomerInfo.objects.filter(
+            latitude__isnull=False, sales_person__isnull=True).exists())
+        sales_persons = set(CustomerInfo.objects.filter(
+            latitude__isnull=False).values_list('sales_person', flat=True))
+        self.assertEqual({user.pk for user in users}, sales_persons)
+
+    def test_owner_only(self):
+        """
+        オーナー以外は表示できないことを確認
+        """
+        self.client.login(email=self.member.email, password=self.password)
+        response = self.client.get(reverse('territory_balance'))
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
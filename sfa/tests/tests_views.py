@@ -2,9 +2,11 @@ from django.test import RequestFactory
 from django.test import TestCase
 from django.urls import resolve
 from faker import Faker
-from register.models import User, Workspace
-from sfa.models import CustomerInfo
-from sfa.views import CustomerInfoFilterView, CustomerInfoCreateView
+from register.models import MyGroup, User, Workspace
+from sfa.models import CustomerInfo, CustomerInfoSupplement, ContactInfo, ActionStatusTransition
+from sfa.views import CustomerInfoFilterView, CustomerInfoCreateView, CustomerInfoUpdateView, GetContactInfoCountView
+import datetime
+import json
 
 class CustomerInfoFilterViewTests(TestCase):
     def setUp(self):
@@ -180,6 +182,8 @@ class CommonRedirectTests(TestCase):
             '/address_info_detail/1/',
             '/address_info_delete/1/',
             '/address_info_import/',
+            '/address_info_match/',
+            '/address_info_customer_create/',
             '/visit_target_filter/',
             '/visit_target_map/',
             '/visit_plan_create/',
@@ -191,10 +195,17 @@ class CommonRedirectTests(TestCase):
             '/call_history_filter/',
             #'/call_history_update/1/',
             '/get_contactinfo_count/',
+            '/get_pipeline_trend/',
+            '/get_postal_code/',
+            '/action_status_funnel/',
             '/goal_setting_create/',
             '/goal_setting_update/1/',
             '/workspace_environment_setting_create/',
             '/workspace_environment_setting_update/1/',
+            '/archived_record_list/',
+            '/company_list/',
+            '/company/1010001000001/',
+            '/get_company_rollup/1010001000001/',
         ]
         
         for target_url in target_urls:
@@ -255,10 +266,12 @@ class CommonRedirectTests(TestCase):
             #'/call_history_filter/',
             #'/call_history_update/1/',
             #'/get_contactinfo_count/',
+            '/action_status_funnel/',
             '/goal_setting_create/',
             #'/goal_setting_update/1/',
             '/workspace_environment_setting_create/',
             #'/workspace_environment_setting_update/1/',
+            '/archived_record_list/',
         ]
         
         for target_url in target_urls:
@@ -269,3 +282,236 @@ class CommonRedirectTests(TestCase):
             response = reverse_match.func(request)
             
             self.assertEquals(response.status_code, 200)
+
+
+class CustomerInfoUpdateViewTests(TestCase):
+    """
+    顧客情報の更新時の楽観的排他制御を確認
+    """
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.factory = RequestFactory()
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            first_name=fake.first_name(),
+            last_name=fake.last_name(),
+            workspace = self.workspace,
+            is_workspace_active = True,
+        )
+        self.customerinfo = CustomerInfo.objects.create(
+            customer_name=fake.company(),
+            potential=1,
+            workspace=self.workspace,
+            author=self.user.email,
+            action_status=0,
+            public_status=0,
+        )
+
+    def post_update(self, last_modified_timestamp, action_status='1'):
+        """
+        対応状況を変更する更新リクエストを送る
+        """
+        request = self.factory.post('/update/{}/'.format(self.customerinfo.pk), {
+            'customer_name': self.customerinfo.customer_name,
+            'potential': 1,
+            'workspace': self.workspace.pk,
+            'action_status': action_status,
+            'public_status': '0',
+            'latitude': '35.0',
+            'longitude': '135.0',
+            'remarks': 'テスト備考',
+            'last_modified_timestamp': last_modified_timestamp,
+        })
+        request.user = self.user
+        return CustomerInfoUpdateView.as_view()(request, pk=self.customerinfo.pk)
+
+    def test_update(self):
+        """
+        編集中に他のユーザーが更新していなければ保存されることを確認
+        """
+        response = self.post_update(str(self.customerinfo.modified_timestamp))
+        self.assertEquals(302, response.status_code)
+        self.customerinfo.refresh_from_db()
+        self.assertEquals(1, self.customerinfo.action_status)
+        # 備考は補足情報として保存される
+        self.assertEquals('テスト備考', self.customerinfo.supplement.remarks)
+
+    def test_update_empty_action_status(self):
+        """
+        対応状況を未選択のまま保存すると、エラーにならず「未対応」になることを確認
+        """
+        CustomerInfo.objects.filter(pk=self.customerinfo.pk).update(action_status=2)
+        self.customerinfo.refresh_from_db()
+        response = self.post_update(str(self.customerinfo.modified_timestamp), action_status='')
+        self.assertEquals(302, response.status_code)
+        self.customerinfo.refresh_from_db()
+        self.assertEquals(0, self.customerinfo.action_status)
+
+    def test_update_conflict(self):
+        """
+        編集中に他のユーザーが更新していた場合は保存されないことを確認
+        """
+        response = self.post_update('2000-01-01 00:00:00')
+        self.assertEquals(200, response.status_code)
+        self.customerinfo.refresh_from_db()
+        self.assertEquals(0, self.customerinfo.action_status)
+
+
+class CustomerInfoBulkUpdateViewTests(TestCase):
+    """
+    顧客情報の一括更新を確認
+    """
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            first_name=fake.first_name(),
+            last_name=fake.last_name(),
+            workspace = self.workspace,
+            is_workspace_active = True,
+        )
+        self.other_user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace = self.workspace,
+            is_workspace_active = True,
+        )
+        # 自分が作成した顧客情報
+        self.customerinfo_list = [
+            CustomerInfo.objects.create(
+                customer_name='株式会社テスト{}'.format(i),
+                potential=1,
+                workspace=self.workspace,
+                author=self.user.email,
+                sales_person=self.user,
+                action_status=0,
+                public_status=1,
+            ) for i in range(3)
+        ]
+        # 他人が作成した閲覧のみ可能な顧客情報
+        self.readonly_customerinfo = CustomerInfo.objects.create(
+            customer_name='株式会社テスト閲覧のみ',
+            potential=1,
+            workspace=self.workspace,
+            author=self.other_user.email,
+            sales_person=self.user,
+            action_status=0,
+            public_status=1,
+        )
+        self.client.force_login(self.user)
+
+    def test_bulk_update_checked(self):
+        """
+        チェックした顧客のうち、編集可能なものだけが更新されることを確認
+        """
+        response = self.client.post('/address_info_bulk_update/', {
+            'action_status': '1',
+            'check_ids': [
+                self.customerinfo_list[0].pk, self.readonly_customerinfo.pk
+            ],
+        })
+        self.assertEquals(302, response.status_code)
+        self.assertEquals(
+            [1, 0, 0, 0],
+            [CustomerInfo.objects.get(pk=customerinfo.pk).action_status
+             for customerinfo in self.customerinfo_list + [self.readonly_customerinfo]])
+        self.assertEquals(1, ActionStatusTransition.objects.count())
+
+    def test_bulk_update_all_matching(self):
+        """
+        検索条件に一致するすべての顧客が更新されることを確認
+        """
+        session = self.client.session
+        session['query'] = {'customer_name': 'テスト1'}
+        session.save()
+        self.client.post('/address_info_bulk_update/', {
+            'action_status': '99',
+            'bulk_target': 'all',
+            'filtering_range': 'user',
+        })
+        self.assertEquals(
+            1, CustomerInfo.objects.filter(delete_flg=True).count())
+        self.assertTrue(
+            CustomerInfo.objects.get(pk=self.customerinfo_list[1].pk).delete_flg)
+
+    def test_bulk_share(self):
+        """
+        グループとの共有が中間テーブルにまとめて追加されることを確認
+        """
+        group = MyGroup.objects.create(group_name='営業部')
+        self.workspace.my_group.add(group)
+        self.customerinfo_list[0].shared_view_group.add(group)
+        self.client.post('/address_info_bulk_update/', {
+            'action_status': '21',
+            'shared_group': group.pk,
+            'bulk_target': 'all',
+        })
+        self.assertEquals(
+            3, CustomerInfo.objects.filter(shared_view_group=group).count())
+        self.assertFalse(
+            self.readonly_customerinfo.shared_view_group.filter(
+                pk=group.pk).exists())
+
+    def test_list_with_supplement(self):
+        """
+        一覧画面では補足情報がまとめて取得されることを確認
+        """
+        CustomerInfoSupplement.objects.create(
+            customer=self.customerinfo_list[0], remarks='一覧に表示する備考')
+        request = RequestFactory().get('/customer_list_user/')
+        request.user = self.user
+        request.session = self.client.session
+        response = CustomerInfoFilterView.as_view()(request)
+        self.assertEquals(200, response.status_code)
+        customerinfo_list = {
+            customerinfo.pk: customerinfo
+            for customerinfo in response.context_data['customerinfo_list']
+        }
+        # 表示時に1件ずつ問い合わせない
+        with self.assertNumQueries(0):
+            self.assertEquals(
+                '一覧に表示する備考',
+                customerinfo_list[self.customerinfo_list[0].pk].supplement.remarks)
+
+
+class GetContactInfoCountViewTests(TestCase):
+    def setUp(self):
+        fake = Faker('ja_JP')
+        self.factory = RequestFactory()
+        self.workspace = Workspace.objects.create(workspace_name=fake.company())
+        self.user = User.objects.create_user(
+            email=fake.email(),
+            password=fake.password(),
+            workspace=self.workspace,
+            is_workspace_active=True,
+        )
+        customerinfo = CustomerInfo.objects.create(
+            customer_name=fake.company(), potential=1, workspace=self.workspace)
+        # 集計終了時刻の秒未満、および翌日0時ちょうどの架電実績
+        for contact_timestamp in (datetime.datetime(2018, 11, 20, 23, 59, 59, 500000),
+                                  datetime.datetime(2018, 11, 21, 0, 0, 0)):
+            contactinfo = ContactInfo.objects.create(
+                target_customer=customerinfo,
+                operator=self.user,
+                contact_type=2,
+                called_flg=True)
+            # contact_timestampはauto_now_addのため、作成後に書き換える
+            ContactInfo.objects.filter(pk=contactinfo.pk).update(
+                contact_timestamp=contact_timestamp)
+
+    def test_outbound_count(self):
+        """
+        集計終了時刻の秒未満までを含み、翌日分は含まないことを確認
+        """
+        request = self.factory.get('/get_contactinfo_count/', {
+            'contact_timestamp_gte': '2018-11-20 0:00:00',
+            'contact_timestamp_lte': '2018-11-20 23:59:59',
+        })
+        request.user = self.user
+        response = GetContactInfoCountView.as_view()(request)
+        results = json.loads(response.context_data['results'])['results'][0]
+        self.assertEqual(1, results['outbound_count'])
@@ -35,8 +35,11 @@ from .views import (
     AddressInfoDetailView,
     AddressInfoDeleteView,
     AddressInfoImportView,
+    AddressInfoMatchView,
+    AddressInfoCustomerCreateView,
     VisitTargetFilterView,
     VisitTargetMapView,
+    VisitRouteView,
     VisitPlanCreateView,
     VisitPlanUpdateView,
     VisitHistoryCreateView,
@@ -46,12 +49,29 @@ from .views import (
     CallHistoryFilterView,
     CallHistoryUpdateView,
     GetContactInfoCountView,
+    GetPipelineTrendView,
+    GetPostalCodeView,
+    ActionStatusFunnelView,
     GoalSettingCreateView,
     GoalSettingUpdateView,
     WorkspaceEnvironmentSettingCreateView,
     WorkspaceEnvironmentSettingUpdateView,
     CustomerInfoDisplaySettingCreateView,
     CustomerInfoDisplaySettingUpdateView,
+    ArchivedRecordListView,
+    ArchivedRecordRestoreView,
+    MetricsView,
+    RequestProfileListView,
+    RequestProfileDownloadView,
+    SlowQuerySummaryView,
+    TerritoryBalanceView,
+    DuplicateClusterListView,
+    DuplicateClusterUpdateView,
+    DuplicateClusterRefreshView,
+    DuplicateClusterMergeView,
+    CompanyRollupListView,
+    CompanyDetailView,
+    GetCompanyRollupView,
 )
 from django.contrib import admin
 
@@ -170,6 +190,14 @@ urlpatterns = [
         'address_info_import/',
         AddressInfoImportView.as_view(),
         name='address_info_import'),
+    path(
+        'address_info_match/',
+        AddressInfoMatchView.as_view(),
+        name='address_info_match'),
+    path(
+        'address_info_customer_create/',
+        AddressInfoCustomerCreateView.as_view(),
+        name='address_info_customer_create'),
     path(
         'visit_target_filter/',
         VisitTargetFilterView.as_view(),
@@ -178,6 +206,10 @@ urlpatterns = [
         'visit_target_map/',
         VisitTargetMapView.as_view(),
         name='visit_target_map'),
+    path(
+        'visit_route/',
+        VisitRouteView.as_view(),
+        name='visit_route'),
     path(
         'visit_plan_create/',
         VisitPlanCreateView.as_view(),
@@ -214,6 +246,18 @@ urlpatterns = [
         'get_contactinfo_count/',
         GetContactInfoCountView.as_view(),
         name='get_contactinfo_count'),
+    path(
+        'get_pipeline_trend/',
+        GetPipelineTrendView.as_view(),
+        name='get_pipeline_trend'),
+    path(
+        'get_postal_code/',
+        GetPostalCodeView.as_view(),
+        name='get_postal_code'),
+    path(
+        'action_status_funnel/',
+        ActionStatusFunnelView.as_view(),
+        name='action_status_funnel'),
     path(
         'goal_setting_create/',
         GoalSettingCreateView.as_view(),
@@ -238,4 +282,95 @@ urlpatterns = [
         'customer_info_display_setting_update/<int:pk>/',
         CustomerInfoDisplaySettingUpdateView.as_view(),
         name='customer_info_display_setting_update'),
+    path(
+        'archived_record_list/',
+        ArchivedRecordListView.as_view(),
+        name='archived_record_list'),
+    path(
+        'archived_record_restore/<int:pk>/',
+        ArchivedRecordRestoreView.as_view(),
+        name='archived_record_restore'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path(
+        'request_profile_list/',
+        RequestProfileListView.as_view(),
+        name='request_profile_list'),
+    path(
+        'request_profile_download/<int:pk>/<str:kind>/',
+        RequestProfileDownloadView.as_view(),
+        name='request_profile_download'),
+    path(
+        'slow_query_summary/',
+        SlowQuerySummaryView.as_view(),
+        name='slow_query_summary'),
+    path(
+        'territory_balance/',
+        TerritoryBalanceView.as_view(),
+        name='territory_balance'),
+    path(
+        'duplicate_cluster_list/',
+        DuplicateClusterListView.as_view(),
+        name='duplicate_cluster_list'),
+    path(
+        'duplicate_cluster_update/<int:pk>/',
+        DuplicateClusterUpdateView.as_view(),
+        name='duplicate_cluster_update'),
+    path(
+        'duplicate_cluster_merge/',
+        DuplicateClusterMergeView.as_view(),
+        name='duplicate_cluster_merge_all'),
+    path(
+        'duplicate_cluster_merge/<int:pk>/',
+        DuplicateClusterMergeView.as_view(),
+        name='duplicate_cluster_merge'),
+    path(
+        'duplicate_cluster_refresh/',
+        DuplicateClusterRefreshView.as_view(),
+        name='duplicate_cluster_refresh'),
+    path(
+        'company_list/',
+        CompanyRollupListView.as_view(),
+        name='company_list'),
+    path(
+        'company/<str:corporate_number>/',
+        CompanyDetailView.as_view(),
+        name='company_detail'),
+    path(
+        'get_company_rollup/<str:corporate_number>/',
+        GetCompanyRollupView.as_view(),
+        name='get_company_rollup'),
 ]
+
+# 画面ごとの1リクエストあたりのクエリ数の上限（URL名: 件数）
+# 一覧画面は表示件数（1ページ30件）に関わらず一定のクエリ数で表示できること。
+# 上限を超えるとQueryCountMiddlewareが警告を出力し、テストは失敗する。
+query_budgets = {
+    'dashboard': 8,
+    'customer_list_user': 15,
+    'customer_list_user_map': 12,
+    'customer_list_group': 15,
+    'customer_list_group_map': 12,
+    'customer_list_all': 15,
+    'customer_list_all_map': 12,
+    'customer_list_duplicate': 15,
+    'detail': 16,
+    'contactinfo_by_customer_list': 13,
+    'contactinfo_by_user_list': 11,
+    'address_info_list': 10,
+    'visit_target_filter': 15,
+    'visit_target_map': 13,
+    'visit_route': 8,
+    'call_history_filter': 14,
+    'get_contactinfo_count': 6,
+    'get_postal_code': 4,
+    'archived_record_list': 9,
+    'request_profile_list': 9,
+    'slow_query_summary': 6,
+    # 反映時は営業担当者の更新（SQLiteでは一時テーブルの作成・登録・削除を含む）と会社単位の集計の更新を含む
+    # 担当エリアの数や顧客情報の件数によらず一定
+    'territory_balance': 11,
+    'duplicate_cluster_list': 10,
+    'company_list': 7,
+    'company_detail': 8,
+    'get_company_rollup': 5,
+}
@@ -1,24 +1,37 @@
 from decimal import Decimal
 from django import forms
 from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
-from django.shortcuts import render, redirect
+from django.db.models import Prefetch, Q
+from django.http import QueryDict, HttpResponse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.views import generic
-from django.views.generic import ListView, DetailView, TemplateView
+from django.views.generic import ListView, DetailView, TemplateView, View
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django_filters.views import FilterView
 from django.db import transaction
 from pure_pagination.mixins import PaginationMixin
 from pytz import timezone
 from register.models import User
-from sfa.common_util import ExtractNumber, DecimalDefaultProc, CheckDuplicatePhoneNumber
+from sfa.metrics import InstrumentedGet, RenderPrometheus, FlushMetrics
+from sfa.addressmatch import MatchAddressInfos, CreateCustomersFromAddressInfos
+from sfa.company import RefreshCompanyRollups, GetCompanyContacts
+from sfa.dedup import RefreshDuplicates
+from sfa.merge import ChooseSurvivors, MergeCustomers
+from sfa.postal import EnrichWithPostalCodes, HasPostalCodes, LookupPostalCodes, SetApproximateLocation
+from sfa.profiling import CreateProfileToken, PROFILE_PARAM
+from sfa.route import SuggestVisitRoute, ApplyVisitRoute
+from sfa.slow_query import ReadSlowQueries, SummarizeSlowQueries
+from sfa.territory import PlanTerritories, ApplyTerritories
+from sfa.common_util import ExtractNumber, ExtractNumberColumns, NormalizeJapaneseAddress, DecimalDefaultProc, CheckDuplicatePhoneNumber, BuildActionStatusTransition, GetActionStatusFunnel, GetActionStatusDuration, GetEditableCustomerInfo, GetEditableCustomerPks, GetViewableCustomerInfo, BulkUpdateCustomerInfo, RestoreArchivedRecord, GetContactTimestampRange
 from .filters import CustomerInfoFilter, ContactInfoFilter
-from .forms import ContactInfoForm, CustomerInfoForm, CustomerInfoDeleteForm, AddressInfoForm, AddressInfoUploadForm, CustomerInfoUploadForm, VisitHistoryForm, VisitPlanForm, CallHistoryForm, GoalSettingForm, WorkspaceEnvironmentSettingForm, CustomerInfoDisplaySettingForm
-from .models import ContactInfo, CustomerInfo, MyGroup, AddressInfo, GoalSetting, WorkspaceEnvironmentSetting, CustomerInfoDisplaySetting
+from .forms import ContactInfoForm, CustomerInfoForm, CustomerInfoDeleteForm, AddressInfoForm, AddressInfoUploadForm, AddressInfoCustomerCreateForm, CustomerInfoUploadForm, VisitHistoryForm, VisitPlanForm, CallHistoryForm, GoalSettingForm, WorkspaceEnvironmentSettingForm, CustomerInfoDisplaySettingForm, TerritoryForm
+from .models import ContactInfo, CustomerInfo, MyGroup, AddressInfo, GoalSetting, WorkspaceEnvironmentSetting, CustomerInfoDisplaySetting, CustomerInfoSupplement, PipelineSnapshot, ActionStatusTransition, ArchivedRecord, RequestProfile, DuplicateCluster, CompanyRollup, ACTION_CHOICES, DUPLICATE_STATUS_CHOICES
 import csv
 import datetime
+import hmac
 import io
 import json
 import requests
@@ -27,6 +40,24 @@ base_url = 'https://maps.googleapis.com/maps/api/geocode/json?language=ja&addres
 headers = {'content-type': 'application/json'}
 
 
+def GetGeocode(address_str, geocode_api_key):
+    """
+    Google Geocode APIで住所から緯度経度を取得する
+    return: (緯度, 経度)。APIキーがない場合や、通信の失敗などで取得できなかった場合はNone
+    """
+    if not (address_str and geocode_api_key):
+        return None
+    try:
+        r = InstrumentedGet((base_url + geocode_api_key).format(address_str), headers=headers)
+        data = r.json()
+    except (requests.RequestException, ValueError):
+        return None
+    if 'results' in data and len(data['results']) > 0:
+        location = data['results'][0]['geometry']['location']
+        return location['lat'], location['lng']
+    return None
+
+
 class CustomerInfoFilterView(LoginRequiredMixin, PaginationMixin, FilterView):
     """ 検索一覧画面（顧客情報） 自分が担当中の顧客で絞り込み（デフォルト表示） """
     model = CustomerInfo
@@ -36,6 +67,17 @@ class CustomerInfoFilterView(LoginRequiredMixin, PaginationMixin, FilterView):
     paginate_by = 30
     object = CustomerInfo
 
+    # 一覧画面と地図画面で表示に使う項目
+    list_fields = (
+        'corporate_number', 'optional_code1', 'optional_code2',
+        'optional_code3', 'customer_name', 'department_name', 'tel_number1',
+        'tel_number1_duplicate_count', 'tel_number2',
+        'tel_number2_duplicate_count', 'tel_number3',
+        'tel_number3_duplicate_count', 'fax_number', 'mail_address',
+        'representative', 'contact_name', 'zip_code', 'address1', 'address2',
+        'address3', 'latitude', 'longitude', 'contracted_flg',
+        'action_status', 'visited_flg', 'sales_person', 'created_timestamp')
+
     def dispatch(self, request, *args, **kwargs):
         # ワークスペースに所属し、有効になっている場合のみ表示できる
         if request.user.workspace and request.user.is_workspace_active:
@@ -61,10 +103,10 @@ class CustomerInfoFilterView(LoginRequiredMixin, PaginationMixin, FilterView):
         """
         return CustomerInfo.objects.filter(
             workspace=self.request.user.workspace,
-            delete_flg='False',
+            delete_flg=False,
             sales_person=self.request.user).filter(
-                Q(public_status='1')
-                | Q(public_status='2')
+                Q(public_status=1)
+                | Q(public_status=2)
                 | Q(author=self.request.user.email)
                 | Q(shared_edit_user=self.request.user)
                 | Q(shared_view_user=self.request.user)
@@ -72,6 +114,16 @@ class CustomerInfoFilterView(LoginRequiredMixin, PaginationMixin, FilterView):
                 | Q(shared_view_group__in=self.request.user.my_group.all())
             ).distinct().order_by('-created_timestamp')
 
+    def get_filterset_kwargs(self, filterset_class):
+        """
+        一覧に表示する項目のみを読み込み、補足情報は表示するページの分だけまとめて取得する
+        """
+        kwargs = super().get_filterset_kwargs(filterset_class)
+        kwargs['queryset'] = kwargs['queryset'].only(
+            *self.list_fields).select_related('sales_person').prefetch_related(
+                'supplement')
+        return kwargs
+
     def setExtractNumber(self, request, field, data_type):
         """
         リクエスト内の指定されたフィールドを変換して上書きする。
@@ -93,7 +145,6 @@ class CustomerInfoFilterView(LoginRequiredMixin, PaginationMixin, FilterView):
             # 全角半角変換と記号の除去
             self.setExtractNumber(request, 'corporate_number', 3)
             self.setExtractNumber(request, 'tel_number1', 1)
-            self.setExtractNumber(request, 'tel_number1', 1)
             self.setExtractNumber(request, 'tel_number2', 1)
             self.setExtractNumber(request, 'tel_number3', 1)
             self.setExtractNumber(request, 'fax_number', 1)
@@ -149,6 +200,13 @@ class CustomerInfoFilterView(LoginRequiredMixin, PaginationMixin, FilterView):
             if 'map_view' in self.request.GET:
                 ctx['map_view'] = '1'
         ctx['filtering_range'] = 'user'  # 絞り込みの範囲はユーザー
+        # 表示中のページで編集可能な顧客（テンプレートで1行ずつ判定しないようにまとめて取得）
+        ctx['editable_customer_pks'] = GetEditableCustomerPks(
+            self.request.user,
+            [customerinfo.pk for customerinfo in ctx['customerinfo_list']])
+        # 一括更新で共有先に選べるグループ
+        ctx['workspace_groups'] = MyGroup.objects.filter(
+            workspace=self.request.user.workspace)
         # 任意コードを用いて外部システムを呼び出すURL1
         try:
             ctx['webhook_url1'] = self.request.user.workspace.workspaceenvironmentsetting.webhook_url1
@@ -298,10 +356,10 @@ class CustomerInfoGroupFilterView(CustomerInfoFilterView):
         """
         return CustomerInfo.objects.filter(
             workspace=self.request.user.workspace,
-            delete_flg='False').filter(sales_person__in=User.objects.all(
+            delete_flg=False).filter(sales_person__in=User.objects.all(
             ).filter(my_group__in=self.request.user.my_group.all())).filter(
-                Q(public_status='1')
-                | Q(public_status='2')
+                Q(public_status=1)
+                | Q(public_status=2)
                 | Q(author=self.request.user.email)
                 | Q(shared_edit_user=self.request.user)
                 | Q(shared_view_user=self.request.user)
@@ -377,9 +435,9 @@ class CustomerInfoAllFilterView(CustomerInfoFilterView):
          ・参照可能グループが自分が所属するグループと一致
         """
         return CustomerInfo.objects.filter(
-            workspace=self.request.user.workspace, delete_flg='False').filter(
-                Q(public_status='1')
-                | Q(public_status='2')
+            workspace=self.request.user.workspace, delete_flg=False).filter(
+                Q(public_status=1)
+                | Q(public_status=2)
                 | Q(author=self.request.user.email)
                 | Q(shared_edit_user=self.request.user)
                 | Q(shared_view_user=self.request.user)
@@ -465,9 +523,9 @@ class CustomerInfoCheckDuplicateView(CustomerInfoFilterView):
             Q(tel_number1=phone_number) | Q(tel_number2=phone_number)
             | Q(tel_number3=phone_number)).filter(
                 workspace=self.request.user.workspace,
-                delete_flg='False').filter(
-                    Q(public_status='1')
-                    | Q(public_status='2')
+                delete_flg=False).filter(
+                    Q(public_status=1)
+                    | Q(public_status=2)
                     | Q(author=self.request.user.email)
                     | Q(shared_edit_user=self.request.user)
                     | Q(shared_view_user=self.request.user)
@@ -511,9 +569,9 @@ class CustomerInfoDetailView(LoginRequiredMixin, DetailView):
          ・参照可能グループが自分が所属するグループと一致
         """
         return CustomerInfo.objects.filter(
-            workspace=self.request.user.workspace, delete_flg='False').filter(
-                Q(public_status='1')
-                | Q(public_status='2')
+            workspace=self.request.user.workspace, delete_flg=False).filter(
+                Q(public_status=1)
+                | Q(public_status=2)
                 | Q(author=self.request.user.email)
                 | Q(shared_edit_user=self.request.user)
                 | Q(shared_view_user=self.request.user)
@@ -576,6 +634,8 @@ class CustomerInfoCreateView(LoginRequiredMixin, CreateView):
         ctx = super().get_context_data(**kwargs)
         form = ctx['form']
         login_user = self.request.user
+        # 郵便番号の索引がない場合は、住所の自動入力に外部のyubinbangoを使う
+        ctx['postal_index'] = HasPostalCodes()
 
         # 選択可能な共有ユーザーを同一ワークスペースで絞り込み、作成者は除外する
         shared_edit_user = form.fields['shared_edit_user']
@@ -640,6 +700,15 @@ class CustomerInfoCreateView(LoginRequiredMixin, CreateView):
             tel_number3, self.request.user)
         form.save()
 
+        # 対応状況の変更履歴を記録
+        transition = BuildActionStatusTransition(form.instance, None,
+                                                 self.request.user)
+        if transition:
+            transition.save()
+
+        # 会社単位の集計を更新
+        RefreshCompanyRollups(self.request.user.workspace, [form.instance.pk])
+
         # 住所から緯度経度を取得
         # すでに緯度経度が入力済みの場合は何もしない
         latitude = self.request.POST[
@@ -654,25 +723,20 @@ class CustomerInfoCreateView(LoginRequiredMixin, CreateView):
             'address1'] if 'address1' in self.request.POST else ''
         address2 = self.request.POST[
             'address2'] if 'address2' in self.request.POST else ''
-        address_str = address1 + address2
+        address_str = NormalizeJapaneseAddress(address1, address2)
         # 住所から緯度経度を取得するためのAPIキー
         try:
             geocode_api_key = self.request.user.workspace.workspaceenvironmentsetting.google_maps_web_service_api_key
         except:
             geocode_api_key = ''
 
-        if address_str and geocode_api_key:
-            # Google Geocode APIで住所から緯度経度情報を取得
-            geocode_url = base_url + geocode_api_key
-            url = geocode_url.format(address_str)
-            r = requests.get(url, headers=headers)
-            data = r.json()
-            if 'results' in data and len(data['results']) > 0:
-                latitude = data['results'][0]['geometry']['location']['lat']
-                longitude = data['results'][0]['geometry']['location']['lng']
-                form.instance.latitude = latitude
-                form.instance.longitude = longitude
-                form.save()
+        location = GetGeocode(address_str, geocode_api_key)
+        if location is not None:
+            form.instance.latitude, form.instance.longitude = location
+            form.save()
+        elif SetApproximateLocation(form.instance):
+            # APIキーがない場合や取得できなかった場合は、郵便番号の代表地点で代用する
+            form.save()
 
         return super().form_valid(form)
 
@@ -706,8 +770,8 @@ class CustomerInfoUpdateView(LoginRequiredMixin, UpdateView):
          ・編集可能グループが自分が所属するグループと一致
         """
         return CustomerInfo.objects.filter(
-            workspace=self.request.user.workspace, delete_flg='False').filter(
-                Q(public_status='2')
+            workspace=self.request.user.workspace, delete_flg=False).filter(
+                Q(public_status=2)
                 | Q(author=self.request.user.email)
                 | Q(shared_edit_user=self.request.user)
                 | Q(shared_edit_group__in=self.request.user.my_group.all())
@@ -721,6 +785,8 @@ class CustomerInfoUpdateView(LoginRequiredMixin, UpdateView):
         form = ctx['form']
         author = CustomerInfo.objects.get(pk=self.kwargs['pk']).author
         login_user = self.request.user
+        # 郵便番号の索引がない場合は、住所の自動入力に外部のyubinbangoを使う
+        ctx['postal_index'] = HasPostalCodes()
 
         # 選択可能な共有ユーザーを同一ワークスペースで絞り込み、作成者は除外する
         shared_edit_user = form.fields['shared_edit_user']
@@ -778,44 +844,78 @@ class CustomerInfoUpdateView(LoginRequiredMixin, UpdateView):
 
         return super().post(request, **kwargs)
 
+    def get_initial(self):
+        """
+        編集画面を開いた時点の修正日時を保持する
+        """
+        initial = super().get_initial()
+        initial['last_modified_timestamp'] = str(
+            self.object.modified_timestamp)
+        return initial
+
     def form_valid(self, form):
         """
-        住所から緯度経度を取得
+        住所から緯度経度を取得し、他のユーザーによる更新がなければ保存する
         """
-        # すでに緯度経度が入力済みの場合は何もしない
+        # 緯度経度が未入力の場合と、郵便番号からの概算のまま変更されていない場合は住所から取得する
         latitude = self.request.POST[
             'latitude'] if 'latitude' in self.request.POST else ''
         longitude = self.request.POST[
             'longitude'] if 'longitude' in self.request.POST else ''
-        if latitude and longitude:
-            return super().form_valid(form)
-
+        location_changed = {'latitude', 'longitude'} & set(form.changed_data)
+        if not (latitude and longitude) or (form.instance.approximate_location
+                                            and not location_changed):
+            self.set_geocode(form)
+        elif location_changed:
+            form.instance.approximate_location = False
+
+        with transaction.atomic():
+            # 編集画面を開いた後に他のユーザーが更新していた場合は保存しない（楽観的排他制御）
+            current_timestamp = CustomerInfo.objects.select_for_update(
+            ).filter(pk=form.instance.pk).values_list(
+                'modified_timestamp', flat=True).first()
+            if form.cleaned_data['last_modified_timestamp'] != str(
+                    current_timestamp):
+                form.add_error(
+                    None, '他のユーザーがこの顧客情報を更新しました。画面を再読み込みして最新の内容を確認してから編集してください。')
+                return self.form_invalid(form)
+
+            # 対応状況の変更履歴を記録
+            transition = BuildActionStatusTransition(
+                form.instance, form.initial.get('action_status'),
+                self.request.user)
+            if transition:
+                transition.save()
+
+            response = super().form_valid(form)
+            # 会社単位の集計を更新（法人番号が変わった場合は変更前の会社も）
+            RefreshCompanyRollups(self.request.user.workspace, [form.instance.pk],
+                                  [form.initial.get('corporate_number')])
+            return response
+
+    def set_geocode(self, form):
+        """
+        住所から緯度経度を取得
+        """
         # 住所を取得
         address1 = self.request.POST[
             'address1'] if 'address1' in self.request.POST else ''
         address2 = self.request.POST[
             'address2'] if 'address2' in self.request.POST else ''
-        address_str = address1 + address2
+        address_str = NormalizeJapaneseAddress(address1, address2)
         # 住所から緯度経度を取得するためのAPIキー
         try:
             geocode_api_key = self.request.user.workspace.workspaceenvironmentsetting.google_maps_web_service_api_key
         except:
             geocode_api_key = ''
 
-        if address_str and geocode_api_key:
-            # Google Geocode APIで住所から緯度経度情報を取得
-            geocode_url = base_url + geocode_api_key
-            url = geocode_url.format(address_str)
-            r = requests.get(url, headers=headers)
-            data = r.json()
-            if 'results' in data and len(data['results']) > 0:
-                latitude = data['results'][0]['geometry']['location']['lat']
-                longitude = data['results'][0]['geometry']['location']['lng']
-                form.instance.latitude = latitude
-                form.instance.longitude = longitude
-                form.save()
-
-        return super().form_valid(form)
+        location = GetGeocode(address_str, geocode_api_key)
+        if location is not None:
+            form.instance.latitude, form.instance.longitude = location
+            form.instance.approximate_location = False
+        else:
+            # APIキーがない場合や取得できなかった場合は、郵便番号の代表地点で代用する
+            SetApproximateLocation(form.instance)
 
 
 class CustomerInfoBulkUpdateView(LoginRequiredMixin, TemplateView):
@@ -823,6 +923,13 @@ class CustomerInfoBulkUpdateView(LoginRequiredMixin, TemplateView):
     model = CustomerInfo
     success_url = reverse_lazy('customer_list_user')
 
+    # 一覧画面の絞り込み範囲ごとの一覧画面クラスと戻り先
+    filter_views = {
+        'user': (CustomerInfoFilterView, 'customer_list_user'),
+        'group': (CustomerInfoGroupFilterView, 'customer_list_group'),
+        'all': (CustomerInfoAllFilterView, 'customer_list_all'),
+    }
+
     def dispatch(self, request, *args, **kwargs):
         # ワークスペースに所属し、有効になっている場合のみ表示できる
         if request.user.workspace and request.user.is_workspace_active:
@@ -830,52 +937,97 @@ class CustomerInfoBulkUpdateView(LoginRequiredMixin, TemplateView):
         else:
             return redirect('index')
 
-    def post(self, request, **kwargs):
+    def get_filtered_queryset(self, filtering_range):
         """
-        チェックされた顧客情報を一括更新する
+        一覧画面と同じ絞り込み範囲と、セッションに保存された検索条件に一致する顧客情報を返す
         """
-        check_ids = request.POST.getlist('check_ids')
-        action_status = request.POST[
-            'action_status'] if 'action_status' in request.POST else None
-        for check_id in check_ids:
-            if not action_status:
-                continue
-            target = CustomerInfo.objects.get(pk=check_id)
-            if not target.is_editable(request.user.email):
+        filter_view = self.filter_views[filtering_range][0]()
+        filter_view.request = self.request
+        # 一覧画面と同様に、検索条件がなければ対応終了を除外する
+        data = QueryDict(mutable=True)
+        data['action_status_ex'] = '3'
+        for key, value in self.request.session.get('query', {}).items():
+            if isinstance(value, list):
+                data.setlist(key, value)
+            else:
+                data[key] = value
+        return CustomerInfoFilter(
+            data, queryset=filter_view.get_queryset()).qs
+
+    def set_geocode(self, queryset):
+        """
+        緯度経度が未入力または郵便番号からの概算の顧客情報について、住所から緯度経度を取得する
+        APIキーがない場合や取得できなかった場合は、未入力のものに郵便番号の代表地点を設定する
+        return: 緯度経度を設定できた件数
+        """
+        # 住所から緯度経度を取得するためのAPIキー
+        try:
+            geocode_api_key = self.request.user.workspace.workspaceenvironmentsetting.google_maps_web_service_api_key
+        except:
+            geocode_api_key = ''
+
+        count = 0
+        unlocated = []  # 住所から取得できなかった、緯度経度が未入力の顧客情報
+        targets = GetEditableCustomerInfo(self.request.user).filter(
+            pk__in=queryset.values('pk')).filter(
+                Q(latitude__isnull=True) | Q(longitude__isnull=True)
+                | Q(approximate_location=True)).only(
+                    'normalized_address', 'approximate_location').distinct()
+        for target in targets:
+            # 住所（表記ゆれをなくしたもの）から緯度経度を取得
+            location = GetGeocode(target.normalized_address, geocode_api_key)
+            if location is None:
+                if not target.approximate_location:
+                    unlocated.append(target.pk)
                 continue
-            if action_status == '0' or action_status == '1' or action_status == '2' or action_status == '3':
-                target.action_status = action_status  # 進捗状況
-            elif action_status == '10':
-                target.sales_person = request.user  # 営業担当者
-            elif action_status == '99':
-                target.delete_flg = True
-
-            # 削除処理以外の場合は住所から緯度・経度を取得する
-            if action_status != '99' and not (target.latitude
-                                              and target.longitude):
-                address_str = target.address1 + target.address2  # 住所を取得
-                # 住所から緯度経度を取得するためのAPIキー
-                try:
-                    geocode_api_key = self.request.user.workspace.workspaceenvironmentsetting.google_maps_web_service_api_key
-                except:
-                    geocode_api_key = ''
-
-                if address_str and geocode_api_key:
-                    # Google Geocode APIで住所から緯度経度情報を取得
-                    geocode_url = base_url + geocode_api_key
-                    url = geocode_url.format(address_str)
-                    r = requests.get(url, headers=headers)
-                    data = r.json()
-                    if 'results' in data and len(data['results']) > 0:
-                        latitude = data['results'][0]['geometry']['location'][
-                            'lat']
-                        longitude = data['results'][0]['geometry']['location'][
-                            'lng']
-                        target.latitude = latitude
-                        target.longitude = longitude
-
-            target.save()
-        return redirect('customer_list_user')
+            CustomerInfo.objects.filter(pk=target.pk).update(
+                latitude=location[0],
+                longitude=location[1],
+                approximate_location=False,
+                modified_timestamp=datetime.datetime.now())
+            count += 1
+        if unlocated:
+            count += EnrichWithPostalCodes(
+                self.request.user.workspace, unlocated, fill_address=False)[1]
+        return count
+
+    def post(self, request, **kwargs):
+        """
+        チェックされた顧客情報、または検索条件に一致するすべての顧客情報を一括更新する
+        """
+        action_status = request.POST.get('action_status')
+        filtering_range = request.POST.get('filtering_range')
+        if filtering_range not in self.filter_views:
+            filtering_range = 'user'
+        success_url = self.filter_views[filtering_range][1]
+        if not action_status:
+            return redirect(success_url)
+
+        # 更新対象を決める
+        if request.POST.get('bulk_target') == 'all':
+            queryset = self.get_filtered_queryset(filtering_range)
+        else:
+            queryset = CustomerInfo.objects.filter(
+                pk__in=request.POST.getlist('check_ids'))
+
+        if action_status == '50':
+            count = self.set_geocode(queryset)
+        else:
+            shared_group = None
+            if action_status in ('20', '21'):
+                shared_group = MyGroup.objects.filter(
+                    pk=request.POST.get('shared_group') or None,
+                    workspace=request.user.workspace).first()
+            # 営業担当者の変更と削除は会社単位の集計に影響するため、更新前に対象を控えておく
+            pks = list(queryset.values_list(
+                'pk', flat=True)) if action_status in ('10', '99') else []
+            count = BulkUpdateCustomerInfo(queryset, request.user,
+                                           action_status, shared_group)
+            if count and pks:
+                RefreshCompanyRollups(request.user.workspace, pks)
+
+        messages.info(request, '{}件の顧客情報を更新しました。'.format(count))
+        return redirect(success_url)
 
 
 class CustomerInfoDeleteView(LoginRequiredMixin, TemplateView):
@@ -894,9 +1046,11 @@ class CustomerInfoDeleteView(LoginRequiredMixin, TemplateView):
             return redirect('index')
 
     def get(self, request, **kwargs):
-        target = CustomerInfo.objects.get(pk=self.kwargs['pk'])
-        target.delete_flg = True
-        target.save()
+        # 削除フラグ・削除日時と修正日時のみを更新する
+        now = datetime.datetime.now()
+        CustomerInfo.objects.filter(pk=self.kwargs['pk']).update(
+            delete_flg=True, deleted_timestamp=now, modified_timestamp=now)
+        RefreshCompanyRollups(request.user.workspace, [self.kwargs['pk']])
         return redirect('customer_list_user')
 
 
@@ -906,6 +1060,8 @@ class CustomerInfoImportView(generic.FormView):
     success_url = reverse_lazy('customer_list_user')
     form_class = CustomerInfoUploadForm
     number_of_columns = 31  # 列の数を定義しておく。各行の列がこれかどうかを判断する
+    # 数字のみに変換する列と、ExtractNumberの種別。法人番号、電話番号1〜3、FAX番号、郵便番号
+    number_columns = {0: 3, 6: 1, 7: 1, 8: 1, 9: 1, 13: 2}
 
     def dispatch(self, request, *args, **kwargs):
         # ワークスペースに所属し、有効になっている場合のみ表示できる
@@ -939,8 +1095,12 @@ class CustomerInfoImportView(generic.FormView):
         ) if 'shared_view_user' in self.request.POST else None
         # csv.readerに渡すため、TextIOWrapperでテキストモードなファイルに変換
         csvfile = io.TextIOWrapper(form.cleaned_data['file'], encoding='MS932')
-        reader = csv.reader(csvfile)
+        # 番号の列は、読み込みながら全角半角変換と記号の除去を行う
+        reader = ExtractNumberColumns(csv.reader(csvfile), self.number_columns)
         index = 1  # 1行目でのUnicodeDecodeError対策。for文の初回のnextでエラーになるとiの値がない為
+        self.imported_pks = []  # インポートした顧客情報（重複候補の更新に用いる）
+        transitions = []  # 対応状況の変更履歴
+        supplements = []  # 顧客情報の補足
         try:
             # indexは、現在の行番号。エラーの際に補足情報として使う
             for index, row in enumerate(reader, 1):
@@ -956,26 +1116,20 @@ class CustomerInfoImportView(generic.FormView):
                 my_potential = potential if row[25] == '' else row[25]
                 customerinfo = CustomerInfo.objects.create(
                     potential=my_potential)
-                customerinfo.corporate_number = ExtractNumber(
-                    row[0], 3)  # 法人番号を数字のみに変換
+                customerinfo.corporate_number = row[0]
                 customerinfo.optional_code1 = row[1]
                 customerinfo.optional_code2 = row[2]
                 customerinfo.optional_code3 = row[3]
                 customerinfo.customer_name = row[4]
                 customerinfo.department_name = row[5]
-                customerinfo.tel_number1 = ExtractNumber(row[6],
-                                                         1)  # 電話番号を数字のみに変換
-                customerinfo.tel_number2 = ExtractNumber(row[7],
-                                                         1)  # 電話番号を数字のみに変換
-                customerinfo.tel_number3 = ExtractNumber(row[8],
-                                                         1)  # 電話番号を数字のみに変換
-                customerinfo.fax_number = ExtractNumber(row[9],
-                                                        1)  # FAX番号を数字のみに変換
+                customerinfo.tel_number1 = row[6]
+                customerinfo.tel_number2 = row[7]
+                customerinfo.tel_number3 = row[8]
+                customerinfo.fax_number = row[9]
                 customerinfo.mail_address = row[10]
                 customerinfo.representative = row[11]
                 customerinfo.contact_name = row[12]
-                customerinfo.zip_code = ExtractNumber(row[13],
-                                                      2)  # 郵便番号を数字のみに変換
+                customerinfo.zip_code = row[13]
                 customerinfo.address1 = row[14]
                 customerinfo.address2 = row[15]
                 customerinfo.address3 = row[16]
@@ -983,9 +1137,6 @@ class CustomerInfoImportView(generic.FormView):
                     row[17])
                 customerinfo.longitude = None if row[18] == '' else Decimal(
                     row[18])
-                customerinfo.url1 = row[19]
-                customerinfo.url2 = row[20]
-                customerinfo.url3 = row[21]
                 customerinfo.industry_code = row[22]
                 customerinfo.data_source = data_source if row[
                     23] == '' else row[23]
@@ -999,14 +1150,13 @@ class CustomerInfoImportView(generic.FormView):
                     row[28])
                 customerinfo.attention_flg = False if row[29] == '' else int(
                     row[29])
-                customerinfo.remarks = row[30]
                 if public_status:
-                    customerinfo.public_status = public_status
+                    customerinfo.public_status = int(public_status)
                 if sales_person:
                     customerinfo.sales_person = User.objects.get(
                         pk=sales_person)
                 if action_status:
-                    customerinfo.action_status = action_status
+                    customerinfo.action_status = int(action_status)
                 if shared_edit_group:
                     customerinfo.shared_edit_group.set(shared_edit_group)
                 if shared_view_group:
@@ -1026,6 +1176,22 @@ class CustomerInfoImportView(generic.FormView):
                 customerinfo.tel_number3_duplicate_count = CheckDuplicatePhoneNumber(
                     customerinfo.tel_number3, self.request.user)
                 customerinfo.save()
+                self.imported_pks.append(customerinfo.pk)
+                supplements.append(
+                    CustomerInfoSupplement(
+                        customer=customerinfo,
+                        url1=row[19],
+                        url2=row[20],
+                        url3=row[21],
+                        remarks=row[30]))
+                transition = BuildActionStatusTransition(
+                    customerinfo, None, self.request.user)
+                if transition:
+                    transitions.append(transition)
+
+            # 顧客情報の補足と対応状況の変更履歴をまとめて記録
+            CustomerInfoSupplement.objects.bulk_create(supplements)
+            ActionStatusTransition.objects.bulk_create(transitions)
 
         except Exception as e:
             raise InvalidSourceExcepion(
@@ -1036,6 +1202,8 @@ class CustomerInfoImportView(generic.FormView):
             # CSVの100行目でエラーがおきたら、前の99行分は保存されないようにする
             with transaction.atomic():
                 self.save_csv(form)
+                # 住所や緯度経度が空の顧客情報を、郵便番号の索引から補う
+                EnrichWithPostalCodes(self.request.user.workspace, self.imported_pks)
         # 今のところは、この2つのエラーは同様に対処します。
         except InvalidSourceExcepion as e:
             form.add_error('file', e)
@@ -1044,6 +1212,9 @@ class CustomerInfoImportView(generic.FormView):
             form.add_error('file', e)
             return super().form_invalid(form)
         else:
+            # インポートした顧客情報に関係する重複候補だけを更新する
+            RefreshDuplicates(self.request.user.workspace, self.imported_pks)
+            RefreshCompanyRollups(self.request.user.workspace, self.imported_pks)
             return super().form_valid(form)  # うまくいったので、リダイレクトさせる
 
     def get_context_data(self, **kwargs):
@@ -1091,28 +1262,31 @@ class ContactInfoCreateView(LoginRequiredMixin, CreateView):
             target_customer_pk = request.POST['target_customer']
         except:
             return super().post(request, **kwargs)
-        target_customer = CustomerInfo.objects.get(pk=target_customer_pk)
-        # 対象顧客が同一ワークスペースでなければ何もしない
-        if not target_customer.workspace == request.user.workspace:
-            return super().post(request, **kwargs)
         if contact_type == '0':  # 対応種別が訪問かつ訪問済みの場合
             try:
                 contact_visited_flg = request.POST['visited_flg']
             except:
                 return super().post(request, **kwargs)
-            if contact_visited_flg:
-                target_customer.visited_flg = True
+            if not contact_visited_flg:
+                return super().post(request, **kwargs)
+            flg_name = 'visited_flg'
         elif contact_type == '2':  # 対応種別が架電（アウトバウンドの場合）（なおインバウンドの場合は架電済みとはみなさない）
-            target_customer.tel_called_flg = True
+            flg_name = 'tel_called_flg'
         elif contact_type == '3':  # 対応種別がメールの場合
-            target_customer.mail_sent_flg = True
+            flg_name = 'mail_sent_flg'
         elif contact_type == '4':  # 対応種別がFAXの場合
-            target_customer.fax_sent_flg = True
+            flg_name = 'fax_sent_flg'
         elif contact_type == '5':  # 対応種別がDMの場合
-            target_customer.dm_sent_flg = True
+            flg_name = 'dm_sent_flg'
         else:
             return super().post(request, **kwargs)
-        target_customer.save()
+        # 済フラグと修正日時のみを更新する（対象顧客が同一ワークスペースでなければ何もしない）
+        CustomerInfo.objects.filter(
+            pk=target_customer_pk, workspace=request.user.workspace).update(
+                **{
+                    flg_name: True,
+                    'modified_timestamp': datetime.datetime.now()
+                })
         return super().post(request, **kwargs)
 
     def dispatch(self, request, *args, **kwargs):
@@ -1137,7 +1311,7 @@ class ContactInfoCreateView(LoginRequiredMixin, CreateView):
             # 選択可能な対象顧客を同一ワークスペースかつ自分が対応中の顧客で絞り込む
             target_customer.queryset = CustomerInfo.objects.filter(
                 workspace=login_user.workspace.pk).filter(
-                    sales_person=login_user, action_status='2')
+                    sales_person=login_user, action_status=2)
         else:
             # 選択可能な対象顧客をPKで指定された顧客のみにする
             target_customer.queryset = CustomerInfo.objects.filter(
@@ -1159,8 +1333,9 @@ class ContactInfoCreateView(LoginRequiredMixin, CreateView):
         if not target_customer.workspace == self.request.user.workspace:
             return redirect('index')
 
-        # フォームの内容を保存
+        # フォームの内容を保存し、対象顧客の会社単位の集計を更新
         form.save()
+        RefreshCompanyRollups(self.request.user.workspace, [target_customer.pk])
 
         return super().form_valid(form)
 
@@ -1178,8 +1353,9 @@ class ContactInfoFromCustomerCreateView(ContactInfoCreateView):
         if not target_customer.workspace == self.request.user.workspace:
             return redirect('index')
 
-        # フォームの内容を保存
+        # フォームの内容を保存し、対象顧客の会社単位の集計を更新
         form.save()
+        RefreshCompanyRollups(self.request.user.workspace, [target_customer.pk])
 
         pk = self.kwargs['pk']
         # 顧客毎のコンタクト一覧に遷移する
@@ -1221,7 +1397,7 @@ class ContactInfoUpdateView(LoginRequiredMixin, UpdateView):
         return super().post(request, **kwargs)
 
     def get_queryset(self):
-        return ContactInfo.objects.filter(delete_flg='False')
+        return ContactInfo.objects.filter(delete_flg=False)
 
     def dispatch(self, request, *args, **kwargs):
         target = ContactInfo.objects.get(pk=self.kwargs['pk'])
@@ -1269,10 +1445,13 @@ class ContactInfoByCustomerDeleteView(LoginRequiredMixin, TemplateView):
     model = ContactInfo
 
     def get(self, request, **kwargs):
-        target = ContactInfo.objects.get(pk=self.kwargs['pk'])
+        target = ContactInfo.objects.only('target_customer').get(
+            pk=self.kwargs['pk'])
         target.delete_flg = True
-        target.save()
-        target_customer_pk = target.target_customer.pk
+        target.deleted_timestamp = datetime.datetime.now()
+        target.save(update_fields=['delete_flg', 'deleted_timestamp'])
+        target_customer_pk = target.target_customer_id
+        RefreshCompanyRollups(request.user.workspace, [target_customer_pk])
 
         return redirect('contactinfo_by_customer_list', pk=target_customer_pk)
 
@@ -1292,11 +1471,18 @@ class ContactInfoByUserDeleteView(LoginRequiredMixin, TemplateView):
     model = ContactInfo
 
     def get(self, request, **kwargs):
-        target = ContactInfo.objects.get(pk=self.kwargs['pk'])
-        target.delete_flg = True
-        target.save()
+        self.delete_contactinfo()
         return redirect('contactinfo_by_user_list')
 
+    def delete_contactinfo(self):
+        """
+        削除フラグと削除日時のみを更新し、対象顧客の会社単位の集計を更新する
+        """
+        contacts = ContactInfo.objects.filter(pk=self.kwargs['pk'])
+        contacts.update(delete_flg=True, deleted_timestamp=datetime.datetime.now())
+        RefreshCompanyRollups(self.request.user.workspace,
+                              list(contacts.values_list('target_customer_id', flat=True)))
+
     def dispatch(self, request, *args, **kwargs):
         target = ContactInfo.objects.get(pk=self.kwargs['pk'])
         # コンタクト情報の削除は、以下の条件を満たす場合のみ実施できる
@@ -1327,7 +1513,7 @@ class ContactInfoDetailView(LoginRequiredMixin, DetailView):
          ・同一ワークスペース
         """
         return ContactInfo.objects.filter(
-            delete_flg='False',
+            delete_flg=False,
             target_customer__in=CustomerInfo.objects.filter(
                 workspace=self.request.user.workspace))
 
@@ -1353,11 +1539,11 @@ class ContactInfoByCustomerListView(LoginRequiredMixin, PaginationMixin,
          ・対象顧客が指定された顧客と一致
         """
         return ContactInfo.objects.filter(
-            delete_flg='False',
+            delete_flg=False,
             target_customer__in=CustomerInfo.objects.filter(
                 workspace=self.request.user.workspace)).filter(
-                    target_customer=self.kwargs['pk']).order_by(
-                        '-contact_timestamp')
+                    target_customer=self.kwargs['pk']).select_related(
+                        'operator').order_by('-contact_timestamp')
 
     def dispatch(self, request, *args, **kwargs):
         target_customer = CustomerInfo.objects.get(pk=kwargs['pk'])
@@ -1401,10 +1587,11 @@ class ContactInfoByUserListView(LoginRequiredMixin, PaginationMixin,
          ・対応者が自分
         """
         return ContactInfo.objects.filter(
-            delete_flg='False',
+            delete_flg=False,
             target_customer__in=CustomerInfo.objects.filter(
                 workspace=self.request.user.workspace)).filter(
-                    operator=self.request.user).order_by('-contact_timestamp')
+                    operator=self.request.user).select_related(
+                        'target_customer').order_by('-contact_timestamp')
 
     def dispatch(self, request, *args, **kwargs):
         # ワークスペースに所属し、有効になっている場合のみ表示できる
@@ -1413,6 +1600,16 @@ class ContactInfoByUserListView(LoginRequiredMixin, PaginationMixin,
         else:
             return redirect('index')
 
+    def get_context_data(self, **kwargs):
+        """
+        表示中のページで編集可能な顧客をテンプレート側に渡す
+        """
+        ctx = super().get_context_data(**kwargs)
+        ctx['editable_customer_pks'] = GetEditableCustomerPks(
+            self.request.user,
+            [contactinfo.target_customer_id for contactinfo in ctx['object_list']])
+        return ctx
+
 
 class AddressInfoCreateView(LoginRequiredMixin, CreateView):
     """ 登録画面（連絡先情報） """
@@ -1498,6 +1695,40 @@ class AddressInfoListView(PaginationMixin, ListView):
         else:
             return redirect('index')
 
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['customer_create_form'] = AddressInfoCustomerCreateForm()
+        return ctx
+
+
+class AddressInfoMatchView(LoginRequiredMixin, AddressInfoListView):
+    """ 関連付けていない連絡先情報を顧客情報と照合し、関連付ける """
+
+    def get(self, request, *args, **kwargs):
+        return redirect('address_info_list')
+
+    def post(self, request, *args, **kwargs):
+        count = MatchAddressInfos(request.user.workspace, request.user)
+        messages.info(request, '{}件の連絡先情報を顧客情報に関連付けました。'.format(count))
+        return redirect('address_info_list')
+
+
+class AddressInfoCustomerCreateView(LoginRequiredMixin, AddressInfoListView):
+    """ 関連付けていない連絡先情報から、顧客情報をまとめて作成する """
+
+    def get(self, request, *args, **kwargs):
+        return redirect('address_info_list')
+
+    def post(self, request, *args, **kwargs):
+        form = AddressInfoCustomerCreateForm(request.POST)
+        if form.is_valid():
+            count = CreateCustomersFromAddressInfos(
+                request.user.workspace, request.user, form.cleaned_data['potential'])
+            messages.info(request, '連絡先情報から{}件の顧客情報を作成しました。'.format(count))
+        else:
+            messages.error(request, 'ポテンシャルには0以上の数値を入力してください。')
+        return redirect('address_info_list')
+
 
 class AddressInfoDetailView(LoginRequiredMixin, DetailView):
     """ 詳細画面（連絡先情報） """
@@ -1519,6 +1750,16 @@ class AddressInfoDetailView(LoginRequiredMixin, DetailView):
         return AddressInfo.objects.filter(
             workspace=self.request.user.workspace)
 
+    def get_context_data(self, **kwargs):
+        """
+        関連付けた顧客情報は、閲覧可能な場合だけ企業名を表示する
+        """
+        ctx = super().get_context_data(**kwargs)
+        related_customer_id = self.object.related_customer_id
+        ctx['related_customer_visible'] = bool(related_customer_id) and GetViewableCustomerInfo(
+            self.request.user).filter(pk=related_customer_id).exists()
+        return ctx
+
 
 class AddressInfoDeleteView(LoginRequiredMixin, DeleteView):
     """ 連絡先情報の削除 """
@@ -1541,6 +1782,16 @@ class AddressInfoDeleteView(LoginRequiredMixin, DeleteView):
         return AddressInfo.objects.filter(
             workspace=self.request.user.workspace)
 
+    def get_context_data(self, **kwargs):
+        """
+        関連付けた顧客情報は、閲覧可能な場合だけ企業名を表示する
+        """
+        ctx = super().get_context_data(**kwargs)
+        related_customer_id = self.object.related_customer_id
+        ctx['related_customer_visible'] = bool(related_customer_id) and GetViewableCustomerInfo(
+            self.request.user).filter(pk=related_customer_id).exists()
+        return ctx
+
 
 class InvalidColumnsExcepion(Exception):
     """CSVの列が足りなかったり多かったりしたらこのエラー"""
@@ -1572,6 +1823,7 @@ class AddressInfoImportView(generic.FormView):
             form.cleaned_data['file'], encoding='Shift_JISx0213')
         reader = csv.reader(csvfile)
         index = 1  # 1行目でのUnicodeDecodeError対策。for文の初回のnextでエラーになるとiの値がない為
+        self.imported_pks = []  # インポートした連絡先情報（顧客情報との照合に用いる）
         try:
             # indexは、現在の行番号。エラーの際に補足情報として使う
             for index, row in enumerate(reader, 1):
@@ -1617,6 +1869,7 @@ class AddressInfoImportView(generic.FormView):
                 addressinfo.author = self.request.user
                 addressinfo.modifier = self.request.user
                 addressinfo.save()
+                self.imported_pks.append(addressinfo.pk)
 
         except Exception as e:
             print(e)
@@ -1636,6 +1889,10 @@ class AddressInfoImportView(generic.FormView):
             form.add_error('file', e)
             return super().form_invalid(form)
         else:
+            # インポートした連絡先情報を顧客情報と照合し、関連付ける
+            count = MatchAddressInfos(
+                self.request.user.workspace, self.request.user, self.imported_pks)
+            messages.info(self.request, '{}件の連絡先情報を顧客情報に関連付けました。'.format(count))
             return super().form_valid(form)  # うまくいったので、リダイレクトさせる
 
 
@@ -1654,10 +1911,13 @@ class VisitTargetFilterView(ContactInfoByUserListView):
          ・訪問開始時刻（予定）の昇順
         """
         return ContactInfo.objects.filter(
-            delete_flg='False',
+            delete_flg=False,
             target_customer__in=CustomerInfo.objects.filter(
                 workspace=self.request.user.workspace)).filter(
-                    operator=self.request.user).order_by('start_time_plan')
+                    operator=self.request.user).select_related(
+                        'target_customer').prefetch_related(
+                            'target_customer__supplement').order_by(
+                                'start_time_plan')
 
     def get(self, request, **kwargs):
         """
@@ -1712,7 +1972,7 @@ class VisitTargetFilterView(ContactInfoByUserListView):
         visit_act_count = ContactInfo.objects.filter(
             delete_flg=False,
             operator=self.request.user,
-            contact_type='0',
+            contact_type=0,
             visit_date_act=visit_date,
             visited_flg=True).count()  # 訪問実績件数
 
@@ -1721,7 +1981,7 @@ class VisitTargetFilterView(ContactInfoByUserListView):
         visit_plan_count = ContactInfo.objects.filter(
             delete_flg=False,
             operator=self.request.user,
-            contact_type='0',
+            contact_type=0,
             visit_date_plan=visit_date).count()  # 訪問予定件数
 
         ctx['visit_plan_count'] = visit_plan_count
@@ -1774,6 +2034,60 @@ class VisitTargetMapView(VisitTargetFilterView):
         return ctx
 
 
+class VisitRouteView(LoginRequiredMixin, TemplateView):
+    """訪問ルートの提案画面"""
+    template_name = 'sfa/visit_route.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # ワークスペースに所属し、有効になっている場合のみ表示可能
+        if request.user.workspace and request.user.is_workspace_active:
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_visit_date(self):
+        """
+        訪問日を取得する。指定がない場合は訪問先リストで表示中の日付、それもなければ当日
+        """
+        visit_date = self.request.GET.get('visit_date') or self.request.POST.get('visit_date')
+        if not visit_date and 'contact_info_query' in self.request.session:
+            visit_date = self.request.session['contact_info_query'].get('visit_date')
+        try:
+            return datetime.datetime.strptime(visit_date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return datetime.datetime.now(timezone('Asia/Tokyo')).date()
+
+    def get_route(self, visit_date):
+        """
+        訪問日の自分の訪問予定（未訪問のもの）から訪問ルートを提案する
+        """
+        contactinfo_list = ContactInfo.objects.filter(
+            delete_flg=False,
+            target_customer__workspace=self.request.user.workspace,
+            operator=self.request.user,
+            contact_type=0,
+            visit_date_plan=visit_date,
+            visited_flg=False).select_related('target_customer').order_by(
+                'start_time_plan', 'pk')
+        return SuggestVisitRoute(list(contactinfo_list))
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        visit_date = self.get_visit_date()
+        ctx['visit_date'] = visit_date.isoformat()
+        ctx['route'] = self.get_route(visit_date)
+        return ctx
+
+    def post(self, request, *args, **kwargs):
+        """
+        提案した訪問開始時刻（予定）を反映する。画面表示時と同じ条件で提案し直すため、送信された時刻は用いない
+        """
+        route = self.get_route(self.get_visit_date())
+        count = ApplyVisitRoute(route['stops'])
+        messages.info(request, '{}件の訪問開始時刻（予定）を更新しました。'.format(count))
+        return redirect('visit_target_filter')
+
+
 class VisitPlanCreateView(ContactInfoCreateView):
     """訪問予定の新規作成"""
     form_class = VisitPlanForm
@@ -1783,7 +2097,7 @@ class VisitPlanCreateView(ContactInfoCreateView):
     def get_initial(self):
         """デフォルト値の設定"""
         initial = super().get_initial()
-        initial['contact_type'] = '0'  # コンタクト種別を「訪問」に設定
+        initial['contact_type'] = 0  # コンタクト種別を「訪問」に設定
         initial['operator'] = self.request.user  # 対応者をログインユーザーに設定
         if 'contact_info_query' in self.request.session:
             query = self.request.session['contact_info_query']
@@ -1801,7 +2115,7 @@ class VisitPlanUpdateView(ContactInfoUpdateView):
     def get_initial(self):
         """デフォルト値の設定"""
         initial = super().get_initial()
-        initial['contact_type'] = '0'  # コンタクト種別を「訪問」に設定
+        initial['contact_type'] = 0  # コンタクト種別を「訪問」に設定
         initial['operator'] = self.request.user  # 対応者をログインユーザーに設定
         return initial
 
@@ -1823,7 +2137,7 @@ class VisitHistoryCreateView(ContactInfoCreateView):
     def get_initial(self):
         """デフォルト値の設定"""
         initial = super().get_initial()
-        initial['contact_type'] = '0'  # コンタクト種別を「訪問」に設定
+        initial['contact_type'] = 0  # コンタクト種別を「訪問」に設定
         initial['operator'] = self.request.user  # 対応者をログインユーザーに設定
         if 'contact_info_query' in self.request.session:
             query = self.request.session['contact_info_query']
@@ -1864,7 +2178,7 @@ class VisitHistoryUpdateView(ContactInfoUpdateView):
     def get_initial(self):
         """デフォルト値の設定"""
         initial = super().get_initial()
-        initial['contact_type'] = '0'  # コンタクト種別を「訪問」に設定
+        initial['contact_type'] = 0  # コンタクト種別を「訪問」に設定
         initial['operator'] = self.request.user  # 対応者をログインユーザーに設定
         initial['visited_flg'] = True  # 訪問済みフラグを設定
         # 訪問予定日時を訪問実績日時のデフォルト値に設定
@@ -1879,9 +2193,7 @@ class VisitPlanOrHistoryDeleteView(ContactInfoByUserDeleteView):
     """ 訪問予定/実績の削除 """
 
     def get(self, request, **kwargs):
-        target = ContactInfo.objects.get(pk=self.kwargs['pk'])
-        target.delete_flg = True
-        target.save()
+        self.delete_contactinfo()
         return redirect('visit_target_filter')
 
 
@@ -1896,7 +2208,7 @@ class CallHistoryCreateView(ContactInfoCreateView):
         pk = self.kwargs['pk']
         target_customer = CustomerInfo.objects.get(pk=pk)
         initial = super().get_initial()
-        initial['contact_type'] = '2'  # コンタクト種別を「架電（アウトバウンド）」に設定
+        initial['contact_type'] = 2  # コンタクト種別を「架電（アウトバウンド）」に設定
         initial['operator'] = self.request.user  # 対応者をログインユーザーに設定
         initial[
             'target_person'] = target_customer.contact_name  # 顧客側担当者名を対象顧客の担当者名に設定
@@ -1932,14 +2244,37 @@ class CallHistoryFilterView(ContactInfoByUserListView):
          ・削除フラグが立っていない
          ・同一ワークスペース
          ・対応者が自分
+         ・対応日時が指定した架電実施日
         以下の条件でソート
          ・対応日時の降順
         """
+        contact_timestamp_gte, contact_timestamp_lt = self.get_contact_timestamp_range()
         return ContactInfo.objects.filter(
-            delete_flg='False',
+            delete_flg=False,
+            contact_timestamp__gte=contact_timestamp_gte,
+            contact_timestamp__lt=contact_timestamp_lt,
             target_customer__in=CustomerInfo.objects.filter(
                 workspace=self.request.user.workspace)).filter(
-                    operator=self.request.user).order_by('-contact_timestamp')
+                    operator=self.request.user).select_related(
+                        'target_customer').prefetch_related(
+                            'target_customer__supplement').order_by(
+                                '-contact_timestamp')
+
+    def get_contact_timestamp_range(self):
+        """
+        架電実施日の0時から翌日0時までの半開区間を返す
+        定数の範囲で絞り込むことで、パーティション化したテーブルでは該当月のパーティションだけが検索される
+        """
+        contact_date = self.request.GET.get('contact_date')
+        try:
+            contact_timestamp_gte = datetime.datetime.strptime(
+                contact_date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            contact_timestamp_gte = datetime.datetime.now(
+                timezone('Asia/Tokyo')).replace(
+                    hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        return contact_timestamp_gte, contact_timestamp_gte + datetime.timedelta(
+            days=1)
 
     def get(self, request, **kwargs):
         """
@@ -1966,15 +2301,13 @@ class CallHistoryFilterView(ContactInfoByUserListView):
             contact_date = datetime.datetime.now(
                 timezone('Asia/Tokyo')).strftime("%Y-%m-%d")
 
-        contact_date_gte = contact_date + " 0:0:0"
-        contact_date_lte = contact_date + " 23:59:59"
-
         request.GET['contact_date'] = contact_date
-        request.GET['contact_timestamp_gte'] = contact_date_gte
-        request.GET['contact_timestamp_lte'] = contact_date_lte
         # 以下の検索条件は予期せぬ動きを引き起こすため削除
+        # 対応日時はget_querysetで架電実施日から絞り込む
         request.GET['visit_date_plan'] = None
         request.GET['visit_date_act'] = None
+        request.GET['contact_timestamp_gte'] = None
+        request.GET['contact_timestamp_lte'] = None
 
         # 一覧画面切り替え時に存在しないページを指定した場合のエラー回避処理
         curr_page = '1'
@@ -1994,14 +2327,13 @@ class CallHistoryFilterView(ContactInfoByUserListView):
         ctx = super().get_context_data(**kwargs)
         contact_date = self.request.GET['contact_date']
         ctx['contact_date'] = contact_date
-        contact_timestamp_gte = self.request.GET['contact_timestamp_gte']
-        contact_timestamp_lte = self.request.GET['contact_timestamp_lte']
+        contact_timestamp_gte, contact_timestamp_lt = self.get_contact_timestamp_range()
         outbound_count = ContactInfo.objects.filter(
             delete_flg=False,
             operator=self.request.user,
-            contact_type='2',
+            contact_type=2,
             contact_timestamp__gte=contact_timestamp_gte,
-            contact_timestamp__lte=contact_timestamp_lte,
+            contact_timestamp__lt=contact_timestamp_lt,
             called_flg=True).count()  # 架電（アウトバウンド）の実績件数
         ctx['outbound_count'] = outbound_count
         # 任意コードを用いて外部システムを呼び出すURL1
@@ -2041,43 +2373,50 @@ class GetContactInfoCountView(LoginRequiredMixin, TemplateView):
         else:
             return redirect('index')
 
+    def get_count_querysets(self):
+        """
+        集計開始時刻、集計終了時刻から各種コンタクト実績の件数を数えるクエリセットを返す
+        訪問予定・実績は訪問日で集計するため、対応日時のパーティションによる絞り込みは効かない
+        """
+        contact_timestamp_gte, contact_timestamp_lt = GetContactTimestampRange(
+            self.request.GET['contact_timestamp_gte'],
+            self.request.GET['contact_timestamp_lte'])
+        visit_date_gte = contact_timestamp_gte.date()
+        visit_date_lte = (
+            contact_timestamp_lt - datetime.timedelta(seconds=1)).date()
+        return {
+            'outbound_count': ContactInfo.objects.filter(
+                delete_flg=False,
+                operator=self.request.user,
+                contact_type=2,
+                contact_timestamp__gte=contact_timestamp_gte,
+                contact_timestamp__lt=contact_timestamp_lt,
+                called_flg=True),  # 架電（アウトバウンド）の実績件数
+            'visit_plan_count': ContactInfo.objects.filter(
+                delete_flg=False,
+                operator=self.request.user,
+                contact_type=0,
+                visit_date_plan__gte=visit_date_gte,
+                visit_date_plan__lte=visit_date_lte),  # 訪問予定件数
+            'visit_count': ContactInfo.objects.filter(
+                delete_flg=False,
+                operator=self.request.user,
+                contact_type=0,
+                visit_date_act__gte=visit_date_gte,
+                visit_date_act__lte=visit_date_lte,
+                visited_flg=True),  # 訪問実績件数
+        }
+
     def get_context_data(self, **kwargs):
         """
-        集計開始時刻、集計終了時刻から各種コンタクト実績の件数を返す
+        各種コンタクト実績の件数を返す
         """
-        contact_timestamp_gte = self.request.GET['contact_timestamp_gte']
-        visit_date_gte = datetime.datetime.strptime(
-            contact_timestamp_gte, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d')
-        contact_timestamp_lte = self.request.GET['contact_timestamp_lte']
-        visit_date_lte = datetime.datetime.strptime(
-            contact_timestamp_lte, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d')
-        outbound_count = ContactInfo.objects.filter(
-            delete_flg=False,
-            operator=self.request.user,
-            contact_type='2',
-            contact_timestamp__gte=contact_timestamp_gte,
-            contact_timestamp__lte=contact_timestamp_lte,
-            called_flg=True).count()  # 架電（アウトバウンド）の実績件数
-        visit_plan_count = ContactInfo.objects.filter(
-            delete_flg=False,
-            operator=self.request.user,
-            contact_type='0',
-            visit_date_plan__gte=visit_date_gte,
-            visit_date_plan__lte=visit_date_lte).count()  # 訪問予定件数
-        visit_count = ContactInfo.objects.filter(
-            delete_flg=False,
-            operator=self.request.user,
-            contact_type='0',
-            visit_date_act__gte=visit_date_gte,
-            visit_date_act__lte=visit_date_lte,
-            visited_flg=True).count()  # 訪問実績件数
         ctx = super().get_context_data(**kwargs)
         results = {
             'results': [
                 {
-                    'outbound_count': outbound_count,
-                    'visit_plan_count': visit_plan_count,
-                    'visit_count': visit_count,
+                    name: queryset.count()
+                    for name, queryset in self.get_count_querysets().items()
                 },
             ]
         }
@@ -2086,6 +2425,140 @@ class GetContactInfoCountView(LoginRequiredMixin, TemplateView):
         return ctx
 
 
+class GetPipelineTrendView(LoginRequiredMixin, TemplateView):
+    """パイプラインの推移をスナップショットから取得する"""
+    template_name = 'sfa/get_pipeline_trend.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # ワークスペースに所属し、有効になっている場合のみ表示できる
+        if request.user.workspace and request.user.is_workspace_active:
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_context_data(self, **kwargs):
+        """
+        集計期間（月数）と集計範囲から対応状況ごとの件数とポテンシャル合計の推移を返す
+        集計範囲はuser=自分が担当中の顧客、all=ワークスペース全体
+        """
+        try:
+            months = int(self.request.GET.get('months', 6))
+        except ValueError:
+            months = 6
+        start_date = datetime.datetime.now(
+            timezone('Asia/Tokyo')).date() - datetime.timedelta(
+                days=31 * months)
+        snapshots = PipelineSnapshot.objects.filter(
+            workspace=self.request.user.workspace,
+            snapshot_date__gte=start_date)
+        if self.request.GET.get('range') == 'all':
+            snapshots = snapshots.filter(sales_person__isnull=True)
+        else:
+            snapshots = snapshots.filter(sales_person=self.request.user)
+
+        labels = []
+        counts = {status: [] for status, _ in ACTION_CHOICES}
+        potentials = {status: [] for status, _ in ACTION_CHOICES}
+        for snapshot in snapshots.order_by('snapshot_date').values_list(
+                'snapshot_date', 'action_status', 'customer_count',
+                'potential_sum'):
+            snapshot_date, action_status, customer_count, potential_sum = snapshot
+            label = snapshot_date.strftime('%Y-%m-%d')
+            if not labels or labels[-1] != label:
+                # 新しい集計日の列を0で初期化する
+                labels.append(label)
+                for status in counts:
+                    counts[status].append(0)
+                    potentials[status].append(0)
+            if action_status in counts:
+                counts[action_status][-1] = customer_count
+                potentials[action_status][-1] = potential_sum
+
+        ctx = super().get_context_data(**kwargs)
+        results = {
+            'results': {
+                'labels': labels,
+                'statuses': [{
+                    'action_status': status,
+                    'label': label,
+                    'customer_count': counts[status],
+                    'potential_sum': potentials[status],
+                } for status, label in ACTION_CHOICES],
+            }
+        }
+        ctx['results'] = json.dumps(results, ensure_ascii=False)
+
+        return ctx
+
+
+class GetPostalCodeView(LoginRequiredMixin, TemplateView):
+    """郵便番号から住所を取得する（顧客情報の入力画面の自動入力用）"""
+    template_name = 'sfa/get_postal_code.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # ワークスペースに所属し、有効になっている場合のみ表示できる
+        if request.user.workspace and request.user.is_workspace_active:
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_context_data(self, **kwargs):
+        """
+        郵便番号の索引から都道府県と市区町村番地を返す。見つからない場合は空にする
+        """
+        zip_code = ExtractNumber(self.request.GET.get('zip_code', ''), 2)
+        address = LookupPostalCodes([zip_code]).get(zip_code) if len(zip_code) == 7 else None
+        ctx = super().get_context_data(**kwargs)
+        results = {'results': {}}
+        if address is not None:
+            results['results'] = {'address1': address[0], 'address2': address[1]}
+        ctx['results'] = json.dumps(results, ensure_ascii=False)
+        return ctx
+
+
+class ActionStatusFunnelView(LoginRequiredMixin, TemplateView):
+    """対応状況の移行率と滞留日数を表示する"""
+    template_name = 'sfa/action_status_funnel.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # ワークスペースに所属し、有効になっている場合のみ表示できる
+        if request.user.workspace and request.user.is_workspace_active:
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_context_data(self, **kwargs):
+        """
+        集計期間（開始日・終了日）を受け取り、対応状況ごとの到達顧客数と平均滞留日数を返す
+        省略時は本日までの90日間を集計する
+        """
+        today = datetime.datetime.now(timezone('Asia/Tokyo')).date()
+        try:
+            date_from = datetime.datetime.strptime(
+                self.request.GET.get('date_from', ''), '%Y-%m-%d').date()
+        except ValueError:
+            date_from = today - datetime.timedelta(days=90)
+        try:
+            date_to = datetime.datetime.strptime(
+                self.request.GET.get('date_to', ''), '%Y-%m-%d').date()
+        except ValueError:
+            date_to = today
+
+        # 終了日の当日分を含めるため、翌日の0時未満を集計対象とする
+        timestamp_from = datetime.datetime.combine(date_from, datetime.time())
+        timestamp_to = datetime.datetime.combine(
+            date_to + datetime.timedelta(days=1), datetime.time())
+
+        ctx = super().get_context_data(**kwargs)
+        ctx['date_from'] = date_from.strftime('%Y-%m-%d')
+        ctx['date_to'] = date_to.strftime('%Y-%m-%d')
+        ctx['funnel'] = GetActionStatusFunnel(
+            self.request.user.workspace, timestamp_from, timestamp_to)
+        ctx['durations'] = GetActionStatusDuration(
+            self.request.user.workspace, timestamp_from, timestamp_to)
+        return ctx
+
+
 class GoalSettingCreateView(LoginRequiredMixin, CreateView):
     """ 目標設定を行う（新規作成） """
     model = GoalSetting
@@ -2230,3 +2703,428 @@ class CustomerInfoDisplaySettingUpdateView(LoginRequiredMixin, UpdateView):
             return super().dispatch(request, *args, **kwargs)
         else:
             return redirect('index')
+
+
+class ArchivedRecordListView(LoginRequiredMixin, PaginationMixin, ListView):
+    """ 一覧画面（アーカイブ済みデータ） """
+
+    model = ArchivedRecord
+    template_name = 'sfa/archivedrecord_list.html'
+
+    # pure_pagination用設定
+    paginate_by = 30
+    object = ArchivedRecord
+
+    def get_queryset(self):
+        """
+        同一ワークスペースのアーカイブ済みデータを新しい順に返す
+        退避データ本体は一覧に不要なため読み込まない
+        """
+        return ArchivedRecord.objects.filter(
+            workspace=self.request.user.workspace).defer('payload').order_by(
+                '-archived_timestamp')
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+
+class ArchivedRecordRestoreView(ArchivedRecordListView):
+    """ アーカイブ済みデータを元に戻す """
+
+    def get(self, request, *args, **kwargs):
+        return redirect('archived_record_list')
+
+    def post(self, request, *args, **kwargs):
+        archived_record = ArchivedRecord.objects.filter(
+            workspace=request.user.workspace, pk=kwargs['pk']).first()
+        if archived_record:
+            try:
+                restored = RestoreArchivedRecord(archived_record)
+                RefreshCompanyRollups(request.user.workspace, [
+                    restored.target_customer_id
+                    if isinstance(restored, ContactInfo) else restored.pk
+                ])
+                messages.info(request, '{}（{}）を復元しました。'.format(
+                    archived_record.label,
+                    archived_record.get_model_name_display()))
+            except CustomerInfo.DoesNotExist:
+                messages.error(request,
+                               '対象の顧客情報がアーカイブされているため、先に顧客情報を復元してください。')
+        return redirect('archived_record_list')
+
+
+class DuplicateClusterListView(LoginRequiredMixin, PaginationMixin, ListView):
+    """ 一覧画面（重複候補） """
+
+    model = DuplicateCluster
+    template_name = 'sfa/duplicatecluster_list.html'
+
+    # pure_pagination用設定
+    paginate_by = 30
+    object = DuplicateCluster
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_status(self):
+        """
+        表示する確認状況。指定がない場合は未確認
+        """
+        status = self.request.GET.get('status', '0')
+        return int(status) if status in ('0', '1', '2') else 0
+
+    def get_queryset(self):
+        """
+        同一ワークスペースの重複候補を類似度の高い順に返す
+        """
+        return DuplicateCluster.objects.filter(
+            workspace=self.request.user.workspace, status=self.get_status()).prefetch_related(
+                Prefetch(
+                    'members__customer',
+                    queryset=CustomerInfo.objects.select_related('sales_person'))).order_by(
+                        '-score', 'pk')
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['status'] = self.get_status()
+        ctx['status_choices'] = DUPLICATE_STATUS_CHOICES
+        if ctx['status'] == 1:
+            # 統合する際に残す顧客情報の初期値
+            clusters = list(ctx['object_list'])
+            survivors = {survivor for survivor, _ in ChooseSurvivors(clusters)}
+            for cluster in clusters:
+                cluster.survivor_pk = next(
+                    (member.customer_id for member in cluster.members.all()
+                     if member.customer_id in survivors), None)
+            ctx['object_list'] = ctx['duplicatecluster_list'] = clusters
+        return ctx
+
+
+class DuplicateClusterUpdateView(DuplicateClusterListView):
+    """ 重複候補の確認状況を変更する """
+
+    def get(self, request, *args, **kwargs):
+        return redirect('duplicate_cluster_list')
+
+    def post(self, request, *args, **kwargs):
+        status = request.POST.get('status')
+        if status in ('0', '1', '2'):
+            DuplicateCluster.objects.filter(
+                workspace=request.user.workspace, pk=kwargs['pk']).update(status=int(status))
+        return redirect(
+            reverse_lazy('duplicate_cluster_list') + '?status={}'.format(self.get_status()))
+
+
+class DuplicateClusterMergeView(DuplicateClusterListView):
+    """ 重複と確認した重複候補の顧客情報を統合する """
+
+    def get(self, request, *args, **kwargs):
+        return redirect('duplicate_cluster_list')
+
+    def post(self, request, *args, **kwargs):
+        clusters = DuplicateCluster.objects.filter(workspace=request.user.workspace, status=1)
+        if 'pk' in kwargs:
+            clusters = clusters.filter(pk=kwargs['pk'])
+        groups = ChooseSurvivors(list(clusters))
+        survivor = request.POST.get('survivor', '')
+        if 'pk' in kwargs and groups and survivor.isdigit():
+            # 画面で選択した顧客情報を残す
+            pks = [groups[0][0]] + groups[0][1]
+            if int(survivor) in pks:
+                groups = [(int(survivor), [pk for pk in pks if pk != int(survivor)])]
+        count = MergeCustomers(request.user.workspace, groups, request.user)
+        messages.info(request, '{}件の顧客情報を統合しました。'.format(count))
+        return redirect(reverse_lazy('duplicate_cluster_list') + '?status=1')
+
+
+class DuplicateClusterRefreshView(DuplicateClusterListView):
+    """ ワークスペースのすべての顧客情報から重複候補を探し直す """
+
+    def get(self, request, *args, **kwargs):
+        return redirect('duplicate_cluster_list')
+
+    def post(self, request, *args, **kwargs):
+        count = RefreshDuplicates(request.user.workspace)
+        messages.info(request, '重複候補を更新しました。新たに{}件の顧客情報が重複候補に加わりました。'.format(count))
+        return redirect('duplicate_cluster_list')
+
+
+class MetricsView(View):
+    """
+    画面ごとの計測値をPrometheusのテキスト形式で返す。
+    計測値はすべてのワークスペースの画面を含むため、同一ホストからのアクセス、
+    METRICS_TOKENを指定したPrometheusの収集（Authorization: Bearer）、管理者のみ参照できる。
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        user = request.user
+        if request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1'):
+            return super().dispatch(request, *args, **kwargs)
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if token and hmac.compare_digest(
+                request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer {}'.format(token)):
+            return super().dispatch(request, *args, **kwargs)
+        if user.is_authenticated and user.is_superuser:
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get(self, request, *args, **kwargs):
+        # 自分のワーカーに貯まっている計測値も含めて返す
+        FlushMetrics()
+        return HttpResponse(
+            RenderPrometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class RequestProfileListView(LoginRequiredMixin, PaginationMixin, ListView):
+    """ 一覧画面（プロファイル） """
+
+    model = RequestProfile
+    template_name = 'sfa/requestprofile_list.html'
+
+    # pure_pagination用設定
+    paginate_by = 30
+    object = RequestProfile
+
+    def get_queryset(self):
+        """
+        同一ワークスペースで取得したプロファイルを新しい順に返す
+        レポートとプロファイル本体は一覧に不要なため読み込まない
+        """
+        return RequestProfile.objects.filter(
+            workspace=self.request.user.workspace).defer(
+                'report', 'profile_data').select_related('user').order_by(
+                    '-created_timestamp')
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_context_data(self, **kwargs):
+        """
+        プロファイルの取得方法をテンプレート側に渡す
+        """
+        ctx = super().get_context_data(**kwargs)
+        ctx['profile_param'] = PROFILE_PARAM
+        ctx['profile_token'] = CreateProfileToken(self.request.user)
+        return ctx
+
+
+class RequestProfileDownloadView(RequestProfileListView):
+    """ プロファイルをダウンロードする（cProfile形式またはテキストのレポート） """
+
+    def get(self, request, *args, **kwargs):
+        profile = RequestProfile.objects.filter(
+            workspace=request.user.workspace, pk=kwargs['pk']).first()
+        if not profile:
+            return redirect('request_profile_list')
+        if kwargs['kind'] == 'prof':
+            response = HttpResponse(
+                bytes(profile.profile_data), content_type='application/octet-stream')
+            filename = 'profile_{}.prof'.format(profile.pk)
+        else:
+            response = HttpResponse(
+                profile.report, content_type='text/plain; charset=utf-8')
+            filename = 'profile_{}.txt'.format(profile.pk)
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+        return response
+
+
+class SlowQuerySummaryView(LoginRequiredMixin, TemplateView):
+    """ スロークエリログの集計画面（SQLの形ごと） """
+
+    template_name = 'sfa/slowquery_summary.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_context_data(self, **kwargs):
+        """
+        自分のワークスペースで記録された遅いSQLを、合計時間の長い順に渡す
+        """
+        ctx = super().get_context_data(**kwargs)
+        ctx['threshold_ms'] = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+        ctx['slow_queries'] = SummarizeSlowQueries(
+            ReadSlowQueries(self.request.user.workspace_id))[:100]
+        return ctx
+
+
+class TerritoryBalanceView(LoginRequiredMixin, generic.FormView):
+    """ 担当エリアの分割画面 """
+    template_name = 'sfa/territory_balance.html'
+    form_class = TerritoryForm
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields['sales_persons'].queryset = User.objects.filter(
+            workspace=self.request.user.workspace,
+            is_workspace_active=True).order_by('pk')
+        return form
+
+    def form_valid(self, form):
+        """
+        担当エリアに分けた結果を表示する。反映を指示された場合は営業担当者を更新する
+        同じ条件であれば同じ分け方になるため、反映時も分け直した結果を用いる
+        """
+        plan = PlanTerritories(
+            self.request.user.workspace,
+            list(form.cleaned_data['sales_persons']),
+            unassigned_only=form.cleaned_data['unassigned_only'])
+        if 'apply' in self.request.POST:
+            count = ApplyTerritories(self.request.user.workspace, plan)
+            messages.info(self.request, '{}件の顧客情報の営業担当者を更新しました。'.format(count))
+            return redirect('territory_balance')
+        markers = [{
+            'territory': index,
+            'lat': lat,
+            'lng': lng,
+        } for index, territory in enumerate(plan['territories'])
+                   for lat, lng in territory['sample']]
+        return self.render_to_response(self.get_context_data(
+            form=form,
+            territories=plan['territories'],
+            markers=json.dumps(markers)))
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        # 地図を動的に生成するためのAPIキー
+        try:
+            ctx['api_key'] = self.request.user.workspace.workspaceenvironmentsetting.google_maps_javascript_api_key
+        except:
+            ctx['api_key'] = ''
+        return ctx
+
+
+class CompanyRollupListView(LoginRequiredMixin, PaginationMixin, ListView):
+    """ 一覧画面（会社単位の集計） """
+
+    model = CompanyRollup
+    template_name = 'sfa/companyrollup_list.html'
+
+    # pure_pagination用設定
+    paginate_by = 30
+    object = CompanyRollup
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー（非公開の顧客情報も含めて集計しているため）
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_queryset(self):
+        """
+        同一ワークスペースの会社をポテンシャルの合計が大きい順に返す
+        """
+        return CompanyRollup.objects.filter(
+            workspace=self.request.user.workspace).order_by('-potential_sum', 'corporate_number')
+
+
+class CompanyDetailView(LoginRequiredMixin, TemplateView):
+    """ 詳細画面（会社単位の集計）。すべての部署と営業担当者、部署をまたいだコンタクト履歴を表示する """
+    template_name = 'sfa/company_detail.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        # 以下の条件をすべて満たす場合のみ表示可能
+        # ・ワークスペースに所属し、有効になっている
+        # ・権限がオーナー（非公開の顧客情報も含めて集計しているため）
+        if request.user.workspace and request.user.is_workspace_active and request.user.workspace_role == '2':
+            return super().dispatch(request, *args, **kwargs)
+        else:
+            return redirect('index')
+
+    def get_context_data(self, **kwargs):
+        """
+        会社の集計と部署の一覧、コンタクト履歴（GETパラメータのcursorで指定されたページ）を返す
+        """
+        ctx = super().get_context_data(**kwargs)
+        workspace = self.request.user.workspace
+        corporate_number = self.kwargs['corporate_number']
+        ctx['company'] = get_object_or_404(
+            CompanyRollup, workspace=workspace, corporate_number=corporate_number)
+        departments = list(CustomerInfo.objects.filter(
+            workspace=workspace, corporate_number=corporate_number,
+            delete_flg=False).select_related('sales_person').order_by('department_name', 'pk'))
+        ctx['departments'] = departments
+        sales_persons = []
+        for department in departments:
+            if department.sales_person and department.sales_person not in sales_persons:
+                sales_persons.append(department.sales_person)
+        ctx['sales_persons'] = sales_persons
+        ctx['contacts'], ctx['next_cursor'] = GetCompanyContacts(
+            workspace, corporate_number, self.request.GET.get('cursor'))
+        return ctx
+
+
+class GetCompanyRollupView(CompanyDetailView):
+    """会社単位の集計と、部署をまたいだコンタクト履歴をJSONで返す"""
+    template_name = 'sfa/get_company_rollup.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        company = ctx['company']
+        results = {
+            'company': {
+                'corporate_number': company.corporate_number,
+                'company_name': company.company_name,
+                'customer_count': company.customer_count,
+                'potential_sum': company.potential_sum,
+                'sales_person_count': company.sales_person_count,
+                'contact_count': company.contact_count,
+                'last_contact_timestamp': str(company.last_contact_timestamp or ''),
+            },
+            'departments': [{
+                'pk': department.pk,
+                'department_name': department.department_name,
+                'potential': department.potential,
+                'action_status': department.get_action_status_display(),
+                'sales_person': str(department.sales_person or ''),
+            } for department in ctx['departments']],
+            'sales_persons': [str(sales_person) for sales_person in ctx['sales_persons']],
+            'contacts': [{
+                'pk': contact.pk,
+                'customer_pk': contact.target_customer_id,
+                'department_name': contact.target_customer.department_name,
+                'contact_type': contact.get_contact_type_display(),
+                'operator': str(contact.operator),
+                'target_person': contact.target_person,
+                'contact_timestamp': str(contact.contact_timestamp),
+            } for contact in ctx['contacts']],
+            'next_cursor': ctx['next_cursor'],
+        }
+        ctx['results'] = json.dumps({'results': results}, ensure_ascii=False)
+        return ctx